@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from edu_core.models import AttendanceRollup
+
+
+# Команда полностью перестраивает агрегаты посещаемости (AttendanceRollup) по записям Attendance.
+# В обычном режиме агрегаты поддерживаются сигналами; команда нужна после массовых
+# изменений в обход ORM-сигналов (bulk_create/update, прямой SQL) или для проверки расхождений.
+class Command(BaseCommand):
+    help = 'Перестраивает агрегаты посещаемости (студент x предмет x учебный период).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--study-period', type=int, action='append', dest='study_period_ids', help='ID учебного периода (можно указать несколько раз). По умолчанию - все периоды.')
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        rollups_count = AttendanceRollup.rebuild(study_period_ids=options['study_period_ids'])
+        self.stdout.write(self.style.SUCCESS(f'Агрегатов посещаемости записано: {rollups_count}'))
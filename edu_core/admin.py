@@ -6,7 +6,7 @@ from django.utils.html import format_html # Импортировано для fo
 from .models import (
     AcademicYear, StudyPeriod, SubjectMaterialAttachment, SubjectType, Subject, Classroom, StudentGroup,
     Curriculum, CurriculumEntry, Lesson, LessonJournalEntry, Homework,
-    HomeworkAttachment, HomeworkSubmission, SubmissionAttachment, Attendance, Grade,
+    HomeworkAttachment, HomeworkSubmission, SubmissionAttachment, Attendance, AttendanceRollup, Grade,
     SubjectMaterial
 )
 
@@ -157,6 +157,7 @@ class CurriculumAdmin(admin.ModelAdmin):
 # - ordering: Сортировка.
 # - fields: Поля для страницы редактирования.
 # - readonly_fields: Поля, вычисляемые как property в модели (запланированные/оставшиеся часы).
+# - get_queryset: Аннотирует записи суммой Lesson.duration_minutes (with_scheduled_minutes).
 # - Кастомные методы: curriculum_info, teacher_name, study_period_name, scheduled_hours_display, remaining_hours_display.
 @admin.register(CurriculumEntry)
 class CurriculumEntryAdmin(admin.ModelAdmin):
@@ -174,6 +175,10 @@ class CurriculumEntryAdmin(admin.ModelAdmin):
     fields = ('curriculum', 'subject', 'teacher', 'study_period', 'planned_hours')
     readonly_fields = ('scheduled_hours', 'remaining_hours')
 
+    def get_queryset(self, request):
+        # Запланированные минуты считаются одним сгруппированным запросом для всей страницы списка
+        return super().get_queryset(request).with_scheduled_minutes()
+
     def curriculum_info(self, obj):
         return str(obj.curriculum)
     curriculum_info.short_description = _("Учебный план")
@@ -456,6 +461,23 @@ class AttendanceAdmin(admin.ModelAdmin):
         return obj.marked_at.strftime('%d.%m.%Y %H:%M')
     marked_at_display.short_description = _('Время отметки')
 
+# Класс AttendanceRollupAdmin отображает агрегаты посещаемости (только чтение).
+# Агрегаты поддерживаются сигналами и командой rebuild_attendance_rollups, поэтому
+# создание и редактирование через админку запрещено.
+@admin.register(AttendanceRollup)
+class AttendanceRollupAdmin(admin.ModelAdmin):
+    list_display = ('student', 'subject', 'study_period', 'total_count', 'present_count', 'late_count', 'remote_count', 'absent_valid_count', 'absent_invalid_count', 'updated_at')
+    list_filter = ('study_period__academic_year', 'study_period', 'subject')
+    search_fields = ('student__last_name', 'student__email', 'subject__name')
+    list_select_related = ('student', 'subject', 'study_period')
+    readonly_fields = [field.name for field in AttendanceRollup._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 # Класс GradeAdmin настраивает отображение модели Grade (Оценка).
 # - list_display: Поля (студент, предмет, оценка, тип, период, инфо о занятии, дата, кем выставлена).
 # - list_filter: Фильтры.
@@ -0,0 +1,128 @@
+import logging
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import transaction
+from django.db.models import Q, F, Sum
+from django.utils import timezone
+from .models import Grade, PendingGradeAverage
+
+logger = logging.getLogger(__name__)
+
+
+# Класс GradeAverageCalculator рассчитывает средневзвешенные оценки за период (PERIOD_AVG)
+# и за год (YEAR_AVG) для каждой пары (студент, предмет) учебного года или группы.
+# - Текущие оценки (все, кроме итоговых/расчетных) читаются одним сгруппированным запросом
+#   по (студент, предмет, период); средняя за год считается из тех же сумм по всем периодам года.
+# - Все средние записываются одним bulk_create(update_conflicts=True) по Grade.calculation_key;
+#   расчетные оценки, для которых больше нет текущих оценок, удаляются.
+# - incremental=True: обрабатываются только студенты из очереди PendingGradeAverage
+#   (оценки изменились после последнего расчета); обработанные записи очереди удаляются.
+# Расчетные оценки создаются с весом 0, чтобы не влиять на средние по текущим оценкам.
+class GradeAverageCalculator:
+    BATCH_SIZE = 1000
+    AVERAGE_PRECISION = Decimal('0.01')
+
+    def __init__(self, academic_year, student_group=None, incremental=True, progress_callback=None):
+        self.academic_year = academic_year
+        self.student_group = student_group
+        self.incremental = incremental
+        self.progress_callback = progress_callback
+
+    def _report(self, stage, current, total):
+        if self.progress_callback:
+            self.progress_callback(stage, current, total)
+
+    def _current_grades(self):
+        grades_qs = Grade.objects.filter(academic_year=self.academic_year, numeric_value__isnull=False)\
+            .exclude(grade_type__in=Grade.SUMMARY_TYPES)
+        if self.student_group is not None:
+            grades_qs = grades_qs.filter(student__student_group_memberships=self.student_group)
+        return grades_qs
+
+    # Студенты для расчета: из очереди (incremental) или все студенты с оценками в году/группе.
+    def _target_student_ids(self):
+        if self.incremental:
+            pending_qs = PendingGradeAverage.objects.filter(academic_year=self.academic_year)
+            if self.student_group is not None:
+                pending_qs = pending_qs.filter(student__student_group_memberships=self.student_group)
+            return set(pending_qs.values_list('student_id', flat=True))
+        student_ids = set(self._current_grades().values_list('student_id', flat=True).distinct())
+        if self.student_group is not None:
+            student_ids |= set(self.student_group.students.values_list('id', flat=True))
+        return student_ids
+
+    def _average(self, weighted_sum, total_weight):
+        return (Decimal(str(weighted_sum)) / Decimal(total_weight)).quantize(self.AVERAGE_PRECISION, rounding=ROUND_HALF_UP)
+
+    def _build_average_grade(self, grade_type, student_id, subject_id, average, study_period_id=None):
+        scope_id = study_period_id if grade_type == Grade.GradeType.PERIOD_AVERAGE else self.academic_year.pk
+        return Grade(
+            student_id=student_id, subject_id=subject_id, study_period_id=study_period_id,
+            academic_year=self.academic_year, grade_type=grade_type, numeric_value=average,
+            grade_value=str(average), weight=0, date_given=timezone.localdate(),
+            calculation_key=f"{grade_type}:{student_id}:{subject_id}:{scope_id}",
+        )
+
+    # Строит (не сохраняя) расчетные оценки для указанных студентов.
+    def build_averages(self, student_ids):
+        rows = self._current_grades().filter(student_id__in=student_ids, weight__gt=0)\
+            .values('student_id', 'subject_id', 'study_period_id')\
+            .annotate(weighted_sum=Sum(F('numeric_value') * F('weight')), total_weight=Sum('weight')).order_by()
+        averages = []; year_totals = {}
+        for row in rows:
+            if not row['total_weight']: continue
+            if row['study_period_id']:
+                averages.append(self._build_average_grade(
+                    Grade.GradeType.PERIOD_AVERAGE, row['student_id'], row['subject_id'],
+                    self._average(row['weighted_sum'], row['total_weight']), study_period_id=row['study_period_id']
+                ))
+            totals = year_totals.setdefault((row['student_id'], row['subject_id']), [Decimal('0'), 0])
+            totals[0] += Decimal(str(row['weighted_sum'])); totals[1] += row['total_weight']
+        for (student_id, subject_id), (weighted_sum, total_weight) in year_totals.items():
+            averages.append(self._build_average_grade(Grade.GradeType.YEAR_AVERAGE, student_id, subject_id, self._average(weighted_sum, total_weight)))
+        return averages
+
+    def execute(self):
+        started_at = timezone.now()
+        student_ids = self._target_student_ids()
+        self._report('computing', 0, len(student_ids))
+        with transaction.atomic():
+            averages = self.build_averages(student_ids)
+            self._report('saving', 0, len(averages))
+            if averages:
+                Grade.objects.bulk_create(
+                    averages, batch_size=self.BATCH_SIZE, update_conflicts=True, unique_fields=['calculation_key'],
+                    update_fields=['numeric_value', 'grade_value', 'date_given'],
+                )
+            # Расчетные оценки обработанных студентов без текущих оценок больше не актуальны.
+            # Удаляются только оценки, созданные калькулятором (с calculation_key): средние без ключа
+            # (выставленные вручную или до введения ключа) не трогаются.
+            stale_qs = Grade.objects.filter(
+                Q(study_period__academic_year=self.academic_year) | Q(academic_year=self.academic_year),
+                student_id__in=student_ids, grade_type__in=Grade.CALCULATED_TYPES, calculation_key__isnull=False,
+            ).exclude(calculation_key__in=[grade.calculation_key for grade in averages])
+            removed_count = stale_qs.delete()[0]
+            PendingGradeAverage.objects.filter(
+                academic_year=self.academic_year, student_id__in=student_ids, marked_at__lte=started_at
+            ).delete()
+        self._notify_stats_cache(student_ids, {grade.study_period_id for grade in averages if grade.study_period_id})
+        result = {
+            'academic_year_id': self.academic_year.pk,
+            'student_group_id': self.student_group.pk if self.student_group is not None else None,
+            'incremental': self.incremental,
+            'students_processed': len(student_ids),
+            'period_averages': sum(1 for grade in averages if grade.grade_type == Grade.GradeType.PERIOD_AVERAGE),
+            'year_averages': sum(1 for grade in averages if grade.grade_type == Grade.GradeType.YEAR_AVERAGE),
+            'removed': removed_count,
+        }
+        logger.info(f"Grade averages computed: {result}")
+        return result
+
+    # bulk_create не отправляет сигналы, поэтому кэш статистики года, периодов и групп инвалидируется явно.
+    def _notify_stats_cache(self, student_ids, study_period_ids):
+        if not student_ids: return
+        from stats.cache import bump_generations, SCOPE_YEAR, SCOPE_PERIOD, SCOPE_GROUP
+        from .models import StudentGroup
+        group_ids = StudentGroup.objects.filter(students__id__in=student_ids).values_list('id', flat=True).distinct()
+        scopes = [(SCOPE_YEAR, self.academic_year.pk)] + [(SCOPE_PERIOD, period_id) for period_id in study_period_ids]\
+            + [(SCOPE_GROUP, group_id) for group_id in group_ids]
+        transaction.on_commit(lambda: bump_generations(scopes))
@@ -0,0 +1,427 @@
+import abc
+import codecs
+import csv
+import datetime
+import logging
+import uuid
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import ValidationError as DRFValidationError
+from notifications.models import UserNotificationSettings
+from users.models import Profile
+from .models import AcademicYear, SubjectType, Subject, Classroom, StudentGroup, CurriculumEntry
+from .serializers import LessonTemplateItemSerializer, ScheduleTemplateImportSerializer
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+
+# Класс ScheduleTemplateImporter - конвейер импорта шаблона расписания.
+# Загруженный CSV не читается в память целиком: методы принимают файл и проходят по нему потоково.
+# 1. scan: первый проход собирает ID предметов, преподавателей, аудиторий и записей учебного плана,
+#    число строк и оценку числа занятий; сами строки не сохраняются.
+# 2. _validate: второй проход валидирует каждую строку LessonTemplateItemSerializer; связанные
+#    объекты берутся из предзагрузки (_preload - по одному запросу in_bulk на сущность).
+#    В памяти остаются только провалидированные строки шаблона.
+# 3. dry_run: строит план импорта и возвращает diff (to_create / to_delete / conflicts) без записи в БД.
+# 4. run: выполняет импорт (удаление при clear_existing_schedule, проверка конфликтов, bulk_create),
+#    сообщая прогресс через progress_callback(done, total).
+# Параметры (params): period_start_date, period_end_date (YYYY-MM-DD), student_group_id,
+# academic_year_id (опционально), clear_existing_schedule. Все значения JSON-сериализуемы;
+# для фонового импорта файл сохраняется в хранилище (save_upload), а задаче
+# edu_core.tasks.import_schedule_template_task передается его путь.
+class ScheduleTemplateImporter:
+    # Начиная с какого ожидаемого числа занятий импорт выполняется в фоне
+    ASYNC_LESSONS_THRESHOLD = getattr(settings, 'SCHEDULE_IMPORT_ASYNC_THRESHOLD', 2000)
+    # Каталог хранилища для файлов, ожидающих фонового импорта
+    UPLOAD_DIR = 'imports/schedule_templates'
+    # Ключ предзагрузки -> столбец CSV с ID
+    PRELOAD_COLUMNS = {
+        'subject': 'subject_id',
+        'teacher': 'teacher_id',
+        'classroom': 'classroom_id',
+        'curriculum_entry': 'curriculum_entry_id',
+    }
+
+    def __init__(self, request_user, params, progress_callback=None):
+        self.user = request_user
+        self.params = params
+        self.progress_callback = progress_callback
+        self._scan_result = None
+
+    @staticmethod
+    def iter_csv_rows(file_obj):
+        # Итерация по UploadedFile отдает строки (bytes); декодируем инкрементально, BOM отбрасывается
+        for row in csv.DictReader(codecs.iterdecode(file_obj, 'utf-8-sig')):
+            yield row
+
+    # Сохраняет загруженный файл в хранилище по умолчанию и возвращает его путь (для фоновой задачи).
+    @classmethod
+    def save_upload(cls, file_obj):
+        file_obj.seek(0)
+        return default_storage.save(f"{cls.UPLOAD_DIR}/{uuid.uuid4().hex}.csv", file_obj)
+
+    def _iter_rows(self, file_obj):
+        file_obj.seek(0)
+        return self.iter_csv_rows(file_obj)
+
+    # Число дней периода импорта по дням недели ({weekday: count}); пусто при некорректных датах.
+    def _weekday_counts(self):
+        try:
+            start = datetime.datetime.strptime(self.params.get('period_start_date') or '', '%Y-%m-%d').date()
+            end = datetime.datetime.strptime(self.params.get('period_end_date') or '', '%Y-%m-%d').date()
+        except ValueError:
+            return {}
+        total_days = (end - start).days + 1
+        weekday_counts = {}
+        for offset in range(max(0, min(total_days, 7))):
+            weekday = (start + datetime.timedelta(days=offset)).weekday()
+            weekday_counts[weekday] = (total_days - offset + 6) // 7
+        return weekday_counts
+
+    # Первый потоковый проход по файлу: {'rows_count', 'lessons_estimate', 'ids'}.
+    # Результат запоминается, поэтому повторные вызовы (оценка, затем импорт) не перечитывают файл.
+    def scan(self, file_obj):
+        if self._scan_result is not None:
+            return self._scan_result
+        weekday_counts = self._weekday_counts()
+        ids = {preload_key: set() for preload_key in self.PRELOAD_COLUMNS}
+        rows_count = lessons_estimate = 0
+        for row in self._iter_rows(file_obj):
+            rows_count += 1
+            for preload_key, column in self.PRELOAD_COLUMNS.items():
+                try:
+                    ids[preload_key].add(int(row.get(column)))
+                except (TypeError, ValueError):
+                    pass # Некорректное значение сообщит сериализатор строки
+            try:
+                lessons_estimate += weekday_counts.get(int(row.get('day_of_week')), 0)
+            except (TypeError, ValueError):
+                pass
+        self._scan_result = {'rows_count': rows_count, 'lessons_estimate': lessons_estimate, 'ids': ids}
+        return self._scan_result
+
+    def _preload(self, ids):
+        return {
+            'subject': Subject.objects.in_bulk(ids['subject']),
+            'teacher': User.objects.filter(role=User.Role.TEACHER).in_bulk(ids['teacher']),
+            'classroom': Classroom.objects.in_bulk(ids['classroom']),
+            'curriculum_entry': CurriculumEntry.objects.in_bulk(ids['curriculum_entry']),
+        }
+
+    # Второй потоковый проход: валидирует строки по одной и возвращает (сериализатор импорта, строки).
+    # Ошибки возвращаются в формате ListSerializer - список по строкам, {} для корректных.
+    def _validate(self, file_obj):
+        context = {
+            'request_user': self.user,
+            'period_start_date': self.params.get('period_start_date'),
+            'period_end_date': self.params.get('period_end_date'),
+            'student_group_id': self.params.get('student_group_id'),
+            'academic_year_id': self.params.get('academic_year_id'),
+            'clear_existing_schedule': self.params.get('clear_existing_schedule'),
+            'preloaded': self._preload(self.scan(file_obj)['ids']),
+            'progress_callback': self.progress_callback,
+        }
+        validated_rows, errors = [], []
+        for row in self._iter_rows(file_obj):
+            item_serializer = LessonTemplateItemSerializer(data=row, context=context)
+            if item_serializer.is_valid():
+                validated_rows.append(item_serializer.validated_data)
+                errors.append({})
+            else:
+                errors.append(item_serializer.errors)
+        if any(errors):
+            raise DRFValidationError(errors)
+        return ScheduleTemplateImportSerializer(context=context), validated_rows
+
+    def estimate_lessons_count(self, file_obj):
+        """Оценка числа создаваемых занятий (строки шаблона x количество соответствующих дней недели)."""
+        return self.scan(file_obj)['lessons_estimate']
+
+    def dry_run(self, file_obj):
+        serializer, validated_rows = self._validate(file_obj)
+        return serializer.preview(validated_rows)
+
+    def run(self, file_obj):
+        serializer, validated_rows = self._validate(file_obj)
+        created_count = serializer.create(validated_rows)
+        logger.info(f"Импорт шаблона расписания пользователем {getattr(self.user, 'email', self.user)}: создано занятий {created_count}.")
+        return {
+            "message": str(_("Импорт шаблона расписания успешно завершен.")),
+            "created_lessons_count": created_count,
+        }
+
+
+# --- Массовые импортеры справочников (преподаватели, предметы, учебные группы) ---
+
+# Создает пользователей пакетно вместе с профилем и настройками уведомлений.
+# bulk_create не вызывает save()/post_save, поэтому Profile (создается в CustomUserManager.create_user)
+# и UserNotificationSettings (создаются сигналом) добавляются здесь тоже пакетно.
+# Пароль новых пользователей - непригодный для входа; доступ выдается через сброс пароля.
+def bulk_create_users(users):
+    if not users:
+        return []
+    for user in users:
+        user.set_unusable_password()
+    created_users = User.objects.bulk_create(users, batch_size=BulkUpsertImporter.BATCH_SIZE)
+    Profile.objects.bulk_create([Profile(user=user) for user in created_users], ignore_conflicts=True, batch_size=BulkUpsertImporter.BATCH_SIZE)
+    UserNotificationSettings.objects.bulk_create(
+        [UserNotificationSettings(user=user) for user in created_users], ignore_conflicts=True, batch_size=BulkUpsertImporter.BATCH_SIZE
+    )
+    return created_users
+
+
+# bulk_create и DELETE по through-таблице не отправляют сигналы (stats.signals), поэтому кэш
+# статистики затронутых областей инвалидируется явно после фиксации транзакции импорта.
+# Пустой список областей увеличивает только глобальное поколение.
+def bump_stats_on_commit(scopes):
+    from stats.cache import bump_generations
+    transaction.on_commit(lambda: bump_generations(scopes))
+
+
+# Абстрактный базовый класс set-based импортера.
+# Подклассы реализуют import_rows(validated_rows): импортируют строки и возвращают self.stats.
+# Существующие записи ищутся по естественному ключу одним запросом, изменения пишутся
+# через bulk_create(update_conflicts=True), строки без изменений не трогаются.
+# Дубликаты естественного ключа в файле схлопываются (побеждает последняя строка).
+class BulkUpsertImporter(abc.ABC):
+    BATCH_SIZE = 1000
+
+    def __init__(self):
+        self.stats = {'created': 0, 'updated': 0, 'unchanged': 0}
+
+    @staticmethod
+    def _dedupe(rows, key_func):
+        unique_rows = {}
+        for row in rows:
+            unique_rows[key_func(row)] = row
+        return unique_rows
+
+    @staticmethod
+    def _has_changes(instance, values):
+        return any(getattr(instance, field_name) != value for field_name, value in values.items())
+
+    @abc.abstractmethod
+    def import_rows(self, validated_rows):
+        ...
+
+
+# Импорт преподавателей по email: новые создаются (с профилем и настройками уведомлений),
+# у существующих обновляются ФИО, роль и флаги активности, если они отличаются.
+class TeacherBulkImporter(BulkUpsertImporter):
+    UPDATE_FIELDS = ['first_name', 'last_name', 'patronymic', 'role', 'is_active', 'is_role_confirmed']
+
+    def _values(self, row):
+        return {
+            'first_name': row['first_name'],
+            'last_name': row['last_name'],
+            'patronymic': row.get('patronymic', ''),
+            'role': User.Role.TEACHER, 'is_active': True, 'is_role_confirmed': True,
+        }
+
+    def import_rows(self, validated_rows):
+        rows_by_email = self._dedupe(validated_rows, lambda row: row['email'])
+        existing = User.objects.in_bulk(list(rows_by_email), field_name='email')
+
+        to_create, to_update = [], []
+        for email, row in rows_by_email.items():
+            values = self._values(row)
+            user = existing.get(email)
+            if user is None:
+                to_create.append(User(email=email, **values))
+            elif self._has_changes(user, values):
+                # Новый экземпляр без pk: конфликт по email превращается в UPDATE только UPDATE_FIELDS
+                to_update.append(User(email=email, **values))
+            else:
+                self.stats['unchanged'] += 1
+
+        bulk_create_users(to_create)
+        if to_update:
+            # Обновление по естественному ключу: INSERT ... ON CONFLICT (email) DO UPDATE
+            User.objects.bulk_create(
+                to_update, update_conflicts=True, unique_fields=['email'],
+                update_fields=self.UPDATE_FIELDS, batch_size=self.BATCH_SIZE
+            )
+        self.stats['created'] += len(to_create)
+        self.stats['updated'] += len(to_update)
+        if to_create or to_update: bump_stats_on_commit([])
+        return self.stats
+
+
+# Импорт предметов по названию. Типы предметов (subject_type_name) создаются недостающие,
+# все сразу; поля, отсутствующие в строке файла, у существующих предметов не меняются.
+class SubjectBulkImporter(BulkUpsertImporter):
+    UPDATE_FIELDS = ['code', 'description', 'subject_type']
+
+    def _resolve_subject_types(self, type_names):
+        subject_types = SubjectType.objects.in_bulk(type_names, field_name='name')
+        missing = [name for name in type_names if name not in subject_types]
+        if missing:
+            SubjectType.objects.bulk_create([SubjectType(name=name) for name in missing], ignore_conflicts=True)
+            subject_types = SubjectType.objects.in_bulk(type_names, field_name='name')
+        return subject_types
+
+    def import_rows(self, validated_rows):
+        rows_by_name = self._dedupe(validated_rows, lambda row: row['name'])
+        type_names = {row['subject_type_name'] for row in rows_by_name.values() if row.get('subject_type_name')}
+        subject_types = self._resolve_subject_types(type_names)
+        existing = Subject.objects.in_bulk(list(rows_by_name), field_name='name')
+
+        to_create, to_update = [], []
+        for name, row in rows_by_name.items():
+            subject = existing.get(name)
+            subject_type = subject_types.get(row['subject_type_name']) if row.get('subject_type_name') else None
+            values = {'subject_type_id': subject_type.pk if subject_type else None}
+            for field_name in ('code', 'description'):
+                if field_name in row:
+                    values[field_name] = row[field_name] or (None if field_name == 'code' else '')
+            if subject is None:
+                to_create.append(Subject(name=name, **values))
+            elif self._has_changes(subject, values):
+                merged_values = {'code': subject.code, 'description': subject.description, **values}
+                to_update.append(Subject(name=name, **merged_values))
+            else:
+                self.stats['unchanged'] += 1
+
+        Subject.objects.bulk_create(to_create, batch_size=self.BATCH_SIZE)
+        if to_update:
+            Subject.objects.bulk_create(
+                to_update, update_conflicts=True, unique_fields=['name'],
+                update_fields=self.UPDATE_FIELDS, batch_size=self.BATCH_SIZE
+            )
+        self.stats['created'] += len(to_create)
+        self.stats['updated'] += len(to_update)
+        if to_create or to_update: bump_stats_on_commit([])
+        return self.stats
+
+
+# Импорт учебных групп по (название, учебный год) с составом студентов.
+# - Учебные годы и кураторы разрешаются одним запросом каждый; ошибки по всем строкам
+#   собираются и возвращаются разом до любых изменений.
+# - Недостающие студенты создаются пакетно (bulk_create_users).
+# - Состав группы синхронизируется diff'ом по through-таблице: недостающие связи
+#   вставляются пакетно, лишние удаляются одним DELETE. Пустой student_emails состав не меняет.
+class StudentGroupBulkImporter(BulkUpsertImporter):
+    def __init__(self):
+        super().__init__()
+        self.stats.update({'students_created': 0, 'memberships_added': 0, 'memberships_removed': 0})
+
+    @staticmethod
+    def _parse_emails(raw_value):
+        return [email.strip() for email in (raw_value or '').split(';') if email.strip()]
+
+    def _resolve_students(self, emails):
+        students = User.objects.in_bulk(emails, field_name='email')
+        new_students = [
+            User(email=email, role=User.Role.STUDENT, is_active=True, is_role_confirmed=True) # Упрощенно
+            for email in emails if email not in students
+        ]
+        for student in bulk_create_users(new_students):
+            students[student.email] = student
+        self.stats['students_created'] += len(new_students)
+        return students
+
+    def import_rows(self, validated_rows):
+        rows_by_key = self._dedupe(validated_rows, lambda row: (row['group_name'], row['academic_year_name']))
+
+        year_names = {year_name for _group_name, year_name in rows_by_key}
+        academic_years = AcademicYear.objects.in_bulk(year_names, field_name='name')
+        curator_emails = {row['curator_email'] for row in rows_by_key.values() if row.get('curator_email')}
+        curators = User.objects.filter(role=User.Role.TEACHER).in_bulk(curator_emails, field_name='email')
+
+        errors = []
+        for year_name in sorted(year_names - set(academic_years)):
+            errors.append(f"Учебный год '{year_name}' не найден.")
+        for email in sorted(curator_emails - set(curators)):
+            errors.append(f"Куратор с email '{email}' не найден или не является преподавателем.")
+        if errors:
+            raise DRFValidationError(errors)
+
+        existing_groups = {
+            (group.name, group.academic_year_id): group
+            for group in StudentGroup.objects.filter(
+                name__in={group_name for group_name, _year_name in rows_by_key},
+                academic_year__in=academic_years.values()
+            )
+        }
+
+        to_create, to_update = [], []
+        changed_group_ids = set()
+        for (group_name, year_name), row in rows_by_key.items():
+            academic_year = academic_years[year_name]
+            curator = curators.get(row['curator_email']) if row.get('curator_email') else None
+            group = existing_groups.get((group_name, academic_year.pk))
+            if group is None:
+                group = StudentGroup(name=group_name, academic_year=academic_year, curator=curator)
+                to_create.append(group)
+                existing_groups[(group_name, academic_year.pk)] = group
+            elif group.curator_id != (curator.pk if curator else None):
+                to_update.append(StudentGroup(name=group_name, academic_year=academic_year, curator=curator))
+                changed_group_ids.add(group.pk)
+            else:
+                self.stats['unchanged'] += 1
+
+        StudentGroup.objects.bulk_create(to_create, batch_size=self.BATCH_SIZE)
+        if to_update:
+            StudentGroup.objects.bulk_create(
+                to_update, update_conflicts=True, unique_fields=['name', 'academic_year'],
+                update_fields=['curator'], batch_size=self.BATCH_SIZE
+            )
+        self.stats['created'] += len(to_create)
+        self.stats['updated'] += len(to_update)
+
+        changed_group_ids |= self._sync_memberships(rows_by_key, academic_years, existing_groups)
+        changed_group_ids |= {group.pk for group in to_create}
+        if changed_group_ids:
+            from stats.cache import SCOPE_YEAR, SCOPE_GROUP
+            bump_stats_on_commit([(SCOPE_YEAR, year.pk) for year in academic_years.values()] + [(SCOPE_GROUP, group_id) for group_id in changed_group_ids])
+        return self.stats
+
+    # Возвращает ID групп, состав которых изменился.
+    def _sync_memberships(self, rows_by_key, academic_years, groups_by_key):
+        desired_by_group = {}
+        all_emails = set()
+        for (group_name, year_name), row in rows_by_key.items():
+            emails = self._parse_emails(row.get('student_emails'))
+            if not emails:
+                continue
+            group = groups_by_key[(group_name, academic_years[year_name].pk)]
+            desired_by_group[group.pk] = emails
+            all_emails.update(emails)
+        if not desired_by_group:
+            return set()
+
+        students = self._resolve_students(all_emails)
+        desired_pairs = {
+            (group_id, students[email].pk)
+            for group_id, emails in desired_by_group.items() for email in emails
+        }
+
+        Membership = StudentGroup.students.through
+        current = {
+            (group_id, user_id): membership_id
+            for membership_id, group_id, user_id in Membership.objects.filter(
+                studentgroup_id__in=desired_by_group
+            ).values_list('id', 'studentgroup_id', 'user_id')
+        }
+
+        to_add = [Membership(studentgroup_id=group_id, user_id=user_id) for group_id, user_id in desired_pairs - set(current)]
+        to_remove_ids = [membership_id for pair, membership_id in current.items() if pair not in desired_pairs]
+        Membership.objects.bulk_create(to_add, ignore_conflicts=True, batch_size=self.BATCH_SIZE)
+        # ignore_conflicts пропускает связи, добавленные параллельно, - учитываются только вставленные строки
+        memberships_added = Membership.objects.filter(studentgroup_id__in=desired_by_group).count() - len(current)
+        memberships_removed = Membership.objects.filter(id__in=to_remove_ids).delete()[0] if to_remove_ids else 0
+        self.stats['memberships_added'] += memberships_added
+        self.stats['memberships_removed'] += memberships_removed
+        removed_pairs = [pair for pair, membership_id in current.items() if pair not in desired_pairs]
+        return {membership.studentgroup_id for membership in to_add} | {group_id for group_id, _user_id in removed_pairs}
+
+
+BULK_IMPORTERS = {
+    'teachers': TeacherBulkImporter,
+    'subjects': SubjectBulkImporter,
+    'student-groups': StudentGroupBulkImporter,
+}
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2025-06-02 10:15
+
+import django.contrib.postgres.constraints
+import django.contrib.postgres.fields.ranges
+import edu_core.models
+from django.contrib.postgres.operations import BtreeGistExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edu_core', '0008_alter_subjectmaterialattachment_file'),
+    ]
+
+    operations = [
+        # btree_gist нужен для оператора '=' по внешним ключам внутри GiST-индекса
+        BtreeGistExtension(),
+        migrations.AddConstraint(
+            model_name='lesson',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(expressions=[(edu_core.models.TsTzRange('start_time', 'end_time', django.contrib.postgres.fields.ranges.RangeBoundary()), '&&'), ('teacher', '=')], name='edu_core_lesson_teacher_no_overlap', violation_error_message='Преподаватель занят в это время на другом занятии.'),
+        ),
+        migrations.AddConstraint(
+            model_name='lesson',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(expressions=[(edu_core.models.TsTzRange('start_time', 'end_time', django.contrib.postgres.fields.ranges.RangeBoundary()), '&&'), ('student_group', '=')], name='edu_core_lesson_group_no_overlap', violation_error_message='Группа занята в это время на другом занятии.'),
+        ),
+        migrations.AddConstraint(
+            model_name='lesson',
+            constraint=django.contrib.postgres.constraints.ExclusionConstraint(expressions=[(edu_core.models.TsTzRange('start_time', 'end_time', django.contrib.postgres.fields.ranges.RangeBoundary()), '&&'), ('classroom', '=')], name='edu_core_lesson_classroom_no_overlap', violation_error_message='Аудитория занята в это время на другом занятии.'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2025-06-02 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edu_core', '0009_lesson_overlap_exclusion_constraints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='duration_minutes',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='продолжительность, мин.'),
+        ),
+        # Заполнение продолжительности для уже существующих занятий
+        migrations.RunSQL(
+            sql="UPDATE edu_core_lesson SET duration_minutes = GREATEST(0, FLOOR(EXTRACT(EPOCH FROM (end_time - start_time)) / 60))::integer;",
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
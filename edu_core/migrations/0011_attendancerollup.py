@@ -0,0 +1,55 @@
+# Generated by Django 5.1.7 on 2025-06-04 10:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edu_core', '0010_lesson_duration_minutes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_count', models.PositiveIntegerField(default=0, verbose_name='всего записей')),
+                ('present_count', models.PositiveIntegerField(default=0, verbose_name='присутствовал')),
+                ('absent_valid_count', models.PositiveIntegerField(default=0, verbose_name='отсутствовал по ув. причине')),
+                ('absent_invalid_count', models.PositiveIntegerField(default=0, verbose_name='отсутствовал по неув. причине')),
+                ('late_count', models.PositiveIntegerField(default=0, verbose_name='опоздал')),
+                ('remote_count', models.PositiveIntegerField(default=0, verbose_name='дистанционно')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='обновлено')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_rollups', to=settings.AUTH_USER_MODEL, verbose_name='студент')),
+                ('study_period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_rollups', to='edu_core.studyperiod', verbose_name='учебный период')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_rollups', to='edu_core.subject', verbose_name='предмет')),
+            ],
+            options={
+                'verbose_name': 'агрегат посещаемости',
+                'verbose_name_plural': 'агрегаты посещаемости',
+                'indexes': [models.Index(fields=['study_period', 'subject'], name='edu_core_at_study_p_ba1948_idx')],
+                'unique_together': {('student', 'subject', 'study_period')},
+            },
+        ),
+        # Начальное заполнение агрегатов по существующим записям посещаемости
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO edu_core_attendancerollup
+                    (student_id, subject_id, study_period_id, total_count, present_count, absent_valid_count,
+                     absent_invalid_count, late_count, remote_count, updated_at)
+                SELECT a.student_id, l.subject_id, l.study_period_id, COUNT(*),
+                       COUNT(*) FILTER (WHERE a.status = 'P'), COUNT(*) FILTER (WHERE a.status = 'V'),
+                       COUNT(*) FILTER (WHERE a.status = 'N'), COUNT(*) FILTER (WHERE a.status = 'L'),
+                       COUNT(*) FILTER (WHERE a.status = 'R'), NOW()
+                FROM edu_core_attendance a
+                JOIN edu_core_lessonjournalentry j ON j.id = a.journal_entry_id
+                JOIN edu_core_lesson l ON l.id = j.lesson_id
+                GROUP BY a.student_id, l.subject_id, l.study_period_id;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
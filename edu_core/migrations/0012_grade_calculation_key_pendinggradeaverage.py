@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2025-06-05 09:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edu_core', '0011_attendancerollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='grade',
+            name='calculation_key',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True, verbose_name='ключ расчетной оценки'),
+        ),
+        migrations.CreateModel(
+            name='PendingGradeAverage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('marked_at', models.DateTimeField(auto_now=True, verbose_name='изменено')),
+                ('academic_year', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_grade_averages', to='edu_core.academicyear', verbose_name='учебный год')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_grade_averages', to=settings.AUTH_USER_MODEL, verbose_name='студент')),
+            ],
+            options={
+                'verbose_name': 'ожидающий расчет средних',
+                'verbose_name_plural': 'ожидающие расчет средних',
+                'unique_together': {('student', 'academic_year')},
+            },
+        ),
+    ]
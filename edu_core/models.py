@@ -5,7 +5,10 @@ from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
-from django.db.models import Q, F, Sum
+from django.db.models import Q, F, Sum, Count, Func, Value
+from django.db.models.functions import Coalesce
+from django.contrib.postgres.constraints import ExclusionConstraint
+from django.contrib.postgres.fields import DateTimeRangeField, RangeBoundary, RangeOperators
 from taggit.managers import TaggableManager # Если используется, оставить
 import datetime
 
@@ -231,12 +234,23 @@ class Curriculum(models.Model):
     def __str__(self):
         return f"{self.name} для {self.student_group.name} ({self.academic_year.name})"
 
+# QuerySet для CurriculumEntry.
+# with_scheduled_minutes() добавляет аннотацию scheduled_minutes - сумму Lesson.duration_minutes
+# связанных занятий, посчитанную одним сгруппированным запросом (LEFT JOIN + GROUP BY)
+# для всех записей сразу, вместо отдельного aggregate() на каждую запись.
+class CurriculumEntryQuerySet(models.QuerySet):
+    def with_scheduled_minutes(self):
+        return self.annotate(
+            scheduled_minutes=Coalesce(Sum('scheduled_lessons__duration_minutes'), Value(0))
+        )
+
 # Модель CurriculumEntry представляет запись в учебном плане (конкретный предмет, преподаватель, часы).
 # - curriculum: Связь с учебным планом.
 # - subject, teacher, study_period: Связи с предметом, преподавателем и учебным периодом.
 # - planned_hours: Количество запланированных часов по предмету в данном периоде.
 # Свойства scheduled_hours и remaining_hours вычисляют количество часов, уже запланированных
-# в расписании, и оставшееся количество часов соответственно.
+# в расписании, и оставшееся количество часов соответственно. Если запись получена через
+# CurriculumEntry.objects.with_scheduled_minutes(), используется аннотация без дополнительных запросов.
 class CurriculumEntry(models.Model):
     curriculum = models.ForeignKey(Curriculum, on_delete=models.CASCADE, related_name='entries', verbose_name=_("учебный план"))
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='curriculum_entries', verbose_name=_("предмет"))
@@ -250,6 +264,8 @@ class CurriculumEntry(models.Model):
     study_period = models.ForeignKey(StudyPeriod, on_delete=models.CASCADE, related_name='curriculum_entries', verbose_name=_("учебный период"))
     planned_hours = models.PositiveIntegerField(_("запланировано часов в периоде"))
 
+    objects = CurriculumEntryQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("запись учебного плана")
         verbose_name_plural = _("записи учебного плана")
@@ -262,12 +278,16 @@ class CurriculumEntry(models.Model):
 
     @property
     def scheduled_hours(self):
-        total_duration = Lesson.objects.filter(
-            curriculum_entry=self
-        ).aggregate(
-            total_duration=Sum(F('end_time') - F('start_time'))
-        )['total_duration']
-        return total_duration.total_seconds() / 3600 if total_duration else 0.0 # Возвращаем float
+        scheduled_minutes = getattr(self, 'scheduled_minutes', None)
+        if scheduled_minutes is None:
+            # Нет аннотации - считаем по сохраненной длительности занятий (один запрос)
+            scheduled_minutes = Lesson.objects.filter(
+                curriculum_entry=self
+            ).aggregate(
+                total_minutes=Sum('duration_minutes')
+            )['total_minutes'] or 0
+            self.scheduled_minutes = scheduled_minutes # Кэшируем для remaining_hours
+        return scheduled_minutes / 60 # Возвращаем float
 
     @property
     def remaining_hours(self):
@@ -275,6 +295,41 @@ class CurriculumEntry(models.Model):
 
 # --- 3. Расписание Занятий ---
 
+# Выражение tstzrange(start_time, end_time, '[)') для ограничений-исключений занятий.
+# Полуоткрытый интервал: занятия "встык" (конец одного = начало другого) не конфликтуют,
+# что совпадает с проверкой в Lesson.clean().
+class TsTzRange(Func):
+    function = 'TSTZRANGE'
+    output_field = DateTimeRangeField()
+
+# Ограничения-исключения (GiST) на пересечение занятий по ресурсу.
+# Ключ - имя ограничения в БД, значение - поле Lesson, по которому обнаружен конфликт.
+LESSON_OVERLAP_CONSTRAINT_FIELDS = {
+    'edu_core_lesson_teacher_no_overlap': 'teacher',
+    'edu_core_lesson_group_no_overlap': 'student_group',
+    'edu_core_lesson_classroom_no_overlap': 'classroom',
+}
+
+LESSON_OVERLAP_MESSAGES = {
+    'teacher': _("Преподаватель занят в это время на другом занятии."),
+    'student_group': _("Группа занята в это время на другом занятии."),
+    'classroom': _("Аудитория занята в это время на другом занятии."),
+}
+
+# Определяет, нарушено ли IntegrityError'ом одно из ограничений пересечения занятий.
+# Возвращает имя поля Lesson ('teacher', 'student_group', 'classroom') или None.
+def get_lesson_overlap_field(exc):
+    cause = getattr(exc, '__cause__', None)
+    diag = getattr(cause, 'diag', None)
+    constraint_name = getattr(diag, 'constraint_name', None)
+    if constraint_name:
+        return LESSON_OVERLAP_CONSTRAINT_FIELDS.get(constraint_name)
+    # Фолбэк, если драйвер не предоставил diag: ищем имя ограничения в тексте ошибки
+    for name, field_name in LESSON_OVERLAP_CONSTRAINT_FIELDS.items():
+        if name in str(exc):
+            return field_name
+    return None
+
 # Модель Lesson представляет занятие (урок) в расписании.
 # - LessonType: Перечисление типов занятий (лекция, практика и т.д.).
 # - study_period, student_group, subject, teacher, classroom: Связи с соответствующими сущностями.
@@ -282,9 +337,15 @@ class CurriculumEntry(models.Model):
 # - start_time, end_time: Время начала и окончания.
 # - curriculum_entry: (Опционально) Связь с записью учебного плана.
 # - created_by: Пользователь, создавший занятие.
+# - duration_minutes: Сохраненная продолжительность занятия в минутах (заполняется в save()
+#   и при массовом создании через Lesson.compute_duration_minutes), чтобы агрегаты по часам
+#   считались через SUM по целому столбцу, а не по разности времени.
 # Свойство duration_hours вычисляет продолжительность занятия в часах.
 # Валидация (clean): проверяет корректность времени, нахождение в пределах периода,
 # отсутствие конфликтов (преподаватель, группа, аудитория заняты), соответствие вместимости аудитории.
+# Проверка конфликтов в clean() - быстрая предварительная; гарантию дают ограничения-исключения
+# в Meta.constraints (GiST по tstzrange(start_time, end_time)), которые действуют и для bulk_create,
+# и для конкурентных запросов.
 class Lesson(models.Model):
     class LessonType(models.TextChoices):
         LECTURE = 'LECTURE', _('Лекция')
@@ -310,6 +371,7 @@ class Lesson(models.Model):
     lesson_type = models.CharField(_('тип занятия'), max_length=20, choices=LessonType.choices, default=LessonType.LECTURE)
     start_time = models.DateTimeField(_('время начала'))
     end_time = models.DateTimeField(_('время окончания'))
+    duration_minutes = models.PositiveIntegerField(_('продолжительность, мин.'), default=0, editable=False)
     curriculum_entry = models.ForeignKey(
         CurriculumEntry,
         on_delete=models.SET_NULL, null=True, blank=True,
@@ -334,6 +396,33 @@ class Lesson(models.Model):
             models.Index(fields=['student_group', 'start_time']),
             models.Index(fields=['classroom', 'start_time']),
         ]
+        constraints = [
+            ExclusionConstraint(
+                name='edu_core_lesson_teacher_no_overlap',
+                expressions=[
+                    (TsTzRange('start_time', 'end_time', RangeBoundary()), RangeOperators.OVERLAPS),
+                    ('teacher', RangeOperators.EQUAL),
+                ],
+                violation_error_message=LESSON_OVERLAP_MESSAGES['teacher'],
+            ),
+            ExclusionConstraint(
+                name='edu_core_lesson_group_no_overlap',
+                expressions=[
+                    (TsTzRange('start_time', 'end_time', RangeBoundary()), RangeOperators.OVERLAPS),
+                    ('student_group', RangeOperators.EQUAL),
+                ],
+                violation_error_message=LESSON_OVERLAP_MESSAGES['student_group'],
+            ),
+            # NULL-аудитория никогда не равна другой, поэтому занятия без аудитории не конфликтуют
+            ExclusionConstraint(
+                name='edu_core_lesson_classroom_no_overlap',
+                expressions=[
+                    (TsTzRange('start_time', 'end_time', RangeBoundary()), RangeOperators.OVERLAPS),
+                    ('classroom', RangeOperators.EQUAL),
+                ],
+                violation_error_message=LESSON_OVERLAP_MESSAGES['classroom'],
+            ),
+        ]
 
     def __str__(self):
         return f"{self.subject.name} - {self.student_group.name} ({self.start_time.strftime('%d.%m %H:%M')})"
@@ -344,6 +433,19 @@ class Lesson(models.Model):
             return (self.end_time - self.start_time).total_seconds() / 3600
         return 0
 
+    @staticmethod
+    def compute_duration_minutes(start_time, end_time):
+        if start_time and end_time and end_time > start_time:
+            return int((end_time - start_time).total_seconds() // 60)
+        return 0
+
+    def save(self, *args, **kwargs):
+        self.duration_minutes = self.compute_duration_minutes(self.start_time, self.end_time)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'start_time', 'end_time'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'duration_minutes'}
+        super().save(*args, **kwargs)
+
     def clean(self):
         if self.start_time >= self.end_time:
             raise ValidationError(_('Время окончания должно быть позже времени начала.'))
@@ -358,11 +460,11 @@ class Lesson(models.Model):
         
         errors = {}
         if self.teacher and conflicting_lessons.filter(teacher=self.teacher).exists():
-            errors['teacher'] = _("Преподаватель занят в это время на другом занятии.")
+            errors['teacher'] = LESSON_OVERLAP_MESSAGES['teacher']
         if conflicting_lessons.filter(student_group=self.student_group).exists():
-            errors['student_group'] = _("Группа занята в это время на другом занятии.")
+            errors['student_group'] = LESSON_OVERLAP_MESSAGES['student_group']
         if self.classroom and conflicting_lessons.filter(classroom=self.classroom).exists():
-            errors['classroom'] = _("Аудитория занята в это время на другом занятии.")
+            errors['classroom'] = LESSON_OVERLAP_MESSAGES['classroom']
         if errors:
             raise ValidationError(errors)
 
@@ -583,6 +685,9 @@ class Attendance(models.Model):
         LATE = 'L', _('Опоздал (О)')
         REMOTE = 'R', _('Дистанционно (Д)')
 
+    # Статусы, при которых студент считается присутствовавшим на занятии.
+    PRESENT_STATUSES = (Status.PRESENT, Status.LATE, Status.REMOTE)
+
     journal_entry = models.ForeignKey(LessonJournalEntry, on_delete=models.CASCADE, related_name='attendances', verbose_name=_("запись в журнале"))
     student = models.ForeignKey(
         settings.AUTH_USER_MODEL,
@@ -618,6 +723,108 @@ class Attendance(models.Model):
             self.marked_by_id = self.journal_entry.lesson.teacher_id
         super().save(*args, **kwargs)
 
+# Модель AttendanceRollup - агрегат посещаемости по ключу (студент, предмет, учебный период).
+# Хранит количество записей посещаемости всего и по каждому статусу, чтобы сводки
+# посещаемости за период/год считались по агрегатам, а не по всем записям Attendance.
+# Поддерживается инкрементально сигналами (edu_core.signals) при записи/удалении Attendance
+# и при смене предмета/периода занятия: пересчитываются только затронутые ключи
+# (refresh_for_keys). rebuild() полностью перестраивает агрегаты (команда rebuild_attendance_rollups).
+class AttendanceRollup(models.Model):
+    # Соответствие статуса посещаемости полю-счетчику.
+    STATUS_COUNT_FIELDS = {
+        Attendance.Status.PRESENT: 'present_count',
+        Attendance.Status.ABSENT_VALID: 'absent_valid_count',
+        Attendance.Status.ABSENT_INVALID: 'absent_invalid_count',
+        Attendance.Status.LATE: 'late_count',
+        Attendance.Status.REMOTE: 'remote_count',
+    }
+    COUNT_FIELDS = ('total_count', *STATUS_COUNT_FIELDS.values())
+    REBUILD_BATCH_SIZE = 1000
+
+    student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='attendance_rollups', verbose_name=_("студент"))
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE, related_name='attendance_rollups', verbose_name=_("предмет"))
+    study_period = models.ForeignKey(StudyPeriod, on_delete=models.CASCADE, related_name='attendance_rollups', verbose_name=_("учебный период"))
+    total_count = models.PositiveIntegerField(_("всего записей"), default=0)
+    present_count = models.PositiveIntegerField(_("присутствовал"), default=0)
+    absent_valid_count = models.PositiveIntegerField(_("отсутствовал по ув. причине"), default=0)
+    absent_invalid_count = models.PositiveIntegerField(_("отсутствовал по неув. причине"), default=0)
+    late_count = models.PositiveIntegerField(_("опоздал"), default=0)
+    remote_count = models.PositiveIntegerField(_("дистанционно"), default=0)
+    updated_at = models.DateTimeField(_("обновлено"), auto_now=True)
+
+    class Meta:
+        verbose_name = _("агрегат посещаемости")
+        verbose_name_plural = _("агрегаты посещаемости")
+        unique_together = ('student', 'subject', 'study_period')
+        indexes = [models.Index(fields=['study_period', 'subject'])]
+
+    def __str__(self):
+        return f"Посещаемость: студент {self.student_id}, предмет {self.subject_id}, период {self.study_period_id}"
+
+    @property
+    def attended_count(self):
+        return self.present_count + self.late_count + self.remote_count
+
+    # Выражения условной агрегации (один проход по записям) для счетчиков агрегата.
+    # prefix - путь до Attendance при агрегации через связи (например, 'attendance_records__').
+    @classmethod
+    def count_expressions(cls, prefix=''):
+        expressions = {'total_count': Count(f'{prefix}id')}
+        for status_value, field_name in cls.STATUS_COUNT_FIELDS.items():
+            expressions[field_name] = Count(f'{prefix}id', filter=Q(**{f'{prefix}status': status_value}))
+        return expressions
+
+    # Сгруппированная по (студент, предмет, период) агрегация записей посещаемости.
+    @classmethod
+    def _aggregate_rows(cls, attendance_qs):
+        return attendance_qs.values(
+            'student_id',
+            subject_id=F('journal_entry__lesson__subject_id'),
+            study_period_id=F('journal_entry__lesson__study_period_id'),
+        ).annotate(**cls.count_expressions()).order_by()
+
+    @classmethod
+    def _upsert_rows(cls, rows):
+        return cls.objects.bulk_create(
+            [cls(**row) for row in rows], batch_size=cls.REBUILD_BATCH_SIZE,
+            update_conflicts=True, unique_fields=['student', 'subject', 'study_period'],
+            update_fields=[*cls.COUNT_FIELDS, 'updated_at'],
+        )
+
+    @staticmethod
+    def _keys_filter(keys, student_field, subject_field, period_field):
+        keys_q = Q()
+        for student_id, subject_id, study_period_id in keys:
+            keys_q |= Q(**{student_field: student_id, subject_field: subject_id, period_field: study_period_id})
+        return keys_q
+
+    # Пересчитывает агрегаты для набора ключей (student_id, subject_id, study_period_id):
+    # один сгруппированный запрос по записям этих ключей и один upsert; ключи без записей удаляются.
+    @classmethod
+    def refresh_for_keys(cls, keys):
+        keys = {tuple(key) for key in keys if all(key)}
+        if not keys: return
+        rows = list(cls._aggregate_rows(Attendance.objects.filter(cls._keys_filter(
+            keys, 'student_id', 'journal_entry__lesson__subject_id', 'journal_entry__lesson__study_period_id'
+        ))))
+        if rows: cls._upsert_rows(rows)
+        empty_keys = keys - {(row['student_id'], row['subject_id'], row['study_period_id']) for row in rows}
+        if empty_keys: cls.objects.filter(cls._keys_filter(empty_keys, 'student_id', 'subject_id', 'study_period_id')).delete()
+
+    # Полностью перестраивает агрегаты (все или для указанных учебных периодов).
+    # Возвращает количество записанных агрегатов.
+    @classmethod
+    def rebuild(cls, study_period_ids=None):
+        attendance_qs = Attendance.objects.all()
+        rollups_qs = cls.objects.all()
+        if study_period_ids is not None:
+            attendance_qs = attendance_qs.filter(journal_entry__lesson__study_period_id__in=study_period_ids)
+            rollups_qs = rollups_qs.filter(study_period_id__in=study_period_ids)
+        rollups_qs.delete()
+        rows = list(cls._aggregate_rows(attendance_qs))
+        cls._upsert_rows(rows)
+        return len(rows)
+
 # Модель Grade представляет оценку студента.
 # - GradeType: Перечисление типов оценок (за работу на занятии, ДЗ, итоговые и т.д.).
 # - student, subject, study_period, academic_year: Связи с соответствующими сущностями.
@@ -631,6 +838,9 @@ class Attendance(models.Model):
 # - comment: Комментарий.
 # - graded_by: Преподаватель, выставивший оценку.
 # - weight: Вес оценки (для расчета средних).
+# - calculation_key: Уникальный ключ расчетной оценки (PERIOD_AVG/YEAR_AVG) вида
+#   'PERIOD_AVG:<студент>:<предмет>:<период>' - цель upsert'а при пакетном расчете средних
+#   (edu_core.grade_averages); у остальных оценок NULL.
 # Валидация (clean): Проверяет согласованность полей (например, годовые оценки не должны быть привязаны к занятию,
 # тип оценки должен соответствовать наличию/отсутствию study_period/academic_year).
 # Метод save автоматически устанавливает graded_by, если не указан.
@@ -647,6 +857,11 @@ class Grade(models.Model):
         YEAR_AVERAGE = 'YEAR_AVG', _('Средняя за год (расчетная)')
         YEAR_FINAL = 'YEAR_FINAL', _('Итог за год (выставленная)')
 
+    # Расчетные оценки (вычисляются пакетно, см. edu_core.grade_averages)
+    CALCULATED_TYPES = (GradeType.PERIOD_AVERAGE, GradeType.YEAR_AVERAGE)
+    # Итоговые оценки за период/год (расчетные и выставленные) - не участвуют в расчете средних
+    SUMMARY_TYPES = (GradeType.PERIOD_AVERAGE, GradeType.PERIOD_FINAL, GradeType.YEAR_AVERAGE, GradeType.YEAR_FINAL)
+
     student = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -698,6 +913,7 @@ class Grade(models.Model):
         limit_choices_to={'role': 'TEACHER'}
     )
     weight = models.PositiveSmallIntegerField(_("вес оценки"), default=1)
+    calculation_key = models.CharField(_("ключ расчетной оценки"), max_length=64, null=True, blank=True, unique=True, editable=False)
 
     class Meta:
         verbose_name = _("оценка")
@@ -781,4 +997,31 @@ class Grade(models.Model):
             self.academic_year = self.study_period.academic_year
         
         # self.full_clean() # Вызов полной валидации перед сохранением
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+# Модель PendingGradeAverage - очередь студентов, у которых изменились текущие оценки
+# в учебном году после последнего расчета средних (PERIOD_AVG/YEAR_AVG).
+# Запись создается/обновляется сигналом при сохранении или удалении оценки и удаляется
+# инкрементальным расчетом (edu_core.grade_averages.GradeAverageCalculator) после обработки студента.
+class PendingGradeAverage(models.Model):
+    student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='pending_grade_averages', verbose_name=_("студент"))
+    academic_year = models.ForeignKey(AcademicYear, on_delete=models.CASCADE, related_name='pending_grade_averages', verbose_name=_("учебный год"))
+    marked_at = models.DateTimeField(_("изменено"), auto_now=True)
+
+    class Meta:
+        verbose_name = _("ожидающий расчет средних")
+        verbose_name_plural = _("ожидающие расчет средних")
+        unique_together = ('student', 'academic_year')
+
+    def __str__(self):
+        return f"Пересчет средних: студент {self.student_id}, год {self.academic_year_id}"
+
+    # Отмечает студентов (student_id, academic_year_id) для пересчета одним upsert'ом.
+    @classmethod
+    def mark(cls, keys):
+        keys = {tuple(key) for key in keys if all(key)}
+        if not keys: return
+        cls.objects.bulk_create(
+            [cls(student_id=student_id, academic_year_id=academic_year_id) for student_id, academic_year_id in keys],
+            update_conflicts=True, unique_fields=['student', 'academic_year'], update_fields=['marked_at'],
+        )
@@ -0,0 +1,259 @@
+import logging
+import re
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import ValidationError as DRFValidationError
+from .models import StudyPeriod, StudentGroup, Curriculum, CurriculumEntry
+
+logger = logging.getLogger(__name__)
+
+_FIRST_NUMBER_RE = re.compile(r'\d+')
+
+
+# Повышает номер курса/класса в названии группы: первое число в названии увеличивается на 1
+# ("10А" -> "11А", "ПИ-1" -> "ПИ-2"). Названия без чисел возвращаются без изменений.
+def promote_group_name(name):
+    return _FIRST_NUMBER_RE.sub(lambda match: str(int(match.group()) + 1).zfill(len(match.group())), name, count=1)
+
+
+# Класс AcademicYearRollover переносит структуру учебного года N в год N+1 набором пакетных вставок:
+# - учебные группы (с повышенными названиями, если promote_group_names) и их кураторы;
+# - учебные планы групп и их записи с переназначением на учебные периоды нового года;
+# - (опционально, carry_memberships) состав групп и старосты.
+# Периоды сопоставляются сначала по названию, затем по порядковому номеру (по дате начала);
+# записи планов для несопоставленных периодов пропускаются и попадают в отчет.
+# Уже существующие в целевом году группы/планы/записи не дублируются, поэтому перенос
+# можно безопасно повторить. Каждая сущность читается одним запросом.
+# Параметры:
+# - exclude_group_ids: ID групп исходного года, которые не переносятся (например, выпускные).
+# - group_name_map: явное сопоставление {исходное название: новое название}, приоритетнее автоповышения.
+class AcademicYearRollover:
+    BATCH_SIZE = 1000
+
+    def __init__(self, source_year, target_year, carry_memberships=False, promote_group_names=True,
+                 exclude_group_ids=None, group_name_map=None, progress_callback=None):
+        if source_year.pk == target_year.pk:
+            raise DRFValidationError({"target_year_id": _("Целевой учебный год должен отличаться от исходного.")})
+        self.source_year = source_year
+        self.target_year = target_year
+        self.carry_memberships = carry_memberships
+        self.promote_group_names = promote_group_names
+        self.exclude_group_ids = set(exclude_group_ids or [])
+        self.group_name_map = group_name_map or {}
+        self.progress_callback = progress_callback
+
+    def _report(self, stage, current, total):
+        if self.progress_callback:
+            self.progress_callback(stage, current, total)
+
+    def _target_group_name(self, source_name):
+        if source_name in self.group_name_map:
+            return self.group_name_map[source_name]
+        return promote_group_name(source_name) if self.promote_group_names else source_name
+
+    # Сопоставление учебных периодов: сначала по названию, затем оставшиеся - по порядку (позиции).
+    # Каждый целевой период используется не больше одного раза; если целевой период на позиции
+    # уже занят, исходный период остается несопоставленным.
+    def _map_study_periods(self):
+        source_periods = list(StudyPeriod.objects.filter(academic_year=self.source_year).order_by('start_date'))
+        target_periods = list(StudyPeriod.objects.filter(academic_year=self.target_year).order_by('start_date'))
+        target_by_name = {period.name: period for period in target_periods}
+        period_map = {}
+        used_target_ids = set()
+        for source_period in source_periods:
+            target_period = target_by_name.get(source_period.name)
+            if target_period is not None and target_period.pk not in used_target_ids:
+                period_map[source_period.pk] = target_period
+                used_target_ids.add(target_period.pk)
+        for index, source_period in enumerate(source_periods):
+            if source_period.pk in period_map or index >= len(target_periods): continue
+            target_period = target_periods[index]
+            if target_period.pk not in used_target_ids:
+                period_map[source_period.pk] = target_period
+                used_target_ids.add(target_period.pk)
+        unmapped = [period for period in source_periods if period.pk not in period_map]
+        return source_periods, period_map, unmapped
+
+    def build_plan(self):
+        source_periods, period_map, unmapped_periods = self._map_study_periods()
+
+        source_groups = list(
+            StudentGroup.objects.filter(academic_year=self.source_year)
+            .exclude(pk__in=self.exclude_group_ids).order_by('name')
+        )
+        target_name_by_group_id = {group.pk: self._target_group_name(group.name) for group in source_groups}
+        existing_target_groups = StudentGroup.objects.filter(
+            academic_year=self.target_year, name__in=set(target_name_by_group_id.values())
+        ).in_bulk(field_name='name')
+
+        source_curricula = list(Curriculum.objects.filter(
+            academic_year=self.source_year, student_group__in=source_groups
+        ))
+        source_entries = list(CurriculumEntry.objects.filter(curriculum__in=source_curricula))
+
+        memberships = []
+        if self.carry_memberships:
+            Membership = StudentGroup.students.through
+            memberships = list(
+                Membership.objects.filter(studentgroup__in=source_groups).values_list('studentgroup_id', 'user_id')
+            )
+
+        return {
+            'source_periods': source_periods,
+            'period_map': period_map,
+            'unmapped_periods': unmapped_periods,
+            'source_groups': source_groups,
+            'target_name_by_group_id': target_name_by_group_id,
+            'existing_target_groups': existing_target_groups,
+            'source_curricula': source_curricula,
+            'source_entries': source_entries,
+            'memberships': memberships,
+        }
+
+    def preview(self):
+        plan = self.build_plan()
+        mapped_entries = [entry for entry in plan['source_entries'] if entry.study_period_id in plan['period_map']]
+        return {
+            'source_year': self.source_year.name,
+            'target_year': self.target_year.name,
+            'study_periods': [
+                {
+                    'source': period.name,
+                    'target': plan['period_map'][period.pk].name if period.pk in plan['period_map'] else None,
+                }
+                for period in plan['source_periods']
+            ],
+            'groups': [
+                {
+                    'source_id': group.pk,
+                    'source_name': group.name,
+                    'target_name': plan['target_name_by_group_id'][group.pk],
+                    'already_exists': plan['target_name_by_group_id'][group.pk] in plan['existing_target_groups'],
+                }
+                for group in plan['source_groups']
+            ],
+            'summary': {
+                'groups_count': len(plan['source_groups']),
+                'curricula_count': len(plan['source_curricula']),
+                'entries_count': len(mapped_entries),
+                'entries_skipped_unmapped_period': len(plan['source_entries']) - len(mapped_entries),
+                'memberships_count': len(plan['memberships']),
+            },
+        }
+
+    @transaction.atomic
+    def execute(self):
+        plan = self.build_plan()
+        stats = {'groups_created': 0, 'groups_existing': 0, 'curricula_created': 0, 'curricula_existing': 0,
+                 'entries_created': 0, 'entries_existing': 0, 'entries_skipped_unmapped_period': 0, 'memberships_created': 0}
+
+        # 1. Группы
+        self._report('groups', 0, len(plan['source_groups']))
+        target_groups_by_name = dict(plan['existing_target_groups'])
+        new_groups = []
+        for group in plan['source_groups']:
+            target_name = plan['target_name_by_group_id'][group.pk]
+            if target_name in target_groups_by_name:
+                stats['groups_existing'] += 1
+                continue
+            new_group = StudentGroup(
+                name=target_name, academic_year=self.target_year, curator_id=group.curator_id,
+                group_monitor_id=group.group_monitor_id if self.carry_memberships else None,
+            )
+            target_groups_by_name[target_name] = new_group
+            new_groups.append(new_group)
+        StudentGroup.objects.bulk_create(new_groups, batch_size=self.BATCH_SIZE)
+        stats['groups_created'] = len(new_groups)
+        target_group_by_source_id = {
+            group.pk: target_groups_by_name[plan['target_name_by_group_id'][group.pk]] for group in plan['source_groups']
+        }
+        self._report('groups', len(plan['source_groups']), len(plan['source_groups']))
+
+        # 2. Учебные планы
+        self._report('curricula', 0, len(plan['source_curricula']))
+        existing_curricula = {
+            (curriculum.name, curriculum.student_group_id): curriculum
+            for curriculum in Curriculum.objects.filter(
+                academic_year=self.target_year,
+                student_group__in=[group for group in target_group_by_source_id.values() if group.pk]
+            )
+        }
+        target_curriculum_by_source_id = {}
+        new_curricula = []
+        for curriculum in plan['source_curricula']:
+            target_group = target_group_by_source_id[curriculum.student_group_id]
+            key = (curriculum.name, target_group.pk)
+            target_curriculum = existing_curricula.get(key)
+            if target_curriculum is None:
+                target_curriculum = Curriculum(
+                    name=curriculum.name, academic_year=self.target_year, student_group=target_group,
+                    description=curriculum.description, is_active=curriculum.is_active,
+                )
+                existing_curricula[key] = target_curriculum
+                new_curricula.append(target_curriculum)
+            else:
+                stats['curricula_existing'] += 1
+            target_curriculum_by_source_id[curriculum.pk] = target_curriculum
+        Curriculum.objects.bulk_create(new_curricula, batch_size=self.BATCH_SIZE)
+        stats['curricula_created'] = len(new_curricula)
+        self._report('curricula', len(plan['source_curricula']), len(plan['source_curricula']))
+
+        # 3. Записи учебных планов (уже перенесенные ранее пропускаются)
+        new_curriculum_ids = {curriculum.pk for curriculum in new_curricula}
+        existing_entry_keys = set(CurriculumEntry.objects.filter(
+            curriculum_id__in={curriculum.pk for curriculum in target_curriculum_by_source_id.values()} - new_curriculum_ids
+        ).values_list('curriculum_id', 'subject_id', 'teacher_id', 'study_period_id'))
+        new_entries = []
+        for entry in plan['source_entries']:
+            target_period = plan['period_map'].get(entry.study_period_id)
+            if target_period is None:
+                stats['entries_skipped_unmapped_period'] += 1
+                continue
+            target_curriculum = target_curriculum_by_source_id[entry.curriculum_id]
+            if (target_curriculum.pk, entry.subject_id, entry.teacher_id, target_period.pk) in existing_entry_keys:
+                stats['entries_existing'] += 1
+                continue
+            new_entries.append(CurriculumEntry(
+                curriculum=target_curriculum, subject_id=entry.subject_id,
+                teacher_id=entry.teacher_id, study_period=target_period, planned_hours=entry.planned_hours,
+            ))
+        target_entries_qs = CurriculumEntry.objects.filter(curriculum_id__in={curriculum.pk for curriculum in target_curriculum_by_source_id.values()})
+        entries_before = target_entries_qs.count() if new_entries else 0
+        for batch_start in range(0, len(new_entries), self.BATCH_SIZE):
+            batch = new_entries[batch_start:batch_start + self.BATCH_SIZE]
+            CurriculumEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            self._report('entries', batch_start + len(batch), len(new_entries))
+        # ignore_conflicts молча пропускает конфликтующие строки - считаются только вставленные записи
+        entries_created = target_entries_qs.count() - entries_before if new_entries else 0
+        stats['entries_created'] = entries_created
+        stats['entries_existing'] += len(new_entries) - entries_created
+
+        # 4. Состав групп
+        if self.carry_memberships and plan['memberships']:
+            Membership = StudentGroup.students.through
+            existing_pairs = set(Membership.objects.filter(
+                studentgroup_id__in={group.pk for group in target_group_by_source_id.values()}
+            ).values_list('studentgroup_id', 'user_id'))
+            desired_pairs = {
+                (target_group_by_source_id[group_id].pk, user_id) for group_id, user_id in plan['memberships']
+            }
+            new_memberships = [
+                Membership(studentgroup_id=group_id, user_id=user_id)
+                for group_id, user_id in desired_pairs - existing_pairs
+            ]
+            Membership.objects.bulk_create(new_memberships, ignore_conflicts=True, batch_size=self.BATCH_SIZE)
+            stats['memberships_created'] = Membership.objects.filter(
+                studentgroup_id__in={group.pk for group in target_group_by_source_id.values()}
+            ).count() - len(existing_pairs)
+
+        self._notify_stats_cache(plan['period_map'].values(), target_group_by_source_id.values())
+        logger.info(f"Перенос структуры учебного года '{self.source_year.name}' -> '{self.target_year.name}': {stats}")
+        return stats
+
+    # bulk_create не отправляет сигналы, поэтому кэш статистики целевого года, его периодов и групп
+    # инвалидируется явно после фиксации транзакции переноса.
+    def _notify_stats_cache(self, target_periods, target_groups):
+        from stats.cache import bump_generations, SCOPE_YEAR, SCOPE_PERIOD, SCOPE_GROUP
+        scopes = [(SCOPE_YEAR, self.target_year.pk)] + [(SCOPE_PERIOD, period.pk) for period in target_periods]\
+            + [(SCOPE_GROUP, group.pk) for group in target_groups]
+        transaction.on_commit(lambda: bump_generations(scopes))
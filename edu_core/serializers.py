@@ -14,12 +14,13 @@ from .models import (
     AcademicYear, StudyPeriod, SubjectMaterialAttachment, SubjectType, Subject, Classroom, StudentGroup,
     Curriculum, CurriculumEntry, Lesson, LessonJournalEntry, Homework,
     HomeworkAttachment, HomeworkSubmission, SubmissionAttachment, Attendance, Grade,
-    SubjectMaterial
+    SubjectMaterial, LESSON_OVERLAP_MESSAGES, get_lesson_overlap_field
 )
 from django.db.models import Q
 # Импортируем UserSerializer для отображения связанных пользователей
 # Предполагаем, что он есть в users.serializers и содержит нужные поля
 from users.serializers import UserSerializer as BaseUserSerializer # Переименуем, чтобы избежать конфликта имен
+from notifications.utils import bulk_schedule_changes, record_lesson_changes
 logger = logging.getLogger(__name__) # Инициализация логгера, если еще не было
 
 User = get_user_model()
@@ -261,6 +262,19 @@ class LessonSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(serializers.as_serializer_error(e))
         return data
 
+    # clean() в validate() - лишь предварительная проверка: между ней и INSERT/UPDATE
+    # конкурентный запрос может занять тот же слот. Нарушение ограничения-исключения БД
+    # превращаем в ту же ошибку валидации по полю, что отдает clean().
+    def save(self, **kwargs):
+        try:
+            with transaction.atomic():
+                return super().save(**kwargs)
+        except IntegrityError as e:
+            overlap_field = get_lesson_overlap_field(e)
+            if not overlap_field:
+                raise
+            raise serializers.ValidationError({overlap_field: [LESSON_OVERLAP_MESSAGES[overlap_field]]})
+
 class LessonListSerializer(serializers.ModelSerializer):
     subject_name = serializers.CharField(source='subject.name', read_only=True)
     teacher_name = serializers.CharField(source='teacher.get_full_name', read_only=True)
@@ -1005,7 +1019,9 @@ class StudentHomeworkSubmissionSerializer(HomeworkSubmissionSerializer):
         fields = tuple(f for f in HomeworkSubmissionSerializer.Meta.fields if f not in ['homework_details']) + ('homework_id',)
 
 
-# --- Сериализаторы для Импорта (оставляем как примеры, требуют доработки под CSV) ---
+# --- Сериализаторы для Импорта ---
+# Проверяют строки CSV; запись выполняют set-based импортеры из edu_core.imports
+# (TeacherBulkImporter, SubjectBulkImporter, StudentGroupBulkImporter).
 
 class TeacherImportSerializer(serializers.Serializer):
     email = serializers.EmailField()
@@ -1013,63 +1029,37 @@ class TeacherImportSerializer(serializers.Serializer):
     first_name = serializers.CharField(max_length=150)
     patronymic = serializers.CharField(max_length=150, required=False, allow_blank=True)
 
-    def create_or_update_teacher(self, data): # Метод для View
-        user, created = User.objects.update_or_create(
-            email=data['email'],
-            defaults={
-                'first_name': data['first_name'],
-                'last_name': data['last_name'],
-                'patronymic': data.get('patronymic', ''),
-                'role': User.Role.TEACHER, 'is_active': True, 'is_role_confirmed': True,
-            }
-        )
-        if created: user.set_password(User.objects.make_random_password()); user.save()
-        return user
-
 class SubjectImportSerializer(serializers.ModelSerializer):
     subject_type_name = serializers.CharField(write_only=True, required=False, allow_blank=True)
-    class Meta: model = Subject; fields = ('name', 'code', 'description', 'subject_type_name')
-    def create(self, validated_data): # Переопределяем create
-        subject_type_name = validated_data.pop('subject_type_name', None)
-        subject_type = None
-        if subject_type_name: subject_type, _ = SubjectType.objects.get_or_create(name=subject_type_name)
-        validated_data['subject_type'] = subject_type
-        subject, _ = Subject.objects.update_or_create(name=validated_data['name'], defaults=validated_data)
-        return subject
+    class Meta:
+        model = Subject; fields = ('name', 'code', 'description', 'subject_type_name')
+        # Импорт - это upsert по названию: существующие name/code не ошибка, а ключ для обновления
+        extra_kwargs = {'name': {'validators': []}, 'code': {'validators': []}}
 
 class StudentGroupImportSerializer(serializers.Serializer):
     group_name = serializers.CharField()
     academic_year_name = serializers.CharField() # Имя года, например "2024-2025"
-    curator_email = serializers.EmailField(required=False, allow_null=True)
-    student_emails = serializers.CharField(help_text="Emails через точку с запятой (;)")
+    curator_email = serializers.EmailField(required=False, allow_null=True, allow_blank=True)
+    student_emails = serializers.CharField(help_text="Emails через точку с запятой (;)", required=False, allow_blank=True)
 
-    def create_or_update_group(self, data): # Метод для View
-        try:
-            academic_year = AcademicYear.objects.get(name=data['academic_year_name'])
-        except AcademicYear.DoesNotExist:
-            raise serializers.ValidationError(f"Учебный год '{data['academic_year_name']}' не найден.")
-        
-        curator = None
-        if data.get('curator_email'):
-            try: curator = User.objects.get(email=data['curator_email'], role=User.Role.TEACHER)
-            except User.DoesNotExist: raise serializers.ValidationError(f"Куратор с email '{data['curator_email']}' не найден или не является преподавателем.")
-        
-        group, created = StudentGroup.objects.update_or_create(
-            name=data['group_name'], academic_year=academic_year,
-            defaults={'curator': curator}
-        )
-        
-        student_emails_list = [email.strip() for email in data.get('student_emails', '').split(';') if email.strip()]
-        students_to_add = []
-        for email in student_emails_list:
-            student, stud_created = User.objects.get_or_create(
-                email=email,
-                defaults={'role': User.Role.STUDENT, 'is_active': True, 'is_role_confirmed': True} # Упрощенно
-            )
-            if stud_created: student.set_password(User.objects.make_random_password()); student.save()
-            students_to_add.append(student)
-        if students_to_add: group.students.set(students_to_add)
-        return group
+
+# Параметры переноса структуры учебного года (AcademicYearViewSet.rollover -> edu_core.rollover.AcademicYearRollover).
+# Принимает JSON и multipart/form-data (списки - повторяющимися ключами, словарь - ключами group_name_map.<имя>).
+# promote_group_names допускает null: в multipart отсутствующий BooleanField читается как False,
+# поэтому значение по умолчанию (True) подставляется в validate.
+class AcademicYearRolloverSerializer(serializers.Serializer):
+    target_year_id = serializers.PrimaryKeyRelatedField(queryset=AcademicYear.objects.all())
+    carry_memberships = serializers.BooleanField(required=False, default=False)
+    promote_group_names = serializers.BooleanField(required=False, allow_null=True, default=None)
+    exclude_group_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, default=list)
+    group_name_map = serializers.DictField(child=serializers.CharField(max_length=100), required=False, default=dict)
+    dry_run = serializers.BooleanField(required=False, default=False)
+    run_async = serializers.BooleanField(required=False, default=False)
+
+    def validate(self, attrs):
+        if attrs.get('promote_group_names') is None:
+            attrs['promote_group_names'] = True
+        return attrs
 
 
 # --- Сериализаторы для Статистики ---
@@ -1186,21 +1176,46 @@ class GroupPerformanceSerializer(serializers.ModelSerializer):
     
 
 
+# PrimaryKeyRelatedField, который сначала ищет объект в context['preloaded'][preload_key]
+# (словарь pk -> объект, заполняемый импортером одним запросом на все строки файла).
+# Без предзагрузки ведет себя как обычный PrimaryKeyRelatedField (запрос на каждую строку).
+class PreloadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    def __init__(self, preload_key=None, **kwargs):
+        self.preload_key = preload_key
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        preloaded = self.context.get('preloaded', {}).get(self.preload_key)
+        if preloaded is None:
+            return super().to_internal_value(data)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        obj = preloaded.get(pk)
+        if obj is None:
+            self.fail('does_not_exist', pk_value=data)
+        return obj
+
+
 class LessonTemplateItemSerializer(serializers.Serializer):
     day_of_week = serializers.IntegerField(min_value=0, max_value=6, help_text=_("День недели: 0 для Понедельника, ..., 6 для Воскресенья"))
     start_time = serializers.TimeField(format='%H:%M', input_formats=['%H:%M'], help_text=_("Время начала в формате ЧЧ:ММ"))
     end_time = serializers.TimeField(format='%H:%M', input_formats=['%H:%M'], help_text=_("Время окончания в формате ЧЧ:ММ"))
     
     # Используем PrimaryKeyRelatedField для валидации существования ID
-    subject_id = serializers.PrimaryKeyRelatedField(
+    subject_id = PreloadedPrimaryKeyRelatedField(
+        preload_key='subject',
         queryset=Subject.objects.all(), source='subject', # source='subject' чтобы в validated_data был объект Subject
         help_text=_("ID существующего предмета")
     )
-    teacher_id = serializers.PrimaryKeyRelatedField(
+    teacher_id = PreloadedPrimaryKeyRelatedField(
+        preload_key='teacher',
         queryset=User.objects.filter(role=User.Role.TEACHER), source='teacher', # source='teacher'
         help_text=_("ID существующего преподавателя")
     )
-    classroom_id = serializers.PrimaryKeyRelatedField(
+    classroom_id = PreloadedPrimaryKeyRelatedField(
+        preload_key='classroom',
         queryset=Classroom.objects.all(), source='classroom', # source='classroom'
         allow_null=True, required=False, 
         help_text=_("ID существующей аудитории (опционально)")
@@ -1215,7 +1230,8 @@ class LessonTemplateItemSerializer(serializers.Serializer):
     #     required=False, # Если может быть общий из контекста
     #     help_text=_("ID учебной группы (если не указан общий для шаблона)")
     # )
-    curriculum_entry_id = serializers.PrimaryKeyRelatedField(
+    curriculum_entry_id = PreloadedPrimaryKeyRelatedField(
+        preload_key='curriculum_entry',
         queryset=CurriculumEntry.objects.all(), source='curriculum_entry',
         allow_null=True, required=False,
         help_text=_("ID связанной записи учебного плана (опционально)")
@@ -1237,6 +1253,7 @@ class LessonTemplateItemSerializer(serializers.Serializer):
 
 class ScheduleTemplateImportSerializer(serializers.ListSerializer):
     child = LessonTemplateItemSerializer()
+    CREATE_BATCH_SIZE = 500
 
     def _parse_date_from_context(self, date_str_key: str, field_name_readable: str): # field_name_readable теперь просто описание
         date_str = self.context.get(date_str_key)
@@ -1280,10 +1297,12 @@ class ScheduleTemplateImportSerializer(serializers.ListSerializer):
             raise serializers.ValidationError(
                 {"student_group_id": gettext_lazy("Учебная группа с ID %(id)s не найдена.") % {'id': student_group_id}}
             )
-    @transaction.atomic # Гарантируем атомарность операции
-    def create(self, validated_data):
+    # Строит план импорта без записи в БД: какие занятия будут созданы, какие удалены
+    # (при clear_existing_schedule) и какие конфликты найдены. Учебные периоды года
+    # загружаются одним запросом и сопоставляются с датами в памяти.
+    def build_plan(self, validated_data):
         context = self.context
-        request_user = context['request'].user
+        request_user = context.get('request_user') or context['request'].user
         
         # Используем описательные строки для передачи в _parse_date_from_context
         period_start_date = self._parse_date_from_context('period_start_date', gettext_lazy("Дата начала периода"))
@@ -1309,12 +1328,10 @@ class ScheduleTemplateImportSerializer(serializers.ListSerializer):
                 }
             )
         
-        # Идемпотентность: Очистка существующих занятий (если флаг установлен)
+        # Идемпотентность: занятия, которые будут удалены перед созданием (если флаг установлен)
         clear_existing = str(self.context.get('clear_existing_schedule', 'false')).lower() == 'true'
+        lessons_to_delete_qs = Lesson.objects.none()
         if clear_existing and student_group_obj:
-            logger.info(f"Импорт расписания (clear_existing=True): Удаление существующих занятий для группы '{student_group_obj.name}' "
-                        f"в учебном году '{academic_year_obj.name}' которые пересекаются с периодом {period_start_date} - {period_end_date}.")
-            
             # Фильтр для занятий, которые хоть как-то пересекаются с указанным периодом дат
             # Занятие пересекается с периодом [P_start, P_end], если:
             # (Lesson_start < P_end) И (Lesson_end > P_start)
@@ -1322,93 +1339,168 @@ class ScheduleTemplateImportSerializer(serializers.ListSerializer):
                             Q(study_period__academic_year=academic_year_obj) & \
                             Q(start_time__date__lte=period_end_date) & \
                             Q(end_time__date__gte=period_start_date)
-            
-            # Альтернативный, более точный фильтр пересечения с периодом, если start_time и end_time это DateTimeField:
-            # delete_filter = Q(student_group=student_group_obj) & \
-            #                 Q(study_period__academic_year=academic_year_obj) & \
-            #                 Q(start_time__lt=datetime.datetime.combine(period_end_date, datetime.time.max)) & \
-            #                 Q(end_time__gt=datetime.datetime.combine(period_start_date, datetime.time.min))
-
-
             lessons_to_delete_qs = Lesson.objects.filter(delete_filter)
-            
-            # Логируем, какие занятия будут удалены, перед удалением
-            if lessons_to_delete_qs.exists():
-                logger.info(f"Будут удалены следующие занятия (ID): {[lesson.id for lesson in lessons_to_delete_qs]}")
-            else:
-                logger.info("Не найдено существующих занятий для удаления по заданным критериям.")
 
-            deleted_count, deleted_types_details = lessons_to_delete_qs.delete()
-            logger.info(f"Удалено {deleted_count} существующих занятий. Детали по типам: {deleted_types_details}")
+        # Учебные периоды года, пересекающиеся с диапазоном импорта - один запрос
+        study_periods = list(StudyPeriod.objects.filter(
+            academic_year=academic_year_obj,
+            start_date__lte=period_end_date,
+            end_date__gte=period_start_date
+        ).order_by('start_date'))
 
+        # Строки шаблона по дням недели, чтобы не перебирать весь шаблон для каждой даты
+        template_items_by_weekday = {}
+        for template_item in validated_data: # validated_data - это список провалидированных данных из CSV
+            template_items_by_weekday.setdefault(template_item['day_of_week'], []).append(template_item)
 
-        # 2. Генерация списка словарей с данными для создания объектов Lesson
+        # Генерация списка словарей с данными для создания объектов Lesson
         lessons_to_generate_data = [] # Список словарей для _check_lesson_conflict_batch
         
         current_date = period_start_date
         while current_date <= period_end_date:
             day_of_week_django = current_date.weekday() # 0 для Понедельника
+            day_template_items = template_items_by_weekday.get(day_of_week_django)
+            if not day_template_items:
+                current_date += datetime.timedelta(days=1)
+                continue
 
-            try:
-                study_period_obj = StudyPeriod.objects.get(
-                    academic_year=academic_year_obj,
-                    start_date__lte=current_date,
-                    end_date__gte=current_date
-                )
-            except StudyPeriod.DoesNotExist:
+            matching_periods = [sp for sp in study_periods if sp.start_date <= current_date <= sp.end_date]
+            if not matching_periods:
                 logger.info(f"Для даты {current_date.strftime('%Y-%m-%d')} не найден учебный период в году '{academic_year_obj.name}'. Занятия на эту дату не будут созданы.")
                 current_date += datetime.timedelta(days=1)
                 continue
-            except StudyPeriod.MultipleObjectsReturned:
+            if len(matching_periods) > 1:
                 raise serializers.ValidationError(
                     gettext_lazy("Найдено несколько учебных периодов для даты %(date)s в году '%(year)s'. Проверьте конфигурацию.") %
                     {'date': current_date.strftime('%Y-%m-%d'), 'year': academic_year_obj.name}
                 )
-
-            for template_item in validated_data: # validated_data - это список провалидированных данных из CSV
-                if template_item['day_of_week'] == day_of_week_django:
-                    
-                    lesson_start_dt_naive = datetime.datetime.combine(current_date, template_item['start_time'])
-                    lesson_end_dt_naive = datetime.datetime.combine(current_date, template_item['end_time'])
-
-                    lesson_start_dt_aware = timezone.make_aware(lesson_start_dt_naive) if settings.USE_TZ else lesson_start_dt_naive
-                    lesson_end_dt_aware = timezone.make_aware(lesson_end_dt_naive) if settings.USE_TZ else lesson_end_dt_naive
-                    
-                    lesson_data = {
-                        'subject': template_item['subject'], # Объект Subject
-                        'teacher': template_item['teacher'], # Объект User (Teacher)
-                        'classroom': template_item.get('classroom'), # Объект Classroom или None
-                        'lesson_type': template_item['lesson_type'],
-                        'start_time': lesson_start_dt_aware,
-                        'end_time': lesson_end_dt_aware,
-                        'student_group': student_group_obj, # Общая группа для шаблона
-                        'study_period': study_period_obj,
-                        'created_by': request_user,
-                        'curriculum_entry': template_item.get('curriculum_entry'), # Объект CurriculumEntry или None
-                    }
-                    lessons_to_generate_data.append(lesson_data)
+            study_period_obj = matching_periods[0]
+
+            for template_item in day_template_items:
+                lesson_start_dt_naive = datetime.datetime.combine(current_date, template_item['start_time'])
+                lesson_end_dt_naive = datetime.datetime.combine(current_date, template_item['end_time'])
+
+                lesson_start_dt_aware = timezone.make_aware(lesson_start_dt_naive) if settings.USE_TZ else lesson_start_dt_naive
+                lesson_end_dt_aware = timezone.make_aware(lesson_end_dt_naive) if settings.USE_TZ else lesson_end_dt_naive
+                
+                lesson_data = {
+                    'subject': template_item['subject'], # Объект Subject
+                    'teacher': template_item['teacher'], # Объект User (Teacher)
+                    'classroom': template_item.get('classroom'), # Объект Classroom или None
+                    'lesson_type': template_item['lesson_type'],
+                    'start_time': lesson_start_dt_aware,
+                    'end_time': lesson_end_dt_aware,
+                    'student_group': student_group_obj, # Общая группа для шаблона
+                    'study_period': study_period_obj,
+                    'created_by': request_user,
+                    'curriculum_entry': template_item.get('curriculum_entry'), # Объект CurriculumEntry или None
+                }
+                lessons_to_generate_data.append(lesson_data)
             current_date += datetime.timedelta(days=1)
         
-        # 3. Пакетная проверка на конфликты
+        # Пакетная проверка на конфликты. Удаляемые занятия не считаются конфликтующими.
+        lessons_to_delete = list(lessons_to_delete_qs.select_related('subject', 'teacher', 'classroom'))
+        conflicts = []
         if lessons_to_generate_data:
-            conflicts = self._check_lesson_conflict_batch(lessons_to_generate_data)
-            if conflicts:
-                error_messages = self._format_conflict_messages(conflicts)
-                raise serializers.ValidationError({"schedule_conflicts": error_messages})
+            conflicts = self._check_lesson_conflict_batch(
+                lessons_to_generate_data,
+                exclude_lesson_ids={lesson.id for lesson in lessons_to_delete}
+            )
+
+        return {
+            'academic_year': academic_year_obj,
+            'student_group': student_group_obj,
+            'lessons_to_create': lessons_to_generate_data,
+            'lessons_to_delete': lessons_to_delete,
+            'conflicts': conflicts,
+        }
 
-        # 4. Создание объектов Lesson и bulk_create
-        generated_lesson_objects = [Lesson(**data) for data in lessons_to_generate_data]
+    # Пробный запуск (dry-run): возвращает diff без изменений в БД.
+    def preview(self, validated_data=None):
+        plan = self.build_plan(self.validated_data if validated_data is None else validated_data)
+        return {
+            'to_create': [
+                {
+                    'date': ld['start_time'].date().isoformat(),
+                    'start_time': ld['start_time'].strftime('%H:%M'),
+                    'end_time': ld['end_time'].strftime('%H:%M'),
+                    'subject': ld['subject'].name,
+                    'teacher': ld['teacher'].get_full_name(),
+                    'classroom': ld['classroom'].identifier if ld.get('classroom') else None,
+                    'lesson_type': ld['lesson_type'],
+                    'study_period': ld['study_period'].name,
+                }
+                for ld in plan['lessons_to_create']
+            ],
+            'to_delete': [
+                {
+                    'id': lesson.id,
+                    'date': lesson.start_time.date().isoformat(),
+                    'start_time': timezone.localtime(lesson.start_time).strftime('%H:%M') if settings.USE_TZ else lesson.start_time.strftime('%H:%M'),
+                    'subject': lesson.subject.name,
+                    'teacher': lesson.teacher.get_full_name() if lesson.teacher else None,
+                }
+                for lesson in plan['lessons_to_delete']
+            ],
+            'conflicts': self._format_conflict_messages(plan['conflicts']),
+            'summary': {
+                'to_create_count': len(plan['lessons_to_create']),
+                'to_delete_count': len(plan['lessons_to_delete']),
+                'conflicts_count': len(plan['conflicts']),
+            },
+        }
+
+    # Импорт выполняется в контексте массовой операции с расписанием: вместо поуроковых
+    # уведомлений каждый затронутый пользователь после фиксации получит одно итоговое уведомление.
+    @transaction.atomic # Гарантируем атомарность операции
+    def create(self, validated_data):
+        with bulk_schedule_changes(label="импорт расписания"):
+            return self._apply_import(validated_data)
+
+    def _apply_import(self, validated_data):
+        progress_callback = self.context.get('progress_callback')
+        plan = self.build_plan(validated_data)
+        student_group_obj = plan['student_group']
+
+        if plan['conflicts']:
+            error_messages = self._format_conflict_messages(plan['conflicts'])
+            raise serializers.ValidationError({"schedule_conflicts": error_messages})
+
+        if plan['lessons_to_delete']:
+            logger.info(f"Импорт расписания (clear_existing=True): Удаление {len(plan['lessons_to_delete'])} существующих занятий "
+                        f"группы '{student_group_obj.name}' (ID: {[lesson.id for lesson in plan['lessons_to_delete']]}).")
+            record_lesson_changes(plan['lessons_to_delete'])
+            deleted_count, deleted_types_details = Lesson.objects.filter(
+                pk__in=[lesson.id for lesson in plan['lessons_to_delete']]
+            ).delete()
+            logger.info(f"Удалено {deleted_count} существующих занятий. Детали по типам: {deleted_types_details}")
+
+        lessons_to_generate_data = plan['lessons_to_create']
+        # bulk_create не вызывает save(), поэтому duration_minutes заполняем явно
+        generated_lesson_objects = [
+            Lesson(**data, duration_minutes=Lesson.compute_duration_minutes(data['start_time'], data['end_time']))
+            for data in lessons_to_generate_data
+        ]
             
         if generated_lesson_objects:
+            total = len(generated_lesson_objects)
             try:
-                Lesson.objects.bulk_create(generated_lesson_objects, batch_size=500)
-                # --- УВЕДОМЛЕНИЯ ---
-                # Отправка уведомлений после успешного bulk_create
-                # Это может быть много уведомлений, возможно, лучше обобщенное уведомление или фоновая задача
-                 # for lesson_obj in generated_lesson_objects:
-                #    notify_lesson_change(lesson_obj, action="создано (импорт)")
+                # Пакетами, чтобы фоновая задача могла сообщать прогресс
+                for batch_start in range(0, total, self.CREATE_BATCH_SIZE):
+                    Lesson.objects.bulk_create(generated_lesson_objects[batch_start:batch_start + self.CREATE_BATCH_SIZE])
+                    if progress_callback:
+                        progress_callback(min(batch_start + self.CREATE_BATCH_SIZE, total), total)
+                # bulk_create не вызывает сигналы - созданные занятия учитываются в итоговом уведомлении
+                # и в инвалидации кэша статистики явно
+                record_lesson_changes(generated_lesson_objects)
+                self._notify_stats_cache(generated_lesson_objects)
 
             except IntegrityError as e:
+                overlap_field = get_lesson_overlap_field(e)
+                if overlap_field:
+                    # Пересечение, которое не поймала предварительная проверка (например, конкурентный импорт)
+                    logger.warning(f"Импорт расписания - нарушено ограничение пересечения занятий ({overlap_field}): {e}")
+                    raise serializers.ValidationError({"schedule_conflicts": [self._format_constraint_conflict_message(overlap_field, e)]})
                 logger.error(f"Импорт расписания - IntegrityError при bulk_create: {e}")
                 raise serializers.ValidationError(_("Ошибка базы данных при сохранении занятий. Возможно, дублирование или нарушение уникальных ограничений."))
             except Exception as e:
@@ -1418,7 +1510,16 @@ class ScheduleTemplateImportSerializer(serializers.ListSerializer):
             return len(generated_lesson_objects)
         return 0 # Нет занятий для создания
 
-    def _check_lesson_conflict_batch(self, lessons_to_generate_data: list[dict]):
+    # Инвалидирует кэш статистики (stats.cache) учебных периодов, годов и групп созданных занятий
+    # после фиксации транзакции импорта.
+    def _notify_stats_cache(self, lessons):
+        from stats.cache import bump_generations, SCOPE_YEAR, SCOPE_PERIOD, SCOPE_GROUP
+        scopes = set()
+        for lesson in lessons:
+            scopes.update({(SCOPE_PERIOD, lesson.study_period_id), (SCOPE_YEAR, lesson.study_period.academic_year_id), (SCOPE_GROUP, lesson.student_group_id)})
+        transaction.on_commit(lambda: bump_generations(scopes))
+
+    def _check_lesson_conflict_batch(self, lessons_to_generate_data: list[dict], exclude_lesson_ids=None):
         conflicts = []
         if not lessons_to_generate_data: return conflicts
 
@@ -1434,6 +1535,8 @@ class ScheduleTemplateImportSerializer(serializers.ListSerializer):
         ).filter(
             Q(teacher_id__in=teacher_ids) | Q(student_group_id__in=group_ids) | Q(classroom_id__in=classroom_ids)
         ).select_related('teacher', 'student_group', 'classroom', 'subject')
+        if exclude_lesson_ids:
+            existing_lessons_qs = existing_lessons_qs.exclude(pk__in=exclude_lesson_ids)
         
         db_conflict_cache = {'teacher': {}, 'group': {}, 'classroom': {}}
         for lesson in existing_lessons_qs:
@@ -1524,6 +1627,18 @@ class ScheduleTemplateImportSerializer(serializers.ListSerializer):
                 seen_conflict_signatures.add(signature)
         return final_conflicts
 
+    def _format_constraint_conflict_message(self, overlap_field: str, exc: IntegrityError) -> str:
+        """Формирует сообщение о конфликте, обнаруженном ограничением-исключением БД."""
+        conflict_type_readable = {
+            'teacher': gettext_lazy("по преподавателю"),
+            'student_group': gettext_lazy("по группе"),
+            'classroom': gettext_lazy("по аудитории"),
+        }[overlap_field]
+        # detail от PostgreSQL содержит ключи пересекающихся занятий: "Key (...)=(...) conflicts with existing key (...)"
+        detail = getattr(getattr(exc.__cause__, 'diag', None), 'message_detail', None) or ""
+        message = gettext_lazy("Конфликт расписания, обнаруженный базой данных. Тип конфликта: %(type)s.") % {'type': conflict_type_readable}
+        return f"{message} {detail}".strip()
+
     def _format_conflict_messages(self, conflicts_data_list: list[dict]) -> list[str]:
         """Формирует читаемые сообщения об ошибках из списка словарей конфликтов."""
         error_messages = []
@@ -1,6 +1,6 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_save, post_delete
 from django.dispatch import receiver
-from .models import Lesson, Homework, HomeworkSubmission, Grade
+from .models import Lesson, Homework, HomeworkSubmission, Grade, Attendance, AttendanceRollup, LessonJournalEntry, PendingGradeAverage
 from notifications.utils import (
     notify_lesson_change, notify_new_homework,
     notify_homework_graded, notify_new_grade
@@ -68,4 +68,55 @@ def grade_created_or_updated_receiver(sender, instance: Grade, created: bool, **
     # Уведомляем при создании любой оценки или при обновлении
     # Исключаем дублирование уведомления об оценке за ДЗ, если оно было отправлено через notify_homework_graded
     if instance.grade_type != Grade.GradeType.HOMEWORK_GRADE or not instance.homework_submission:
-        notify_new_grade(instance)
\ No newline at end of file
+        notify_new_grade(instance)
+
+
+# Функция _attendance_rollup_key возвращает ключ агрегата посещаемости
+# (student_id, subject_id, study_period_id) для записи Attendance.
+# Предмет и период берутся из занятия запросом по id записи журнала, поэтому функция
+# работает и при каскадном удалении (когда связанные объекты не загружены).
+def _attendance_rollup_key(attendance):
+    lesson_data = LessonJournalEntry.objects.filter(pk=attendance.journal_entry_id)\
+        .values('lesson__subject_id', 'lesson__study_period_id').first()
+    if not lesson_data: return None
+    return (attendance.student_id, lesson_data['lesson__subject_id'], lesson_data['lesson__study_period_id'])
+
+# Функция-обработчик сигнала attendance_changed_receiver.
+# Вызывается после сохранения или удаления записи Attendance.
+# Пересчитывает агрегат посещаемости (AttendanceRollup) только для затронутого ключа
+# (студент, предмет, период) - одним сгруппированным запросом по записям этого ключа.
+@receiver(post_save, sender=Attendance)
+@receiver(post_delete, sender=Attendance)
+def attendance_changed_receiver(sender, instance: Attendance, **kwargs):
+    rollup_key = _attendance_rollup_key(instance)
+    if rollup_key: AttendanceRollup.refresh_for_keys([rollup_key])
+
+# Функция-обработчик сигнала lesson_rollup_key_capture_receiver.
+# Вызывается перед сохранением существующего занятия и запоминает его текущие
+# предмет и учебный период, чтобы после сохранения понять, сменился ли ключ агрегатов посещаемости.
+@receiver(pre_save, sender=Lesson)
+def lesson_rollup_key_capture_receiver(sender, instance: Lesson, **kwargs):
+    if instance.pk:
+        instance._previous_rollup_key = Lesson.objects.filter(pk=instance.pk).values_list('subject_id', 'study_period_id').first()
+
+# Функция-обработчик сигнала lesson_rollup_key_changed_receiver.
+# Если у занятия сменился предмет или учебный период, пересчитывает агрегаты посещаемости
+# студентов этого занятия и для старого, и для нового ключа.
+@receiver(post_save, sender=Lesson)
+def lesson_rollup_key_changed_receiver(sender, instance: Lesson, created, **kwargs):
+    previous_key = getattr(instance, '_previous_rollup_key', None)
+    current_key = (instance.subject_id, instance.study_period_id)
+    if created or not previous_key or previous_key == current_key: return
+    student_ids = list(Attendance.objects.filter(journal_entry__lesson=instance).values_list('student_id', flat=True))
+    AttendanceRollup.refresh_for_keys(
+        [(student_id, *previous_key) for student_id in student_ids] + [(student_id, *current_key) for student_id in student_ids]
+    )
+
+# Функция-обработчик сигнала grade_average_pending_receiver.
+# Вызывается после сохранения или удаления оценки. Для текущих оценок (не итоговых/расчетных)
+# отмечает студента в учебном году для инкрементального пересчета средних (PendingGradeAverage).
+@receiver(post_save, sender=Grade)
+@receiver(post_delete, sender=Grade)
+def grade_average_pending_receiver(sender, instance: Grade, **kwargs):
+    if instance.grade_type not in Grade.SUMMARY_TYPES:
+        PendingGradeAverage.mark([(instance.student_id, instance.academic_year_id)])
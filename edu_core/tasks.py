@@ -0,0 +1,102 @@
+from celery import shared_task
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from rest_framework.exceptions import ValidationError as DRFValidationError
+import logging
+
+logger = logging.getLogger(__name__)
+User = get_user_model()
+
+# Фоновая задача импорта шаблона расписания для больших диапазонов дат.
+# - upload_path: путь к CSV в хранилище по умолчанию (ScheduleTemplateImporter.save_upload);
+#   файл читается потоково и удаляется после завершения задачи.
+# - params: параметры импорта (см. edu_core.imports.ScheduleTemplateImporter).
+# - user_id: ID администратора, запустившего импорт (станет created_by занятий).
+# Прогресс создания занятий публикуется в состоянии задачи (state='PROGRESS',
+# meta={'stage', 'current', 'total'}) и доступен через ImportJobStatusView.
+# Ошибки валидации и конфликты возвращаются как результат {'errors': ...},
+# остальные исключения логгируются и перевыбрасываются, чтобы Celery зафиксировал сбой.
+@shared_task(bind=True, name="import_schedule_template")
+def import_schedule_template_task(self, upload_path, params, user_id):
+    from .imports import ScheduleTemplateImporter
+    logger.info(f"Celery task: Starting import_schedule_template_task (file={upload_path}, user_id={user_id}).")
+
+    def report_progress(done, total):
+        self.update_state(state='PROGRESS', meta={'stage': 'creating', 'current': done, 'total': total})
+
+    try:
+        user = User.objects.get(pk=user_id)
+        self.update_state(state='PROGRESS', meta={'stage': 'planning', 'current': 0, 'total': None})
+        importer = ScheduleTemplateImporter(user, params, progress_callback=report_progress)
+        with default_storage.open(upload_path, 'rb') as file_obj:
+            result = importer.run(file_obj)
+        logger.info(f"Celery task: Finished import_schedule_template_task: {result}")
+        return result
+    except DRFValidationError as e:
+        logger.warning(f"Celery task: import_schedule_template_task validation failed: {e.detail}")
+        return {"errors": e.detail}
+    except Exception as e:
+        logger.error(f"Celery task: Error in import_schedule_template_task: {e}", exc_info=True)
+        raise
+    finally:
+        default_storage.delete(upload_path)
+
+
+# Фоновая задача переноса структуры учебного года (edu_core.rollover.AcademicYearRollover).
+# Прогресс по этапам (groups / curricula / entries) публикуется в состоянии задачи,
+# итоговая статистика возвращается как результат.
+@shared_task(bind=True, name="rollover_academic_year")
+def rollover_academic_year_task(self, source_year_id, target_year_id, options):
+    from .models import AcademicYear
+    from .rollover import AcademicYearRollover
+    logger.info(f"Celery task: Starting rollover_academic_year_task ({source_year_id} -> {target_year_id}).")
+
+    def report_progress(stage, done, total):
+        self.update_state(state='PROGRESS', meta={'stage': stage, 'current': done, 'total': total})
+
+    try:
+        rollover = AcademicYearRollover(
+            AcademicYear.objects.get(pk=source_year_id), AcademicYear.objects.get(pk=target_year_id),
+            progress_callback=report_progress, **options
+        )
+        result = rollover.execute()
+        logger.info(f"Celery task: Finished rollover_academic_year_task: {result}")
+        return result
+    except DRFValidationError as e:
+        logger.warning(f"Celery task: rollover_academic_year_task validation failed: {e.detail}")
+        return {"errors": e.detail}
+    except Exception as e:
+        logger.error(f"Celery task: Error in rollover_academic_year_task: {e}", exc_info=True)
+        raise
+
+
+# Фоновая/периодическая задача расчета средних оценок за период и год
+# (edu_core.grade_averages.GradeAverageCalculator).
+# - academic_year_id: учебный год; если не указан - все учебные годы, в которых есть
+#   студенты в очереди пересчета (ночной инкрементальный запуск из Celery Beat).
+# - student_group_id: (опционально) ограничение одной группой.
+# - incremental: пересчитывать только студентов с изменившимися оценками.
+@shared_task(bind=True, name="compute_grade_averages")
+def compute_grade_averages_task(self, academic_year_id=None, student_group_id=None, incremental=True):
+    from .models import AcademicYear, StudentGroup, PendingGradeAverage
+    from .grade_averages import GradeAverageCalculator
+    logger.info(f"Celery task: Starting compute_grade_averages_task (year={academic_year_id}, group={student_group_id}, incremental={incremental}).")
+
+    def report_progress(stage, done, total):
+        self.update_state(state='PROGRESS', meta={'stage': stage, 'current': done, 'total': total})
+
+    try:
+        if academic_year_id:
+            academic_years = AcademicYear.objects.filter(pk=academic_year_id)
+        else:
+            academic_years = AcademicYear.objects.filter(pk__in=PendingGradeAverage.objects.values('academic_year_id'))
+        student_group = StudentGroup.objects.get(pk=student_group_id) if student_group_id else None
+        results = [
+            GradeAverageCalculator(academic_year, student_group=student_group, incremental=incremental, progress_callback=report_progress).execute()
+            for academic_year in academic_years
+        ]
+        logger.info(f"Celery task: Finished compute_grade_averages_task: {results}")
+        return results
+    except Exception as e:
+        logger.error(f"Celery task: Error in compute_grade_averages_task: {e}", exc_info=True)
+        raise
@@ -7,6 +7,7 @@ from rest_framework import status
 from rest_framework.test import APITestCase
 from django.core.exceptions import ValidationError as DjangoValidationError
 from datetime import date, timedelta, time, datetime as dt
+from decimal import Decimal
 import os
 from django.core.files.uploadedfile import SimpleUploadedFile
 from unittest.mock import patch, MagicMock, AsyncMock # Добавлен AsyncMock
@@ -15,7 +16,7 @@ from .models import (
     AcademicYear, StudyPeriod, SubjectType, Subject, Classroom, StudentGroup,
     Curriculum, CurriculumEntry, Lesson, LessonJournalEntry, Homework,
     HomeworkAttachment, HomeworkSubmission, SubmissionAttachment, Attendance, Grade,
-    SubjectMaterial, SubjectMaterialAttachment
+    SubjectMaterial, SubjectMaterialAttachment, PendingGradeAverage
 )
 from notifications.models import Notification # Импорт Notification
 
@@ -105,6 +106,27 @@ class LessonModelAndAPITests(APITestCase):
             ).full_clean()
         self.assertIn("Преподаватель занят", str(cm.exception))
 
+    def test_lesson_overlap_enforced_by_db_constraint(self):
+        # bulk_create обходит clean(), пересечение должно отсечь ограничение-исключение БД
+        from django.db import IntegrityError, transaction
+        from .models import get_lesson_overlap_field
+        overlapping = Lesson(
+            study_period=self.period, student_group=self.group, subject=self.subject,
+            teacher=self.teacher, lesson_type=Lesson.LessonType.PRACTICE,
+            start_time=self.lesson1_start + timedelta(minutes=30),
+            end_time=self.lesson1_end + timedelta(minutes=30)
+        )
+        with self.assertRaises(IntegrityError) as cm:
+            with transaction.atomic():
+                Lesson.objects.bulk_create([overlapping])
+        self.assertIn(get_lesson_overlap_field(cm.exception), ('teacher', 'student_group'))
+        # Занятие "встык" конфликтом не является
+        Lesson.objects.create(
+            study_period=self.period, student_group=self.group, subject=self.subject,
+            teacher=self.teacher, classroom=self.classroom, lesson_type=Lesson.LessonType.PRACTICE,
+            start_time=self.lesson1_end, end_time=self.lesson1_end + timedelta(hours=1)
+        )
+
     def test_teacher_my_schedule_api(self):
         self.client.force_authenticate(user=self.teacher)
         response = self.client.get(self.my_schedule_url)
@@ -221,4 +243,305 @@ class JournalExporterTests(APITestCase):
         url = reverse('export-journal')
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response['Content-Type'], 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
\ No newline at end of file
+        self.assertEqual(response['Content-Type'], 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+
+class CurriculumFulfilmentTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin_fulfil@example.com', 'TestPassword123!')
+        cls.teacher = User.objects.create_user('teacher_fulfil@example.com', 'TestPassword123!', role=User.Role.TEACHER, is_active=True)
+        cls.year = AcademicYear.objects.create(name="FulfilYear", start_date=date(2023,9,1), end_date=date(2024,8,31))
+        cls.period = StudyPeriod.objects.create(academic_year=cls.year, name="FulfilPeriod", start_date=date(2023,9,1), end_date=date(2024,1,31))
+        cls.group = StudentGroup.objects.create(name="FulfilGroup", academic_year=cls.year)
+        cls.subject_math = Subject.objects.create(name="FulfilMath")
+        cls.subject_phys = Subject.objects.create(name="FulfilPhys")
+        cls.curriculum = Curriculum.objects.create(name="FulfilPlan", academic_year=cls.year, student_group=cls.group)
+        cls.entry_math = CurriculumEntry.objects.create(curriculum=cls.curriculum, subject=cls.subject_math, teacher=cls.teacher, study_period=cls.period, planned_hours=1)
+        cls.entry_phys = CurriculumEntry.objects.create(curriculum=cls.curriculum, subject=cls.subject_phys, teacher=cls.teacher, study_period=cls.period, planned_hours=10)
+        start = timezone.make_aware(dt(2023, 10, 2, 9, 0))
+        for day in range(2): # 2 x 90 минут = 3 часа при плане 1 час
+            Lesson.objects.create(
+                study_period=cls.period, student_group=cls.group, subject=cls.subject_math, teacher=cls.teacher,
+                start_time=start + timedelta(days=day), end_time=start + timedelta(days=day, minutes=90),
+                curriculum_entry=cls.entry_math
+            )
+        cls.url = reverse('stats-curriculum-fulfilment')
+
+    def test_lesson_duration_minutes_stored(self):
+        self.assertEqual(set(Lesson.objects.values_list('duration_minutes', flat=True)), {90})
+        entry = CurriculumEntry.objects.with_scheduled_minutes().get(pk=self.entry_math.pk)
+        self.assertEqual(entry.scheduled_hours, 3.0)
+        self.assertEqual(entry.remaining_hours, -2.0)
+
+    def test_fulfilment_report_for_curriculum(self):
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get(self.url, {'curriculum_id': self.curriculum.id})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = {row['curriculum_entry_id']: row for row in response.data['entries']}
+        self.assertTrue(rows[self.entry_math.id]['over_scheduled'])
+        self.assertEqual(rows[self.entry_math.id]['scheduled_hours'], 3.0)
+        self.assertTrue(rows[self.entry_phys.id]['under_scheduled'])
+        self.assertEqual(rows[self.entry_phys.id]['remaining_hours'], 10.0)
+        self.assertEqual(response.data['totals']['over_scheduled_count'], 1)
+
+    def test_fulfilment_report_requires_scope(self):
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+class ScheduleTemplateImportTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin_import@example.com', 'TestPassword123!')
+        cls.teacher = User.objects.create_user('teacher_import@example.com', 'TestPassword123!', role=User.Role.TEACHER, is_active=True)
+        cls.year = AcademicYear.objects.create(name="ImportYear", start_date=date(2023,9,1), end_date=date(2024,8,31))
+        cls.period = StudyPeriod.objects.create(academic_year=cls.year, name="ImportPeriod", start_date=date(2023,9,1), end_date=date(2024,1,31))
+        cls.group = StudentGroup.objects.create(name="ImportGroup", academic_year=cls.year)
+        cls.subject = Subject.objects.create(name="ImportSubject")
+        cls.url = reverse('import-data', kwargs={'import_type': 'schedule_template'})
+
+    def _post(self, **extra):
+        csv_content = (
+            "day_of_week,start_time,end_time,subject_id,teacher_id,classroom_id,lesson_type\n"
+            f"0,09:00,10:30,{self.subject.id},{self.teacher.id},,LECTURE\n"
+            f"2,09:00,10:30,{self.subject.id},{self.teacher.id},,PRACTICE\n"
+        ).encode('utf-8-sig')
+        data = {
+            'file': SimpleUploadedFile('template.csv', csv_content, content_type='text/csv'),
+            'period_start_date': '2023-10-02', 'period_end_date': '2023-10-15', # две недели
+            'student_group_id': self.group.id, 'academic_year_id': self.year.id,
+        }
+        data.update(extra)
+        self.client.force_authenticate(user=self.admin)
+        return self.client.post(self.url, data, format='multipart')
+
+    def test_dry_run_returns_diff_without_writing(self):
+        response = self._post(dry_run='true')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['summary']['to_create_count'], 4)
+        self.assertEqual(response.data['conflicts'], [])
+        self.assertFalse(Lesson.objects.filter(student_group=self.group).exists())
+
+    def test_import_creates_lessons_and_reports_conflicts(self):
+        response = self._post()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['created_lessons_count'], 4)
+        # Повторный пробный импорт без очистки - все занятия конфликтуют с уже созданными
+        response = self._post(dry_run='true')
+        self.assertEqual(response.data['summary']['conflicts_count'], 4)
+        # С очисткой существующего расписания конфликтов нет, старые занятия попадут в to_delete
+        response = self._post(dry_run='true', clear_existing_schedule='true')
+        self.assertEqual(response.data['summary']['conflicts_count'], 0)
+        self.assertEqual(response.data['summary']['to_delete_count'], 4)
+
+    @patch('notifications.utils.get_channel_layer')
+    def test_import_invalidates_stats_cache(self, mock_get_channel_layer):
+        from stats.cache import get_or_compute_stats
+        mock_layer = MagicMock(); mock_layer.group_send = AsyncMock()
+        mock_get_channel_layer.return_value = mock_layer
+        compute = MagicMock(return_value={'lessons': 0})
+        get_or_compute_stats('import_probe', 'admin', {'study_period_id': self.period.id}, compute)
+        get_or_compute_stats('import_probe', 'admin', {'study_period_id': self.period.id}, compute)
+        self.assertEqual(compute.call_count, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self._post().status_code, status.HTTP_201_CREATED)
+        get_or_compute_stats('import_probe', 'admin', {'study_period_id': self.period.id}, compute)
+        self.assertEqual(compute.call_count, 2)
+
+    @patch('edu_core.imports.default_storage')
+    @patch('edu_core.views.import_schedule_template_task')
+    def test_async_import_returns_task_id(self, mock_task, mock_storage):
+        mock_task.delay.return_value = MagicMock(id='task-123')
+        mock_storage.save.return_value = 'imports/schedule_templates/upload.csv'
+        response = self._post(run_async='true')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['task_id'], 'task-123')
+        mock_task.delay.assert_called_once()
+        # В задачу передается путь к сохраненному файлу, а не строки шаблона
+        self.assertEqual(mock_task.delay.call_args.args[0], 'imports/schedule_templates/upload.csv')
+
+class BulkDirectoryImportTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin_bulk@example.com', 'TestPassword123!')
+        cls.curator = User.objects.create_user('curator_bulk@example.com', 'TestPassword123!', role=User.Role.TEACHER, is_active=True)
+        cls.year = AcademicYear.objects.create(name="2030-2031", start_date=date(2030,9,1), end_date=date(2031,8,31))
+        cls.existing_student = User.objects.create_user('old_student@example.com', 'TestPassword123!', role=User.Role.STUDENT, is_active=True)
+
+    def _post(self, import_type, csv_content):
+        self.client.force_authenticate(user=self.admin)
+        url = reverse('import-data', kwargs={'import_type': import_type})
+        upload = SimpleUploadedFile('data.csv', csv_content.encode('utf-8'), content_type='text/csv')
+        return self.client.post(url, {'file': upload}, format='multipart')
+
+    def test_teacher_import_reports_created_updated_unchanged(self):
+        User.objects.create_user('t_same@example.com', 'TestPassword123!', first_name='Same', last_name='Teacher', role=User.Role.TEACHER, is_active=True, is_role_confirmed=True)
+        User.objects.create_user('t_upd@example.com', 'TestPassword123!', first_name='Old', last_name='Name', role=User.Role.TEACHER, is_active=True, is_role_confirmed=True)
+        response = self._post('teachers', (
+            "email,last_name,first_name,patronymic\n"
+            "t_same@example.com,Teacher,Same,\n"
+            "t_upd@example.com,Name,New,\n"
+            "t_new@example.com,Brand,New,\n"
+        ))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['unchanged']), (1, 1, 1))
+        self.assertEqual(User.objects.get(email='t_upd@example.com').first_name, 'New')
+        new_teacher = User.objects.get(email='t_new@example.com')
+        self.assertTrue(hasattr(new_teacher, 'profile'))
+        self.assertFalse(new_teacher.has_usable_password())
+
+    def test_student_group_import_applies_membership_diff(self):
+        group = StudentGroup.objects.create(name="BulkGroup", academic_year=self.year)
+        group.students.add(self.existing_student)
+        response = self._post('student-groups', (
+            "group_name,academic_year_name,curator_email,student_emails\n"
+            f"BulkGroup,{self.year.name},{self.curator.email},new1@example.com;new2@example.com\n"
+        ))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(response.data['students_created'], 2)
+        self.assertEqual(response.data['memberships_added'], 2)
+        self.assertEqual(response.data['memberships_removed'], 1)
+        group.refresh_from_db()
+        self.assertEqual(group.curator, self.curator)
+        self.assertEqual(set(group.students.values_list('email', flat=True)), {'new1@example.com', 'new2@example.com'})
+
+    def test_student_group_import_invalidates_group_stats_cache(self):
+        from stats.cache import get_or_compute_stats, SCOPE_GROUP
+        group = StudentGroup.objects.create(name="CacheGroup", academic_year=self.year)
+        compute = MagicMock(return_value={'students': 0})
+        get_or_compute_stats('group_probe', 'admin', {}, compute, scopes=[(SCOPE_GROUP, group.id)])
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self._post('student-groups', (
+                "group_name,academic_year_name,curator_email,student_emails\n"
+                f"CacheGroup,{self.year.name},,{self.existing_student.email}\n"
+            ))
+        self.assertEqual(response.data['memberships_added'], 1)
+        get_or_compute_stats('group_probe', 'admin', {}, compute, scopes=[(SCOPE_GROUP, group.id)])
+        self.assertEqual(compute.call_count, 2)
+
+    def test_student_group_import_unknown_year_rejected(self):
+        response = self._post('student-groups', "group_name,academic_year_name,curator_email,student_emails\nG,NoSuchYear,,\n")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(StudentGroup.objects.filter(name="G").exists())
+
+class AcademicYearRolloverTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin_rollover@example.com', 'TestPassword123!')
+        cls.teacher = User.objects.create_user('teacher_rollover@example.com', 'TestPassword123!', role=User.Role.TEACHER, is_active=True)
+        cls.student = User.objects.create_user('student_rollover@example.com', 'TestPassword123!', role=User.Role.STUDENT, is_active=True)
+        cls.source_year = AcademicYear.objects.create(name="RollSrc", start_date=date(2024,9,1), end_date=date(2025,8,31))
+        cls.target_year = AcademicYear.objects.create(name="RollDst", start_date=date(2025,9,1), end_date=date(2026,8,31))
+        cls.source_period = StudyPeriod.objects.create(academic_year=cls.source_year, name="1 семестр", start_date=date(2024,9,1), end_date=date(2024,12,31))
+        cls.target_period = StudyPeriod.objects.create(academic_year=cls.target_year, name="1 семестр", start_date=date(2025,9,1), end_date=date(2025,12,31))
+        cls.group = StudentGroup.objects.create(name="10А", academic_year=cls.source_year, curator=cls.teacher)
+        cls.group.students.add(cls.student)
+        cls.subject = Subject.objects.create(name="RollSubject")
+        cls.curriculum = Curriculum.objects.create(name="План", academic_year=cls.source_year, student_group=cls.group)
+        CurriculumEntry.objects.create(curriculum=cls.curriculum, subject=cls.subject, teacher=cls.teacher, study_period=cls.source_period, planned_hours=36)
+        cls.url = reverse('academic-year-rollover', kwargs={'pk': cls.source_year.pk})
+
+    def test_promote_group_name(self):
+        from .rollover import promote_group_name
+        self.assertEqual(promote_group_name("10А"), "11А")
+        self.assertEqual(promote_group_name("ПИ-09"), "ПИ-10")
+        self.assertEqual(promote_group_name("Без номера"), "Без номера")
+
+    def test_rollover_preview_and_execute(self):
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.post(self.url, {'target_year_id': self.target_year.id, 'dry_run': True, 'carry_memberships': True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['groups'][0]['target_name'], "11А")
+        self.assertEqual(response.data['summary']['entries_count'], 1)
+        self.assertFalse(StudentGroup.objects.filter(academic_year=self.target_year).exists())
+
+        response = self.client.post(self.url, {'target_year_id': self.target_year.id, 'carry_memberships': True}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        new_group = StudentGroup.objects.get(academic_year=self.target_year, name="11А")
+        self.assertEqual(new_group.curator, self.teacher)
+        self.assertTrue(new_group.students.filter(pk=self.student.pk).exists())
+        entry = CurriculumEntry.objects.get(curriculum__student_group=new_group)
+        self.assertEqual(entry.study_period, self.target_period)
+
+        # Повторный перенос ничего не дублирует
+        response = self.client.post(self.url, {'target_year_id': self.target_year.id, 'carry_memberships': True}, format='json')
+        self.assertEqual(response.data['groups_created'], 0)
+        self.assertEqual(response.data['entries_existing'], 1)
+        self.assertEqual(CurriculumEntry.objects.filter(curriculum__academic_year=self.target_year).count(), 1)
+
+    def test_study_periods_are_not_mapped_twice(self):
+        from .rollover import AcademicYearRollover
+        # "2 семестр" по позиции попал бы на целевой "1 семестр", уже занятый по названию
+        second_source = StudyPeriod.objects.create(academic_year=self.source_year, name="2 семестр", start_date=date(2024,8,1), end_date=date(2024,8,31))
+        _periods, period_map, unmapped = AcademicYearRollover(self.source_year, self.target_year)._map_study_periods()
+        self.assertEqual(period_map, {self.source_period.pk: self.target_period})
+        self.assertEqual(unmapped, [second_source])
+
+    def test_rollover_options_are_validated(self):
+        self.client.force_authenticate(user=self.admin)
+        for bad_options in ({'exclude_group_ids': 5}, {'group_name_map': "10А"}, {'target_year_id': 999999}):
+            response = self.client.post(self.url, {'target_year_id': self.target_year.id, 'dry_run': True, **bad_options}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        # multipart: одиночное значение списка - это один ID, а не набор цифр
+        response = self.client.post(self.url, {'target_year_id': self.target_year.id, 'dry_run': 'true', 'exclude_group_ids': str(self.group.id)}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['groups'], [])
+
+
+class GradeAverageCalculatorTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin_avg@example.com', 'TestPassword123!')
+        cls.student = User.objects.create_user('student_avg@example.com', 'TestPassword123!', role=User.Role.STUDENT, is_active=True)
+        cls.year = AcademicYear.objects.create(name="AvgYear", start_date=date(2024,9,1), end_date=date(2025,8,31), is_current=True)
+        cls.period1 = StudyPeriod.objects.create(academic_year=cls.year, name="1 семестр", start_date=date(2024,9,1), end_date=date(2024,12,31))
+        cls.period2 = StudyPeriod.objects.create(academic_year=cls.year, name="2 семестр", start_date=date(2025,1,1), end_date=date(2025,5,31))
+        cls.subject = Subject.objects.create(name="AvgSubject")
+        cls.url = reverse('grade-admin-compute-averages')
+
+    def _grade(self, period, value, weight=1):
+        return Grade.objects.create(student=self.student, subject=self.subject, study_period=period, grade_type=Grade.GradeType.TEST, grade_value=str(value), numeric_value=value, weight=weight)
+
+    def _average(self, grade_type, period=None):
+        return Grade.objects.get(student=self.student, subject=self.subject, grade_type=grade_type, study_period=period)
+
+    def test_incremental_upsert_and_stale_removal(self):
+        self._grade(self.period1, 5, weight=2); self._grade(self.period1, 2)
+        grade_p2 = self._grade(self.period2, 3)
+        self.assertTrue(PendingGradeAverage.objects.filter(student=self.student, academic_year=self.year).exists())
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['period_averages'], response.data['year_averages']), (2, 1))
+        self.assertEqual(self._average(Grade.GradeType.PERIOD_AVERAGE, self.period1).numeric_value, Decimal('4.00'))
+        self.assertEqual(self._average(Grade.GradeType.YEAR_AVERAGE).numeric_value, Decimal('3.75'))
+        self.assertFalse(PendingGradeAverage.objects.exists())
+
+        # Без изменений оценок инкрементальный запуск ничего не пересчитывает
+        response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.data['students_processed'], 0)
+
+        # Изменение оценки обновляет существующие средние, удаление - убирает неактуальную среднюю за период
+        grade_p2.delete()
+        response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.data['removed'], 1)
+        self.assertFalse(Grade.objects.filter(grade_type=Grade.GradeType.PERIOD_AVERAGE, study_period=self.period2).exists())
+        self.assertEqual(self._average(Grade.GradeType.YEAR_AVERAGE).numeric_value, Decimal('4.00'))
+        self.assertEqual(Grade.objects.filter(grade_type__in=Grade.CALCULATED_TYPES).count(), 2)
+
+    def test_full_run_keeps_averages_without_calculation_key(self):
+        self._grade(self.period1, 4)
+        manual = self._grade(self.period2, 5)
+        Grade.objects.filter(pk=manual.pk).update(grade_type=Grade.GradeType.PERIOD_AVERAGE, weight=0)
+        from .grade_averages import GradeAverageCalculator
+        result = GradeAverageCalculator(self.year, incremental=False).execute()
+        self.assertEqual(result['removed'], 0)
+        self.assertTrue(Grade.objects.filter(pk=manual.pk, calculation_key__isnull=True).exists())
+
+    def test_compute_averages_requires_admin(self):
+        self.client.force_authenticate(user=self.student)
+        response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
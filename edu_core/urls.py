@@ -107,9 +107,11 @@ urlpatterns = [
     path('management/', include(admin_homework_router.urls)),
     path('management/', include(admin_submissions_router.urls)),
     # Пути для импорта/экспорта данных и статистики (доступны администраторам)
+    path('management/import/jobs/<str:task_id>/', views.ImportJobStatusView.as_view(), name='import-job-status'),
     path('management/import/<str:import_type>/', views.ImportDataView.as_view(), name='import-data'),
     path('management/export/journal/', views.ExportJournalView.as_view(), name='export-journal'),
     path('management/stats/teacher-load/', views.TeacherLoadStatsView.as_view(), name='stats-teacher-load'),
+    path('management/stats/curriculum-fulfilment/', views.CurriculumFulfilmentView.as_view(), name='stats-curriculum-fulfilment'),
     path('management/stats/teacher-subject-performance/', views.TeacherSubjectPerformanceStatsView.as_view(), name='stats-teacher-subject-performance'),
     path('management/stats/group-performance/', views.GroupPerformanceView.as_view(), name='stats-group-performance-admin'),
 
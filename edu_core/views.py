@@ -22,6 +22,12 @@ from rest_framework import filters as drf_filters
 from rest_framework.exceptions import ValidationError as DRFValidationError, PermissionDenied
 
 from edu_core.exports import JournalExporter
+from edu_core.imports import ScheduleTemplateImporter, BULK_IMPORTERS
+from edu_core.rollover import AcademicYearRollover
+from edu_core.grade_averages import GradeAverageCalculator
+from edu_core.tasks import import_schedule_template_task, rollover_academic_year_task, compute_grade_averages_task
+from stats.services import TeacherLoadStatsService, StudentPerformanceStatsService
+from celery.result import AsyncResult
 from edu_core.filters import HomeworkFilter, HomeworkSubmissionFilter, LessonFilter
 
 
@@ -43,7 +49,7 @@ from .serializers import (
     HomeworkAttachmentSerializer, HomeworkSubmissionSerializer, SubmissionAttachmentSerializer,
     AttendanceSerializer, GradeSerializer, SubjectMaterialSerializer,
     TeacherLoadSerializer, GroupPerformanceSerializer, TeacherSubjectPerformanceSerializer,
-    TeacherImportSerializer, SubjectImportSerializer, StudentGroupImportSerializer, # ScheduleImportSerializer,
+    TeacherImportSerializer, SubjectImportSerializer, StudentGroupImportSerializer, AcademicYearRolloverSerializer, # ScheduleImportSerializer,
     MyGradeSerializer, MyAttendanceSerializer, MyHomeworkSerializer, StudentHomeworkSubmissionSerializer
 )
 from users.permissions import (
@@ -108,6 +114,39 @@ class AcademicYearViewSet(viewsets.ModelViewSet):
             raise DRFValidationError({ # Используем DRFValidationError
                 "study_period_creation_error": _("Учебный год создан, но не удалось автоматически создать идентичный учебный период. Ошибка: %(error)s") % {'error': str(e)}
             })
+
+    @action(detail=True, methods=['post'], url_path='rollover', permission_classes=[permissions.IsAuthenticated, IsAdmin])
+    def rollover(self, request, pk=None):
+        """
+        Перенос структуры этого учебного года (группы, учебные планы, записи планов,
+        опционально состав групп) в год target_year_id.
+        Параметры: target_year_id (обязательно), carry_memberships, promote_group_names (по умолчанию true),
+        exclude_group_ids, group_name_map, dry_run (предпросмотр без изменений), run_async (фоновая задача).
+        """
+        source_year = self.get_object()
+        params_serializer = AcademicYearRolloverSerializer(data=request.data)
+        params_serializer.is_valid(raise_exception=True)
+        params = params_serializer.validated_data
+        target_year = params['target_year_id']
+        options = {
+            'carry_memberships': params['carry_memberships'],
+            'promote_group_names': params['promote_group_names'],
+            'exclude_group_ids': params['exclude_group_ids'],
+            'group_name_map': params['group_name_map'],
+        }
+        try:
+            rollover = AcademicYearRollover(source_year, target_year, **options)
+            if params['dry_run']:
+                return Response(rollover.preview())
+            if params['run_async']:
+                task = rollover_academic_year_task.delay(source_year.pk, target_year.pk, options)
+                return Response({
+                    "message": _("Перенос структуры учебного года поставлен в очередь."),
+                    "task_id": task.id,
+                }, status=status.HTTP_202_ACCEPTED)
+            return Response(rollover.execute(), status=status.HTTP_201_CREATED)
+        except DRFValidationError as e:
+            return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
 class StudyPeriodViewSet(viewsets.ModelViewSet):
     pagination_class = StandardLimitOffsetPagination
 
@@ -291,7 +330,12 @@ class StudentGroupViewSet(viewsets.ModelViewSet):
 
 class CurriculumViewSet(viewsets.ModelViewSet):
     pagination_class = StandardLimitOffsetPagination
-    queryset = Curriculum.objects.select_related('academic_year', 'student_group').prefetch_related('entries__subject', 'entries__teacher', 'entries__study_period').all()
+    queryset = Curriculum.objects.select_related('academic_year', 'student_group').prefetch_related(
+        Prefetch(
+            'entries',
+            queryset=CurriculumEntry.objects.with_scheduled_minutes().select_related('subject', 'teacher', 'study_period')
+        )
+    ).all()
     serializer_class = CurriculumSerializer
     permission_classes = [permissions.IsAuthenticated]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
@@ -326,7 +370,7 @@ class CurriculumEntryViewSet(viewsets.ModelViewSet):
         if curriculum_id:
             # Фильтруем записи учебного плана по ID родительского учебного плана
             # и делаем все необходимые select_related/prefetch_related здесь
-            return CurriculumEntry.objects.filter(curriculum_id=curriculum_id).select_related(
+            return CurriculumEntry.objects.filter(curriculum_id=curriculum_id).with_scheduled_minutes().select_related(
                 'curriculum__academic_year', 
                 'curriculum__student_group', 
                 'subject', 
@@ -1243,10 +1287,45 @@ class GradeViewSet(viewsets.ModelViewSet):
     ordering_fields = ['date_given', 'student__last_name', 'subject__name', 'grade_type']; ordering = ['-date_given']
 
     def get_permissions(self):
+        if self.action == 'compute_averages':
+            return [permissions.IsAuthenticated(), IsAdmin()]
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             return [permissions.IsAuthenticated(), IsTeacherOrAdmin()]
         return [permissions.IsAuthenticated()] # Для list, retrieve
 
+    @action(detail=False, methods=['post'], url_path='compute-averages')
+    def compute_averages(self, request):
+        """
+        Расчет средних оценок за периоды (PERIOD_AVG) и за год (YEAR_AVG).
+        Параметры: academic_year_id (по умолчанию - текущий учебный год), student_group_id,
+        full (пересчитать всех студентов, а не только из очереди изменений),
+        run_async (фоновая задача; статус - management/import/jobs/<task_id>/).
+        """
+        def as_bool(value):
+            return str(value).lower() == 'true'
+
+        academic_year_id = request.data.get('academic_year_id')
+        try:
+            academic_year = AcademicYear.objects.get(pk=int(academic_year_id)) if academic_year_id else AcademicYear.objects.get(is_current=True)
+        except (TypeError, ValueError, AcademicYear.DoesNotExist, AcademicYear.MultipleObjectsReturned):
+            return Response({"error": _("Учебный год не найден.")}, status=status.HTTP_400_BAD_REQUEST)
+        student_group = None
+        student_group_id = request.data.get('student_group_id')
+        if student_group_id:
+            try:
+                student_group = StudentGroup.objects.get(pk=int(student_group_id))
+            except (TypeError, ValueError, StudentGroup.DoesNotExist):
+                return Response({"error": _("Учебная группа не найдена.")}, status=status.HTTP_400_BAD_REQUEST)
+        incremental = not as_bool(request.data.get('full'))
+
+        if as_bool(request.data.get('run_async')):
+            task = compute_grade_averages_task.delay(academic_year.pk, student_group.pk if student_group else None, incremental)
+            return Response({
+                "message": _("Расчет средних оценок поставлен в очередь."),
+                "task_id": task.id,
+            }, status=status.HTTP_202_ACCEPTED)
+        return Response(GradeAverageCalculator(academic_year, student_group=student_group, incremental=incremental).execute())
+
     def get_queryset(self):
         user = self.request.user; queryset = super().get_queryset()
         if self.action == 'list': # Применяем фильтры для списка
@@ -1873,130 +1952,124 @@ class ImportDataView(generics.GenericAPIView):
         if import_type == 'subjects': return SubjectImportSerializer
         if import_type == 'student-groups': return StudentGroupImportSerializer
         return None
-    # В ImportDataView
+    # Импорт шаблона расписания через ScheduleTemplateImporter.
+    # - dry_run=true: возвращает diff (to_create / to_delete / conflicts) без изменений в БД.
+    # - run_async=true или большой ожидаемый объем: файл сохраняется в хранилище, импорт ставится
+    #   в фоновую задачу, возвращается 202 с task_id; прогресс - через ImportJobStatusView.
+    # - иначе импорт выполняется синхронно.
+    def _import_schedule_template(self, request):
+        file_obj = request.FILES.get('file')
+        if not file_obj: return Response({"error": "Файл шаблона не предоставлен."}, status=status.HTTP_400_BAD_REQUEST)
+        if not file_obj.name.endswith('.csv'): return Response({"error": "Неверный формат файла. Требуется CSV."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Извлечение метаданных из request.data (не из файла)
+        if not request.data.get('period_start_date') or not request.data.get('period_end_date'):
+            return Response({"error": "Необходимо указать 'period_start_date' и 'period_end_date'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Валидация ID, если переданы
+        student_group_id = None
+        if request.data.get('student_group_id'):
+            try: student_group_id = int(request.data.get('student_group_id'))
+            except ValueError: return Response({"error": "Некорректный ID учебной группы."}, status=status.HTTP_400_BAD_REQUEST)
+
+        academic_year_id = None
+        if request.data.get('academic_year_id'):
+            try: academic_year_id = int(request.data.get('academic_year_id'))
+            except ValueError: return Response({"error": "Некорректный ID учебного года."}, status=status.HTTP_400_BAD_REQUEST)
+
+        params = {
+            'period_start_date': request.data.get('period_start_date'),
+            'period_end_date': request.data.get('period_end_date'),
+            'student_group_id': student_group_id,
+            'academic_year_id': academic_year_id,
+            'clear_existing_schedule': request.data.get('clear_existing_schedule'),
+        }
+        dry_run = str(request.data.get('dry_run', 'false')).lower() == 'true'
+        run_async = str(request.data.get('run_async', 'false')).lower() == 'true'
+
+        # Файл читается потоково: первый проход считает строки и оценку объема, не сохраняя их
+        importer = ScheduleTemplateImporter(request.user, params)
+        try:
+            scan = importer.scan(file_obj)
+        except (UnicodeDecodeError, csv.Error) as e:
+            return Response({"error": f"Ошибка чтения CSV: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+        if not scan['rows_count']:
+            return Response({"error": "CSV файл пуст или не содержит данных."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            if dry_run:
+                return Response(importer.dry_run(file_obj), status=status.HTTP_200_OK)
+
+            if run_async or scan['lessons_estimate'] > importer.ASYNC_LESSONS_THRESHOLD:
+                # В брокер уходит только путь к сохраненному файлу, а не строки шаблона
+                upload_path = ScheduleTemplateImporter.save_upload(file_obj)
+                task = import_schedule_template_task.delay(upload_path, params, request.user.id)
+                return Response({
+                    "message": "Импорт шаблона расписания поставлен в очередь.",
+                    "task_id": task.id,
+                }, status=status.HTTP_202_ACCEPTED)
+
+            return Response(importer.run(file_obj), status=status.HTTP_201_CREATED)
+
+        except DRFValidationError as e:
+            logger.warning(f"Schedule Import - Validation Error: {e.detail}")
+            return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error(f"Schedule Import - Unhandled error: {e}", exc_info=True)
+            return Response({
+                "error": _("Внутренняя ошибка сервера при генерации расписания."),
+                "details": f"{type(e).__name__}: {str(e)}"
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
     @transaction.atomic
     def post(self, request, import_type, *args, **kwargs):
         if import_type == 'schedule_template':
-            file_obj = request.FILES.get('file')
-            if not file_obj: return Response({"error": "Файл шаблона не предоставлен."}, status=status.HTTP_400_BAD_REQUEST)
-            if not file_obj.name.endswith('.csv'): return Response({"error": "Неверный формат файла. Требуется CSV."}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # --- ЛОГИРОВАНИЕ СОДЕРЖИМОГО ФАЙЛА ---
-            try:
-                # Прочитать файл для логирования, затем "перемотать" его для DictReader
-                file_content_for_log = file_obj.read().decode('utf-8-sig')
-                print("----------- RECEIVED CSV CONTENT START -----------")
-                print(file_content_for_log)
-                print("------------ RECEIVED CSV CONTENT END ------------")
-                file_obj.seek(0) # Возвращаем указатель в начало файла для DictReader
-            except Exception as log_e:
-                print(f"Error trying to log file content: {log_e}")
-            # --- КОНЕЦ ЛОГИРОВАНИЯ ---
-
-            try:
-                decoded_file = file_obj.read().decode('utf-8-sig')
-                csv_data = csv.DictReader(StringIO(decoded_file))
-                template_data_list = list(csv_data)
-                if not template_data_list:
-                    return Response({"error": "CSV файл пуст или не содержит данных."}, status=status.HTTP_400_BAD_REQUEST)
-            except Exception as e:
-                return Response({"error": f"Ошибка чтения CSV: {e}"}, status=status.HTTP_400_BAD_REQUEST)
-
-            # Извлечение метаданных из request.data (не из файла)
-            period_start_date_str = request.data.get('period_start_date')
-            period_end_date_str = request.data.get('period_end_date')
-            student_group_id_str = request.data.get('student_group_id') # Общий ID группы
-            academic_year_id_str = request.data.get('academic_year_id') # Опционально
-            clear_existing_value_from_request = request.data.get('clear_existing_schedule') # Имя ключа, которое вы используете на клиенте
-            print(f"!!!!!!!!!! ImportDataView - clear_existing_schedule from request.data: '{clear_existing_value_from_request}' (type: {type(clear_existing_value_from_request)}) !!!!!!!!!!")
-            if not period_start_date_str or not period_end_date_str:
-                return Response({"error": "Необходимо указать 'period_start_date' и 'period_end_date'."}, status=status.HTTP_400_BAD_REQUEST)
-            
-            # Валидация ID, если переданы
-            student_group_id = None
-            if student_group_id_str:
-                try: student_group_id = int(student_group_id_str)
-                except ValueError: return Response({"error": "Некорректный ID учебной группы."}, status=status.HTTP_400_BAD_REQUEST)
-            
-            academic_year_id = None
-            if academic_year_id_str:
-                try: academic_year_id = int(academic_year_id_str)
-                except ValueError: return Response({"error": "Некорректный ID учебного года."}, status=status.HTTP_400_BAD_REQUEST)
-
-
-            context = {
-                'request': request,
-                'period_start_date': period_start_date_str,
-                'period_end_date': period_end_date_str,
-                'student_group_id': student_group_id,
-                'academic_year_id': academic_year_id,
-                'clear_existing_schedule': clear_existing_value_from_request             }
-
-            serializer = ScheduleTemplateImportSerializer(data=template_data_list, context=context)
-            if serializer.is_valid(raise_exception=False): # Изменим на raise_exception=False, чтобы обработать ошибки is_valid отдельно
-                try:
-                    # serializer.save() вызовет serializer.create()
-                    # serializer.create() может выбросить serializers.ValidationError, если есть конфликты
-                    created_count = serializer.save() 
-                    
-                    return Response({
-                        "message": "Импорт шаблона расписания успешно завершен.",
-                        "created_lessons_count": created_count
-                    }, status=status.HTTP_201_CREATED)
-
-                # 1. Сначала ловим ValidationError, который может быть выброшен из serializer.create() (через serializer.save())
-                except DRFValidationError as e:
-                    logger.warning(f"Schedule Import - Validation Error during serializer.save() or create(): {e.detail}")
-                    return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
-                
-                # 2. Затем ловим IntegrityError, если bulk_create не удался из-за ограничений БД
-                except IntegrityError as e:
-                    logger.error(f"Schedule Import - IntegrityError during bulk_create: {e}", exc_info=True)
-                    # Пытаемся получить более детальную информацию об ошибке БД, если это возможно
-                    db_error_detail = getattr(e, 'args', None)
-                    if db_error_detail and len(db_error_detail) > 0:
-                        db_error_message = str(db_error_detail[0])
-                    else:
-                        db_error_message = str(e)
-                    return Response({
-                        "error": _("Ошибка базы данных при сохранении занятий. Проверьте на дублирование или нарушение уникальных ограничений."),
-                        "details": db_error_message
-                    }, status=status.HTTP_400_BAD_REQUEST)
-
-                # 3. Для всех остальных непредвиденных ошибок во время выполнения serializer.save()
-                except Exception as e:
-                    logger.error(f"Schedule Import - Unhandled error in serializer.save() or processing: {e}", exc_info=True)
-                    return Response({
-                        "error": _("Внутренняя ошибка сервера при генерации расписания."),
-                        "details": f"{type(e).__name__}: {str(e)}" # Более информативно
-                    }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            
-            else: # Если serializer.is_valid() сам по себе вернул False (ошибки на уровне LessonTemplateItemSerializer)
-                logger.warning(f"Schedule Import - Initial serializer validation failed: {serializer.errors}")
-                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-
-        else: # Обработка других типов импорта (как было)
+            return self._import_schedule_template(request)
+        else: # Справочники: set-based импорт (edu_core.imports.BULK_IMPORTERS)
             serializer_class = self.get_serializer_class_for_import(import_type)
-            # ... (ваша существующая логика для других импортов)
             if not serializer_class: return Response({"error": f"Неизвестный тип импорта: {import_type}"}, status=status.HTTP_400_BAD_REQUEST)
             file_obj = request.FILES.get('file')
             if not file_obj: return Response({"error": "Файл не предоставлен."}, status=status.HTTP_400_BAD_REQUEST)
             if not file_obj.name.endswith('.csv'): return Response({"error": "Неверный формат файла. Требуется CSV."}, status=status.HTTP_400_BAD_REQUEST)
-            try: decoded_file = file_obj.read().decode('utf-8-sig'); csv_data = csv.DictReader(StringIO(decoded_file)); data_to_serialize = list(csv_data)
-            except Exception as e: return Response({"error": f"Ошибка чтения CSV: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+            try: data_to_serialize = list(ScheduleTemplateImporter.iter_csv_rows(file_obj))
+            except (UnicodeDecodeError, csv.Error) as e: return Response({"error": f"Ошибка чтения CSV: {e}"}, status=status.HTTP_400_BAD_REQUEST)
             serializer = serializer_class(data=data_to_serialize, many=True, context={'request': request})
-            if serializer.is_valid():
-                try:
-                    created_instances = []
-                    if hasattr(serializer.child, 'create_or_update_teacher'): created_instances = [serializer.child.create_or_update_teacher(item_data) for item_data in serializer.validated_data]
-                    elif hasattr(serializer.child, 'create_or_update_subject'): created_instances = [serializer.child.create_or_update_subject(item_data) for item_data in serializer.validated_data]
-                    elif hasattr(serializer.child, 'create_or_update_group'): created_instances = [serializer.child.create_or_update_group(item_data) for item_data in serializer.validated_data]
-                    else: created_instances = serializer.save() # Общий случай, если нет кастомных методов
-                    return Response({"message": f"Импорт '{import_type}' успешно завершен.","processed_count": len(data_to_serialize),"created_or_updated_count": len(created_instances)}, status=status.HTTP_201_CREATED)
-                except serializers.ValidationError as e: # Явно ловим ошибки валидации из create/update
-                    return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
-                except Exception as e: return Response({"error": f"Ошибка во время сохранения данных: {e}", "details": getattr(e, 'detail', str(e))}, status=status.HTTP_400_BAD_REQUEST)
-            else: return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            importer = BULK_IMPORTERS[import_type]()
+            try:
+                import_stats = importer.import_rows(serializer.validated_data)
+            except DRFValidationError as e:
+                transaction.set_rollback(True)
+                return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
+            except IntegrityError as e:
+                transaction.set_rollback(True)
+                logger.error(f"Import '{import_type}' - IntegrityError: {e}", exc_info=True)
+                return Response({"error": f"Ошибка во время сохранения данных: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({
+                "message": f"Импорт '{import_type}' успешно завершен.",
+                "processed_count": len(data_to_serialize),
+                **import_stats,
+            }, status=status.HTTP_201_CREATED)
+
+
+class ImportJobStatusView(APIView):
+    """
+    Статус фоновой задачи импорта: state (PENDING / PROGRESS / SUCCESS / FAILURE),
+    progress ({'stage', 'current', 'total'}) во время выполнения и result после завершения.
+    """
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+
+    def get(self, request, task_id, *args, **kwargs):
+        task_result = AsyncResult(task_id)
+        data = {"task_id": task_id, "state": task_result.state}
+        if task_result.state == 'PROGRESS':
+            data["progress"] = task_result.info
+        elif task_result.state == 'SUCCESS':
+            data["result"] = task_result.result
+        elif task_result.state == 'FAILURE':
+            data["error"] = str(task_result.result)
+        return Response(data)
 
 
 class ExportJournalView(generics.GenericAPIView):
@@ -2049,36 +2122,30 @@ class ExportJournalView(generics.GenericAPIView):
 
 
 class TeacherLoadStatsView(generics.ListAPIView):
+    """
+    Нагрузка преподавателей (запланировано / поставлено в расписание).
+    Расчет - stats.services.TeacherLoadStatsService.get_loads_by_teacher, тот же, что у
+    статистики администратора, поэтому цифры совпадают.
+    """
     serializer_class = TeacherLoadSerializer
     permission_classes = [permissions.IsAuthenticated, IsAdmin]
     def get_queryset(self):
-        academic_year_id = self.request.query_params.get('academic_year_id')
-        study_period_id = self.request.query_params.get('study_period_id')
-        teachers_qs = User.objects.filter(role=User.Role.TEACHER).order_by('last_name', 'first_name')
-        planned_hours_filter = Q(teacher=OuterRef('pk'))
-        scheduled_lessons_filter = Q(teacher=OuterRef('pk'))
-        if academic_year_id:
-            planned_hours_filter &= Q(curriculum__academic_year_id=academic_year_id)
-            scheduled_lessons_filter &= Q(study_period__academic_year_id=academic_year_id)
-        if study_period_id:
-            planned_hours_filter &= Q(study_period_id=study_period_id)
-            scheduled_lessons_filter &= Q(study_period_id=study_period_id)
-        planned_hours_subquery = CurriculumEntry.objects.filter(planned_hours_filter).values('teacher').annotate(total_planned=Sum('planned_hours')).values('total_planned')
-        teachers_qs = teachers_qs.annotate(
-            total_planned_hours=Subquery(planned_hours_subquery, output_field=models.FloatField()),
-            scheduled_lesson_count=Count('lessons_taught_in_core', filter=scheduled_lessons_filter),
-            total_scheduled_duration=Sum(F('lessons_taught_in_core__end_time') - F('lessons_taught_in_core__start_time'), filter=scheduled_lessons_filter)
-        )
-        return teachers_qs
+        return User.objects.filter(role=User.Role.TEACHER).order_by('last_name', 'first_name')
     def list(self, request, *args, **kwargs): # Переопределяем для передачи обработанных данных в сериализатор
         queryset = self.filter_queryset(self.get_queryset())
+        load_service = TeacherLoadStatsService()
+        loads = load_service.get_loads_by_teacher(
+            academic_year_id=self.request.query_params.get('academic_year_id'),
+            study_period_id=self.request.query_params.get('study_period_id'),
+        )
         results = []
         for teacher in queryset:
+            load = loads.get(teacher.pk, load_service.EMPTY_LOAD)
             data = {
                 'id': teacher.pk, 'full_name': teacher.get_full_name(), 'email': teacher.email,
-                'total_planned_hours': teacher.total_planned_hours or 0.0,
-                'scheduled_lesson_count': teacher.scheduled_lesson_count or 0,
-                'total_scheduled_hours_float': (teacher.total_scheduled_duration.total_seconds() / 3600) if teacher.total_scheduled_duration else 0.0
+                'total_planned_hours': load['total_planned_hours'],
+                'scheduled_lesson_count': load['total_scheduled_lessons'],
+                'total_scheduled_hours_float': load['total_scheduled_hours'],
             }
             results.append(data)
         page = self.paginate_queryset(results)
@@ -2088,51 +2155,87 @@ class TeacherLoadStatsView(generics.ListAPIView):
         serializer = self.get_serializer(results, many=True)
         return Response(serializer.data)
 
+class CurriculumFulfilmentView(APIView):
+    """
+    Отчет о выполнении учебного плана: запланировано / поставлено в расписание / осталось часов
+    по каждой записи учебного плана. Параметры: curriculum_id (один план) или academic_year_id
+    (все планы года). Все записи считаются одним сгруппированным запросом по Lesson.duration_minutes.
+    Флаги over_scheduled / under_scheduled показывают избыток или недостаток часов в расписании.
+    """
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+
+    def get(self, request, *args, **kwargs):
+        curriculum_id = request.query_params.get('curriculum_id')
+        academic_year_id = request.query_params.get('academic_year_id')
+        if not curriculum_id and not academic_year_id:
+            return Response({"error": _("Необходимо указать 'curriculum_id' или 'academic_year_id'.")}, status=status.HTTP_400_BAD_REQUEST)
+
+        entries_qs = CurriculumEntry.objects.all()
+        try:
+            if curriculum_id:
+                entries_qs = entries_qs.filter(curriculum_id=int(curriculum_id))
+            if academic_year_id:
+                entries_qs = entries_qs.filter(curriculum__academic_year_id=int(academic_year_id))
+        except (TypeError, ValueError):
+            return Response({"error": _("Некорректный ID учебного плана или учебного года.")}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = entries_qs.with_scheduled_minutes().values(
+            'id', 'planned_hours', 'scheduled_minutes',
+            'curriculum_id', 'curriculum__name', 'curriculum__student_group__name',
+            'subject_id', 'subject__name',
+            'teacher_id', 'teacher__last_name', 'teacher__first_name',
+            'study_period_id', 'study_period__name',
+        ).order_by('curriculum__name', 'study_period__start_date', 'subject__name')
+
+        results = []
+        totals = {'planned_hours': 0.0, 'scheduled_hours': 0.0, 'over_scheduled_count': 0, 'under_scheduled_count': 0}
+        for row in rows:
+            planned_hours = float(row['planned_hours'])
+            scheduled_hours = round(row['scheduled_minutes'] / 60, 2)
+            remaining_hours = round(planned_hours - scheduled_hours, 2)
+            over_scheduled = scheduled_hours > planned_hours
+            under_scheduled = scheduled_hours < planned_hours
+            teacher_name = f"{row['teacher__last_name'] or ''} {row['teacher__first_name'] or ''}".strip() if row['teacher_id'] else None
+            results.append({
+                'curriculum_entry_id': row['id'],
+                'curriculum_id': row['curriculum_id'],
+                'curriculum_name': row['curriculum__name'],
+                'student_group_name': row['curriculum__student_group__name'],
+                'subject_id': row['subject_id'],
+                'subject_name': row['subject__name'],
+                'teacher_id': row['teacher_id'],
+                'teacher_name': teacher_name,
+                'study_period_id': row['study_period_id'],
+                'study_period_name': row['study_period__name'],
+                'planned_hours': planned_hours,
+                'scheduled_hours': scheduled_hours,
+                'remaining_hours': remaining_hours,
+                'over_scheduled': over_scheduled,
+                'under_scheduled': under_scheduled,
+            })
+            totals['planned_hours'] += planned_hours
+            totals['scheduled_hours'] += scheduled_hours
+            totals['over_scheduled_count'] += int(over_scheduled)
+            totals['under_scheduled_count'] += int(under_scheduled)
+
+        totals['planned_hours'] = round(totals['planned_hours'], 2)
+        totals['scheduled_hours'] = round(totals['scheduled_hours'], 2)
+        totals['remaining_hours'] = round(totals['planned_hours'] - totals['scheduled_hours'], 2)
+        return Response({'entries': results, 'totals': totals})
+
 class TeacherSubjectPerformanceStatsView(generics.ListAPIView):
     serializer_class = TeacherSubjectPerformanceSerializer
     permission_classes = [permissions.IsAuthenticated]
     def get_queryset(self):
         user = self.request.user; academic_year_id = self.request.query_params.get('academic_year_id'); study_period_id = self.request.query_params.get('study_period_id'); teacher_id_param = self.request.query_params.get('teacher_id')
         if not academic_year_id or not study_period_id: raise DRFValidationError(str(_("Необходимо указать 'academic_year_id' и 'study_period_id'.")))
-        target_teachers_qs = User.objects.filter(role=User.Role.TEACHER)
-        if user.is_teacher and not user.is_admin: target_teachers_qs = target_teachers_qs.filter(pk=user.pk)
-        elif user.is_admin and teacher_id_param: target_teachers_qs = target_teachers_qs.filter(pk=teacher_id_param)
-        elif not user.is_admin: return [] # Возвращаем пустой список, если нет прав и не указан teacher_id
-        results = []
-        for teacher in target_teachers_qs:
-            # Получаем информацию о предметах и группах, которые ведет учитель в данном периоде
-            lessons_info = Lesson.objects.filter(
-                teacher=teacher,
-                study_period_id=study_period_id,
-                # study_period__academic_year_id=academic_year_id # Это уже включено в study_period_id
-            ).values(
-                'subject_id', 'subject__name', 'student_group_id', 'student_group__name'
-            ).distinct()
-
-            teacher_data = {'teacher_id': teacher.id, 'teacher_name': teacher.get_full_name(), 'groups_data': []}
-            for lesson_info in lessons_info:
-                group_id = lesson_info['student_group_id']; subject_id = lesson_info['subject_id']
-                # Считаем средний балл для группы по предмету в периоде
-                avg_grade_data = Grade.objects.filter(
-                    student__student_group_memberships__id=group_id, # Студенты из этой группы
-                    subject_id=subject_id,
-                    study_period_id=study_period_id,
-                    numeric_value__isnull=False,
-                    weight__gt=0 # Учитываем только оценки с весом > 0
-                ).aggregate(
-                    weighted_sum=Sum(F('numeric_value') * F('weight')),
-                    total_weight=Sum('weight')
-                )
-                avg_grade = round(avg_grade_data['weighted_sum'] / avg_grade_data['total_weight'], 2) if avg_grade_data['total_weight'] and avg_grade_data['total_weight'] > 0 else None
-                grades_count = Grade.objects.filter(student__student_group_memberships__id=group_id, subject_id=subject_id, study_period_id=study_period_id, numeric_value__isnull=False).count()
-
-                teacher_data['groups_data'].append({
-                    'group_id': group_id, 'group_name': lesson_info['student_group__name'],
-                    'subject_id': subject_id, 'subject_name': lesson_info['subject__name'],
-                    'average_grade': avg_grade,
-                    'grades_count': grades_count
-                })
-            if teacher_data['groups_data']: results.append(teacher_data)
+        # Матрица строится сервисом статистики одним сгруппированным запросом по оценкам,
+        # поэтому выборка по всем преподавателям (админ) не дороже выборки по одному.
+        if user.is_teacher and not user.is_admin: teacher_ids = [user.pk]
+        elif user.is_admin and teacher_id_param: teacher_ids = [teacher_id_param]
+        elif user.is_admin: teacher_ids = None
+        else: return [] # Возвращаем пустой список, если нет прав и не указан teacher_id
+        results = StudentPerformanceStatsService().get_teacher_subject_group_matrix(study_period_id, teacher_ids=teacher_ids)
         return results
     def list(self, request, *args, **kwargs):
         queryset_data = self.get_queryset() # get_queryset теперь возвращает список словарей
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Notification, UserNotificationSettings
+from .models import Notification, NotificationArchive, UserNotificationSettings
 from django.urls import reverse # Импортировано для reverse
 
 # Класс NotificationAdmin настраивает отображение и управление моделью Notification
@@ -43,6 +43,20 @@ class NotificationAdmin(admin.ModelAdmin):
     content_object_link.short_description = 'Связанный объект'
     # allow_tags устарел, format_html является предпочтительным способом
 
+# Класс NotificationArchiveAdmin - просмотр архива старых непрочитанных уведомлений
+# (заполняется задачей хранения уведомлений); записи архива только для чтения.
+@admin.register(NotificationArchive)
+class NotificationArchiveAdmin(admin.ModelAdmin):
+    list_display = ('recipient', 'notification_type', 'created_at', 'archived_at')
+    list_filter = ('notification_type', 'created_at')
+    search_fields = ('recipient__email', 'message')
+    list_select_related = ('recipient',)
+    readonly_fields = ('recipient', 'notification_type', 'message', 'content_type', 'object_id', 'created_at', 'archived_at')
+    list_per_page = 50
+
+    def has_add_permission(self, request):
+        return False
+
 # Класс UserNotificationSettingsInline определяет встроенное отображение настроек
 # уведомлений пользователя (модель UserNotificationSettings) непосредственно на странице
 # редактирования объекта User в административной панели.
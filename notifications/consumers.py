@@ -1,10 +1,17 @@
 # notifications/consumers.py
+import asyncio
 import json
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.generic.http import AsyncHttpConsumer
+from channels.exceptions import StopConsumer
 from channels.db import database_sync_to_async # Если нужны запросы к БД
+from django.utils.dateparse import parse_datetime
 from users.models import User # Для типизации
 
 class NotificationConsumer(AsyncWebsocketConsumer):
+    SNAPSHOT_NOTIFICATIONS_LIMIT = 20
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.user: User | None = None # Типизация
@@ -29,12 +36,10 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         await self.accept()
         print(f"Notification WS connected for user {self.user.id} (group: {self.user_group_name})")
 
-        # Опционально: Отправить начальное состояние (например, кол-во непрочитанных)
-        # initial_unread_count = await self.get_total_unread_count()
-        # await self.send(text_data=json.dumps({
-        #     'type': 'unread_count_update',
-        #     'total_unread': initial_unread_count
-        # }))
+        # Начальное состояние одним фреймом: общее число непрочитанных, непрочитанные по чатам
+        # и последние уведомления - вместо нескольких REST-запросов клиента при загрузке страницы
+        snapshot = await self.get_snapshot()
+        await self.send(text_data=json.dumps({'type': 'snapshot', **snapshot}))
 
     async def disconnect(self, close_code):
         print(f"Notification WS disconnected for user {self.user.id}, code: {close_code}")
@@ -81,12 +86,120 @@ class NotificationConsumer(AsyncWebsocketConsumer):
                  'total_unread': total_unread
              }))
 
-    # --- Вспомогательные методы (пример) ---
-    # @database_sync_to_async
-    # def get_total_unread_count(self):
-    #     """ Асинхронно получает общее количество непрочитанных уведомлений для пользователя. """
-    #     if self.user:
-    #         # Ваша логика подсчета непрочитанных уведомлений из модели Notification
-    #         # return Notification.objects.filter(recipient=self.user, is_read=False).count()
-    #         return 0 # Заглушка
-    #     return 0
\ No newline at end of file
+    # --- Вспомогательные методы ---
+    @database_sync_to_async
+    def get_snapshot(self):
+        """ Собирает начальное состояние клиента (notifications.utils.build_notification_snapshot). """
+        from .utils import build_notification_snapshot
+        return build_notification_snapshot(self.user.id, notifications_limit=self.SNAPSHOT_NOTIFICATIONS_LIMIT)
+
+
+# Класс NotificationStreamConsumer - облегченный транспорт уведомлений через Server-Sent Events
+# (GET /api/notifications/stream/?token=<JWT>, маршрутизируется в server_api.asgi).
+# Подписывается на ту же группу channel layer (`user_{id}`), что и NotificationConsumer,
+# и передает события new_notification, unread_count_update и chat.unread_update в формате SSE
+# (поле data - тот же JSON, что и во фреймах WebSocket).
+# Идентификатор события - время создания уведомления (created_at, ISO 8601; для схлопываемых
+# уведомлений оно сдвигается при каждом новом событии). При переподключении браузер передает его
+# в заголовке Last-Event-ID (или клиент - в параметре last_event_id), и перед подпиской на живые
+# события отправляются уведомления, созданные или обновленные позже (не больше RESUME_LIMIT).
+# Каждые HEARTBEAT_SECONDS отправляется комментарий-пинг, чтобы прокси не закрывали соединение.
+# Поток живет до отключения клиента: http.disconnect (AsyncHttpConsumer.http_disconnect) вызывает
+# disconnect(), который останавливает пинги и выходит из группы.
+class NotificationStreamConsumer(AsyncHttpConsumer):
+    RESUME_LIMIT = 100
+    HEARTBEAT_SECONDS = 25
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.user = None
+        self.user_group_name = None
+        self.heartbeat_task = None
+        self.streaming = False
+
+    # AsyncHttpConsumer.http_request завершает потребителя (disconnect() и StopConsumer) сразу после
+    # возврата handle(). Для открытого потока SSE потребитель остается работать до http.disconnect.
+    # handle() при этом не блокируется: цикл потребителя обрабатывает сообщения последовательно,
+    # и ожидание внутри handle() не дало бы доставлять события group_send и само http.disconnect.
+    async def http_request(self, message):
+        if "body" in message:
+            self.body.append(message["body"])
+        if message.get("more_body"):
+            return
+        try:
+            await self.handle(b"".join(self.body))
+        except Exception:
+            await self.disconnect()
+            raise
+        if not self.streaming:
+            await self.disconnect()
+            raise StopConsumer()
+
+    async def handle(self, body):
+        self.user = self.scope.get("user")
+        if not self.user or not self.user.is_authenticated:
+            await self.send_response(401, b"Authentication required", headers=[(b"Content-Type", b"text/plain; charset=utf-8")])
+            return
+
+        await self.send_headers(headers=[
+            (b"Content-Type", b"text/event-stream; charset=utf-8"),
+            (b"Cache-Control", b"no-cache"),
+            (b"X-Accel-Buffering", b"no"), # Отключает буферизацию ответа в nginx
+        ])
+        # Пустой фрагмент тела отправляет заголовки клиенту сразу, даже если событий для повтора нет
+        await self.send_body(b"", more_body=True)
+        self.streaming = True
+        self.user_group_name = f"user_{self.user.id}"
+        await self.channel_layer.group_add(self.user_group_name, self.channel_name)
+
+        last_event_at = parse_datetime(self._last_event_id() or '')
+        if last_event_at:
+            for notification_data in await self.get_notifications_since(last_event_at):
+                await self.send_event('new_notification', {'notification': notification_data}, event_id=notification_data['created_at'])
+        self.heartbeat_task = asyncio.ensure_future(self._heartbeat())
+
+    def _last_event_id(self):
+        headers = dict(self.scope.get('headers') or [])
+        if b'last-event-id' in headers: return headers[b'last-event-id'].decode('utf-8', 'ignore')
+        return parse_qs(self.scope.get('query_string', b'').decode('utf-8')).get('last_event_id', [None])[0]
+
+    @database_sync_to_async
+    def get_notifications_since(self, last_event_at):
+        from .models import Notification
+        from .serializers import NotificationSerializer
+        notifications = Notification.objects.filter(recipient=self.user, created_at__gt=last_event_at).order_by('created_at')[:self.RESUME_LIMIT]
+        return NotificationSerializer(notifications, many=True).data
+
+    async def send_event(self, event_type, data, event_id=None):
+        frame = f"id: {event_id}\n" if event_id else ""
+        frame += f"event: {event_type}\ndata: {json.dumps({'type': event_type, **data})}\n\n"
+        await self.send_body(frame.encode('utf-8'), more_body=True)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.HEARTBEAT_SECONDS)
+            await self.send_body(b": ping\n\n", more_body=True)
+
+    async def disconnect(self):
+        self.streaming = False
+        if self.heartbeat_task:
+            self.heartbeat_task.cancel()
+            self.heartbeat_task = None
+        if self.user_group_name:
+            await self.channel_layer.group_discard(self.user_group_name, self.channel_name)
+            self.user_group_name = None
+
+    # --- МЕТОДЫ-ОБРАБОТЧИКИ ДЛЯ group_send (те же события, что и у NotificationConsumer) ---
+
+    async def new_notification(self, event):
+        notification_data = event.get('notification')
+        if notification_data:
+            await self.send_event('new_notification', {'notification': notification_data}, event_id=notification_data.get('created_at'))
+
+    async def chat_unread_update(self, event):
+        if event.get('chat_id') is not None and event.get('unread_count') is not None:
+            await self.send_event('chat.unread_update', {'chat_id': event['chat_id'], 'unread_count': event['unread_count']})
+
+    async def total_unread_update(self, event):
+        if event.get('total_unread') is not None:
+            await self.send_event('unread_count_update', {'total_unread': event['total_unread']})
@@ -0,0 +1,65 @@
+import logging
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+# Счетчики непрочитанных уведомлений пользователей.
+# Значение хранится в кэше Django (django-redis) бессрочно и изменяется атомарными incr/decr
+# при создании уведомлений и изменении статуса прочтения (notifications.utils.change_unread_counts).
+# Если ключа нет (первое обращение, сброс кэша), счетчик вычисляется из БД при чтении.
+# Периодическая сверка (reconcile_unread_counts) исправляет расхождения с БД.
+
+UNREAD_COUNT_KEY_PREFIX = 'notifications:unread'
+
+
+def _unread_count_key(user_id):
+    return f"{UNREAD_COUNT_KEY_PREFIX}:{user_id}"
+
+
+# Пересчитывает счетчик пользователя из БД и сохраняет его в кэше.
+def refresh_unread_count(user_id):
+    count = Notification.objects.filter(recipient_id=user_id, is_read=False).count()
+    cache.set(_unread_count_key(user_id), count, timeout=None)
+    return count
+
+
+# Возвращает число непрочитанных уведомлений пользователя (из кэша или из БД).
+def get_unread_count(user_id):
+    count = cache.get(_unread_count_key(user_id))
+    if count is None or count < 0: return refresh_unread_count(user_id)
+    return count
+
+
+# Изменяет счетчики на указанные величины (словарь {user_id: delta}).
+# Отсутствующие ключи не создаются - они будут вычислены из БД при следующем чтении.
+def adjust_unread_counts(deltas):
+    for user_id, delta in deltas.items():
+        if not delta: continue
+        try:
+            if delta > 0: cache.incr(_unread_count_key(user_id), delta)
+            else: cache.decr(_unread_count_key(user_id), -delta)
+        except ValueError:
+            pass
+
+
+# Сверяет счетчики с БД одним сгруппированным запросом.
+# Учитываются пользователи, для которых счетчик есть в кэше или есть непрочитанные уведомления
+# (user_ids ограничивает сверку). Возвращает словарь {user_id: count} исправленных счетчиков.
+def reconcile_unread_counts(user_ids):
+    user_ids = list(user_ids)
+    actual_counts = dict(
+        Notification.objects.filter(recipient_id__in=user_ids, is_read=False)
+        .values('recipient_id').annotate(unread=Count('id')).order_by().values_list('recipient_id', 'unread')
+    )
+    cached_counts = cache.get_many([_unread_count_key(user_id) for user_id in user_ids])
+    corrected = {
+        user_id: actual_counts.get(user_id, 0) for user_id in user_ids
+        if cached_counts.get(_unread_count_key(user_id)) not in (None, actual_counts.get(user_id, 0))
+    }
+    if corrected:
+        cache.set_many({_unread_count_key(user_id): count for user_id, count in corrected.items()}, timeout=None)
+        logger.info(f"Reconciled {len(corrected)} unread notification counters.")
+    return corrected
@@ -0,0 +1,86 @@
+import logging
+from collections import defaultdict
+from django.db import transaction
+from django.utils import timezone
+
+from users.mail import enqueue_emails
+from users.models import User
+from .models import Notification, PendingDigestItem, UserNotificationSettings
+from .preferences import get_notification_preferences
+from .utils import bulk_send_notifications
+
+logger = logging.getLogger(__name__)
+
+
+# Класс NotificationDigestService отправляет сводки (дайджесты) буферизованных уведомлений
+# для режима доставки HOURLY или DAILY.
+# - Получатели с записями в буфере PendingDigestItem обрабатываются пакетами по BATCH_SIZE;
+#   для каждого получателя создается одно уведомление со списком событий (не больше MAX_LINES строк).
+# - Уведомления пакета создаются одним bulk_create (без повторной буферизации), обработанные
+#   записи буфера удаляются в той же транзакции.
+# - Пользователям с включенным digest_email письмо с тем же текстом ставится в очередь исходящих
+#   писем (users.mail.enqueue_emails) в той же транзакции; отправку с повторами выполняет outbox.
+# Записи буфера неактивных пользователей удаляются без отправки.
+class NotificationDigestService:
+    BATCH_SIZE = 500
+    MAX_LINES = 20
+    EMAIL_TEMPLATE = 'emails/notification_digest.html'
+    TITLES = {
+        UserNotificationSettings.DeliveryMode.HOURLY: "Сводка уведомлений за час",
+        UserNotificationSettings.DeliveryMode.DAILY: "Сводка уведомлений за день",
+    }
+
+    def __init__(self, delivery_mode, now=None):
+        self.delivery_mode = delivery_mode
+        self.now = now or timezone.now()
+
+    def _pending_items(self):
+        return PendingDigestItem.objects.filter(delivery_mode=self.delivery_mode, created_at__lte=self.now)
+
+    def _render(self, items):
+        lines = [f"- {item['message']}" for item in items[:self.MAX_LINES]]
+        if len(items) > self.MAX_LINES: lines.append(f"...и еще {len(items) - self.MAX_LINES}")
+        return f"{self.TITLES.get(self.delivery_mode, 'Сводка уведомлений')} ({len(items)}):\n" + "\n".join(lines)
+
+    # Тип уведомления-сводки: тип событий, если он у всех один, иначе системное.
+    def _digest_type(self, items):
+        notification_types = {item['notification_type'] for item in items}
+        return notification_types.pop() if len(notification_types) == 1 else Notification.NotificationType.SYSTEM
+
+    def _send_batch(self, recipient_ids):
+        with transaction.atomic():
+            items = list(
+                self._pending_items().select_for_update().filter(recipient_id__in=recipient_ids)
+                .order_by('recipient_id', 'created_at').values('id', 'recipient_id', 'notification_type', 'message')
+            )
+            items_by_recipient = defaultdict(list)
+            for item in items: items_by_recipient[item['recipient_id']].append(item)
+            recipient_emails = dict(User.objects.filter(id__in=items_by_recipient, is_active=True).values_list('id', 'email'))
+            digests = {recipient_id: self._render(recipient_items) for recipient_id, recipient_items in items_by_recipient.items() if recipient_id in recipient_emails}
+            bulk_send_notifications([
+                Notification(recipient_id=recipient_id, message=digest_text, notification_type=self._digest_type(items_by_recipient[recipient_id]))
+                for recipient_id, digest_text in digests.items()
+            ], batch_size=self.BATCH_SIZE, apply_digest=False)
+            PendingDigestItem.objects.filter(id__in=[item['id'] for item in items]).delete()
+
+            preferences = get_notification_preferences(digests)
+            title = self.TITLES.get(self.delivery_mode, 'Сводка уведомлений')
+            emails = enqueue_emails([
+                {
+                    'to_email': recipient_emails[recipient_id], 'subject': title,
+                    'template_name': self.EMAIL_TEMPLATE, 'context': {'title': title, 'digest_text': digest_text},
+                }
+                for recipient_id, digest_text in digests.items() if preferences[recipient_id].get('digest_email')
+            ])
+        return len(digests), len(emails)
+
+    # Отправляет сводки. Возвращает {'digests': количество уведомлений-сводок, 'emails': количество писем}.
+    def execute(self):
+        recipient_ids = list(self._pending_items().values_list('recipient_id', flat=True).distinct().order_by('recipient_id'))
+        digests_sent = emails_sent = 0
+        for start in range(0, len(recipient_ids), self.BATCH_SIZE):
+            batch_digests, batch_emails = self._send_batch(recipient_ids[start:start + self.BATCH_SIZE])
+            digests_sent += batch_digests; emails_sent += batch_emails
+        result = {'delivery_mode': self.delivery_mode, 'digests': digests_sent, 'emails': emails_sent}
+        logger.info(f"Notification digests sent: {result}")
+        return result
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2025-06-05 12:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edu_core', '0012_grade_calculation_key_pendinggradeaverage'),
+        ('notifications', '0004_remove_usernotificationsettings_enable_quiz_due_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HomeworkReminder',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sent_at', models.DateTimeField(auto_now_add=True, verbose_name='отправлено')),
+                ('homework', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='deadline_reminders', to='edu_core.homework', verbose_name='домашнее задание')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='homework_reminders', to=settings.AUTH_USER_MODEL, verbose_name='студент')),
+            ],
+            options={
+                'verbose_name': 'напоминание о сроке ДЗ',
+                'verbose_name_plural': 'напоминания о сроках ДЗ',
+                'unique_together': {('homework', 'student')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.7 on 2025-06-06 10:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0005_homeworkreminder'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='group_key',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='ключ группировки'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='aggregated_count',
+            field=models.PositiveIntegerField(default=1, verbose_name='количество событий'),
+        ),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_read', False)), fields=('recipient', 'group_key'), name='notification_unread_group_key_uniq'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.7 on 2025-06-06 15:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('notifications', '0006_notification_group_key_aggregated_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notification_type', models.CharField(choices=[('SCHEDULE', 'Расписание'), ('MESSAGE', 'Сообщение в чате'), ('ASSIGNMENT_NEW', 'Новое домашнее задание'), ('ASSIGNMENT_DUE', 'Срок сдачи ДЗ'), ('ASSIGNMENT_SUBMITTED', 'ДЗ сдано'), ('ASSIGNMENT_GRADED', 'ДЗ проверено/оценено'), ('GRADE_NEW', 'Новая оценка'), ('SYSTEM', 'Системное')], max_length=25, verbose_name='тип уведомления')),
+                ('message', models.TextField(verbose_name='текст уведомления')),
+                ('object_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(verbose_name='создано')),
+                ('archived_at', models.DateTimeField(auto_now_add=True, verbose_name='архивировано')),
+                ('content_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_notifications', to=settings.AUTH_USER_MODEL, verbose_name='получатель')),
+            ],
+            options={
+                'verbose_name': 'архивное уведомление',
+                'verbose_name_plural': 'архив уведомлений',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['recipient', '-created_at'], name='notificatio_recipie_914bcc_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.1.7 on 2025-06-07 11:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('notifications', '0007_notificationarchive'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usernotificationsettings',
+            name='schedule_delivery',
+            field=models.CharField(choices=[('INSTANT', 'Сразу'), ('HOURLY', 'Сводка раз в час'), ('DAILY', 'Сводка раз в день')], default='INSTANT', max_length=10, verbose_name='доставка: расписание'),
+        ),
+        migrations.AddField(
+            model_name='usernotificationsettings',
+            name='assignment_new_delivery',
+            field=models.CharField(choices=[('INSTANT', 'Сразу'), ('HOURLY', 'Сводка раз в час'), ('DAILY', 'Сводка раз в день')], default='INSTANT', max_length=10, verbose_name='доставка: новые ДЗ'),
+        ),
+        migrations.AddField(
+            model_name='usernotificationsettings',
+            name='assignment_due_delivery',
+            field=models.CharField(choices=[('INSTANT', 'Сразу'), ('HOURLY', 'Сводка раз в час'), ('DAILY', 'Сводка раз в день')], default='INSTANT', max_length=10, verbose_name='доставка: напоминания о сроках ДЗ'),
+        ),
+        migrations.AddField(
+            model_name='usernotificationsettings',
+            name='digest_email',
+            field=models.BooleanField(default=False, verbose_name='дублировать сводку по email'),
+        ),
+        migrations.CreateModel(
+            name='PendingDigestItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notification_type', models.CharField(choices=[('SCHEDULE', 'Расписание'), ('MESSAGE', 'Сообщение в чате'), ('ASSIGNMENT_NEW', 'Новое домашнее задание'), ('ASSIGNMENT_DUE', 'Срок сдачи ДЗ'), ('ASSIGNMENT_SUBMITTED', 'ДЗ сдано'), ('ASSIGNMENT_GRADED', 'ДЗ проверено/оценено'), ('GRADE_NEW', 'Новая оценка'), ('SYSTEM', 'Системное')], max_length=25, verbose_name='тип уведомления')),
+                ('delivery_mode', models.CharField(max_length=10, verbose_name='режим доставки')),
+                ('message', models.TextField(verbose_name='текст уведомления')),
+                ('object_id', models.PositiveIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='создано')),
+                ('content_type', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='contenttypes.contenttype')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_digest_items', to=settings.AUTH_USER_MODEL, verbose_name='получатель')),
+            ],
+            options={
+                'verbose_name': 'уведомление в очереди дайджеста',
+                'verbose_name_plural': 'очередь дайджеста уведомлений',
+                'indexes': [models.Index(fields=['delivery_mode', 'recipient', 'created_at'], name='notificatio_deliver_da0878_idx')],
+            },
+        ),
+    ]
@@ -4,7 +4,8 @@ from django.conf import settings
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
 from django.utils.translation import gettext_lazy as _
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
 logger = logging.getLogger(__name__)
@@ -23,6 +24,11 @@ logger = logging.getLogger(__name__)
 # - is_read: Булево поле, указывающее, прочитано ли уведомление пользователем (индексируется).
 # - content_type, object_id, content_object: Поля для GenericForeignKey, позволяющие
 #   связать уведомление с конкретным объектом-источником.
+# - group_key, aggregated_count: Схлопываемые уведомления (например, сообщения чата).
+#   У получателя не больше одного непрочитанного уведомления с данным group_key
+#   (частичный уникальный индекс); новые события обновляют его текст, увеличивают
+#   aggregated_count и сдвигают created_at на время последнего события.
+#   После прочтения следующее событие создает новое уведомление.
 # Мета-класс определяет человекочитаемые имена, порядок сортировки по умолчанию
 # (сначала новые уведомления) и составной индекс для полей ('recipient', 'is_read', '-created_at')
 # для ускорения запросов на получение непрочитанных уведомлений для пользователя.
@@ -51,17 +57,89 @@ class Notification(models.Model):
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, null=True, blank=True)
     object_id = models.PositiveIntegerField(null=True, blank=True)
     content_object = GenericForeignKey('content_type', 'object_id')
+    group_key = models.CharField(_('ключ группировки'), max_length=64, null=True, blank=True)
+    aggregated_count = models.PositiveIntegerField(_('количество событий'), default=1)
 
     class Meta:
         verbose_name = _('уведомление')
         verbose_name_plural = _('уведомления')
         ordering = ['-created_at']
         indexes = [models.Index(fields=['recipient', 'is_read', '-created_at'])]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipient', 'group_key'], condition=models.Q(is_read=False),
+                name='notification_unread_group_key_uniq'
+            )
+        ]
 
     def __str__(self):
         recipient_name = self.recipient.email if self.recipient else "N/A"
         return f"Уведомление для {recipient_name}: {self.message[:50]}..."
 
+# Модель NotificationArchive - компактный архив старых непрочитанных уведомлений.
+# Задача хранения (notifications.retention) переносит сюда непрочитанные уведомления
+# старше заданного срока и удаляет их из основной таблицы Notification.
+# Хранятся только получатель, тип, текст, ссылка на связанный объект и время создания;
+# индекс (recipient, -created_at) покрывает выборку архива пользователя.
+class NotificationArchive(models.Model):
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_notifications', verbose_name=_('получатель'))
+    notification_type = models.CharField(_('тип уведомления'), max_length=25, choices=Notification.NotificationType.choices)
+    message = models.TextField(_('текст уведомления'))
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, null=True, blank=True)
+    object_id = models.PositiveIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(_('создано'))
+    archived_at = models.DateTimeField(_('архивировано'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('архивное уведомление')
+        verbose_name_plural = _('архив уведомлений')
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['recipient', '-created_at'])]
+
+    def __str__(self):
+        return f"Архивное уведомление для {self.recipient_id}: {self.message[:50]}..."
+
+# Модель HomeworkReminder - журнал отправленных напоминаний о сроке сдачи ДЗ.
+# Одна запись на пару (ДЗ, студент): движок напоминаний (notifications.reminders)
+# исключает пары, уже записанные в журнал, поэтому повторные запуски задачи
+# не отправляют повторных напоминаний. Уникальный индекс (homework, student) используется
+# и для анти-соединения при выборке, и как защита от дублей при вставке.
+class HomeworkReminder(models.Model):
+    homework = models.ForeignKey('edu_core.Homework', on_delete=models.CASCADE, related_name='deadline_reminders', verbose_name=_('домашнее задание'))
+    student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='homework_reminders', verbose_name=_('студент'))
+    sent_at = models.DateTimeField(_('отправлено'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('напоминание о сроке ДЗ')
+        verbose_name_plural = _('напоминания о сроках ДЗ')
+        unique_together = ('homework', 'student')
+
+    def __str__(self):
+        return f"Напоминание о ДЗ {self.homework_id} для студента {self.student_id}"
+
+# Модель PendingDigestItem - буфер уведомлений, доставляемых сводкой (дайджестом).
+# Уведомления типов, для которых пользователь выбрал доставку раз в час или раз в день,
+# не создаются сразу, а записываются сюда; задача дайджеста (notifications.digests)
+# объединяет буфер каждого пользователя в одно уведомление (и, по настройке, одно письмо)
+# и очищает обработанные записи. Индекс (delivery_mode, recipient, created_at) покрывает
+# выборку буфера задачей.
+class PendingDigestItem(models.Model):
+    recipient = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='pending_digest_items', verbose_name=_('получатель'))
+    notification_type = models.CharField(_('тип уведомления'), max_length=25, choices=Notification.NotificationType.choices)
+    delivery_mode = models.CharField(_('режим доставки'), max_length=10)
+    message = models.TextField(_('текст уведомления'))
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE, null=True, blank=True)
+    object_id = models.PositiveIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField(_('создано'), auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('уведомление в очереди дайджеста')
+        verbose_name_plural = _('очередь дайджеста уведомлений')
+        indexes = [models.Index(fields=['delivery_mode', 'recipient', 'created_at'])]
+
+    def __str__(self):
+        return f"Дайджест ({self.delivery_mode}) для {self.recipient_id}: {self.message[:50]}..."
+
 # Модель UserNotificationSettings хранит индивидуальные настройки уведомлений для каждого пользователя.
 # Она связана с моделью пользователя (AUTH_USER_MODEL) отношением "один-к-одному".
 # - user: OneToOneField на модель пользователя.
@@ -69,13 +147,22 @@ class Notification(models.Model):
 #   типу уведомлений из Notification.NotificationType (например, enable_schedule, enable_messages).
 #   Эти поля позволяют пользователю включать или отключать получение уведомлений конкретных типов.
 #   По умолчанию все типы уведомлений включены.
+# - Поля *_delivery: Режим доставки для низкоприоритетных типов (расписание, новые ДЗ,
+#   напоминания о сроках): сразу (INSTANT), сводкой раз в час (HOURLY) или раз в день (DAILY).
+#   Карта DIGEST_FIELD_MAP сопоставляет тип уведомления и поле режима доставки.
+# - digest_email: Дублировать сводку письмом на email пользователя.
 # Метод класса get_settings_for_user возвращает объект настроек для указанного пользователя,
 # создавая его с настройками по умолчанию, если он еще не существует.
 # Метод is_enabled проверяет, включен ли конкретный тип уведомления для данного пользователя,
-# используя карту сопоставления строкового значения типа уведомления (из Notification.NotificationType)
+# используя карту сопоставления TYPE_FIELD_MAP строкового значения типа уведомления (из Notification.NotificationType)
 # с соответствующим полем enable_* в модели настроек. Если для типа уведомления
 # нет явной настройки, по умолчанию уведомление разрешается (возвращает True).
 class UserNotificationSettings(models.Model):
+    class DeliveryMode(models.TextChoices):
+        INSTANT = 'INSTANT', _('Сразу')
+        HOURLY = 'HOURLY', _('Сводка раз в час')
+        DAILY = 'DAILY', _('Сводка раз в день')
+
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL, 
         on_delete=models.CASCADE, 
@@ -93,6 +180,29 @@ class UserNotificationSettings(models.Model):
     enable_system = models.BooleanField(_('системные'), default=True)
     # При добавлении новых NotificationType, сюда также добавляются соответствующие поля enable_...
 
+    schedule_delivery = models.CharField(_('доставка: расписание'), max_length=10, choices=DeliveryMode.choices, default=DeliveryMode.INSTANT)
+    assignment_new_delivery = models.CharField(_('доставка: новые ДЗ'), max_length=10, choices=DeliveryMode.choices, default=DeliveryMode.INSTANT)
+    assignment_due_delivery = models.CharField(_('доставка: напоминания о сроках ДЗ'), max_length=10, choices=DeliveryMode.choices, default=DeliveryMode.INSTANT)
+    digest_email = models.BooleanField(_('дублировать сводку по email'), default=False)
+
+    # Сопоставление типа уведомления и поля настройки (используется и кэшем настроек notifications.preferences)
+    TYPE_FIELD_MAP = {
+        Notification.NotificationType.SCHEDULE: 'enable_schedule',
+        Notification.NotificationType.MESSAGE: 'enable_messages',
+        Notification.NotificationType.ASSIGNMENT_NEW: 'enable_assignment_new',
+        Notification.NotificationType.ASSIGNMENT_DUE: 'enable_assignment_due',
+        Notification.NotificationType.ASSIGNMENT_SUBMITTED: 'enable_assignment_submitted',
+        Notification.NotificationType.ASSIGNMENT_GRADED: 'enable_assignment_graded',
+        Notification.NotificationType.GRADE_NEW: 'enable_grade_new',
+        Notification.NotificationType.SYSTEM: 'enable_system',
+    }
+    # Типы уведомлений, которые можно получать сводкой, и поля режима их доставки
+    DIGEST_FIELD_MAP = {
+        Notification.NotificationType.SCHEDULE: 'schedule_delivery',
+        Notification.NotificationType.ASSIGNMENT_NEW: 'assignment_new_delivery',
+        Notification.NotificationType.ASSIGNMENT_DUE: 'assignment_due_delivery',
+    }
+
     class Meta:
         verbose_name = _('настройки уведомлений')
         verbose_name_plural = _('настройки уведомлений')
@@ -107,18 +217,7 @@ class UserNotificationSettings(models.Model):
         return settings_obj
 
     def is_enabled(self, notification_type_value: str) -> bool:
-        type_to_field_map = {
-            Notification.NotificationType.SCHEDULE: 'enable_schedule',
-            Notification.NotificationType.MESSAGE: 'enable_messages',
-            Notification.NotificationType.ASSIGNMENT_NEW: 'enable_assignment_new',
-            Notification.NotificationType.ASSIGNMENT_DUE: 'enable_assignment_due',
-            Notification.NotificationType.ASSIGNMENT_SUBMITTED: 'enable_assignment_submitted',
-            Notification.NotificationType.ASSIGNMENT_GRADED: 'enable_assignment_graded',
-            Notification.NotificationType.GRADE_NEW: 'enable_grade_new',
-            Notification.NotificationType.SYSTEM: 'enable_system',
-        }
-
-        field_name_to_check = type_to_field_map.get(notification_type_value)
+        field_name_to_check = self.TYPE_FIELD_MAP.get(notification_type_value)
 
         if field_name_to_check and hasattr(self, field_name_to_check):
             is_setting_enabled = getattr(self, field_name_to_check)
@@ -145,4 +244,15 @@ class UserNotificationSettings(models.Model):
 def create_user_notification_settings_receiver(sender, instance, created, **kwargs):
     if created:
         UserNotificationSettings.get_settings_for_user(instance)
-        logger.info(f"Созданы настройки уведомлений по умолчанию для нового пользователя {instance.email}")
\ No newline at end of file
+        logger.info(f"Созданы настройки уведомлений по умолчанию для нового пользователя {instance.email}")
+
+# Функция-обработчик сигнала invalidate_notification_preferences_receiver.
+# После сохранения или удаления настроек уведомлений (в т.ч. через UserNotificationSettingsView)
+# удаляет их из кэша настроек (notifications.preferences) сразу и повторно после фиксации
+# транзакции - чтобы параллельный запрос не закэшировал прежние значения до фиксации.
+@receiver(post_save, sender=UserNotificationSettings)
+@receiver(post_delete, sender=UserNotificationSettings)
+def invalidate_notification_preferences_receiver(sender, instance, **kwargs):
+    from .preferences import invalidate_notification_preferences
+    invalidate_notification_preferences(instance.user_id)
+    transaction.on_commit(lambda: invalidate_notification_preferences(instance.user_id))
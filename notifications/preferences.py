@@ -0,0 +1,108 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import UserNotificationSettings
+
+logger = logging.getLogger(__name__)
+
+# Кэш настроек уведомлений пользователей (UserNotificationSettings) для горячего пути отправки.
+# Двухуровневый: LRU в памяти процесса (с коротким TTL) поверх кэша Django (django-redis).
+# Промахи обоих уровней загружаются из БД одним запросом для всех запрошенных пользователей.
+# При сохранении настроек (сигнал post_save в notifications.models) запись удаляется из Redis
+# и из LRU текущего процесса; LRU других процессов обновляются по истечении LOCAL_TTL.
+# Строки настроек создаются заранее обработчиком create_user_notification_settings_receiver,
+# поэтому путь отправки ничего не пишет; для пользователя без строки действуют значения по умолчанию.
+
+PREFERENCES_CACHE_TIMEOUT = getattr(settings, 'NOTIFICATION_PREFERENCES_CACHE_TIMEOUT', 60 * 60)
+PREFERENCES_LOCAL_TTL = getattr(settings, 'NOTIFICATION_PREFERENCES_LOCAL_TTL', 30)
+PREFERENCES_LOCAL_MAXSIZE = getattr(settings, 'NOTIFICATION_PREFERENCES_LOCAL_MAXSIZE', 5000)
+PREFERENCES_KEY_PREFIX = 'notifications:prefs:v2'
+PREFERENCE_FIELDS = tuple(UserNotificationSettings.TYPE_FIELD_MAP.values()) + tuple(UserNotificationSettings.DIGEST_FIELD_MAP.values()) + ('digest_email',)
+DEFAULT_PREFERENCES = {field_name: UserNotificationSettings._meta.get_field(field_name).default for field_name in PREFERENCE_FIELDS}
+
+
+# LRU-кэш в памяти процесса с ограничением размера и временем жизни записей.
+class _LocalLRUCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize; self.ttl = ttl
+        self._data = OrderedDict(); self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic(); found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._data.get(key)
+                if entry is None: continue
+                if entry[0] < now:
+                    del self._data[key]; continue
+                self._data.move_to_end(key); found[key] = entry[1]
+        return found
+
+    def set_many(self, items):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for key, value in items.items():
+                self._data[key] = (expires_at, value); self._data.move_to_end(key)
+            while len(self._data) > self.maxsize: self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock: self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock: self._data.clear()
+
+
+_local_cache = _LocalLRUCache(PREFERENCES_LOCAL_MAXSIZE, PREFERENCES_LOCAL_TTL)
+
+
+def _preferences_key(user_id):
+    return f"{PREFERENCES_KEY_PREFIX}:{user_id}"
+
+
+# Возвращает настройки уведомлений для набора пользователей:
+# {user_id: {enable_*: bool, *_delivery: режим доставки, digest_email: bool}}.
+def get_notification_preferences(user_ids):
+    user_ids = set(user_ids)
+    preferences = _local_cache.get_many(user_ids)
+    missing_ids = user_ids - set(preferences)
+    if missing_ids:
+        cached = cache.get_many([_preferences_key(user_id) for user_id in missing_ids])
+        shared_hits = {user_id: cached[_preferences_key(user_id)] for user_id in missing_ids if _preferences_key(user_id) in cached}
+        missing_ids -= set(shared_hits)
+        loaded = {}
+        if missing_ids:
+            loaded = {
+                row.pop('user_id'): row
+                for row in UserNotificationSettings.objects.filter(user_id__in=missing_ids).values('user_id', *PREFERENCE_FIELDS)
+            }
+            # Строки нет (например, пользователь создан до появления настроек) - значения по умолчанию
+            loaded.update({user_id: dict(DEFAULT_PREFERENCES) for user_id in missing_ids - set(loaded)})
+            cache.set_many({_preferences_key(user_id): row for user_id, row in loaded.items()}, timeout=PREFERENCES_CACHE_TIMEOUT)
+        _local_cache.set_many({**shared_hits, **loaded})
+        preferences.update(shared_hits); preferences.update(loaded)
+    return preferences
+
+
+# Проверяет, включен ли тип уведомления у пользователя (по кэшу настроек).
+# Для типа без настройки уведомление разрешается, как и в UserNotificationSettings.is_enabled.
+def is_notification_enabled(user_id, notification_type_value):
+    field_name = UserNotificationSettings.TYPE_FIELD_MAP.get(notification_type_value)
+    if field_name is None: return True
+    return get_notification_preferences([user_id])[user_id].get(field_name, True)
+
+
+# Возвращает режим доставки типа уведомления по строке настроек пользователя
+# (INSTANT для типов, которые нельзя получать сводкой).
+def delivery_mode_for(preferences, notification_type_value):
+    field_name = UserNotificationSettings.DIGEST_FIELD_MAP.get(notification_type_value)
+    if field_name is None: return UserNotificationSettings.DeliveryMode.INSTANT
+    return preferences.get(field_name, UserNotificationSettings.DeliveryMode.INSTANT)
+
+
+def invalidate_notification_preferences(user_id):
+    cache.delete(_preferences_key(user_id))
+    _local_cache.delete(user_id)
@@ -0,0 +1,94 @@
+import logging
+from datetime import timedelta
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models import Q, F, Exists, OuterRef
+from django.utils import timezone
+
+from edu_core.models import Homework, HomeworkSubmission
+from .models import Notification, HomeworkReminder
+from .utils import bulk_send_notifications
+
+logger = logging.getLogger(__name__)
+
+
+# Класс HomeworkReminderEngine рассылает напоминания о приближающихся сроках сдачи ДЗ.
+# - Все пары (ДЗ, студент группы занятия) со сроком в ближайшие days_threshold дней, для которых
+#   нет сдачи и еще не было напоминания, выбираются одним запросом с анти-соединениями (NOT EXISTS)
+#   по HomeworkSubmission и журналу HomeworkReminder; неактивные студенты и студенты с отключенными
+#   напоминаниями (enable_assignment_due) отсекаются в том же запросе.
+# - Пары обрабатываются пакетами по BATCH_SIZE: в одной транзакции пакетно вставляются записи журнала
+#   и уведомления, после фиксации уведомления отправляются через WebSocket.
+# - Записи журнала вставляются через INSERT ... ON CONFLICT DO NOTHING RETURNING, и уведомления создаются
+#   только для пар, вставленных этим запуском: пересекающиеся запуски (beat и ручной/повторный запуск)
+#   не отправляют одно напоминание дважды.
+# Повторный запуск отправляет напоминания только новым парам (например, по новым ДЗ или новым студентам группы).
+class HomeworkReminderEngine:
+    BATCH_SIZE = 500
+    STUDENT_PATH = 'journal_entry__lesson__student_group__students'
+
+    def __init__(self, days_threshold=3, now=None):
+        self.now = now or timezone.now()
+        self.deadline_end = self.now + timedelta(days=days_threshold)
+
+    # Пары (homework_id, student_id), которым нужно отправить напоминание.
+    def pending_pairs(self):
+        student_path = self.STUDENT_PATH
+        return Homework.objects.filter(
+            Q(**{f'{student_path}__notification_settings__isnull': True}) | Q(**{f'{student_path}__notification_settings__enable_assignment_due': True}),
+            due_date__gte=self.now, due_date__lte=self.deadline_end,
+            **{f'{student_path}__is_active': True},
+        ).annotate(student_id=F(student_path)).filter(
+            ~Exists(HomeworkSubmission.objects.filter(homework_id=OuterRef('pk'), student_id=OuterRef('student_id'))),
+            ~Exists(HomeworkReminder.objects.filter(homework_id=OuterRef('pk'), student_id=OuterRef('student_id'))),
+        ).values_list('pk', 'student_id').order_by('pk', 'student_id')
+
+    def _message(self, homework_data):
+        due_date_str = homework_data['due_date'].strftime('%d.%m.%Y %H:%M') if homework_data['due_date'] else "N/A"
+        subject_name = homework_data['journal_entry__lesson__subject__name'] or "N/A"
+        return f"Напоминание: срок сдачи ДЗ '{homework_data['title']}' по предмету '{subject_name}' истекает {due_date_str}."
+
+    def _send_batch(self, pairs, homework_content_type):
+        homework_messages = {
+            homework_data['id']: self._message(homework_data)
+            for homework_data in Homework.objects.filter(pk__in={homework_id for homework_id, _ in pairs})
+            .values('id', 'title', 'due_date', 'journal_entry__lesson__subject__name')
+        }
+        with transaction.atomic():
+            pairs = self._claim_pairs(pairs)
+            bulk_send_notifications([
+                Notification(
+                    recipient_id=student_id, message=homework_messages[homework_id],
+                    notification_type=Notification.NotificationType.ASSIGNMENT_DUE,
+                    content_type=homework_content_type, object_id=homework_id,
+                )
+                for homework_id, student_id in pairs
+            ], batch_size=self.BATCH_SIZE)
+        return len(pairs)
+
+    # Записывает пары в журнал HomeworkReminder и возвращает только реально вставленные.
+    # Пары, уже записанные другим запуском, пропускаются (ON CONFLICT DO NOTHING); конкурентная
+    # незафиксированная вставка той же пары ждет фиксации первой транзакции.
+    def _claim_pairs(self, pairs):
+        if not pairs: return []
+        sent_at = timezone.now()
+        params = [value for homework_id, student_id in pairs for value in (homework_id, student_id, sent_at)]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {connection.ops.quote_name(HomeworkReminder._meta.db_table)} (homework_id, student_id, sent_at) "
+                f"VALUES {', '.join(['(%s, %s, %s)'] * len(pairs))} "
+                "ON CONFLICT (homework_id, student_id) DO NOTHING RETURNING homework_id, student_id",
+                params,
+            )
+            return [tuple(row) for row in cursor.fetchall()]
+
+    # Отправляет напоминания. Возвращает {'homeworks': количество ДЗ, 'reminders_sent': количество напоминаний}.
+    def execute(self):
+        pairs = list(self.pending_pairs())
+        homework_content_type = ContentType.objects.get_for_model(Homework)
+        reminders_sent = 0
+        for start in range(0, len(pairs), self.BATCH_SIZE):
+            reminders_sent += self._send_batch(pairs[start:start + self.BATCH_SIZE], homework_content_type)
+        result = {'homeworks': len({homework_id for homework_id, _ in pairs}), 'reminders_sent': reminders_sent}
+        logger.info(f"Homework deadline reminders (until {self.deadline_end}): {result}")
+        return result
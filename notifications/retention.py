@@ -0,0 +1,70 @@
+import logging
+from collections import Counter
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Notification, NotificationArchive
+from .utils import change_unread_counts
+
+logger = logging.getLogger(__name__)
+
+
+# Класс NotificationRetentionService применяет политику хранения уведомлений:
+# - прочитанные уведомления старше read_retention_days удаляются;
+# - непрочитанные уведомления старше unread_archive_days переносятся в NotificationArchive.
+# Обработка идет пакетами по batch_size: идентификаторы пакета выбираются по индексу created_at,
+# каждый пакет удаляется (и архивируется) в отдельной короткой транзакции, поэтому блокировки
+# основной таблицы не удерживаются надолго. max_batches ограничивает объем работы за один запуск.
+class NotificationRetentionService:
+    READ_RETENTION_DAYS = getattr(settings, 'NOTIFICATION_READ_RETENTION_DAYS', 90)
+    UNREAD_ARCHIVE_DAYS = getattr(settings, 'NOTIFICATION_UNREAD_ARCHIVE_DAYS', 180)
+    BATCH_SIZE = getattr(settings, 'NOTIFICATION_RETENTION_BATCH_SIZE', 5000)
+    ARCHIVE_FIELDS = ('id', 'recipient_id', 'notification_type', 'message', 'content_type_id', 'object_id', 'created_at')
+
+    def __init__(self, read_retention_days=None, unread_archive_days=None, batch_size=None, max_batches=None, now=None):
+        now = now or timezone.now()
+        self.read_cutoff = now - timedelta(days=read_retention_days or self.READ_RETENTION_DAYS)
+        self.unread_cutoff = now - timedelta(days=unread_archive_days or self.UNREAD_ARCHIVE_DAYS)
+        self.batch_size = batch_size or self.BATCH_SIZE
+        self.max_batches = max_batches
+
+    def _batches(self, queryset):
+        batches_done = 0
+        while self.max_batches is None or batches_done < self.max_batches:
+            batch_ids = list(queryset.order_by('created_at').values_list('id', flat=True)[:self.batch_size])
+            if not batch_ids: return
+            yield batch_ids
+            batches_done += 1
+
+    def purge_read(self):
+        purged_count = 0
+        for batch_ids in self._batches(Notification.objects.filter(is_read=True, created_at__lt=self.read_cutoff)):
+            purged_count += Notification.objects.filter(id__in=batch_ids).delete()[0]
+        return purged_count
+
+    def archive_unread(self):
+        archived_count = 0
+        for batch_ids in self._batches(Notification.objects.filter(is_read=False, created_at__lt=self.unread_cutoff)):
+            with transaction.atomic():
+                rows = Notification.objects.select_for_update().filter(id__in=batch_ids, is_read=False).values(*self.ARCHIVE_FIELDS)
+                archive_entries = [
+                    NotificationArchive(
+                        recipient_id=row['recipient_id'], notification_type=row['notification_type'], message=row['message'],
+                        content_type_id=row['content_type_id'], object_id=row['object_id'], created_at=row['created_at'],
+                    )
+                    for row in rows
+                ]
+                NotificationArchive.objects.bulk_create(archive_entries, batch_size=self.batch_size)
+                # Удаляются только заархивированные строки; уведомления, прочитанные между выборкой
+                # идентификаторов и блокировкой, остаются для purge_read.
+                Notification.objects.filter(id__in=[row['id'] for row in rows]).delete()
+                change_unread_counts({user_id: -count for user_id, count in Counter(row['recipient_id'] for row in rows).items()})
+            archived_count += len(archive_entries)
+        return archived_count
+
+    def execute(self):
+        result = {'purged': self.purge_read(), 'archived': self.archive_unread()}
+        logger.info(f"Notification retention applied: {result}")
+        return result
@@ -1,4 +1,5 @@
-from django.urls import re_path
+from django.urls import path, re_path
+from server_api.middleware import JwtAuthMiddlewareStack
 from . import consumers
 
 # Список websocket_urlpatterns определяет маршрутизацию для WebSocket-соединений,
@@ -22,4 +23,12 @@ from . import consumers
 # NotificationConsumer.
 websocket_urlpatterns = [
     re_path(r'ws/notifications/$', consumers.NotificationConsumer.as_asgi()),
-]
\ No newline at end of file
+]
+
+# Список http_urlpatterns - HTTP-маршруты, обслуживаемые консьюмерами Channels (а не Django):
+# потоковая доставка уведомлений через Server-Sent Events (NotificationStreamConsumer).
+# EventSource не передает заголовки, поэтому JWT берется из query string (JwtAuthMiddleware).
+# Подключается в server_api.asgi перед основным Django-приложением.
+http_urlpatterns = [
+    path('api/notifications/stream/', JwtAuthMiddlewareStack(consumers.NotificationStreamConsumer.as_asgi())),
+]
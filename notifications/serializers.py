@@ -9,10 +9,13 @@ from .models import Notification, UserNotificationSettings
 #   - fields: Определяет набор полей модели, которые будут включены в сериализованное
 #     представление. Включает 'id', 'recipient' (получатель), 'message' (текст),
 #     'notification_type' (тип), 'created_at' (дата создания), 'is_read' (статус прочтения),
-#     а также 'content_type' и 'object_id' для ссылки на связанный объект (GenericForeignKey).
+#     а также 'content_type' и 'object_id' для ссылки на связанный объект (GenericForeignKey)
+#     и 'aggregated_count' - число событий, схлопнутых в уведомление (например, сообщений чата).
 #   - read_only_fields: Список полей, которые доступны только для чтения. Это означает,
 #     что эти поля не могут быть изменены через API с использованием этого сериализатора.
 #     Обычно такие поля устанавливаются программно при создании уведомления.
+#     'is_read' тоже только для чтения: статус прочтения меняется действиями mark-read/mark-unread/
+#     mark-all-read, которые проверяют схлопываемые уведомления (group_key) и обновляют счетчик.
 #
 # Закомментированное поле 'content_object_url' предполагает возможность добавления
 # метода для генерации URL-адреса связанного объекта, если это необходимо для клиента.
@@ -22,9 +25,9 @@ class NotificationSerializer(serializers.ModelSerializer):
         fields = (
             'id', 'recipient', 'message', 'notification_type',
             'created_at', 'is_read',
-            'content_type', 'object_id',
+            'content_type', 'object_id', 'aggregated_count',
         )
-        read_only_fields = ('recipient', 'message', 'notification_type', 'created_at', 'content_type', 'object_id')
+        read_only_fields = ('recipient', 'message', 'notification_type', 'created_at', 'is_read', 'content_type', 'object_id', 'aggregated_count')
 
 # Сериализатор UserNotificationSettingsSerializer предназначен для преобразования
 # экземпляров модели UserNotificationSettings (настройки уведомлений пользователя)
@@ -1,6 +1,10 @@
 from celery import shared_task
 from django.utils import timezone # Импортировано для использования в notify_upcoming_homework_deadlines
-from .utils import notify_upcoming_homework_deadlines # Импорт функции из utils.py
+from users.models import User
+from .utils import notify_upcoming_homework_deadlines, push_unread_counts # Импорт функций из utils.py
+from .counters import reconcile_unread_counts
+from .retention import NotificationRetentionService
+from .digests import NotificationDigestService
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,8 +26,9 @@ logger = logging.getLogger(__name__)
 # 2. Вызывает функцию `notify_upcoming_homework_deadlines` из `notifications.utils`,
 #    передавая ей параметр `days_before` (как `days_threshold`).
 #    Эта функция содержит основную логику по поиску домашних заданий
-#    с подходящими сроками и отправке уведомлений студентам.
-# 3. Логгирует успешное завершение задачи.
+#    с подходящими сроками и отправке уведомлений студентам. Отправленные напоминания
+#    записываются в журнал HomeworkReminder, поэтому задачу можно запускать часто (ежечасно).
+# 3. Логгирует успешное завершение задачи и возвращает количество ДЗ и отправленных напоминаний.
 # 4. В случае возникновения исключения, логгирует ошибку и перевыбрасывает исключение,
 #    чтобы Celery мог зафиксировать сбой задачи и, возможно, применить
 #    механизмы повторного выполнения (если они настроены).
@@ -31,9 +36,54 @@ logger = logging.getLogger(__name__)
 def send_homework_deadline_reminders_task(days_before=3):
     logger.info(f"Celery task: Starting send_homework_deadline_reminders_task (days_before={days_before}).")
     try:
-        notify_upcoming_homework_deadlines(days_threshold=days_before)
-        logger.info(f"Celery task: Finished send_homework_deadline_reminders_task successfully.")
-        return f"Reminders sent for homework due in {days_before} days."
+        result = notify_upcoming_homework_deadlines(days_threshold=days_before)
+        logger.info(f"Celery task: Finished send_homework_deadline_reminders_task successfully: {result}")
+        return result
     except Exception as e:
         logger.error(f"Celery task: Error in send_homework_deadline_reminders_task: {e}", exc_info=True)
-        raise
\ No newline at end of file
+        raise
+
+# Задача apply_notification_retention_task применяет политику хранения уведомлений
+# (notifications.retention.NotificationRetentionService): удаляет старые прочитанные
+# уведомления и архивирует старые непрочитанные пакетами ограниченного размера.
+# Запускается ежедневно через Celery Beat; max_batches ограничивает объем работы за запуск,
+# остаток обрабатывается следующими запусками.
+@shared_task(name="apply_notification_retention")
+def apply_notification_retention_task(max_batches=None):
+    logger.info("Celery task: Starting apply_notification_retention_task.")
+    try:
+        result = NotificationRetentionService(max_batches=max_batches).execute()
+        logger.info(f"Celery task: Finished apply_notification_retention_task successfully: {result}")
+        return result
+    except Exception as e:
+        logger.error(f"Celery task: Error in apply_notification_retention_task: {e}", exc_info=True)
+        raise
+
+# Задача reconcile_unread_notification_counts_task сверяет счетчики непрочитанных уведомлений
+# в кэше (notifications.counters) с БД пакетами по batch_size активных пользователей
+# и отправляет исправленные значения пользователям через WebSocket.
+# Запускается ежечасно через Celery Beat.
+@shared_task(name="reconcile_unread_notification_counts")
+def reconcile_unread_notification_counts_task(batch_size=1000):
+    user_ids = list(User.objects.filter(is_active=True).order_by('id').values_list('id', flat=True))
+    corrected_count = 0
+    for start in range(0, len(user_ids), batch_size):
+        corrected = reconcile_unread_counts(user_ids[start:start + batch_size])
+        push_unread_counts(corrected)
+        corrected_count += len(corrected)
+    logger.info(f"Celery task: reconcile_unread_notification_counts_task corrected {corrected_count} counters.")
+    return {'users': len(user_ids), 'corrected': corrected_count}
+
+# Задача send_notification_digests_task отправляет сводки буферизованных уведомлений
+# (notifications.digests.NotificationDigestService) для режима доставки HOURLY или DAILY.
+# Запускается через Celery Beat: ежечасно для HOURLY и раз в день для DAILY.
+@shared_task(name="send_notification_digests")
+def send_notification_digests_task(delivery_mode="HOURLY"):
+    logger.info(f"Celery task: Starting send_notification_digests_task (delivery_mode={delivery_mode}).")
+    try:
+        result = NotificationDigestService(delivery_mode).execute()
+        logger.info(f"Celery task: Finished send_notification_digests_task successfully: {result}")
+        return result
+    except Exception as e:
+        logger.error(f"Celery task: Error in send_notification_digests_task: {e}", exc_info=True)
+        raise
@@ -13,9 +13,15 @@ from channels.db import database_sync_to_async # Для асинхронного
 from channels.layers import get_channel_layer
 
 
-from .models import Notification, UserNotificationSettings
-from .consumers import NotificationConsumer
-from .utils import send_notification
+from users.mail import OutgoingEmailProcessor
+from users.models import OutgoingEmail
+from .models import Notification, NotificationArchive, PendingDigestItem, UserNotificationSettings, HomeworkReminder
+from .consumers import NotificationConsumer, NotificationStreamConsumer
+from .retention import NotificationRetentionService
+from .views import NotificationViewSet
+from .preferences import get_notification_preferences
+from .digests import NotificationDigestService
+from .utils import send_notification, notify_upcoming_homework_deadlines, bulk_schedule_changes, build_notification_snapshot
 
 User = get_user_model()
 
@@ -78,6 +84,56 @@ class NotificationUtilsTests(APITestCase):
         self.assertFalse(Notification.objects.filter(recipient=self.user, message="System, but disabled").exists())
         mock_layer.group_send.assert_not_called()
 
+    @patch('notifications.utils.get_channel_layer')
+    def test_chat_message_notifications_are_collapsed_per_chat(self, mock_get_channel_layer):
+        from messaging.models import Chat as MessagingChat, Message as MessagingMessage
+        mock_layer = MagicMock(); mock_layer.group_send = AsyncMock()
+        mock_get_channel_layer.return_value = mock_layer
+        sender = User.objects.create_user(email='collapse_sender@example.com', password='pw', is_active=True)
+        chat = MessagingChat.objects.create(chat_type=MessagingChat.ChatType.GROUP, name="Collapse Chat")
+        chat.participants.add(sender, self.user)
+        for text in ("first", "second", "third"):
+            MessagingMessage.objects.create(chat=chat, sender=sender, content=text)
+        notification = Notification.objects.get(recipient=self.user, notification_type=Notification.NotificationType.MESSAGE)
+        self.assertEqual(notification.aggregated_count, 3)
+        self.assertIn("third", notification.message)
+        self.assertFalse(Notification.objects.filter(recipient=sender).exists())
+
+        # После прочтения следующее сообщение создает новое уведомление
+        notification.is_read = True; notification.save(update_fields=['is_read'])
+        MessagingMessage.objects.create(chat=chat, sender=sender, content="fourth")
+        self.assertEqual(Notification.objects.filter(recipient=self.user, group_key=f"chat:{chat.id}").count(), 2)
+        self.assertEqual(Notification.objects.get(recipient=self.user, is_read=False).aggregated_count, 1)
+
+    def test_notification_preferences_are_cached_and_invalidated_on_save(self):
+        other_user = User.objects.create_user(email='prefs_other@example.com', password='pw', is_active=True)
+        user_ids = [self.user.id, other_user.id]
+        get_notification_preferences(user_ids)
+        with self.assertNumQueries(0):
+            preferences = get_notification_preferences(user_ids)
+        self.assertTrue(preferences[other_user.id]['enable_messages'])
+        settings = UserNotificationSettings.objects.get(user=other_user)
+        settings.enable_messages = False; settings.save()
+        self.assertFalse(get_notification_preferences([other_user.id])[other_user.id]['enable_messages'])
+
+    def test_notification_snapshot_counts_unread_messages_per_chat(self):
+        from django.core.cache import cache
+        from messaging.models import Chat as MessagingChat, ChatParticipant, Message as MessagingMessage
+        cache.clear()
+        sender = User.objects.create_user(email='snapshot_sender@example.com', password='pw', is_active=True)
+        chats = [MessagingChat.objects.create(chat_type=MessagingChat.ChatType.GROUP, name=f"Snapshot {i}") for i in range(2)]
+        for chat in chats: chat.participants.add(sender, self.user)
+        read_message = MessagingMessage.objects.create(chat=chats[0], sender=sender, content="read")
+        MessagingMessage.objects.create(chat=chats[0], sender=sender, content="unread")
+        ChatParticipant.objects.filter(chat=chats[0], user=self.user).update(last_read_message=read_message)
+        MessagingMessage.objects.create(chat=chats[1], sender=sender, content="unread 1")
+        MessagingMessage.objects.filter(chat=chats[0], content="unread").update(timestamp=read_message.timestamp + timedelta(seconds=1))
+        with self.assertNumQueries(3):
+            snapshot = build_notification_snapshot(self.user.id)
+        self.assertEqual(snapshot['chat_unread'], {str(chats[0].id): 1, str(chats[1].id): 1})
+        self.assertEqual(snapshot['total_unread'], 2)
+        self.assertEqual(len(snapshot['notifications']), 2)
+
     def test_send_notification_inactive_recipient(self):
         inactive_user = User.objects.create_user(email="inactive@example.com", password="pw", is_active=False)
         send_notification(inactive_user, "For inactive", Notification.NotificationType.SYSTEM)
@@ -108,6 +164,17 @@ class NotificationAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         unread_notification.refresh_from_db(); self.assertTrue(unread_notification.is_read)
 
+    @patch('notifications.views.change_unread_counts')
+    def test_mark_as_read_with_stale_instance_does_not_change_counter(self, mock_change_unread_counts):
+        self.client.force_authenticate(user=self.user1)
+        unread_notification = Notification.objects.get(recipient=self.user1, is_read=False)
+        # Параллельный запрос уже пометил уведомление прочитанным, а get_object вернул прежнее состояние
+        Notification.objects.filter(pk=unread_notification.pk).update(is_read=True)
+        with patch.object(NotificationViewSet, 'get_object', return_value=unread_notification):
+            response = self.client.post(reverse('notification-list-mark-as-read', kwargs={'pk': unread_notification.pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        mock_change_unread_counts.assert_not_called()
+
     def test_mark_all_notifications_as_read(self):
         self.client.force_authenticate(user=self.user1)
         url = reverse('notification-list-mark-all-as-read') # ПРОВЕРЬТЕ ИМЯ URL
@@ -115,6 +182,42 @@ class NotificationAPITests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(Notification.objects.filter(recipient=self.user1, is_read=False).count(), 0)
 
+    def test_update_cannot_reopen_collapsed_notification(self):
+        self.client.force_authenticate(user=self.user1)
+        Notification.objects.filter(recipient=self.user1, is_read=False).update(group_key="chat:1")
+        read_duplicate = Notification.objects.create(recipient=self.user1, message="Old chat", notification_type=Notification.NotificationType.MESSAGE, group_key="chat:1", is_read=True)
+        response = self.client.patch(reverse('notification-list-detail', kwargs={'pk': read_duplicate.pk}), {'is_read': False}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        read_duplicate.refresh_from_db(); self.assertTrue(read_duplicate.is_read)
+        response = self.client.post(reverse('notification-list-mark-as-unread', kwargs={'pk': read_duplicate.pk}))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+    @patch('notifications.utils.get_channel_layer')
+    def test_unread_count_endpoint_and_counter_updates(self, mock_get_channel_layer):
+        from django.core.cache import cache
+        mock_layer = MagicMock(); mock_layer.group_send = AsyncMock()
+        mock_get_channel_layer.return_value = mock_layer
+        cache.clear()
+        self.client.force_authenticate(user=self.user1)
+        url = reverse('notification-unread-count')
+        self.assertEqual(self.client.get(url).data['total_unread'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            send_notification(self.user1, "N3 unread", Notification.NotificationType.SYSTEM)
+        self.assertEqual(self.client.get(url).data['total_unread'], 2)
+        unread_notification = Notification.objects.get(recipient=self.user1, message="N1 unread")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('notification-list-mark-as-read', kwargs={'pk': unread_notification.pk}))
+        self.assertEqual(self.client.get(url).data['total_unread'], 1)
+        mock_layer.group_send.assert_any_call(f"user_{self.user1.id}", {"type": "total_unread_update", "total_unread": 1})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('notification-list-mark-all-as-read'))
+        self.assertEqual(self.client.get(url).data['total_unread'], 0)
+        # Статус прочтения нельзя изменить в обход счетчика
+        detail_url = reverse('notification-list-detail', kwargs={'pk': unread_notification.pk})
+        for method in (self.client.patch, self.client.put):
+            self.assertEqual(method(detail_url, {'is_read': False}, format='json').status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+        self.assertEqual(self.client.get(url).data['total_unread'], Notification.objects.filter(recipient=self.user1, is_read=False).count())
+
     def test_user_notification_settings_api(self):
         self.client.force_authenticate(user=self.user1)
         url = reverse('notification-settings')
@@ -134,6 +237,10 @@ class NotificationConsumerTests(APITestCase):
         communicator.scope['user'] = self.user_ws
         connected, _ = await communicator.connect()
         self.assertTrue(connected)
+
+        snapshot = await communicator.receive_json_from(timeout=1)
+        self.assertEqual(snapshot['type'], 'snapshot')
+        self.assertEqual((snapshot['total_unread'], snapshot['chat_unread'], snapshot['notifications']), (0, {}, []))
         
         channel_layer = get_channel_layer()
         test_notification_data = {'id': 123, 'message': 'WS Test'}
@@ -150,4 +257,190 @@ class NotificationConsumerTests(APITestCase):
         communicator = WebsocketCommunicator(NotificationConsumer.as_asgi(), "/ws/notifications/")
         communicator.scope['user'] = AnonymousUser()
         connected, _ = await communicator.connect()
-        self.assertFalse(connected)
\ No newline at end of file
+        self.assertFalse(connected)
+
+
+class NotificationStreamConsumerTests(APITestCase):
+    async def asyncSetUp(self):
+        self.user_sse = await database_sync_to_async(User.objects.create_user)(email='sse_notify@example.com', password='TestPassword123!', is_active=True)
+
+    def _communicator(self, user, headers=()):
+        from asgiref.testing import ApplicationCommunicator
+        scope = {'type': 'http', 'method': 'GET', 'path': '/api/notifications/stream/', 'query_string': b'', 'headers': list(headers), 'user': user}
+        return ApplicationCommunicator(NotificationStreamConsumer.as_asgi(), scope)
+
+    async def test_stream_resumes_from_last_event_id_and_forwards_group_events(self):
+        older = await database_sync_to_async(Notification.objects.create)(recipient=self.user_sse, message="Seen")
+        newer = await database_sync_to_async(Notification.objects.create)(recipient=self.user_sse, message="Missed")
+        await database_sync_to_async(Notification.objects.filter(pk=older.pk).update)(created_at=timezone.now() - timedelta(minutes=5))
+        communicator = self._communicator(self.user_sse, headers=[(b'last-event-id', (timezone.now() - timedelta(minutes=1)).isoformat().encode())])
+        await communicator.send_input({'type': 'http.request', 'body': b''})
+        response_start = await communicator.receive_output(timeout=1)
+        self.assertEqual(response_start['status'], 200)
+        self.assertEqual((await communicator.receive_output(timeout=1))['body'], b'')
+        resumed = await communicator.receive_output(timeout=1)
+        self.assertIn(b'event: new_notification', resumed['body'])
+        self.assertIn(f'"id": {newer.id}'.encode(), resumed['body'])
+        self.assertNotIn(b'Seen', resumed['body'])
+
+        await get_channel_layer().group_send(f"user_{self.user_sse.id}", {"type": "total.unread.update", "total_unread": 3})
+        live = await communicator.receive_output(timeout=1)
+        self.assertIn(b'event: unread_count_update', live['body'])
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait(timeout=1)
+
+    async def test_stream_without_backlog_sends_headers_and_stays_subscribed(self):
+        communicator = self._communicator(self.user_sse)
+        await communicator.send_input({'type': 'http.request', 'body': b''})
+        self.assertEqual((await communicator.receive_output(timeout=1))['status'], 200)
+        self.assertEqual((await communicator.receive_output(timeout=1))['body'], b'')
+        for total_unread in (1, 2):
+            await get_channel_layer().group_send(f"user_{self.user_sse.id}", {"type": "total.unread.update", "total_unread": total_unread})
+            live = await communicator.receive_output(timeout=1)
+            self.assertIn(f'"total_unread": {total_unread}'.encode(), live['body'])
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait(timeout=1)
+        # После отключения потребитель вышел из группы
+        await get_channel_layer().group_send(f"user_{self.user_sse.id}", {"type": "total.unread.update", "total_unread": 3})
+        self.assertTrue(await communicator.receive_nothing(timeout=0.1))
+
+    async def test_stream_requires_authentication(self):
+        from django.contrib.auth.models import AnonymousUser
+        communicator = self._communicator(AnonymousUser())
+        await communicator.send_input({'type': 'http.request', 'body': b''})
+        response_start = await communicator.receive_output(timeout=1)
+        self.assertEqual(response_start['status'], 401)
+
+
+class HomeworkReminderEngineTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from datetime import date
+        from edu_core.models import AcademicYear, StudyPeriod, Subject, StudentGroup, Lesson, LessonJournalEntry, Homework, HomeworkSubmission
+        teacher = User.objects.create_user(email='reminder_teacher@example.com', password='pw', role=User.Role.TEACHER, is_active=True)
+        cls.students = [User.objects.create_user(email=f'reminder_s{i}@example.com', password='pw', role=User.Role.STUDENT, is_active=True) for i in range(3)]
+        year = AcademicYear.objects.create(name="ReminderYear", start_date=date(2020, 1, 1), end_date=date(2040, 12, 31))
+        period = StudyPeriod.objects.create(academic_year=year, name="ReminderPeriod", start_date=date(2020, 1, 1), end_date=date(2040, 12, 31))
+        group = StudentGroup.objects.create(name="ReminderGroup", academic_year=year)
+        group.students.add(*cls.students)
+        start = timezone.now() - timedelta(days=1)
+        lesson = Lesson.objects.create(study_period=period, student_group=group, subject=Subject.objects.create(name="ReminderSubject"), teacher=teacher, start_time=start, end_time=start + timedelta(hours=1))
+        journal = LessonJournalEntry.objects.create(lesson=lesson)
+        cls.homework = Homework.objects.create(journal_entry=journal, title="Due soon", description="", author=teacher, due_date=timezone.now() + timedelta(days=1))
+        Homework.objects.create(journal_entry=journal, title="Due later", description="", author=teacher, due_date=timezone.now() + timedelta(days=10))
+        HomeworkSubmission.objects.create(homework=cls.homework, student=cls.students[0])
+        UserNotificationSettings.objects.filter(user=cls.students[2]).update(enable_assignment_due=False)
+
+    @patch('notifications.utils.get_channel_layer')
+    def test_reminders_are_sent_once_per_unsubmitted_student(self, mock_get_channel_layer):
+        mock_layer = MagicMock(); mock_layer.group_send = AsyncMock()
+        mock_get_channel_layer.return_value = mock_layer
+        with self.captureOnCommitCallbacks(execute=True):
+            result = notify_upcoming_homework_deadlines(days_threshold=3)
+        self.assertEqual(result, {'homeworks': 1, 'reminders_sent': 1})
+        self.assertEqual(list(HomeworkReminder.objects.values_list('homework_id', 'student_id')), [(self.homework.id, self.students[1].id)])
+        notification = Notification.objects.get(notification_type=Notification.NotificationType.ASSIGNMENT_DUE)
+        self.assertEqual((notification.recipient_id, notification.object_id), (self.students[1].id, self.homework.id))
+        event_types = [call.args[1]['type'] for call in mock_layer.group_send.call_args_list]
+        self.assertEqual(event_types.count("new_notification"), 1)
+
+        # Повторный запуск ничего не отправляет
+        self.assertEqual(notify_upcoming_homework_deadlines(days_threshold=3)['reminders_sent'], 0)
+        self.assertEqual(Notification.objects.filter(notification_type=Notification.NotificationType.ASSIGNMENT_DUE).count(), 1)
+
+        # Пересекающийся запуск, выбравший те же пары до записи журнала, напоминание не дублирует
+        from .reminders import HomeworkReminderEngine
+        engine = HomeworkReminderEngine(days_threshold=3)
+        with patch.object(engine, 'pending_pairs', return_value=[(self.homework.id, self.students[1].id)]):
+            self.assertEqual(engine.execute()['reminders_sent'], 0)
+        self.assertEqual(Notification.objects.filter(notification_type=Notification.NotificationType.ASSIGNMENT_DUE).count(), 1)
+
+
+class NotificationRetentionTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='retention@example.com', password='pw', is_active=True)
+        now = timezone.now()
+        for index, (is_read, age_days) in enumerate([(True, 100), (True, 100), (True, 10), (False, 200), (False, 100)]):
+            notification = Notification.objects.create(recipient=cls.user, message=f"N{index}", is_read=is_read)
+            Notification.objects.filter(pk=notification.pk).update(created_at=now - timedelta(days=age_days))
+
+    def test_old_read_notifications_are_purged_and_old_unread_archived_in_batches(self):
+        result = NotificationRetentionService(read_retention_days=90, unread_archive_days=180, batch_size=1).execute()
+        self.assertEqual(result, {'purged': 2, 'archived': 1})
+        self.assertEqual(sorted(Notification.objects.values_list('message', flat=True)), ["N2", "N4"])
+        archived = NotificationArchive.objects.get()
+        self.assertEqual((archived.recipient_id, archived.message), (self.user.id, "N3"))
+
+    def test_max_batches_limits_work_per_run(self):
+        result = NotificationRetentionService(read_retention_days=90, unread_archive_days=180, batch_size=1, max_batches=1).execute()
+        self.assertEqual(result, {'purged': 1, 'archived': 1})
+
+
+class NotificationDigestTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='digest@example.com', password='pw', is_active=True)
+        UserNotificationSettings.objects.filter(user=cls.user).update(schedule_delivery=UserNotificationSettings.DeliveryMode.HOURLY, digest_email=True)
+
+    def setUp(self):
+        from .preferences import invalidate_notification_preferences
+        invalidate_notification_preferences(self.user.id)
+
+    @patch('users.tasks.send_outgoing_emails_task.delay')
+    @patch('notifications.utils.get_channel_layer')
+    def test_digest_notifications_are_buffered_and_sent_as_one(self, mock_get_channel_layer, mock_outbox_delay):
+        from django.core import mail
+        mock_layer = MagicMock(); mock_layer.group_send = AsyncMock()
+        mock_get_channel_layer.return_value = mock_layer
+        send_notification(self.user, "Lesson 1 moved", Notification.NotificationType.SCHEDULE)
+        send_notification(self.user, "Lesson 2 moved", Notification.NotificationType.SCHEDULE)
+        send_notification(self.user, "Instant system", Notification.NotificationType.SYSTEM)
+        self.assertEqual(PendingDigestItem.objects.filter(recipient=self.user).count(), 2)
+        self.assertEqual(Notification.objects.filter(recipient=self.user).count(), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = NotificationDigestService(UserNotificationSettings.DeliveryMode.HOURLY).execute()
+        self.assertEqual(result, {'delivery_mode': 'HOURLY', 'digests': 1, 'emails': 1})
+        digest = Notification.objects.get(recipient=self.user, notification_type=Notification.NotificationType.SCHEDULE)
+        self.assertIn("Lesson 1 moved", digest.message); self.assertIn("Lesson 2 moved", digest.message)
+        self.assertFalse(PendingDigestItem.objects.exists())
+        email = OutgoingEmail.objects.get(to_email=self.user.email)
+        self.assertEqual(email.template_name, NotificationDigestService.EMAIL_TEMPLATE)
+        self.assertIn("Lesson 1 moved", email.context['digest_text'])
+        mock_outbox_delay.assert_called_once()
+        OutgoingEmailProcessor().execute()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn("Lesson 2 moved", mail.outbox[0].body)
+
+
+class BulkScheduleChangesTests(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from datetime import date
+        from edu_core.models import AcademicYear, StudyPeriod, Subject, StudentGroup
+        cls.teacher = User.objects.create_user(email='bulk_teacher@example.com', password='pw', role=User.Role.TEACHER, is_active=True)
+        cls.students = [User.objects.create_user(email=f'bulk_s{i}@example.com', password='pw', role=User.Role.STUDENT, is_active=True) for i in range(2)]
+        year = AcademicYear.objects.create(name="BulkYear", start_date=date(2020, 1, 1), end_date=date(2040, 12, 31))
+        cls.period = StudyPeriod.objects.create(academic_year=year, name="BulkPeriod", start_date=date(2020, 1, 1), end_date=date(2040, 12, 31))
+        cls.group = StudentGroup.objects.create(name="BulkGroup", academic_year=year)
+        cls.group.students.add(*cls.students)
+        cls.subject = Subject.objects.create(name="BulkSubject")
+
+    @patch('notifications.utils.get_channel_layer')
+    def test_lesson_changes_inside_bulk_operation_produce_one_summary_per_user(self, mock_get_channel_layer):
+        from edu_core.models import Lesson
+        mock_layer = MagicMock(); mock_layer.group_send = AsyncMock()
+        mock_get_channel_layer.return_value = mock_layer
+        start = timezone.now() + timedelta(days=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            with bulk_schedule_changes(label="тест"):
+                for day in range(3):
+                    lesson_start = start + timedelta(days=day)
+                    Lesson.objects.create(
+                        study_period=self.period, student_group=self.group, subject=self.subject, teacher=self.teacher,
+                        start_time=lesson_start, end_time=lesson_start + timedelta(hours=1)
+                    )
+        schedule_notifications = Notification.objects.filter(notification_type=Notification.NotificationType.SCHEDULE)
+        self.assertEqual(sorted(schedule_notifications.values_list('recipient_id', flat=True)), sorted([self.teacher.id] + [student.id for student in self.students]))
+        self.assertTrue(all("3" in notification.message for notification in schedule_notifications))
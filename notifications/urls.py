@@ -27,6 +27,9 @@ urlpatterns = [
     #   обратного разрешения URL (например, в шаблонах или тестах).
     path('settings/', views.UserNotificationSettingsView.as_view(), name='notification-settings'),
 
+    # Число непрочитанных уведомлений текущего пользователя (счетчик в кэше) для бейджа.
+    path('unread-count/', views.UnreadNotificationCountView.as_view(), name='notification-unread-count'),
+
     # Включение URL-адресов, сгенерированных роутером 'router'.
     # Это добавит в urlpatterns все URL-адреса, определенные NotificationViewSet
     # (например, для получения списка уведомлений, отметки уведомлений как прочитанных).
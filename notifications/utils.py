@@ -1,19 +1,25 @@
 import logging
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
 from mailbox import Message
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
 from django.contrib.auth import get_user_model
-from django.db.models import Model
+from django.db import transaction
+from django.db.models import Model, F, Q, Count
 from django.utils import timezone
 
 from edu_core.models import AcademicYear, Grade, Homework, HomeworkSubmission, Lesson, StudentGroup, StudyPeriod
-from messaging.models import Chat, Message
+from messaging.models import Chat, ChatParticipant, Message
 from users.models import User # Импортировано для notify_upcoming_homework_deadlines
 
 
-from .models import Notification, UserNotificationSettings
+from .models import Notification, PendingDigestItem, UserNotificationSettings
+from .counters import adjust_unread_counts, get_unread_count, refresh_unread_count
+from .preferences import get_notification_preferences, is_notification_enabled, delivery_mode_for
 from .serializers import NotificationSerializer
 
 logger = logging.getLogger(__name__)
@@ -27,15 +33,20 @@ logger = logging.getLogger(__name__)
 #   - related_object: (Опционально) Объект модели, с которым связано уведомление (для GenericForeignKey).
 # Принцип работы:
 # 1. Проверяет, активен ли получатель.
-# 2. Получает или создает настройки уведомлений для пользователя (UserNotificationSettings).
-# 3. Проверяет, включены ли у пользователя уведомления данного типа. Если нет, отправка пропускается.
-# 4. Если передан `related_object`, получает для него ContentType и object_id.
-# 5. Создает экземпляр модели Notification в базе данных.
-# 6. Сериализует созданное уведомление с помощью NotificationSerializer.
-# 7. Отправляет сериализованное уведомление через WebSocket (Django Channels)
+# 2. Проверяет по кэшу настроек (notifications.preferences), включены ли у пользователя
+#    уведомления данного типа. Если нет, отправка пропускается. Настройки на этом пути
+#    не создаются - строки создаются при регистрации пользователя. Рассылки группе
+#    получателей заранее заполняют кэш настроек одним запросом.
+#    Если для типа выбрана доставка сводкой (HOURLY/DAILY), уведомление записывается
+#    в буфер дайджеста (PendingDigestItem) и дальнейшие шаги не выполняются.
+# 3. Если передан `related_object`, получает для него ContentType и object_id.
+# 4. Создает экземпляр модели Notification в базе данных.
+# 5. Сериализует созданное уведомление с помощью NotificationSerializer.
+# 6. Отправляет сериализованное уведомление через WebSocket (Django Channels)
 #    в персональную группу пользователя (`user_{recipient.id}`).
 #    Предполагается, что NotificationConsumer подписан на эту группу и обработает событие
 #    с типом "new_notification".
+# 7. Увеличивает счетчик непрочитанных уведомлений получателя (change_unread_counts).
 # 8. Логирует ошибки на каждом этапе.
 def send_notification(
     recipient: User,
@@ -48,15 +59,12 @@ def send_notification(
         return
 
     try:
-        user_settings, created = UserNotificationSettings.objects.get_or_create(user=recipient)
-        if created:
-            logger.info(f"Created default notification settings for user {recipient.id}")
-
-        if not user_settings.is_enabled(notification_type_value):
+        if not is_notification_enabled(recipient.id, notification_type_value):
             logger.debug(f"Notifications '{notification_type_value}' disabled for user {recipient.id}. Skipping.")
             return
+        delivery_mode = delivery_mode_for(get_notification_preferences([recipient.id])[recipient.id], notification_type_value)
     except Exception as e:
-         logger.error(f"Error getting/creating notification settings for user {recipient.id}: {e}", exc_info=True)
+         logger.error(f"Error getting notification settings for user {recipient.id}: {e}", exc_info=True)
          return
 
     content_type_instance = None
@@ -68,6 +76,14 @@ def send_notification(
         except Exception as e:
              logger.error(f"Error getting content type for related_object {related_object.__class__.__name__} (pk={getattr(related_object, 'pk', 'N/A')}): {e}", exc_info=True)
 
+    if delivery_mode != UserNotificationSettings.DeliveryMode.INSTANT:
+        PendingDigestItem.objects.create(
+            recipient=recipient, notification_type=notification_type_value, delivery_mode=delivery_mode,
+            message=message_text, content_type=content_type_instance, object_id=object_id_value
+        )
+        logger.debug(f"Notification '{notification_type_value}' for user {recipient.id} buffered for {delivery_mode} digest.")
+        return
+
     try:
         notification_instance = Notification.objects.create(
             recipient=recipient,
@@ -80,6 +96,8 @@ def send_notification(
          logger.error(f"Error creating Notification object in DB for user {recipient.id} (type: {notification_type_value}): {e}", exc_info=True)
          return 
 
+    change_unread_counts({recipient.id: 1})
+
     try:
         channel_layer = get_channel_layer()
         serializer = NotificationSerializer(notification_instance)
@@ -97,14 +115,196 @@ def send_notification(
     except Exception as e:
          logger.error(f"Error sending WS notification (ID: {notification_instance.id}) to user {recipient.id}: {e}", exc_info=True)
 
+# Функция bulk_send_notifications создает подготовленные (несохраненные) экземпляры Notification
+# пакетными вставками (bulk_create) и после фиксации транзакции рассылает их через WebSocket
+# в персональные группы получателей (`user_{recipient_id}`).
+# Проверку активности получателей и их настроек выполняет вызывающий код - как правило,
+# прямо в запросе выборки получателей. Возвращает список созданных уведомлений.
+# apply_digest=True: уведомления получателей, выбравших для типа доставку сводкой,
+# записываются в буфер дайджеста (PendingDigestItem) вместо немедленной отправки.
+def bulk_send_notifications(notifications, batch_size=500, apply_digest=True):
+    if not notifications: return []
+    if apply_digest:
+        preferences = get_notification_preferences({notification.recipient_id for notification in notifications})
+        instant_notifications, digest_items = [], []
+        for notification in notifications:
+            delivery_mode = delivery_mode_for(preferences[notification.recipient_id], notification.notification_type)
+            if delivery_mode == UserNotificationSettings.DeliveryMode.INSTANT:
+                instant_notifications.append(notification); continue
+            digest_items.append(PendingDigestItem(
+                recipient_id=notification.recipient_id, notification_type=notification.notification_type, delivery_mode=delivery_mode,
+                message=notification.message, content_type_id=notification.content_type_id, object_id=notification.object_id
+            ))
+        PendingDigestItem.objects.bulk_create(digest_items, batch_size=batch_size)
+        notifications = instant_notifications
+        if not notifications: return []
+    created_notifications = Notification.objects.bulk_create(notifications, batch_size=batch_size)
+    transaction.on_commit(lambda: _push_notifications(created_notifications))
+    change_unread_counts(Counter(notification.recipient_id for notification in created_notifications if not notification.is_read))
+    return created_notifications
+
+def _push_notifications(notifications):
+    channel_layer = get_channel_layer()
+    for notification_instance in notifications:
+        try:
+            async_to_sync(channel_layer.group_send)(
+                f"user_{notification_instance.recipient_id}",
+                {"type": "new_notification", "notification": NotificationSerializer(notification_instance).data}
+            )
+        except Exception as e:
+            logger.error(f"Error sending WS notification (ID: {notification_instance.id}) to user {notification_instance.recipient_id}: {e}", exc_info=True)
+    logger.info(f"Sent {len(notifications)} bulk WS notifications.")
+
+# Функция change_unread_counts после фиксации транзакции изменяет счетчики непрочитанных
+# уведомлений (notifications.counters) на величины из словаря {user_id: delta} и отправляет
+# новые значения пользователям через WebSocket (событие "total_unread_update").
+# reset_user_ids - пользователи, счетчик которых нужно пересчитать из БД (например, после mark_all_as_read).
+def change_unread_counts(deltas, reset_user_ids=()):
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta}
+    if not deltas and not reset_user_ids: return
+    def apply_changes():
+        adjust_unread_counts(deltas)
+        for user_id in reset_user_ids: refresh_unread_count(user_id)
+        push_unread_counts(set(deltas) | set(reset_user_ids))
+    transaction.on_commit(apply_changes)
+
+def push_unread_counts(user_ids):
+    channel_layer = get_channel_layer()
+    for user_id in user_ids:
+        try:
+            async_to_sync(channel_layer.group_send)(
+                f"user_{user_id}", {"type": "total_unread_update", "total_unread": get_unread_count(user_id)}
+            )
+        except Exception as e:
+            logger.error(f"Error sending WS unread count to user {user_id}: {e}", exc_info=True)
+
+# Функция send_collapsed_notifications отправляет схлопываемое уведомление группе получателей:
+# у каждого получателя не больше одного непрочитанного уведомления с данным group_key.
+# Существующие непрочитанные уведомления обновляются одним UPDATE (новый текст,
+# aggregated_count + 1, created_at = время события), для остальных получателей уведомления
+# создаются одним bulk_create. Конфликт с частичным уникальным индексом (параллельная вставка)
+# пропускается (ignore_conflicts). Число запросов не зависит от количества получателей.
+# Проверку активности получателей и их настроек выполняет вызывающий код.
+# После фиксации транзакции актуальные уведомления рассылаются через WebSocket.
+def send_collapsed_notifications(recipient_ids, message_text: str, notification_type_value: str, related_object: Model, group_key: str):
+    recipient_ids = set(recipient_ids)
+    if not recipient_ids: return []
+    content_type_instance = ContentType.objects.get_for_model(related_object)
+    with transaction.atomic():
+        unread_qs = Notification.objects.filter(recipient_id__in=recipient_ids, group_key=group_key, is_read=False)
+        existing_recipient_ids = set(unread_qs.select_for_update().values_list('recipient_id', flat=True))
+        if existing_recipient_ids:
+            unread_qs.update(message=message_text, aggregated_count=F('aggregated_count') + 1, created_at=timezone.now())
+        Notification.objects.bulk_create([
+            Notification(
+                recipient_id=recipient_id, message=message_text, notification_type=notification_type_value,
+                content_type=content_type_instance, object_id=related_object.pk, group_key=group_key
+            )
+            for recipient_id in recipient_ids - existing_recipient_ids
+        ], ignore_conflicts=True)
+        notifications = list(unread_qs)
+        transaction.on_commit(lambda: _push_notifications(notifications))
+        change_unread_counts({notification.recipient_id: 1 for notification in notifications if notification.recipient_id not in existing_recipient_ids})
+    return notifications
+
+# Функция build_notification_snapshot собирает начальное состояние для клиента уведомлений
+# (отправляется NotificationConsumer сразу после подключения):
+# - total_unread: число непрочитанных уведомлений (счетчик в кэше, notifications.counters);
+# - chat_unread: {chat_id: число непрочитанных сообщений} только для чатов с непрочитанными -
+#   одним сгруппированным запросом по участиям пользователя (индекс сообщений (chat, timestamp));
+#   непрочитанными считаются сообщения позже последнего прочитанного, как в ChatSerializer;
+# - notifications: последние notifications_limit уведомлений пользователя.
+def build_notification_snapshot(user_id, notifications_limit=20):
+    chat_unread = ChatParticipant.objects.filter(user_id=user_id).values('chat_id').annotate(
+        unread=Count('chat__messages', filter=Q(last_read_message__isnull=True) | Q(chat__messages__timestamp__gt=F('last_read_message__timestamp')))
+    ).order_by().values_list('chat_id', 'unread')
+    recent_notifications = Notification.objects.filter(recipient_id=user_id).order_by('-created_at')[:notifications_limit]
+    return {
+        'total_unread': get_unread_count(user_id),
+        'chat_unread': {str(chat_id): unread for chat_id, unread in chat_unread if unread},
+        'notifications': NotificationSerializer(recent_notifications, many=True).data,
+    }
+
+# --- Массовые операции с расписанием ---
+
+# Состояние массовой операции с расписанием в текущем потоке: глубина вложенности
+# и словарь затронутых занятий {lesson_id: (student_group_id, teacher_id, дата)}.
+_bulk_schedule_state = threading.local()
+
+# Контекстный менеджер bulk_schedule_changes подавляет поуроковые уведомления об изменении
+# расписания (notify_lesson_change) на время массовой операции (импорт шаблона, удаление
+# периода занятий и т.п.). Затронутые занятия запоминаются (notify_lesson_change или явный
+# вызов record_lesson_changes - для bulk_create и удаления QuerySet, которые не вызывают сигналы),
+# а после успешного завершения внешнего блока и фиксации транзакции каждый затронутый пользователь
+# (преподаватель занятий и студенты групп) получает одно итоговое уведомление - notify_schedule_summary.
+@contextmanager
+def bulk_schedule_changes(label=None):
+    depth = getattr(_bulk_schedule_state, 'depth', 0)
+    if depth == 0: _bulk_schedule_state.lessons = {}
+    _bulk_schedule_state.depth = depth + 1
+    try:
+        yield
+    except Exception:
+        if depth == 0: _bulk_schedule_state.lessons = None
+        raise
+    finally:
+        _bulk_schedule_state.depth = depth
+    if depth == 0:
+        lesson_rows = list(_bulk_schedule_state.lessons.values()); _bulk_schedule_state.lessons = None
+        if lesson_rows: transaction.on_commit(lambda: notify_schedule_summary(lesson_rows, label))
+
+# Запоминает занятия, затронутые массовой операцией. Возвращает False, если массовая операция не активна.
+def record_lesson_changes(lessons):
+    if not getattr(_bulk_schedule_state, 'depth', 0): return False
+    for lesson in lessons:
+        lesson_date = timezone.localtime(lesson.start_time).date() if lesson.start_time else None
+        _bulk_schedule_state.lessons[lesson.pk or id(lesson)] = (lesson.student_group_id, lesson.teacher_id, lesson_date)
+    return True
+
+# Отправляет итоговые уведомления по затронутым занятиям (список кортежей (группа, преподаватель, дата)).
+# Для каждого пользователя считаются число его занятий и диапазон дат: преподавателю - по его занятиям,
+# студенту - по занятиям его групп. Состав групп, активность и настройки получателей загружаются
+# одним запросом каждый, уведомления создаются одним bulk_create (с учетом режима доставки сводкой).
+def notify_schedule_summary(lesson_rows, label=None):
+    group_ids = {group_id for group_id, _, _ in lesson_rows if group_id}
+    group_students = defaultdict(set)
+    for group_id, student_id in StudentGroup.students.through.objects.filter(studentgroup_id__in=group_ids).values_list('studentgroup_id', 'user_id'):
+        group_students[group_id].add(student_id)
+
+    user_lesson_dates = defaultdict(list)
+    for group_id, teacher_id, lesson_date in lesson_rows:
+        affected_user_ids = set(group_students.get(group_id, ()))
+        if teacher_id: affected_user_ids.add(teacher_id)
+        for user_id in affected_user_ids: user_lesson_dates[user_id].append(lesson_date)
+
+    recipient_ids = User.objects.filter(id__in=user_lesson_dates, is_active=True)\
+        .filter(Q(notification_settings__isnull=True) | Q(notification_settings__enable_schedule=True))\
+        .values_list('id', flat=True)
+    notifications = []
+    for user_id in recipient_ids:
+        known_dates = [lesson_date for lesson_date in user_lesson_dates[user_id] if lesson_date]
+        period_text = f" на {min(known_dates).strftime('%d.%m.%Y')}–{max(known_dates).strftime('%d.%m.%Y')}" if known_dates else ""
+        label_text = f" ({label})" if label else ""
+        notifications.append(Notification(
+            recipient_id=user_id, notification_type=Notification.NotificationType.SCHEDULE,
+            message=f"Ваше расписание{period_text} изменено{label_text}: затронуто занятий - {len(user_lesson_dates[user_id])}"
+        ))
+    bulk_send_notifications(notifications)
+    logger.info(f"Sent schedule summary notifications to {len(notifications)} users for {len(lesson_rows)} lessons.")
+    return notifications
+
 # --- Функции для отправки уведомлений, связанных с модулем edu_core ---
 
 # Уведомляет участников (преподавателя и студентов группы) об изменении,
 # создании или удалении занятия в расписании.
+# Внутри массовой операции с расписанием (bulk_schedule_changes) занятие только
+# запоминается, а участники получат одно итоговое уведомление.
 def notify_lesson_change(lesson: Lesson, action="изменено"):
     if not Lesson: # Проверка, что модель Lesson была успешно импортирована
         logger.error("notify_lesson_change: Lesson model not imported.")
         return
+    if record_lesson_changes([lesson]):
+        return
     try:
         action_text_map = {"создано": "Создано", "удалено": "Удалено"}
         action_text = action_text_map.get(action, "Изменено")
@@ -122,6 +322,7 @@ def notify_lesson_change(lesson: Lesson, action="изменено"):
             # Логика уведомления родителей студентов здесь может быть добавлена при необходимости
 
         logger.info(f"Notifying {len(recipients)} users about schedule change for lesson {lesson.id}")
+        get_notification_preferences(user_recipient.id for user_recipient in recipients) # Прогрев кэша настроек одним запросом
         for user_recipient in recipients:
             send_notification(user_recipient, message, Notification.NotificationType.SCHEDULE, lesson)
     except Exception as e:
@@ -146,6 +347,7 @@ def notify_new_homework(homework: Homework):
         message = f"Новое домашнее задание: '{homework.title}' по предмету '{lesson_subject_name}'"
         
         logger.info(f"Notifying {len(group_students)} students about new homework {homework.id}")
+        get_notification_preferences(student.id for student in group_students) # Прогрев кэша настроек одним запросом
         for student in group_students:
             send_notification(student, message, Notification.NotificationType.ASSIGNMENT_NEW, homework)
     except Exception as e:
@@ -207,6 +409,8 @@ def notify_new_grade(grade: Grade):
 
 # Уведомляет участников чата (кроме отправителя) о новом сообщении.
 # Вызывается из сигнала post_save для модели Message.
+# Уведомления схлопываются: у получателя одно непрочитанное уведомление на чат
+# (group_key "chat:<id>") со счетчиком сообщений и превью последнего из них.
 def notify_new_message(message_instance: Message):
      if not Message or not Chat: 
          logger.error("notify_new_message: Message or Chat model not imported.")
@@ -231,14 +435,13 @@ def notify_new_message(message_instance: Message):
              chat_name = chat.name or "Групповой чат"
              message_text_for_notification = f"{chat_name}: {sender_name} - {content_preview}"
 
-        recipients = chat.participants.filter(is_active=True).exclude(id=sender.id)
-        logger.info(f"Notifying (main notification system) {recipients.count()} users about new message {message_instance.id} in chat {chat.id}")
-
-        for user_recipient in recipients:
-            try:
-                 send_notification(user_recipient, message_text_for_notification, Notification.NotificationType.MESSAGE, chat)
-            except Exception as e:
-                 logger.error(f"Failed to send main message notification to user {user_recipient.id} for chat {chat.id}: {e}", exc_info=True)
+        recipient_ids = chat.participants.filter(is_active=True)\
+            .filter(Q(notification_settings__isnull=True) | Q(notification_settings__enable_messages=True))\
+            .exclude(id=sender.id).values_list('id', flat=True)
+        notifications = send_collapsed_notifications(
+            recipient_ids, message_text_for_notification, Notification.NotificationType.MESSAGE, chat, group_key=f"chat:{chat.id}"
+        )
+        logger.info(f"Notified (main notification system) {len(notifications)} users about new message {message_instance.id} in chat {chat.id}")
      except Exception as e:
           logger.error(f"Error preparing main message notification for message {getattr(message_instance, 'id', 'N/A')}: {e}", exc_info=True)
 
@@ -294,50 +497,8 @@ def notify_removed_from_chat(chat: Chat, removed_user: User, actor: User | None
 
 # Отправляет напоминания студентам о приближающихся сроках сдачи домашних заданий.
 # Предназначена для вызова периодической задачей (например, Celery beat).
+# Пары (ДЗ, студент без сдачи) выбираются одним запросом и записываются в журнал HomeworkReminder
+# (см. notifications.reminders.HomeworkReminderEngine), поэтому повторные запуски не дублируют напоминания.
 def notify_upcoming_homework_deadlines(days_threshold=3):
-    if not Homework or not HomeworkSubmission or not StudentGroup:
-        logger.error("notify_upcoming_homework_deadlines: Required models (Homework, HomeworkSubmission, StudentGroup) not imported.")
-        return
-
-    now = timezone.now()
-    deadline_limit_start = now
-    deadline_limit_end = now + timezone.timedelta(days=days_threshold)
-
-    upcoming_homeworks = Homework.objects.filter(
-        due_date__gte=deadline_limit_start,
-        due_date__lte=deadline_limit_end
-    ).select_related(
-        'journal_entry__lesson__student_group',
-        'journal_entry__lesson__subject'
-    ).prefetch_related(
-        'journal_entry__lesson__student_group__students'
-    )
-
-    logger.info(f"Checking for upcoming homework deadlines (next {days_threshold} days). Found {upcoming_homeworks.count()} relevant homeworks.")
-
-    for hw in upcoming_homeworks:
-        if not hw.journal_entry or not hw.journal_entry.lesson or not hw.journal_entry.lesson.student_group:
-            logger.warning(f"Homework ID {hw.id} is missing necessary linked lesson/group. Skipping.")
-            continue
-
-        submitted_students_ids = HomeworkSubmission.objects.filter(
-            homework=hw
-        ).values_list('student_id', flat=True)
-
-        students_to_notify = hw.journal_entry.lesson.student_group.students.filter(
-            is_active=True
-        ).exclude(
-            id__in=submitted_students_ids
-        )
-
-        if not students_to_notify.exists():
-            logger.info(f"All students submitted or no students to notify for HW ID {hw.id} ('{hw.title}').")
-            continue
-
-        due_date_str = hw.due_date.strftime('%d.%m.%Y %H:%M') if hw.due_date else "N/A"
-        subject_name = hw.journal_entry.lesson.subject.name if hw.journal_entry.lesson.subject else "N/A"
-        message = f"Напоминание: срок сдачи ДЗ '{hw.title}' по предмету '{subject_name}' истекает {due_date_str}."
-        
-        logger.info(f"Notifying {students_to_notify.count()} students about upcoming deadline for HW ID {hw.id} ('{hw.title}').")
-        for student in students_to_notify:
-            send_notification(student, message, Notification.NotificationType.ASSIGNMENT_DUE, hw)
\ No newline at end of file
+    from .reminders import HomeworkReminderEngine
+    return HomeworkReminderEngine(days_threshold=days_threshold).execute()
@@ -1,8 +1,11 @@
+from django.db import IntegrityError, transaction
 from rest_framework import viewsets, permissions, status, generics
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from .models import Notification, UserNotificationSettings
 from .serializers import NotificationSerializer, UserNotificationSettingsSerializer
+from .counters import get_unread_count
+from .utils import change_unread_counts
 from rest_framework.pagination import LimitOffsetPagination
 
 # Класс StandardNotificationsPagination определяет кастомную пагинацию для списка уведомлений.
@@ -37,37 +40,69 @@ class StandardNotificationsPagination(LimitOffsetPagination):
 #     - URL: `notifications/list/{pk}/mark-unread/` (POST-запрос)
 #     - Позволяет пользователю пометить конкретное уведомление как непрочитанное.
 #     - Если уведомление уже не прочитано, возвращает соответствующий статус.
+#     - Схлопываемое уведомление нельзя вернуть в непрочитанные, если у пользователя
+#       уже есть непрочитанное уведомление с тем же group_key (ответ 409).
+# Изменение статуса прочтения и удаление непрочитанного уведомления обновляют счетчик
+# непрочитанных уведомлений пользователя (notifications.counters) с отправкой через WebSocket.
+# PUT/PATCH отключены: статус прочтения меняется только действиями mark-*, которые обновляют счетчик.
 class NotificationViewSet(viewsets.ModelViewSet):
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = StandardNotificationsPagination 
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
 
     def get_queryset(self):
         return self.request.user.notifications.select_related('content_type').all()
 
+    def perform_destroy(self, instance):
+        was_unread = not instance.is_read
+        super().perform_destroy(instance)
+        if was_unread: change_unread_counts({self.request.user.id: -1})
+
     @action(detail=False, methods=['post'], url_path='mark-all-read')
     def mark_all_as_read(self, request):
         updated_count = request.user.notifications.filter(is_read=False).update(is_read=True)
+        if updated_count: change_unread_counts({}, reset_user_ids=[request.user.id])
         return Response({'status': 'Все уведомления помечены как прочитанные', 'updated_count': updated_count})
 
+    # Статус меняется условным UPDATE (filter по is_read): при параллельных запросах
+    # строку обновит только один из них, и счетчик изменится ровно один раз.
     @action(detail=True, methods=['post'], url_path='mark-read')
     def mark_as_read(self, request, pk=None):
         notification = self.get_object()
-        if not notification.is_read:
-            notification.is_read = True
-            notification.save(update_fields=['is_read'])
+        updated_count = request.user.notifications.filter(pk=notification.pk, is_read=False).update(is_read=True)
+        if updated_count == 1:
+            change_unread_counts({request.user.id: -1})
             return Response({'status': 'Уведомление помечено как прочитанное'})
         return Response({'status': 'Уведомление уже было прочитано'})
 
     @action(detail=True, methods=['post'], url_path='mark-unread')
     def mark_as_unread(self, request, pk=None):
         notification = self.get_object()
-        if notification.is_read:
-            notification.is_read = False
-            notification.save(update_fields=['is_read'])
+        group_conflict = Response({'detail': 'Уже есть непрочитанное уведомление по этому источнику'}, status=status.HTTP_409_CONFLICT)
+        if notification.is_read and notification.group_key and request.user.notifications.filter(group_key=notification.group_key, is_read=False).exists():
+            return group_conflict
+        try:
+            # Параллельно созданное непрочитанное уведомление с тем же group_key нарушит уникальное ограничение
+            with transaction.atomic():
+                updated_count = request.user.notifications.filter(pk=notification.pk, is_read=True).update(is_read=False)
+        except IntegrityError:
+            return group_conflict
+        if updated_count == 1:
+            change_unread_counts({request.user.id: 1})
             return Response({'status': 'Уведомление помечено как непрочитанное'})
         return Response({'status': 'Уведомление уже было непрочитано'})
 
+# Класс UnreadNotificationCountView возвращает число непрочитанных уведомлений текущего
+# пользователя из счетчика в кэше (notifications.counters) без запроса к таблице уведомлений.
+# Используется для бейджа вместо опроса списка уведомлений; изменения счетчика также
+# приходят через WebSocket (событие unread_count_update).
+class UnreadNotificationCountView(generics.GenericAPIView):
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        return Response({'total_unread': get_unread_count(request.user.id)})
+
 # Класс UserNotificationSettingsView предоставляет API-эндпоинт для получения
 # и обновления настроек уведомлений текущего аутентифицированного пользователя.
 # Наследуется от generics.RetrieveUpdateAPIView, что обеспечивает функционал
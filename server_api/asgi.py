@@ -9,9 +9,17 @@ django.setup()
 
 import messaging.routing
 import notifications.routing
+from django.urls import re_path
+
+django_asgi_app = get_asgi_application()
 
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    # SSE-поток уведомлений обслуживается Channels (аутентификация по JWT из query string),
+    # остальные HTTP-запросы - основным Django-приложением.
+    "http": URLRouter(
+        notifications.routing.http_urlpatterns +
+        [re_path(r'', django_asgi_app)]
+    ),
     "websocket": JwtAuthMiddlewareStack( 
         URLRouter(
             messaging.routing.websocket_urlpatterns +
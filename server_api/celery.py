@@ -3,6 +3,7 @@
 from datetime import timedelta
 import os
 from celery import Celery
+from celery.schedules import crontab
 from django.conf import settings # Для доступа к настройкам Django
 
 # Устанавливаем переменную окружения для настроек Django,
@@ -42,4 +43,42 @@ app.conf.beat_schedule.update({  # Используем update, если beat_sc
         'schedule': timedelta(seconds=10),        # Каждые 10 секунд
         # 'args': (), # Аргументы не нужны для этой задачи
     },
+    'build-platform-snapshots-nightly': {
+        'task': 'build_platform_snapshots', # stats.tasks.build_platform_snapshots_task
+        'schedule': crontab(hour=0, minute=15), # Ежедневно в 00:15 - снимок за прошедший день
+    },
+    'compute-grade-averages-nightly': {
+        'task': 'compute_grade_averages', # edu_core.tasks.compute_grade_averages_task
+        'schedule': crontab(hour=1, minute=0), # Ежедневно в 01:00 - инкрементальный пересчет средних
+    },
+    'compute-student-risk-scores-nightly': {
+        'task': 'compute_student_risk_scores', # stats.tasks.compute_student_risk_scores_task
+        'schedule': crontab(hour=1, minute=30), # Ежедневно в 01:30 - баллы риска неуспеваемости
+    },
+    'send-homework-deadline-reminders-hourly': {
+        'task': 'send_homework_deadline_reminders', # notifications.tasks.send_homework_deadline_reminders_task
+        'schedule': crontab(minute=5), # Ежечасно - журнал HomeworkReminder исключает повторные напоминания
+    },
+    'apply-notification-retention-nightly': {
+        'task': 'apply_notification_retention', # notifications.tasks.apply_notification_retention_task
+        'schedule': crontab(hour=3, minute=0), # Ежедневно в 03:00 - очистка и архивация старых уведомлений
+    },
+    'reconcile-unread-notification-counts-hourly': {
+        'task': 'reconcile_unread_notification_counts', # notifications.tasks.reconcile_unread_notification_counts_task
+        'schedule': crontab(minute=45), # Ежечасно - сверка счетчиков непрочитанных уведомлений с БД
+    },
+    'send-notification-digests-hourly': {
+        'task': 'send_notification_digests', # notifications.tasks.send_notification_digests_task
+        'schedule': crontab(minute=0), # Ежечасно - сводки для режима доставки HOURLY
+        'args': ('HOURLY',),
+    },
+    'send-notification-digests-daily': {
+        'task': 'send_notification_digests',
+        'schedule': crontab(hour=7, minute=0), # Ежедневно в 07:00 - сводки для режима доставки DAILY
+        'args': ('DAILY',),
+    },
+    'send-outgoing-emails-every-minute': {
+        'task': 'send_outgoing_emails', # users.tasks.send_outgoing_emails_task
+        'schedule': crontab(), # Ежеминутно - повторные попытки и письма, для которых задача не была поставлена
+    },
 })
\ No newline at end of file
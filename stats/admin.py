@@ -1,3 +1,25 @@
 from django.contrib import admin
+from .models import PlatformDailySnapshot, StudentRiskScore
 
-# Register your models here.
+# Класс PlatformDailySnapshotAdmin отображает ежедневные снимки метрик платформы (только чтение).
+@admin.register(PlatformDailySnapshot)
+class PlatformDailySnapshotAdmin(admin.ModelAdmin):
+    list_display = ('date', 'users_total', 'new_users', 'chats_created', 'messages_sent', 'active_chats', 'notifications_sent', 'notifications_read', 'updated_at')
+    date_hierarchy = 'date'
+    readonly_fields = [field.name for field in PlatformDailySnapshot._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+# Класс StudentRiskScoreAdmin отображает рассчитанные баллы риска студентов (только чтение).
+@admin.register(StudentRiskScore)
+class StudentRiskScoreAdmin(admin.ModelAdmin):
+    list_display = ('student', 'study_period', 'risk_score', 'average_grade', 'absences_invalid', 'homework_missed', 'computed_at')
+    list_filter = ('study_period__academic_year', 'study_period')
+    search_fields = ('student__last_name', 'student__email')
+    list_select_related = ('student', 'study_period')
+    ordering = ('study_period', '-risk_score')
+    readonly_fields = [field.name for field in StudentRiskScore._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import logging
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Кэш ответов статистики.
+# Ответ хранится в кэше Django (django-redis) под ключом, в который входят: имя эндпоинта,
+# область видимости роли (например, 'admin' или 'student:<id>'), учебный год, учебный период,
+# дополнительные параметры запроса и текущие "поколения" (generation counters) областей данных,
+# от которых зависит ответ. Запись оценок/посещаемости/ДЗ/занятий (stats.signals) увеличивает
+# поколения затронутых учебного периода, учебного года и групп - старые ключи перестают
+# использоваться и истекают по таймауту, а следующий запрос пересчитывает статистику.
+
+STATS_CACHE_TIMEOUT = getattr(settings, 'STATS_CACHE_TIMEOUT', 60 * 15)
+STATS_CACHE_KEY_PREFIX = 'stats:v1'
+
+# Области данных, для которых ведутся счетчики поколений.
+SCOPE_GLOBAL = 'global'
+SCOPE_YEAR = 'year'
+SCOPE_PERIOD = 'period'
+SCOPE_GROUP = 'group'
+
+
+def _generation_key(scope, object_id=None):
+    return f"{STATS_CACHE_KEY_PREFIX}:gen:{scope}" if object_id is None else f"{STATS_CACHE_KEY_PREFIX}:gen:{scope}:{object_id}"
+
+
+# Возвращает области данных, от которых зависит ответ с фильтрами по году/периоду:
+# учебный период (если указан), иначе учебный год, иначе глобальная область.
+def period_scopes(academic_year_id=None, study_period_id=None):
+    if study_period_id: return [(SCOPE_PERIOD, study_period_id)]
+    if academic_year_id: return [(SCOPE_YEAR, academic_year_id)]
+    return [(SCOPE_GLOBAL, None)]
+
+
+# Увеличивает поколения указанных областей (список пар (scope, id)).
+# Глобальное поколение увеличивается всегда: от него зависят ответы без фильтра по году/периоду.
+def bump_generations(scopes):
+    keys = {_generation_key(scope, object_id) for scope, object_id in scopes if object_id is not None}
+    keys.add(_generation_key(SCOPE_GLOBAL))
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError: # Ключа еще нет - создаем бессрочный счетчик
+            cache.add(key, 1, timeout=None)
+
+
+# Возвращает кэшированный ответ статистики или вычисляет его через compute() и кэширует.
+# - endpoint: Имя эндпоинта.
+# - role_scope: Область видимости роли ('admin', 'teacher:<id>', 'student:<id>' и т.п.).
+# - filters: Словарь с 'academic_year_id' и 'study_period_id' (из get_effective_period_filters).
+# - compute: Функция без аргументов, вычисляющая данные ответа.
+# - scopes: Области данных (по умолчанию - period_scopes(filters)).
+# - extra: Дополнительные параметры запроса, влияющие на ответ.
+# - timeout: Время жизни записи (по умолчанию STATS_CACHE_TIMEOUT).
+# Ответы с ключом 'error' не кэшируются.
+def get_or_compute_stats(endpoint, role_scope, filters, compute, scopes=None, extra=None, timeout=None):
+    academic_year_id = filters.get('academic_year_id'); study_period_id = filters.get('study_period_id')
+    if scopes is None: scopes = period_scopes(academic_year_id, study_period_id)
+    generation_keys = [_generation_key(scope, object_id) for scope, object_id in scopes]
+    generations = cache.get_many(generation_keys)
+    generation_part = ','.join(str(generations.get(key, 0)) for key in generation_keys)
+    extra_part = hashlib.md5(json.dumps(extra or {}, sort_keys=True, default=str).encode()).hexdigest()[:12]
+    cache_key = f"{STATS_CACHE_KEY_PREFIX}:{endpoint}:{role_scope}:{academic_year_id}:{study_period_id}:{extra_part}:{generation_part}"
+
+    data = cache.get(cache_key)
+    if data is not None:
+        logger.debug(f"Stats cache hit: {cache_key}")
+        return data
+    data = compute()
+    if not (isinstance(data, dict) and 'error' in data):
+        cache.set(cache_key, data, timeout=STATS_CACHE_TIMEOUT if timeout is None else timeout)
+    return data
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.7 on 2025-06-05 09:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlatformDailySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True, verbose_name='дата')),
+                ('users_total', models.PositiveIntegerField(default=0, verbose_name='пользователей всего')),
+                ('users_by_role', models.JSONField(default=dict, verbose_name='пользователей по ролям')),
+                ('new_users', models.PositiveIntegerField(default=0, verbose_name='новых пользователей')),
+                ('new_users_by_role', models.JSONField(default=dict, verbose_name='новых пользователей по ролям')),
+                ('chats_created', models.PositiveIntegerField(default=0, verbose_name='создано чатов')),
+                ('messages_sent', models.PositiveIntegerField(default=0, verbose_name='отправлено сообщений')),
+                ('active_chats', models.PositiveIntegerField(default=0, verbose_name='активных чатов')),
+                ('notifications_sent', models.PositiveIntegerField(default=0, verbose_name='отправлено уведомлений')),
+                ('notifications_read', models.PositiveIntegerField(default=0, verbose_name='прочитано уведомлений')),
+                ('notifications_by_type', models.JSONField(default=dict, verbose_name='уведомления по типам')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='обновлено')),
+            ],
+            options={
+                'verbose_name': 'снимок метрик платформы',
+                'verbose_name_plural': 'снимки метрик платформы',
+                'ordering': ['-date'],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.7 on 2025-06-05 11:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('edu_core', '0012_grade_calculation_key_pendinggradeaverage'),
+        ('stats', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentRiskScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('average_grade', models.DecimalField(blank=True, decimal_places=2, max_digits=4, null=True, verbose_name='средняя оценка')),
+                ('grades_count', models.PositiveIntegerField(default=0, verbose_name='количество оценок')),
+                ('attendance_records', models.PositiveIntegerField(default=0, verbose_name='записей посещаемости')),
+                ('absences_invalid', models.PositiveIntegerField(default=0, verbose_name='пропусков без уважительной причины')),
+                ('homework_expected', models.PositiveIntegerField(default=0, verbose_name='ДЗ с истекшим сроком')),
+                ('homework_missed', models.PositiveIntegerField(default=0, verbose_name='несданных ДЗ')),
+                ('risk_score', models.DecimalField(decimal_places=2, default=0, max_digits=5, verbose_name='балл риска')),
+                ('computed_at', models.DateTimeField(auto_now=True, verbose_name='рассчитано')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='risk_scores', to=settings.AUTH_USER_MODEL, verbose_name='студент')),
+                ('study_period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='risk_scores', to='edu_core.studyperiod', verbose_name='учебный период')),
+            ],
+            options={
+                'verbose_name': 'балл риска студента',
+                'verbose_name_plural': 'баллы риска студентов',
+                'indexes': [models.Index(fields=['study_period', '-risk_score'], name='stats_stude_study_p_080093_idx')],
+                'unique_together': {('student', 'study_period')},
+            },
+        ),
+    ]
@@ -1,3 +1,65 @@
+from django.conf import settings
 from django.db import models
+from django.utils.translation import gettext_lazy as _
 
-# Create your models here.
+# Модель PlatformDailySnapshot - ежедневный снимок метрик платформы для сводки администратора.
+# Снимки строит ночная задача Celery beat (stats.tasks.build_platform_snapshots_task) инкрементально:
+# для каждого нового дня считаются только события этого дня, а накопительные значения
+# (пользователи по ролям) получаются из предыдущего снимка.
+# - date: Дата (локальная), за которую собраны метрики (уникальна).
+# - users_total, users_by_role: Количество пользователей всего и по ролям на конец дня.
+# - new_users, new_users_by_role: Регистрации за день.
+# - chats_created, messages_sent, active_chats: Активность в мессенджере за день.
+# - notifications_sent, notifications_read, notifications_by_type: Уведомления, созданные за день
+#   (прочитанные - на момент последнего обновления снимка).
+class PlatformDailySnapshot(models.Model):
+    date = models.DateField(_('дата'), unique=True)
+    users_total = models.PositiveIntegerField(_('пользователей всего'), default=0)
+    users_by_role = models.JSONField(_('пользователей по ролям'), default=dict)
+    new_users = models.PositiveIntegerField(_('новых пользователей'), default=0)
+    new_users_by_role = models.JSONField(_('новых пользователей по ролям'), default=dict)
+    chats_created = models.PositiveIntegerField(_('создано чатов'), default=0)
+    messages_sent = models.PositiveIntegerField(_('отправлено сообщений'), default=0)
+    active_chats = models.PositiveIntegerField(_('активных чатов'), default=0)
+    notifications_sent = models.PositiveIntegerField(_('отправлено уведомлений'), default=0)
+    notifications_read = models.PositiveIntegerField(_('прочитано уведомлений'), default=0)
+    notifications_by_type = models.JSONField(_('уведомления по типам'), default=dict)
+    updated_at = models.DateTimeField(_('обновлено'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('снимок метрик платформы')
+        verbose_name_plural = _('снимки метрик платформы')
+        ordering = ['-date']
+
+    def __str__(self):
+        return f"Снимок платформы за {self.date}"
+
+
+# Модель StudentRiskScore - рассчитанный балл риска неуспеваемости студента за учебный период.
+# Баллы пересчитывает ночная задача Celery beat (stats.tasks.compute_student_risk_scores_task)
+# сразу для всех студентов (stats.services.RiskScoringService); эндпоинт "группа риска"
+# читает готовые строки по индексу (study_period, -risk_score).
+# - average_grade, grades_count: Средневзвешенная текущая оценка и количество оценок.
+# - attendance_records, absences_invalid: Записи посещаемости и пропуски без уважительной причины.
+# - homework_expected, homework_missed: ДЗ с истекшим сроком в группах студента и несданные из них.
+# - risk_score: Итоговый балл 0-100 (чем выше, тем выше риск).
+class StudentRiskScore(models.Model):
+    student = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='risk_scores', verbose_name=_('студент'))
+    study_period = models.ForeignKey('edu_core.StudyPeriod', on_delete=models.CASCADE, related_name='risk_scores', verbose_name=_('учебный период'))
+    average_grade = models.DecimalField(_('средняя оценка'), max_digits=4, decimal_places=2, null=True, blank=True)
+    grades_count = models.PositiveIntegerField(_('количество оценок'), default=0)
+    attendance_records = models.PositiveIntegerField(_('записей посещаемости'), default=0)
+    absences_invalid = models.PositiveIntegerField(_('пропусков без уважительной причины'), default=0)
+    homework_expected = models.PositiveIntegerField(_('ДЗ с истекшим сроком'), default=0)
+    homework_missed = models.PositiveIntegerField(_('несданных ДЗ'), default=0)
+    risk_score = models.DecimalField(_('балл риска'), max_digits=5, decimal_places=2, default=0)
+    computed_at = models.DateTimeField(_('рассчитано'), auto_now=True)
+
+    class Meta:
+        verbose_name = _('балл риска студента')
+        verbose_name_plural = _('баллы риска студентов')
+        unique_together = ('student', 'study_period')
+        indexes = [models.Index(fields=['study_period', '-risk_score'])]
+
+    def __str__(self):
+        return f"Риск студента {self.student_id} за период {self.study_period_id}: {self.risk_score}"
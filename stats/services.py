@@ -1,18 +1,22 @@
 from decimal import ROUND_HALF_UP, Decimal # Импорт для точного округления Decimal
 import logging
+from django.db import transaction
 from django.db.models import Avg, Count, Sum, F, ExpressionWrapper, fields, Q, Case, When, Value
 from django.utils import timezone
-from datetime import timedelta, date # date импортирован для использования в HomeworkStatsService
+from datetime import timedelta, date, datetime, time # date импортирован для использования в HomeworkStatsService
 from django.conf import settings 
 
 from users.models import User
 from edu_core.models import (
     Lesson, StudentGroup, Subject, Grade, Attendance, Homework, HomeworkSubmission, 
-    AcademicYear, StudyPeriod, CurriculumEntry
+    AcademicYear, StudyPeriod, CurriculumEntry, AttendanceRollup
 )
 from messaging.models import Chat, Message # Модели из модуля messaging
 from notifications.models import Notification # Модель из модуля notifications
 from django.db.models import Prefetch # Prefetch для оптимизации запросов
+from django.db.models.functions import TruncDate, Trunc
+from django.db.models import DateField
+from .models import PlatformDailySnapshot, StudentRiskScore
 from django.utils.translation import gettext_lazy as _ # Для интернационализации строк
 
 logger = logging.getLogger(__name__)
@@ -93,67 +97,250 @@ class PlatformStatsService:
             "sent_by_type": by_type,
         }
 
+# Класс PlatformSnapshotService строит ежедневные снимки метрик платформы (PlatformDailySnapshot)
+# и собирает из них сводку для администратора.
+# - build_snapshots: Достраивает снимки за все дни после последнего снимка (по вчерашний день включительно).
+#   Метрики каждого дня считаются сгруппированными по дню запросами только по событиям новых дней
+#   (индексированные диапазоны по date_joined/created_at/timestamp). Количество пользователей по ролям
+#   считается одним сгруппированным COUNT по User на момент построения (учитывает удаления и смену ролей).
+#   Дополнительно обновляется количество прочитанных уведомлений за последние READ_REFRESH_DAYS дней
+#   (прочтение происходит после снимка).
+# - get_platform_summary: Сводка в формате PlatformStatsService за последние `days_ago` дней:
+#   снимки за полные дни + дешевые "дельты" за сегодняшний день; количество пользователей по ролям - текущее.
+# - get_history: Временной ряд снимков.
+class PlatformSnapshotService:
+    READ_REFRESH_DAYS = 7
+
+    def _day_start(self, day):
+        return timezone.make_aware(datetime.combine(day, time.min))
+
+    def _by_day(self, queryset, field_name, start, end, *extra_group_fields, **aggregates):
+        day_expression = TruncDate(field_name, tzinfo=timezone.get_current_timezone())
+        return queryset.filter(**{f'{field_name}__gte': start, f'{field_name}__lt': end})\
+            .annotate(day=day_expression).values('day', *extra_group_fields).annotate(**aggregates).order_by()
+
+    # Возвращает метрики событий по дням за [start_day, end_day] (включительно):
+    # словарь {date: {...}}; дни без событий отсутствуют.
+    def _collect_daily_activity(self, start_day, end_day):
+        start, end = self._day_start(start_day), self._day_start(end_day + timedelta(days=1))
+        days = {}
+        def day_data(day):
+            return days.setdefault(day, {
+                'new_users_by_role': {}, 'chats_created': 0, 'messages_sent': 0, 'active_chats': 0,
+                'notifications_sent': 0, 'notifications_read': 0, 'notifications_by_type': {},
+            })
+        for row in self._by_day(User.objects.all(), 'date_joined', start, end, 'role', count=Count('id')):
+            day_data(row['day'])['new_users_by_role'][row['role']] = row['count']
+        for row in self._by_day(Chat.objects.all(), 'created_at', start, end, count=Count('id')):
+            day_data(row['day'])['chats_created'] = row['count']
+        for row in self._by_day(Message.objects.all(), 'timestamp', start, end, count=Count('id'), chats=Count('chat', distinct=True)):
+            day_data(row['day']).update(messages_sent=row['count'], active_chats=row['chats'])
+        for row in self._by_day(Notification.objects.all(), 'created_at', start, end, 'notification_type', count=Count('id'), read=Count('id', filter=Q(is_read=True))):
+            data = day_data(row['day'])
+            data['notifications_by_type'][row['notification_type']] = row['count']
+            data['notifications_sent'] += row['count']; data['notifications_read'] += row['read']
+        return days
+
+    # Достраивает недостающие снимки по `until_date` включительно (по умолчанию - вчерашний день).
+    # Если снимков еще нет, строится только снимок за `until_date`. Количество пользователей по ролям
+    # на конец `until_date` считается одним сгруппированным COUNT по текущим пользователям; для более
+    # ранних достраиваемых дней из него вычитаются регистрации следующих дней.
+    # Возвращает количество созданных снимков.
+    def build_snapshots(self, until_date=None):
+        until_date = until_date or (timezone.localdate() - timedelta(days=1))
+        previous = PlatformDailySnapshot.objects.filter(date__lte=until_date).order_by('-date').first()
+        start_day = previous.date + timedelta(days=1) if previous else until_date
+        snapshots = []
+        if start_day <= until_date:
+            daily_activity = self._collect_daily_activity(start_day, until_date)
+            users_by_role = dict(
+                User.objects.filter(date_joined__lt=self._day_start(until_date + timedelta(days=1))).values('role')
+                .annotate(count=Count('id')).order_by().values_list('role', 'count')
+            )
+            day = until_date
+            while day >= start_day:
+                data = daily_activity.get(day) or {}
+                new_users_by_role = data.get('new_users_by_role', {})
+                snapshots.append(PlatformDailySnapshot(
+                    date=day, users_total=sum(users_by_role.values()), users_by_role=dict(users_by_role),
+                    new_users=sum(new_users_by_role.values()), new_users_by_role=new_users_by_role,
+                    chats_created=data.get('chats_created', 0), messages_sent=data.get('messages_sent', 0),
+                    active_chats=data.get('active_chats', 0), notifications_sent=data.get('notifications_sent', 0),
+                    notifications_read=data.get('notifications_read', 0), notifications_by_type=data.get('notifications_by_type', {}),
+                ))
+                for role, count in new_users_by_role.items(): users_by_role[role] = users_by_role.get(role, 0) - count
+                users_by_role = {role: count for role, count in users_by_role.items() if count > 0}
+                day -= timedelta(days=1)
+            snapshots.reverse()
+            PlatformDailySnapshot.objects.bulk_create(
+                snapshots, update_conflicts=True, unique_fields=['date'],
+                update_fields=[field.name for field in PlatformDailySnapshot._meta.concrete_fields if field.name not in ('id', 'date')],
+            )
+        self._refresh_read_counts(until_date)
+        return len(snapshots)
+
+    # Обновляет количество прочитанных уведомлений в снимках за последние READ_REFRESH_DAYS дней.
+    def _refresh_read_counts(self, until_date):
+        refresh_from = until_date - timedelta(days=self.READ_REFRESH_DAYS - 1)
+        read_by_day = {
+            row['day']: row['read']
+            for row in self._by_day(Notification.objects.all(), 'created_at', self._day_start(refresh_from), self._day_start(until_date + timedelta(days=1)), read=Count('id', filter=Q(is_read=True)))
+        }
+        snapshots = list(PlatformDailySnapshot.objects.filter(date__gte=refresh_from, date__lte=until_date))
+        for snapshot in snapshots: snapshot.notifications_read = read_by_day.get(snapshot.date, 0)
+        PlatformDailySnapshot.objects.bulk_update(snapshots, ['notifications_read'])
+
+    # Сводка по платформе за последние `days_ago` дней (окно - с начала дня `days_ago` дней назад).
+    # Без снимков используется прямой расчет PlatformStatsService.
+    def get_platform_summary(self, days_ago=7):
+        live_service = PlatformStatsService()
+        latest = PlatformDailySnapshot.objects.order_by('-date').first()
+        if latest is None:
+            return {
+                'user_counts_by_role': live_service.get_user_counts_by_role(),
+                f'recent_registrations_{days_ago}_days': live_service.get_recent_registrations(days_ago=days_ago),
+                'active_users_approx_15_min': live_service.get_active_users_approx(minutes_ago=15),
+                'online_users_via_channels': live_service.get_online_users_via_channels(),
+                'messaging_activity_summary': live_service.get_messaging_activity_summary(days_ago=days_ago),
+                'notification_stats': live_service.get_notification_stats(days_ago=days_ago),
+            }
+        window_start_day = timezone.localdate() - timedelta(days=days_ago)
+        window_start = self._day_start(window_start_day)
+        totals = PlatformDailySnapshot.objects.filter(date__gte=window_start_day).aggregate(
+            new_users=Sum('new_users'), chats_created=Sum('chats_created'), messages_sent=Sum('messages_sent'),
+            notifications_sent=Sum('notifications_sent'), notifications_read=Sum('notifications_read'),
+        )
+        # Дельты после последнего снимка (как правило - только сегодняшний день)
+        deltas = self._collect_daily_activity(latest.date + timedelta(days=1), timezone.localdate())
+        sent_by_type = {}
+        for row in PlatformDailySnapshot.objects.filter(date__gte=window_start_day).values_list('notifications_by_type', flat=True):
+            for notification_type, count in row.items(): sent_by_type[notification_type] = sent_by_type.get(notification_type, 0) + count
+        for day, data in deltas.items():
+            if day < window_start_day: continue
+            totals['new_users'] = (totals['new_users'] or 0) + sum(data['new_users_by_role'].values())
+            for field_name in ('chats_created', 'messages_sent', 'notifications_sent', 'notifications_read'):
+                totals[field_name] = (totals[field_name] or 0) + data[field_name]
+            for notification_type, count in data['notifications_by_type'].items(): sent_by_type[notification_type] = sent_by_type.get(notification_type, 0) + count
+        total_sent = totals['notifications_sent'] or 0; total_read = totals['notifications_read'] or 0
+        return {
+            # Один сгруппированный COUNT - дешевле и точнее накопления от снимков (удаления, смена ролей)
+            'user_counts_by_role': live_service.get_user_counts_by_role(),
+            f'recent_registrations_{days_ago}_days': totals['new_users'] or 0,
+            'active_users_approx_15_min': live_service.get_active_users_approx(minutes_ago=15),
+            'online_users_via_channels': live_service.get_online_users_via_channels(),
+            'messaging_activity_summary': {
+                "period_days": days_ago,
+                "new_chats_created": totals['chats_created'] or 0,
+                "messages_sent": totals['messages_sent'] or 0,
+                # Чат активен в окне, если его последнее сообщение попало в окно
+                "active_chats_count": Chat.objects.filter(last_message__timestamp__gte=window_start).count(),
+            },
+            'notification_stats': {
+                "period_days": days_ago,
+                "total_notifications_sent": total_sent,
+                "total_notifications_read": total_read,
+                "read_percentage": round((total_read / total_sent) * 100, 1) if total_sent > 0 else 0,
+                "sent_by_type": [{'notification_type': t, 'count': c} for t, c in sorted(sent_by_type.items(), key=lambda item: -item[1])],
+            },
+            'snapshot_date': latest.date,
+        }
+
+    # Временной ряд снимков за [date_from, date_to] (по возрастанию даты).
+    def get_history(self, date_from, date_to):
+        return list(
+            PlatformDailySnapshot.objects.filter(date__gte=date_from, date__lte=date_to).order_by('date')
+            .values('date', 'users_total', 'users_by_role', 'new_users', 'chats_created', 'messages_sent',
+                    'active_chats', 'notifications_sent', 'notifications_read', 'notifications_by_type')
+        )
+
 # Класс TeacherLoadStatsService предоставляет методы для расчета и получения статистики
 # по учебной нагрузке преподавателей.
 class TeacherLoadStatsService:
+    # Единый расчет нагрузки преподавателей: запланированные часы (CurriculumEntry.planned_hours)
+    # и поставленные в расписание занятия/часы (Lesson.duration_minutes) для всех
+    # преподавателей сразу - двумя сгруппированными по teacher_id запросами.
+    # Фильтр: учебный период (приоритетнее) или учебный год (через study_period__academic_year).
+    # teacher_ids ограничивает расчет конкретными преподавателями.
+    # Используется и статистикой (stats), и edu_core TeacherLoadStatsView, поэтому цифры совпадают.
+    # Возвращает словарь {teacher_id: {'total_planned_hours', 'total_scheduled_lessons',
+    # 'total_scheduled_hours', 'load_percentage'}} (только для преподавателей, у которых есть данные).
+    def get_loads_by_teacher(self, academic_year_id=None, study_period_id=None, teacher_ids=None):
+        period_filter = Q()
+        if study_period_id: period_filter = Q(study_period_id=study_period_id)
+        elif academic_year_id: period_filter = Q(study_period__academic_year_id=academic_year_id)
+        teacher_filter = Q(teacher_id__in=teacher_ids) if teacher_ids is not None else Q(teacher__isnull=False)
+
+        planned_by_teacher = dict(
+            CurriculumEntry.objects.filter(period_filter, teacher_filter)
+            .values('teacher_id').annotate(total=Sum('planned_hours')).order_by()
+            .values_list('teacher_id', 'total')
+        )
+        scheduled_by_teacher = {
+            row['teacher_id']: row
+            for row in Lesson.objects.filter(period_filter, teacher_filter)
+            .values('teacher_id').annotate(lesson_count=Count('id'), total_minutes=Sum('duration_minutes')).order_by()
+        }
+
+        loads = {}
+        for teacher_id in set(planned_by_teacher) | set(scheduled_by_teacher):
+            total_planned_hours = float(planned_by_teacher.get(teacher_id) or 0.0)
+            scheduled_row = scheduled_by_teacher.get(teacher_id, {})
+            total_scheduled_hours = round((scheduled_row.get('total_minutes') or 0) / 60, 2)
+            loads[teacher_id] = {
+                'total_planned_hours': total_planned_hours,
+                'total_scheduled_lessons': scheduled_row.get('lesson_count') or 0,
+                'total_scheduled_hours': total_scheduled_hours,
+                'load_percentage': round((total_scheduled_hours / total_planned_hours) * 100, 1) if total_planned_hours > 0 else 0,
+            }
+        return loads
+
+    # Нулевая нагрузка для преподавателей без учебного плана и занятий в выбранном периоде.
+    EMPTY_LOAD = {'total_planned_hours': 0.0, 'total_scheduled_lessons': 0, 'total_scheduled_hours': 0.0, 'load_percentage': 0}
+
     # Возвращает детализированную информацию о нагрузке конкретного преподавателя.
     # Фильтруется по ID учебного года и/или ID учебного периода.
-    # Рассчитывает общие запланированные часы, детализацию по предметам/группам,
-    # количество и общую продолжительность проведенных занятий, а также процент выполнения нагрузки.
+    # Итоговые цифры берутся из get_loads_by_teacher; дополнительно возвращается
+    # детализация запланированных часов по предметам/группам.
     def get_teacher_load_details(self, teacher_id, academic_year_id=None, study_period_id=None):
         try: teacher = User.objects.get(pk=teacher_id, role=User.Role.TEACHER)
         except User.DoesNotExist: return {"error": _("Преподаватель не найден.")}
         
         planned_hours_filter = Q(teacher=teacher)
-        scheduled_lessons_filter = Q(teacher=teacher)
-        
         if study_period_id:
-            target_study_period = StudyPeriod.objects.filter(pk=study_period_id).first()
-            if not target_study_period: return {"error": _("Учебный период не найден.")}
-            planned_hours_filter &= Q(study_period=target_study_period)
-            scheduled_lessons_filter &= Q(study_period=target_study_period)
+            if not StudyPeriod.objects.filter(pk=study_period_id).exists(): return {"error": _("Учебный период не найден.")}
+            planned_hours_filter &= Q(study_period_id=study_period_id)
         elif academic_year_id:
-            target_academic_year = AcademicYear.objects.filter(pk=academic_year_id).first()
-            if not target_academic_year: return {"error": _("Учебный год не найден.")}
-            planned_hours_filter &= Q(study_period__academic_year=target_academic_year)
-            scheduled_lessons_filter &= Q(study_period__academic_year=target_academic_year)
+            if not AcademicYear.objects.filter(pk=academic_year_id).exists(): return {"error": _("Учебный год не найден.")}
+            planned_hours_filter &= Q(study_period__academic_year_id=academic_year_id)
         
-        planned_entries = CurriculumEntry.objects.filter(planned_hours_filter).select_related('subject', 'study_period', 'curriculum__student_group')
-        total_planned_hours = planned_entries.aggregate(total=Sum('planned_hours'))['total'] or 0.0
-        planned_details = [{'subject_name': entry.subject.name, 'group_name': entry.curriculum.student_group.name, 'period_name': entry.study_period.name, 'hours': entry.planned_hours} for entry in planned_entries]
-        
-        duration_expression = ExpressionWrapper(F('end_time') - F('start_time'), output_field=fields.DurationField())
-        scheduled_lessons_qs = Lesson.objects.filter(scheduled_lessons_filter).annotate(duration=duration_expression)
-        scheduled_agg = scheduled_lessons_qs.aggregate(total_duration_agg=Sum('duration'), lesson_count_agg=Count('id'))
-        total_scheduled_seconds = scheduled_agg.get('total_duration_agg').total_seconds() if scheduled_agg.get('total_duration_agg') else 0
-        total_scheduled_hours = round(total_scheduled_seconds / 3600, 2)
-        lesson_count = scheduled_agg.get('lesson_count_agg') or 0
+        planned_details = [
+            {'subject_name': entry['subject__name'], 'group_name': entry['curriculum__student_group__name'], 'period_name': entry['study_period__name'], 'hours': entry['planned_hours']}
+            for entry in CurriculumEntry.objects.filter(planned_hours_filter).values('subject__name', 'curriculum__student_group__name', 'study_period__name', 'planned_hours')
+        ]
+        load = self.get_loads_by_teacher(academic_year_id, study_period_id, teacher_ids=[teacher.id]).get(teacher.id, self.EMPTY_LOAD)
 
         return {
             'teacher_id': teacher.id, 'teacher_name': teacher.get_full_name(),
             'filter_academic_year_id': academic_year_id, 'filter_study_period_id': study_period_id,
-            'total_planned_hours': total_planned_hours, 'planned_details_by_subject_group': planned_details,
-            'total_scheduled_lessons': lesson_count, 'total_scheduled_hours': total_scheduled_hours,
-            'load_percentage': round((total_scheduled_hours / total_planned_hours) * 100, 1) if total_planned_hours > 0 else 0,
+            'total_planned_hours': load['total_planned_hours'], 'planned_details_by_subject_group': planned_details,
+            'total_scheduled_lessons': load['total_scheduled_lessons'], 'total_scheduled_hours': load['total_scheduled_hours'],
+            'load_percentage': load['load_percentage'],
         }
 
     # Возвращает сводную информацию о нагрузке для всех преподавателей.
     # Фильтруется по ID учебного года и/или ID учебного периода.
-    # Для каждого преподавателя агрегирует общие запланированные часы, количество проведенных занятий,
-    # общую продолжительность проведенных занятий и процент выполнения нагрузки.
+    # Три запроса независимо от числа преподавателей: список преподавателей и два
+    # сгруппированных запроса get_loads_by_teacher.
     def get_all_teachers_summary_load(self, academic_year_id=None, study_period_id=None):
         teachers = User.objects.filter(role=User.Role.TEACHER).order_by('last_name', 'first_name')
+        loads = self.get_loads_by_teacher(academic_year_id, study_period_id)
         results = []
         for teacher in teachers:
-            details = self.get_teacher_load_details(teacher.id, academic_year_id, study_period_id)
-            if "error" not in details:
-                results.append({
-                    'teacher_id': details['teacher_id'], 'teacher_name': details['teacher_name'],
-                    'total_planned_hours': details['total_planned_hours'],
-                    'total_scheduled_lessons': details['total_scheduled_lessons'],
-                    'total_scheduled_hours': details['total_scheduled_hours'],
-                    'load_percentage': details['load_percentage'],
-                })
+            load = loads.get(teacher.id, self.EMPTY_LOAD)
+            results.append({
+                'teacher_id': teacher.id, 'teacher_name': teacher.get_full_name(),
+                **load,
+            })
         return results
 
 # Класс StudentPerformanceStatsService предоставляет методы для расчета и получения
@@ -189,35 +376,66 @@ class StudentPerformanceStatsService:
             results.append({'subject_id': subject.id, 'subject_name': subject.name, 'average_grade': avg_grade, 'grades_count': num_grades})
         return results
 
+    # Средневзвешенная оценка (Decimal с округлением до сотых) из сумм сгруппированного запроса.
+    def _weighted_average(self, weighted_sum, total_weight):
+        if not total_weight: return None
+        return (Decimal(str(weighted_sum)) / Decimal(str(total_weight))).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+    # Выражения сгруппированного запроса по оценкам: сумма (оценка x вес), сумма весов и количество
+    # оценок с числовым значением (оценки с нулевым весом в среднюю не входят).
+    WEIGHTED_GRADE_EXPRESSIONS = {
+        'weighted_sum': Sum(F('numeric_value') * F('weight'), filter=Q(weight__gt=0, numeric_value__isnull=False)),
+        'total_weight': Sum('weight', filter=Q(weight__gt=0, numeric_value__isnull=False)),
+        'grades_count': Count('id', filter=Q(numeric_value__isnull=False)),
+    }
+
     # Возвращает сводную информацию об успеваемости для указанной учебной группы в учебном периоде.
     # Включает общую среднюю оценку по группе, процент студентов, преодолевших порог успеваемости,
     # и детализацию успеваемости для каждого студента группы.
     def get_group_performance_summary(self, student_group_id, study_period_id, passing_threshold=3.0):
         try: group = StudentGroup.objects.get(pk=student_group_id)
         except StudentGroup.DoesNotExist: return {"error": _("Группа не найдена.")}
-        students_in_group = group.students.filter(role=User.Role.STUDENT)
-        if not students_in_group.exists(): return {'group_name': group.name, 'average_grade': None, 'passing_percentage': None, 'student_count': 0}
-        
-        passing_students_count = 0; total_average_grade_sum = Decimal('0.0'); students_with_grades_count = 0
-        student_details_list = []; passing_threshold_decimal = Decimal(str(passing_threshold))
-
-        for student in students_in_group:
-            grades_for_student_period = Grade.objects.filter(student=student, study_period_id=study_period_id, numeric_value__isnull=False)
-            student_avg_decimal, num_grades = self._calculate_weighted_average(grades_for_student_period) 
-            student_details_list.append({'student_id': student.id, 'student_name': student.get_full_name(), 'average_grade': float(student_avg_decimal) if student_avg_decimal is not None else None, 'grades_count': num_grades})
-            if student_avg_decimal is not None:
-                total_average_grade_sum += student_avg_decimal; students_with_grades_count += 1
-                if student_avg_decimal >= passing_threshold_decimal: passing_students_count += 1
-        
-        overall_group_avg_decimal = (total_average_grade_sum / Decimal(students_with_grades_count)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) if students_with_grades_count > 0 else None
-        passing_percentage = round((passing_students_count / students_in_group.count()) * 100, 1) if students_in_group.count() > 0 else 0.0
+        return self.get_groups_performance_summaries([group], study_period_id, passing_threshold)[0]
 
-        return {
-            'group_id': group.id, 'group_name': group.name, 'study_period_id': study_period_id,
-            'overall_average_grade': float(overall_group_avg_decimal) if overall_group_avg_decimal is not None else None,
-            'passing_students_percentage': passing_percentage, 'total_students_in_group': students_in_group.count(),
-            'students_counted_for_average': students_with_grades_count, 'students_details': student_details_list
+    # Сводки успеваемости (в формате get_group_performance_summary) для нескольких групп:
+    # состав групп и средние оценки студентов считаются двумя запросами независимо от числа групп и студентов.
+    def get_groups_performance_summaries(self, groups, study_period_id, passing_threshold=3.0):
+        if not groups: return []
+        members_by_group = {}
+        memberships = StudentGroup.students.through.objects.filter(studentgroup__in=groups, user__role=User.Role.STUDENT)\
+            .select_related('user').order_by('user__last_name', 'user__first_name')
+        for membership in memberships: members_by_group.setdefault(membership.studentgroup_id, []).append(membership.user)
+        averages = {
+            row['student_id']: (self._weighted_average(row['weighted_sum'], row['total_weight']), row['grades_count'])
+            for row in Grade.objects.filter(
+                student_id__in={student.id for members in members_by_group.values() for student in members},
+                study_period_id=study_period_id,
+            ).values('student_id').annotate(**self.WEIGHTED_GRADE_EXPRESSIONS).order_by()
         }
+        passing_threshold_decimal = Decimal(str(passing_threshold))
+        summaries = []
+        for group in groups:
+            students_in_group = members_by_group.get(group.id, [])
+            if not students_in_group:
+                summaries.append({'group_name': group.name, 'average_grade': None, 'passing_percentage': None, 'student_count': 0})
+                continue
+            passing_students_count = 0; total_average_grade_sum = Decimal('0.0'); students_with_grades_count = 0
+            student_details_list = []
+            for student in students_in_group:
+                student_avg_decimal, num_grades = averages.get(student.id, (None, 0))
+                student_details_list.append({'student_id': student.id, 'student_name': student.get_full_name(), 'average_grade': float(student_avg_decimal) if student_avg_decimal is not None else None, 'grades_count': num_grades})
+                if student_avg_decimal is not None:
+                    total_average_grade_sum += student_avg_decimal; students_with_grades_count += 1
+                    if student_avg_decimal >= passing_threshold_decimal: passing_students_count += 1
+            overall_group_avg_decimal = (total_average_grade_sum / Decimal(students_with_grades_count)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) if students_with_grades_count > 0 else None
+            summaries.append({
+                'group_id': group.id, 'group_name': group.name, 'study_period_id': study_period_id,
+                'overall_average_grade': float(overall_group_avg_decimal) if overall_group_avg_decimal is not None else None,
+                'passing_students_percentage': round((passing_students_count / len(students_in_group)) * 100, 1),
+                'total_students_in_group': len(students_in_group),
+                'students_counted_for_average': students_with_grades_count, 'students_details': student_details_list
+            })
+        return summaries
 
     # Возвращает список студентов, чья средняя успеваемость в указанном учебном периоде
     # выше или ниже заданного порога (`threshold`).
@@ -233,28 +451,90 @@ class StudentPerformanceStatsService:
         if limit: filtered_students = filtered_students[:limit]
         return list(filtered_students.values('student_id', 'student__first_name', 'student__last_name', 'student_avg_grade'))
 
+    # Возвращает матрицу успеваемости преподаватель x предмет x группа за учебный период.
+    # Пары (предмет, группа) преподавателя берутся из его занятий в периоде; средневзвешенная
+    # оценка и количество оценок считаются одним сгруппированным запросом по оценкам,
+    # соединенным с членством студентов в группах (по предмету и группе).
+    # Количество запросов не зависит от числа преподавателей: занятия, преподаватели, оценки.
+    # teacher_ids=None - все преподаватели. Возвращает список
+    # {'teacher_id', 'teacher_name', 'groups_data': [...]} только для преподавателей с занятиями.
+    def get_teacher_subject_group_matrix(self, study_period_id, teacher_ids=None):
+        lessons_qs = Lesson.objects.filter(study_period_id=study_period_id, teacher__isnull=False)
+        if teacher_ids is not None: lessons_qs = lessons_qs.filter(teacher_id__in=teacher_ids)
+        teaching_pairs = list(
+            lessons_qs.values('teacher_id', 'subject_id', 'subject__name', 'student_group_id', 'student_group__name')
+            .distinct().order_by('subject__name', 'student_group__name')
+        )
+        if not teaching_pairs: return []
+
+        group_field = 'student__student_group_memberships'
+        grade_stats = {
+            (row['subject_id'], row[group_field]): row
+            for row in Grade.objects.filter(
+                study_period_id=study_period_id, numeric_value__isnull=False,
+                subject_id__in={pair['subject_id'] for pair in teaching_pairs},
+                **{f'{group_field}__in': {pair['student_group_id'] for pair in teaching_pairs}},
+            ).values('subject_id', group_field).annotate(
+                weighted_sum=Sum(F('numeric_value') * F('weight'), filter=Q(weight__gt=0)),
+                total_weight=Sum('weight', filter=Q(weight__gt=0)),
+                grades_count=Count('id'),
+            ).order_by()
+        }
+
+        teachers = User.objects.filter(pk__in={pair['teacher_id'] for pair in teaching_pairs}, role=User.Role.TEACHER).order_by('last_name', 'first_name')
+        groups_by_teacher = {}
+        for pair in teaching_pairs:
+            stats_row = grade_stats.get((pair['subject_id'], pair['student_group_id']), {})
+            total_weight = stats_row.get('total_weight')
+            groups_by_teacher.setdefault(pair['teacher_id'], []).append({
+                'group_id': pair['student_group_id'], 'group_name': pair['student_group__name'],
+                'subject_id': pair['subject_id'], 'subject_name': pair['subject__name'],
+                'average_grade': round(stats_row['weighted_sum'] / total_weight, 2) if total_weight and total_weight > 0 else None,
+                'grades_count': stats_row.get('grades_count', 0),
+            })
+        return [
+            {'teacher_id': teacher.id, 'teacher_name': teacher.get_full_name(), 'groups_data': groups_by_teacher[teacher.id]}
+            for teacher in teachers
+        ]
+
 # Класс AttendanceStatsService предоставляет методы для расчета и получения
 # статистики по посещаемости.
 class AttendanceStatsService:
+    # Сводки за период/год считаются по агрегатам AttendanceRollup (студент x предмет x период),
+    # а не по всем записям Attendance; там, где агрегатов недостаточно (уникальные занятия группы),
+    # используется один проход условной агрегации по записям.
+    ROLLUP_SUM_EXPRESSIONS = {field_name: Sum(field_name) for field_name in AttendanceRollup.COUNT_FIELDS}
+
+    def _rollups_for_period(self, academic_year_id=None, study_period_id=None):
+        rollups_qs = AttendanceRollup.objects.all()
+        if study_period_id: rollups_qs = rollups_qs.filter(study_period_id=study_period_id)
+        elif academic_year_id: rollups_qs = rollups_qs.filter(study_period__academic_year_id=academic_year_id)
+        return rollups_qs
+
+    # Из словаря счетчиков (total_count и счетчики по статусам) формирует распределение по статусам
+    # (только ненулевые) и количество присутствий.
+    def _summarize_counts(self, counts):
+        summary_by_status = [
+            {'status': status_value, 'count': counts[field_name]}
+            for status_value, field_name in AttendanceRollup.STATUS_COUNT_FIELDS.items() if counts[field_name]
+        ]
+        present_count = sum(counts[AttendanceRollup.STATUS_COUNT_FIELDS[status_value]] or 0 for status_value in Attendance.PRESENT_STATUSES)
+        return summary_by_status, counts['total_count'] or 0, present_count
+
     # Возвращает общий процент посещаемости по всем записям в указанном
-    # учебном году или периоде.
+    # учебном году или периоде. Один запрос по агрегатам.
     def get_overall_attendance_percentage(self, academic_year_id=None, study_period_id=None):
-        base_qs = Attendance.objects.all()
-        if study_period_id: base_qs = base_qs.filter(journal_entry__lesson__study_period_id=study_period_id)
-        elif academic_year_id: base_qs = base_qs.filter(journal_entry__lesson__study_period__academic_year_id=academic_year_id)
-        total_records = base_qs.count()
+        counts = self._rollups_for_period(academic_year_id, study_period_id).aggregate(**self.ROLLUP_SUM_EXPRESSIONS)
+        _, total_records, present_count = self._summarize_counts(counts)
         if total_records == 0: return None
-        present_count = base_qs.filter(status__in=[Attendance.Status.PRESENT, Attendance.Status.LATE, Attendance.Status.REMOTE]).count()
         return round((present_count / total_records) * 100, 1)
 
     # Возвращает топ `limit` студентов с наибольшим количеством пропусков по неуважительной причине
     # в указанном учебном году или периоде.
     def get_top_absent_students(self, limit=10, academic_year_id=None, study_period_id=None):
-        base_qs = Attendance.objects.filter(status=Attendance.Status.ABSENT_INVALID)
-        if study_period_id: base_qs = base_qs.filter(journal_entry__lesson__study_period_id=study_period_id)
-        elif academic_year_id: base_qs = base_qs.filter(journal_entry__lesson__study_period__academic_year_id=academic_year_id)
-        absences = base_qs.values('student', 'student__first_name', 'student__last_name')\
-            .annotate(absent_count=Count('id')).order_by('-absent_count')[:limit]
+        absences = self._rollups_for_period(academic_year_id, study_period_id)\
+            .values('student', 'student__first_name', 'student__last_name')\
+            .annotate(absent_count=Sum('absent_invalid_count')).filter(absent_count__gt=0).order_by('-absent_count')[:limit]
         return list(absences)
     
     # Возвращает сводку по посещаемости для конкретного студента в указанном учебном периоде.
@@ -262,11 +542,8 @@ class AttendanceStatsService:
     def get_student_attendance_summary(self, student_id, study_period_id):
         try: student = User.objects.get(pk=student_id, role=User.Role.STUDENT)
         except User.DoesNotExist: return {"error": _("Студент не найден.")}
-        records_qs = Attendance.objects.filter(student=student, journal_entry__lesson__study_period_id=study_period_id)
-        summary_by_status = list(records_qs.values('status').annotate(count=Count('id')))
-        total_recorded_lessons = records_qs.count()
-        present_statuses = [Attendance.Status.PRESENT, Attendance.Status.LATE, Attendance.Status.REMOTE]
-        present_count = records_qs.filter(status__in=present_statuses).count()
+        counts = AttendanceRollup.objects.filter(student=student, study_period_id=study_period_id).aggregate(**self.ROLLUP_SUM_EXPRESSIONS)
+        summary_by_status, total_recorded_lessons, present_count = self._summarize_counts(counts)
         return {
             'student_id': student.id, 'student_name': student.get_full_name(), 'study_period_id': study_period_id,
             'summary_by_status': summary_by_status, 'total_recorded_lessons': total_recorded_lessons,
@@ -276,46 +553,66 @@ class AttendanceStatsService:
 
     # Возвращает сводку по посещаемости для указанной учебной группы в учебном периоде.
     # Включает общую статистику по статусам, средний процент посещаемости по группе.
+    # Все счетчики (включая количество уникальных занятий) считаются одним проходом условной агрегации.
     def get_group_attendance_summary(self, student_group_id, study_period_id):
         try: group = StudentGroup.objects.get(pk=student_group_id)
         except StudentGroup.DoesNotExist: return {"error": _("Группа не найдена.")}
-        records_qs = Attendance.objects.filter(student__student_group_memberships=group, journal_entry__lesson__study_period_id=study_period_id)
-        summary_by_status = list(records_qs.values('status').annotate(count=Count('id')))
-        total_recorded_student_lessons = records_qs.count()
-        present_statuses = [Attendance.Status.PRESENT, Attendance.Status.LATE, Attendance.Status.REMOTE]
-        present_student_lessons_count = records_qs.filter(status__in=present_statuses).count()
-        unique_lessons_with_attendance_count = records_qs.values('journal_entry__lesson_id').distinct().count()
+        counts = Attendance.objects.filter(student__student_group_memberships=group, journal_entry__lesson__study_period_id=study_period_id).aggregate(
+            **AttendanceRollup.count_expressions(),
+            unique_lessons_count=Count('journal_entry__lesson_id', distinct=True),
+        )
+        summary_by_status, total_recorded_student_lessons, present_student_lessons_count = self._summarize_counts(counts)
         return {
             'group_id': group.id, 'group_name': group.name, 'study_period_id': study_period_id,
             'summary_by_status_for_group': summary_by_status,
             'total_student_lesson_records': total_recorded_student_lessons,
             'total_present_student_lessons': present_student_lessons_count,
             'average_presence_percentage_group': round((present_student_lessons_count / total_recorded_student_lessons) * 100, 1) if total_recorded_student_lessons > 0 else None,
-            'unique_lessons_with_attendance_records': unique_lessons_with_attendance_count
+            'unique_lessons_with_attendance_records': counts['unique_lessons_count']
         }
 
 # Класс HomeworkStatsService предоставляет методы для расчета и получения
 # статистики по домашним заданиям.
 class HomeworkStatsService:
+    # Размеры групп (количество студентов) одним сгруппированным запросом по through-таблице.
+    # Возвращает словарь {student_group_id: количество студентов}.
+    def _get_group_sizes(self, group_ids):
+        Membership = StudentGroup.students.through
+        return dict(
+            Membership.objects.filter(studentgroup_id__in=group_ids)
+            .values('studentgroup_id').annotate(students_count=Count('id'))
+            .values_list('studentgroup_id', 'students_count')
+        )
+
+    # Условие "сдано в срок" для условного Count по submissions (ДЗ без срока считаются сданными в срок).
+    ON_TIME_SUBMISSION_Q = Q(submissions__submitted_at__lte=F('due_date')) | Q(due_date__isnull=True)
+
     # Возвращает общую статистику по сдаче домашних заданий в указанном
     # учебном году или периоде (количество выданных ДЗ, средний процент сдачи,
     # средний процент сдачи в срок).
-    # Внимание: этот метод может быть ресурсоемким из-за необходимости итерации по ДЗ.
+    # Считается двумя запросами независимо от количества ДЗ: сгруппированная по учебным группам
+    # агрегация ДЗ/сдач (условный Count для сдач в срок) и размеры групп.
     def get_overall_submission_stats(self, academic_year_id=None, study_period_id=None):
         homework_qs = Homework.objects.all()
         if study_period_id: homework_qs = homework_qs.filter(journal_entry__lesson__study_period_id=study_period_id)
         elif academic_year_id: homework_qs = homework_qs.filter(journal_entry__lesson__study_period__academic_year_id=academic_year_id)
-        total_homeworks = homework_qs.count()
+
+        per_group_rows = list(
+            homework_qs.values('journal_entry__lesson__student_group_id').annotate(
+                homeworks_count=Count('id', distinct=True),
+                submissions_count=Count('submissions', distinct=True),
+                on_time_count=Count('submissions', filter=self.ON_TIME_SUBMISSION_Q, distinct=True),
+            ).order_by()
+        )
+        total_homeworks = sum(row['homeworks_count'] for row in per_group_rows)
         if total_homeworks == 0: return {"total_homeworks_issued": 0, "average_submission_rate_percent": None, "average_on_time_submission_rate_percent": None}
-        
-        total_possible_submissions, total_actual_submissions, total_on_time_submissions = 0, 0, 0
-        for hw in homework_qs.select_related('journal_entry__lesson__student_group').prefetch_related('journal_entry__lesson__student_group__students', 'submissions'):
-            num_students_in_group = hw.journal_entry.lesson.student_group.students.count()
-            total_possible_submissions += num_students_in_group
-            submissions_for_hw = hw.submissions.all()
-            total_actual_submissions += submissions_for_hw.count()
-            if hw.due_date: total_on_time_submissions += submissions_for_hw.filter(submitted_at__lte=hw.due_date).count()
-            else: total_on_time_submissions += submissions_for_hw.count()
+
+        group_sizes = self._get_group_sizes([row['journal_entry__lesson__student_group_id'] for row in per_group_rows])
+        total_possible_submissions = sum(
+            row['homeworks_count'] * group_sizes.get(row['journal_entry__lesson__student_group_id'], 0) for row in per_group_rows
+        )
+        total_actual_submissions = sum(row['submissions_count'] for row in per_group_rows)
+        total_on_time_submissions = sum(row['on_time_count'] for row in per_group_rows)
         
         avg_submission_rate = round((total_actual_submissions / total_possible_submissions) * 100, 1) if total_possible_submissions > 0 else None
         avg_on_time_rate = round((total_on_time_submissions / total_actual_submissions) * 100, 1) if total_actual_submissions > 0 else None
@@ -329,27 +626,41 @@ class HomeworkStatsService:
     # Возвращает сводку по сдаче домашних заданий для конкретного преподавателя
     # в указанном учебном периоде. Для каждого ДЗ преподавателя рассчитывается
     # количество ожидаемых сдач, полученных, сданных в срок, оцененных и средняя оценка.
+    # ДЗ аннотируются одним запросом (условные Count и Avg по сдачам и их оценкам),
+    # размеры групп - вторым.
     def get_homework_submission_summary_for_teacher(self, teacher_id, study_period_id):
         try: teacher = User.objects.get(pk=teacher_id, role=User.Role.TEACHER)
         except User.DoesNotExist: return {"error": _("Преподаватель не найден.")}
-        homeworks_qs = Homework.objects.filter(Q(author=teacher) | Q(journal_entry__lesson__teacher=teacher), journal_entry__lesson__study_period_id=study_period_id)\
-            .select_related('journal_entry__lesson__student_group', 'journal_entry__lesson__subject')\
-            .prefetch_related('submissions__student', 'submissions__grade_for_submission').distinct()
+        return self.summarize_teacher_homeworks(teacher.id, study_period_id)
+
+    # Сводка по ДЗ преподавателя (без проверки преподавателя) - два запроса.
+    def summarize_teacher_homeworks(self, teacher_id, study_period_id):
+        homeworks = list(
+            Homework.objects.filter(Q(author_id=teacher_id) | Q(journal_entry__lesson__teacher_id=teacher_id), journal_entry__lesson__study_period_id=study_period_id)
+            .annotate(
+                submissions_count=Count('submissions', distinct=True),
+                on_time_count=Count('submissions', filter=self.ON_TIME_SUBMISSION_Q, distinct=True),
+                graded_count=Count('submissions__grade_for_submission', distinct=True),
+                average_grade=Avg('submissions__grade_for_submission__numeric_value'),
+            )
+            .values(
+                'id', 'title', 'due_date', 'journal_entry__lesson__subject__name',
+                'journal_entry__lesson__student_group_id', 'journal_entry__lesson__student_group__name',
+                'submissions_count', 'on_time_count', 'graded_count', 'average_grade',
+            )
+        )
+        group_sizes = self._get_group_sizes({hw['journal_entry__lesson__student_group_id'] for hw in homeworks})
         results = []
-        for hw in homeworks_qs:
-            students_in_group_count = hw.journal_entry.lesson.student_group.students.count()
-            all_submissions_for_hw = hw.submissions.all(); submitted_count = all_submissions_for_hw.count()
-            on_time_count = all_submissions_for_hw.filter(submitted_at__lte=hw.due_date).count() if hw.due_date else submitted_count
-            grades = [s.grade_for_submission.numeric_value for s in all_submissions_for_hw if hasattr(s, 'grade_for_submission') and s.grade_for_submission and s.grade_for_submission.numeric_value is not None]
-            avg_grade = round(sum(grades) / len(grades), 2) if grades else None
-            graded_count = Grade.objects.filter(homework_submission__homework=hw).count()
+        for hw in homeworks:
+            students_in_group_count = group_sizes.get(hw['journal_entry__lesson__student_group_id'], 0)
+            submitted_count = hw['submissions_count']
             results.append({
-                'homework_id': hw.id, 'homework_title': hw.title, 'subject_name': hw.journal_entry.lesson.subject.name,
-                'group_name': hw.journal_entry.lesson.student_group.name, 'due_date': hw.due_date,
+                'homework_id': hw['id'], 'homework_title': hw['title'], 'subject_name': hw['journal_entry__lesson__subject__name'],
+                'group_name': hw['journal_entry__lesson__student_group__name'], 'due_date': hw['due_date'],
                 'total_students_expected': students_in_group_count, 'submissions_received': submitted_count,
-                'submissions_on_time': on_time_count, 'submissions_graded': graded_count,
+                'submissions_on_time': hw['on_time_count'], 'submissions_graded': hw['graded_count'],
                 'submission_rate_percent': round((submitted_count / students_in_group_count) * 100, 1) if students_in_group_count > 0 else 0,
-                'average_grade': avg_grade
+                'average_grade': round(hw['average_grade'], 2) if hw['average_grade'] is not None else None
             })
         return sorted(results, key=lambda x: (x['due_date'].date() if x['due_date'] else date.max, x['homework_title']), reverse=True)
 
@@ -364,20 +675,373 @@ class HomeworkStatsService:
             .select_related('journal_entry__lesson__subject', 'author')\
             .prefetch_related(Prefetch('submissions', queryset=HomeworkSubmission.objects.filter(student=student).select_related('grade_for_submission'), to_attr='my_submission_list'))\
             .distinct().order_by('-due_date', '-created_at')
-        results = []
-        for hw in homeworks_for_student:
-            my_submission = hw.my_submission_list[0] if hw.my_submission_list else None
-            status = ""; grade_value = None
-            if my_submission:
-                status = _("Сдано")
-                if hasattr(my_submission, 'grade_for_submission') and my_submission.grade_for_submission:
-                    grade = my_submission.grade_for_submission; grade_value = grade.grade_value; status += f" (Оценено: {grade_value})"
-                else: status += _(" (Ожидает проверки)")
-            elif hw.due_date and timezone.now().replace(tzinfo=None) > hw.due_date.replace(tzinfo=None): status = _("Не сдано (Срок истек)")
-            else: status = _("Не сдано")
-            results.append({
-                'homework_id': hw.id, 'homework_title': hw.title, 'subject_name': hw.journal_entry.lesson.subject.name,
-                'teacher_name': hw.author.get_full_name() if hw.author else "N/A", 'due_date': hw.due_date,
-                'submission_status': status, 'my_grade': grade_value, 'submitted_at': my_submission.submitted_at if my_submission else None,
+        return [self.student_homework_row(hw, hw.my_submission_list[0] if hw.my_submission_list else None) for hw in homeworks_for_student]
+
+    # Строка сводки по ДЗ для студента: статус сдачи и оценка (если есть).
+    # hw - ДЗ с select_related('journal_entry__lesson__subject', 'author'), my_submission - сдача студента или None.
+    def student_homework_row(self, hw, my_submission):
+        status = ""; grade_value = None
+        if my_submission:
+            status = _("Сдано")
+            if hasattr(my_submission, 'grade_for_submission') and my_submission.grade_for_submission:
+                grade = my_submission.grade_for_submission; grade_value = grade.grade_value; status += f" (Оценено: {grade_value})"
+            else: status += _(" (Ожидает проверки)")
+        elif hw.due_date and timezone.now().replace(tzinfo=None) > hw.due_date.replace(tzinfo=None): status = _("Не сдано (Срок истек)")
+        else: status = _("Не сдано")
+        return {
+            'homework_id': hw.id, 'homework_title': hw.title, 'subject_name': hw.journal_entry.lesson.subject.name,
+            'teacher_name': hw.author.get_full_name() if hw.author else "N/A", 'due_date': hw.due_date,
+            'submission_status': status, 'my_grade': grade_value, 'submitted_at': my_submission.submitted_at if my_submission else None,
+        }
+
+# Класс TrendStatsService строит временные ряды (тренды) средневзвешенной оценки и
+# процента посещаемости для студента, группы или предмета с разбивкой по неделям или дням.
+# Каждый ряд считается одним сгруппированным запросом с Trunc по дате оценки / времени начала занятия.
+# Результат - компактные массивы одинаковой длины для графиков:
+# {'bucket', 'buckets': [даты начала интервалов], 'average_grade', 'grades_count', 'attendance_rate', 'attendance_records'}.
+class TrendStatsService:
+    BUCKETS = ('week', 'day')
+    TARGETS = ('student', 'group', 'subject')
+    # Итоговые/расчетные оценки не относятся к конкретной дате и в тренд не входят
+    EXCLUDED_GRADE_TYPES = (
+        Grade.GradeType.PERIOD_AVERAGE, Grade.GradeType.PERIOD_FINAL,
+        Grade.GradeType.YEAR_AVERAGE, Grade.GradeType.YEAR_FINAL,
+    )
+
+    def _grade_filter(self, target, target_id, academic_year_id, study_period_id):
+        target_q = {
+            'student': Q(student_id=target_id),
+            'group': Q(student__student_group_memberships__id=target_id),
+            'subject': Q(subject_id=target_id),
+        }[target]
+        if study_period_id: target_q &= Q(study_period_id=study_period_id)
+        elif academic_year_id: target_q &= Q(study_period__academic_year_id=academic_year_id) | Q(academic_year_id=academic_year_id)
+        return target_q
+
+    def _attendance_filter(self, target, target_id, academic_year_id, study_period_id):
+        target_q = {
+            'student': Q(student_id=target_id),
+            'group': Q(student__student_group_memberships__id=target_id),
+            'subject': Q(journal_entry__lesson__subject_id=target_id),
+        }[target]
+        if study_period_id: target_q &= Q(journal_entry__lesson__study_period_id=study_period_id)
+        elif academic_year_id: target_q &= Q(journal_entry__lesson__study_period__academic_year_id=academic_year_id)
+        return target_q
+
+    def get_trends(self, target, target_id, bucket='week', academic_year_id=None, study_period_id=None):
+        if target not in self.TARGETS: return {"error": _("Неизвестный объект тренда.")}
+        if bucket not in self.BUCKETS: return {"error": _("Параметр 'bucket' должен быть 'week' или 'day'.")}
+        grade_rows = Grade.objects.filter(
+            self._grade_filter(target, target_id, academic_year_id, study_period_id),
+            numeric_value__isnull=False
+        ).exclude(grade_type__in=self.EXCLUDED_GRADE_TYPES).annotate(
+            bucket_start=Trunc('date_given', bucket, output_field=DateField())
+        ).values('bucket_start').annotate(
+            weighted_sum=Sum(F('numeric_value') * F('weight'), filter=Q(weight__gt=0)),
+            total_weight=Sum('weight', filter=Q(weight__gt=0)),
+            grades_count=Count('id'),
+        ).order_by()
+        attendance_rows = Attendance.objects.filter(
+            self._attendance_filter(target, target_id, academic_year_id, study_period_id)
+        ).annotate(
+            bucket_start=Trunc('journal_entry__lesson__start_time', bucket, output_field=DateField(), tzinfo=timezone.get_current_timezone())
+        ).values('bucket_start').annotate(
+            records=Count('id'),
+            attended=Count('id', filter=Q(status__in=Attendance.PRESENT_STATUSES)),
+        ).order_by()
+
+        grades_by_bucket = {row['bucket_start']: row for row in grade_rows}
+        attendance_by_bucket = {row['bucket_start']: row for row in attendance_rows}
+        buckets = sorted(set(grades_by_bucket) | set(attendance_by_bucket))
+        result = {'target': target, 'target_id': target_id, 'bucket': bucket, 'buckets': buckets,
+                  'average_grade': [], 'grades_count': [], 'attendance_rate': [], 'attendance_records': []}
+        for bucket_start in buckets:
+            grade_row = grades_by_bucket.get(bucket_start, {}); attendance_row = attendance_by_bucket.get(bucket_start, {})
+            total_weight = grade_row.get('total_weight')
+            result['average_grade'].append(round(float(grade_row['weighted_sum']) / total_weight, 2) if total_weight else None)
+            result['grades_count'].append(grade_row.get('grades_count', 0))
+            records = attendance_row.get('records', 0)
+            result['attendance_rate'].append(round(attendance_row['attended'] / records * 100, 1) if records else None)
+            result['attendance_records'].append(records)
+        return result
+
+# Класс RiskScoringService рассчитывает баллы риска неуспеваемости (StudentRiskScore)
+# сразу для всех студентов в учебных периодах и выдает "группу риска" из сохраненных баллов.
+# Балл (0-100) - взвешенная сумма трех составляющих, каждая нормирована в диапазон 0..1:
+# - оценки: насколько средневзвешенная текущая оценка ниже максимальной (MIN_GRADE..MAX_GRADE);
+# - посещаемость: доля пропусков без уважительной причины (по агрегатам AttendanceRollup);
+# - ДЗ: доля несданных ДЗ с истекшим сроком в группах студента.
+# Расчет выполняется тремя сгруппированными запросами по (студент, период) независимо от числа студентов,
+# результаты записываются одним bulk upsert'ом.
+class RiskScoringService:
+    GRADE_WEIGHT = Decimal('0.5')
+    ABSENCE_WEIGHT = Decimal('0.3')
+    HOMEWORK_WEIGHT = Decimal('0.2')
+    MIN_GRADE = Decimal('2')
+    MAX_GRADE = Decimal('5')
+    BATCH_SIZE = 1000
+    SCORE_FIELDS = ['average_grade', 'grades_count', 'attendance_records', 'absences_invalid', 'homework_expected', 'homework_missed', 'risk_score']
+
+    # Периоды для ночного расчета: уже начавшиеся периоды текущего учебного года.
+    def _default_period_ids(self):
+        return list(StudyPeriod.objects.filter(academic_year__is_current=True, start_date__lte=timezone.localdate()).values_list('id', flat=True))
+
+    def _ratio(self, part, total):
+        return min(Decimal(part) / Decimal(total), Decimal('1')) if total else Decimal('0')
+
+    # Возвращает балл риска (Decimal 0-100) по собранным показателям студента за период.
+    def calculate_score(self, average_grade, attendance_records, absences_invalid, homework_expected, homework_missed):
+        grade_risk = Decimal('0')
+        if average_grade is not None:
+            grade_risk = min(max((self.MAX_GRADE - Decimal(str(average_grade))) / (self.MAX_GRADE - self.MIN_GRADE), Decimal('0')), Decimal('1'))
+        score = grade_risk * self.GRADE_WEIGHT \
+            + self._ratio(absences_invalid, attendance_records) * self.ABSENCE_WEIGHT \
+            + self._ratio(homework_missed, homework_expected) * self.HOMEWORK_WEIGHT
+        return (score * 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+    # Собирает показатели {(student_id, study_period_id): {...}} тремя сгруппированными запросами.
+    def _collect_metrics(self, study_period_ids):
+        metrics = {}
+        def row_for(student_id, study_period_id):
+            return metrics.setdefault((student_id, study_period_id), {
+                'average_grade': None, 'grades_count': 0, 'attendance_records': 0, 'absences_invalid': 0,
+                'homework_expected': 0, 'homework_missed': 0,
             })
-        return results
\ No newline at end of file
+
+        grade_rows = Grade.objects.filter(study_period_id__in=study_period_ids, student__role=User.Role.STUDENT, numeric_value__isnull=False)\
+            .exclude(grade_type__in=Grade.SUMMARY_TYPES).values('student_id', 'study_period_id').annotate(
+                weighted_sum=Sum(F('numeric_value') * F('weight'), filter=Q(weight__gt=0)),
+                total_weight=Sum('weight', filter=Q(weight__gt=0)),
+                grades_count=Count('id'),
+            ).order_by()
+        for grade_row in grade_rows:
+            row = row_for(grade_row['student_id'], grade_row['study_period_id'])
+            row['grades_count'] = grade_row['grades_count']
+            if grade_row['total_weight']:
+                row['average_grade'] = (Decimal(str(grade_row['weighted_sum'])) / Decimal(grade_row['total_weight'])).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+        attendance_rows = AttendanceRollup.objects.filter(study_period_id__in=study_period_ids, student__role=User.Role.STUDENT)\
+            .values('student_id', 'study_period_id').annotate(records=Sum('total_count'), absences=Sum('absent_invalid_count')).order_by()
+        for attendance_row in attendance_rows:
+            row = row_for(attendance_row['student_id'], attendance_row['study_period_id'])
+            row['attendance_records'] = attendance_row['records'] or 0; row['absences_invalid'] = attendance_row['absences'] or 0
+
+        # ДЗ с истекшим сроком x студенты группы занятия; сданные - по сдачам этого же студента
+        membership_field = 'journal_entry__lesson__student_group__students'
+        homework_rows = Homework.objects.filter(
+            journal_entry__lesson__study_period_id__in=study_period_ids, due_date__lt=timezone.now(),
+            **{f'{membership_field}__role': User.Role.STUDENT},
+        ).values('journal_entry__lesson__study_period_id', student_id=F(membership_field)).annotate(
+            expected=Count('id', distinct=True),
+            submitted=Count('id', filter=Q(submissions__student_id=F(membership_field)), distinct=True),
+        ).order_by()
+        for homework_row in homework_rows:
+            row = row_for(homework_row['student_id'], homework_row['journal_entry__lesson__study_period_id'])
+            row['homework_expected'] = homework_row['expected']; row['homework_missed'] = max(homework_row['expected'] - homework_row['submitted'], 0)
+        return metrics
+
+    # Пересчитывает и сохраняет баллы риска для указанных периодов (по умолчанию - начавшиеся периоды
+    # текущего учебного года). Баллы студентов, по которым в периоде больше нет данных, удаляются.
+    # Возвращает количество сохраненных баллов.
+    def compute_scores(self, study_period_ids=None):
+        if study_period_ids is None: study_period_ids = self._default_period_ids()
+        if not study_period_ids: return 0
+        metrics = self._collect_metrics(study_period_ids)
+        scores = [
+            StudentRiskScore(student_id=student_id, study_period_id=study_period_id, risk_score=self.calculate_score(
+                row['average_grade'], row['attendance_records'], row['absences_invalid'], row['homework_expected'], row['homework_missed']
+            ), **row)
+            for (student_id, study_period_id), row in metrics.items()
+        ]
+        with transaction.atomic():
+            if scores:
+                StudentRiskScore.objects.bulk_create(
+                    scores, batch_size=self.BATCH_SIZE, update_conflicts=True,
+                    unique_fields=['student', 'study_period'], update_fields=self.SCORE_FIELDS + ['computed_at'],
+                )
+            for study_period_id in study_period_ids:
+                StudentRiskScore.objects.filter(study_period_id=study_period_id)\
+                    .exclude(student_id__in=[student_id for student_id, period_id in metrics if period_id == study_period_id]).delete()
+        logger.info(f"Risk scores computed for periods {study_period_ids}: {len(scores)} students.")
+        return len(scores)
+
+    # Возвращает топ `limit` студентов с наибольшим баллом риска в учебном периоде
+    # (чтение сохраненных баллов по индексу). student_group_ids ограничивает выборку группами,
+    # min_score - минимальным баллом.
+    def get_top_at_risk(self, study_period_id, limit=20, student_group_ids=None, min_score=None):
+        scores_qs = StudentRiskScore.objects.filter(study_period_id=study_period_id)
+        if student_group_ids is not None: scores_qs = scores_qs.filter(student__student_group_memberships__id__in=student_group_ids).distinct()
+        if min_score is not None: scores_qs = scores_qs.filter(risk_score__gte=min_score)
+        return [
+            {
+                'student_id': score.student_id, 'student_name': score.student.get_full_name(),
+                'risk_score': float(score.risk_score),
+                'average_grade': float(score.average_grade) if score.average_grade is not None else None,
+                'grades_count': score.grades_count, 'attendance_records': score.attendance_records,
+                'absences_invalid': score.absences_invalid, 'homework_expected': score.homework_expected,
+                'homework_missed': score.homework_missed, 'computed_at': score.computed_at,
+            }
+            for score in scores_qs.select_related('student').order_by('-risk_score', 'student__last_name')[:limit]
+        ]
+
+# Класс DashboardContext - общий контекст запроса сводной панели (dashboard), собираемый один раз:
+# пользователь, учебный период (с учебным годом), студенты (сам студент или дети родителя)
+# и группы студентов. Все блоки панели используют его вместо повторной загрузки этих данных.
+class DashboardContext:
+    def __init__(self, user, study_period, students=None, groups_by_student=None):
+        self.user = user
+        self.study_period = study_period
+        self.students = students or []
+        self.groups_by_student = groups_by_student or {}
+
+    @property
+    def student_ids(self):
+        return [student.id for student in self.students]
+
+    @property
+    def group_ids(self):
+        return {group.id for groups in self.groups_by_student.values() for group in groups}
+
+    def period_info(self):
+        return {
+            'study_period_id': self.study_period.id, 'study_period_name': self.study_period.name,
+            'academic_year_id': self.study_period.academic_year_id, 'academic_year_name': self.study_period.academic_year.name,
+        }
+
+
+# Класс DashboardStatsService собирает сводные панели студента, родителя и преподавателя
+# за один проход: контекст (DashboardContext) строится один раз, а оценки, посещаемость и ДЗ
+# считаются сгруппированными запросами сразу для всех студентов контекста.
+# Количество запросов ограничено и не зависит от числа детей, предметов, групп и ДЗ:
+# - студент/родитель: период, (дети), членство в группах, занятия, оценки, агрегаты посещаемости, ДЗ, сдачи;
+# - преподаватель: период, нагрузка (3), ДЗ (2), курируемые группы, их состав и оценки.
+# Блоки имеют тот же формат, что и ответы StudentPerformanceStatsService, AttendanceStatsService
+# и HomeworkStatsService для одного студента/группы.
+class DashboardStatsService:
+    def __init__(self):
+        self.performance_service = StudentPerformanceStatsService()
+        self.attendance_service = AttendanceStatsService()
+        self.homework_service = HomeworkStatsService()
+        self.load_service = TeacherLoadStatsService()
+
+    # Строит контекст панели. students - список студентов (для панели студента/родителя).
+    # Возвращает DashboardContext или None, если учебный период не найден.
+    def build_context(self, user, study_period_id, students=None):
+        study_period = StudyPeriod.objects.select_related('academic_year').filter(pk=study_period_id).first()
+        if study_period is None: return None
+        groups_by_student = {}
+        if students:
+            memberships = StudentGroup.students.through.objects.filter(user_id__in=[student.id for student in students])\
+                .select_related('studentgroup').order_by('studentgroup__name')
+            for membership in memberships: groups_by_student.setdefault(membership.user_id, []).append(membership.studentgroup)
+        return DashboardContext(user, study_period, students=students, groups_by_student=groups_by_student)
+
+    # Блоки успеваемости, посещаемости и ДЗ для всех студентов контекста.
+    # Возвращает {student_id: {'average_grades_by_subject', 'attendance_summary', 'homework_summary'}}.
+    def _student_blocks(self, context):
+        study_period_id = context.study_period.id; student_ids = context.student_ids
+
+        # Предметы занятий групп студентов в периоде (и группы, у которых есть занятия)
+        lesson_subjects_by_group = {}
+        for row in Lesson.objects.filter(student_group_id__in=context.group_ids, study_period_id=study_period_id)\
+                .values('student_group_id', 'subject_id', 'subject__name').distinct().order_by():
+            lesson_subjects_by_group.setdefault(row['student_group_id'], {})[row['subject_id']] = row['subject__name']
+
+        subjects_by_student = {student_id: {} for student_id in student_ids}
+        for student_id in student_ids:
+            for group in context.groups_by_student.get(student_id, []):
+                for subject_id, subject_name in lesson_subjects_by_group.get(group.id, {}).items():
+                    subjects_by_student[student_id][subject_id] = {'subject_id': subject_id, 'subject_name': subject_name, 'average_grade': None, 'grades_count': 0}
+        grade_rows = Grade.objects.filter(student_id__in=student_ids, study_period_id=study_period_id)\
+            .values('student_id', 'subject_id', 'subject__name').annotate(**self.performance_service.WEIGHTED_GRADE_EXPRESSIONS).order_by()
+        for row in grade_rows:
+            subjects_by_student[row['student_id']][row['subject_id']] = {
+                'subject_id': row['subject_id'], 'subject_name': row['subject__name'],
+                'average_grade': self.performance_service._weighted_average(row['weighted_sum'], row['total_weight']),
+                'grades_count': row['grades_count'],
+            }
+
+        empty_counts = {field_name: 0 for field_name in self.attendance_service.ROLLUP_SUM_EXPRESSIONS}
+        counts_by_student = {
+            row['student_id']: row
+            for row in AttendanceRollup.objects.filter(student_id__in=student_ids, study_period_id=study_period_id)
+            .values('student_id').annotate(**self.attendance_service.ROLLUP_SUM_EXPRESSIONS).order_by()
+        }
+
+        homeworks = list(
+            Homework.objects.filter(journal_entry__lesson__student_group_id__in=list(lesson_subjects_by_group), journal_entry__lesson__study_period_id=study_period_id)
+            .select_related('journal_entry__lesson__subject', 'author').order_by('-due_date', '-created_at')
+        )
+        submissions = {
+            (submission.homework_id, submission.student_id): submission
+            for submission in HomeworkSubmission.objects.filter(homework__in=homeworks, student_id__in=student_ids).select_related('grade_for_submission')
+        } if homeworks else {}
+
+        blocks = {}
+        for student in context.students:
+            summary_by_status, total_recorded_lessons, present_count = self.attendance_service._summarize_counts(counts_by_student.get(student.id, empty_counts))
+            lesson_group_ids = {group.id for group in context.groups_by_student.get(student.id, []) if group.id in lesson_subjects_by_group}
+            if lesson_group_ids:
+                homework_summary = [
+                    self.homework_service.student_homework_row(hw, submissions.get((hw.id, student.id)))
+                    for hw in homeworks if hw.journal_entry.lesson.student_group_id in lesson_group_ids
+                ]
+            else: homework_summary = {"info": _("Нет групп или ДЗ для этого студента в указанном периоде.")}
+            blocks[student.id] = {
+                'average_grades_by_subject': sorted(subjects_by_student[student.id].values(), key=lambda row: row['subject_name']),
+                'attendance_summary': {
+                    'student_id': student.id, 'student_name': student.get_full_name(), 'study_period_id': study_period_id,
+                    'summary_by_status': summary_by_status, 'total_recorded_lessons': total_recorded_lessons,
+                    'present_lessons_count': present_count,
+                    'presence_percentage': round((present_count / total_recorded_lessons) * 100, 1) if total_recorded_lessons > 0 else None
+                },
+                'homework_summary': homework_summary,
+            }
+        return blocks
+
+    def _groups_info(self, context, student_id):
+        return [{'group_id': group.id, 'group_name': group.name} for group in context.groups_by_student.get(student_id, [])]
+
+    # Панель студента: успеваемость по предметам, посещаемость и ДЗ за период.
+    def get_student_dashboard(self, student, study_period_id):
+        context = self.build_context(student, study_period_id, students=[student])
+        if context is None: return {"error": _("Учебный период не найден.")}
+        return {
+            'student_id': student.id, 'student_name': student.get_full_name(), **context.period_info(),
+            'groups': self._groups_info(context, student.id),
+            **self._student_blocks(context)[student.id],
+        }
+
+    # Панель родителя: те же блоки для всех детей (или детей из child_ids) за период.
+    def get_parent_dashboard(self, parent, study_period_id, child_ids=None):
+        children_qs = parent.children.filter(role=User.Role.STUDENT).order_by('last_name', 'first_name')
+        if child_ids is not None: children_qs = children_qs.filter(pk__in=child_ids)
+        context = self.build_context(parent, study_period_id, students=list(children_qs))
+        if context is None: return {"error": _("Учебный период не найден.")}
+        blocks = self._student_blocks(context) if context.students else {}
+        return {
+            **context.period_info(),
+            'children': [
+                {'child_id': child.id, 'child_name': child.get_full_name(), 'groups': self._groups_info(context, child.id), **blocks[child.id]}
+                for child in context.students
+            ],
+        }
+
+    # Панель преподавателя: нагрузка, сводка по ДЗ и успеваемость курируемых групп учебного года периода.
+    def get_teacher_dashboard(self, teacher, study_period_id):
+        context = self.build_context(teacher, study_period_id)
+        if context is None: return {"error": _("Учебный период не найден.")}
+        study_period = context.study_period
+        planned_details = [
+            {'subject_name': entry['subject__name'], 'group_name': entry['curriculum__student_group__name'], 'period_name': entry['study_period__name'], 'hours': entry['planned_hours']}
+            for entry in CurriculumEntry.objects.filter(teacher=teacher, study_period=study_period)
+            .values('subject__name', 'curriculum__student_group__name', 'study_period__name', 'planned_hours')
+        ]
+        load = self.load_service.get_loads_by_teacher(study_period_id=study_period.id, teacher_ids=[teacher.id]).get(teacher.id, self.load_service.EMPTY_LOAD)
+        curated_groups = list(StudentGroup.objects.filter(curator=teacher, academic_year_id=study_period.academic_year_id))
+        return {
+            **context.period_info(),
+            'my_load_summary': {**load, 'planned_details_by_subject_group': planned_details},
+            'my_homework_summary': self.homework_service.summarize_teacher_homeworks(teacher.id, study_period.id),
+            'curated_groups_performance_summary': self.performance_service.get_groups_performance_summaries(curated_groups, study_period.id),
+        }
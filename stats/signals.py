@@ -0,0 +1,82 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from edu_core.models import (
+    Lesson, Homework, HomeworkSubmission, Attendance, Grade,
+    StudyPeriod, StudentGroup, CurriculumEntry
+)
+from .cache import bump_generations, SCOPE_PERIOD, SCOPE_YEAR, SCOPE_GROUP
+
+# Обработчики сигналов инвалидации кэша статистики (stats.cache).
+# При записи/удалении оценок, посещаемости, ДЗ, сдач ДЗ, занятий и записей учебного плана
+# определяются затронутые учебный период, учебный год и учебные группы, и после фиксации
+# транзакции увеличиваются их поколения - кэшированные ответы по этим областям становятся неактуальными.
+
+
+# Области учебного периода и его учебного года.
+def _period_scopes(study_period_id, academic_year_id=None):
+    scopes = []
+    if study_period_id:
+        scopes.append((SCOPE_PERIOD, study_period_id))
+        if not academic_year_id:
+            academic_year_id = StudyPeriod.objects.filter(pk=study_period_id).values_list('academic_year_id', flat=True).first()
+    if academic_year_id: scopes.append((SCOPE_YEAR, academic_year_id))
+    return scopes
+
+# Области занятия, найденного по фильтру (период, год, группа занятия).
+def _lesson_scopes(**lesson_filter):
+    lesson_data = Lesson.objects.filter(**lesson_filter)\
+        .values('study_period_id', 'study_period__academic_year_id', 'student_group_id').first()
+    if not lesson_data: return []
+    return _period_scopes(lesson_data['study_period_id'], lesson_data['study_period__academic_year_id']) + [(SCOPE_GROUP, lesson_data['student_group_id'])]
+
+# Области групп, в которых состоит студент.
+def _student_group_scopes(student_id):
+    return [(SCOPE_GROUP, group_id) for group_id in StudentGroup.objects.filter(students__id=student_id).values_list('id', flat=True)]
+
+def _bump_on_commit(scopes):
+    transaction.on_commit(lambda: bump_generations(scopes))
+
+
+@receiver(post_save, sender=Grade)
+@receiver(post_delete, sender=Grade)
+def grade_stats_cache_receiver(sender, instance: Grade, **kwargs):
+    _bump_on_commit(_period_scopes(instance.study_period_id, instance.academic_year_id) + _student_group_scopes(instance.student_id))
+
+@receiver(post_save, sender=Attendance)
+@receiver(post_delete, sender=Attendance)
+def attendance_stats_cache_receiver(sender, instance: Attendance, **kwargs):
+    _bump_on_commit(_lesson_scopes(journal_entry__id=instance.journal_entry_id) + _student_group_scopes(instance.student_id))
+
+@receiver(post_save, sender=Homework)
+@receiver(post_delete, sender=Homework)
+def homework_stats_cache_receiver(sender, instance: Homework, **kwargs):
+    _bump_on_commit(_lesson_scopes(journal_entry__id=instance.journal_entry_id))
+
+@receiver(post_save, sender=HomeworkSubmission)
+@receiver(post_delete, sender=HomeworkSubmission)
+def homework_submission_stats_cache_receiver(sender, instance: HomeworkSubmission, **kwargs):
+    _bump_on_commit(_lesson_scopes(journal_entry__homework_assignments__id=instance.homework_id))
+
+# Для занятия учитывается и прежний учебный период, если он сменился
+# (запоминается обработчиком pre_save в edu_core.signals).
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def lesson_stats_cache_receiver(sender, instance: Lesson, **kwargs):
+    scopes = _period_scopes(instance.study_period_id) + [(SCOPE_GROUP, instance.student_group_id)]
+    previous_key = getattr(instance, '_previous_rollup_key', None)
+    if previous_key and previous_key[1] != instance.study_period_id: scopes += _period_scopes(previous_key[1])
+    _bump_on_commit(scopes)
+
+@receiver(post_save, sender=CurriculumEntry)
+@receiver(post_delete, sender=CurriculumEntry)
+def curriculum_entry_stats_cache_receiver(sender, instance: CurriculumEntry, **kwargs):
+    _bump_on_commit(_period_scopes(instance.study_period_id))
+
+@receiver(m2m_changed, sender=StudentGroup.students.through)
+def group_membership_stats_cache_receiver(sender, instance, action, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'): return
+    if isinstance(instance, StudentGroup): scopes = [(SCOPE_GROUP, instance.pk)]
+    else: scopes = [(SCOPE_GROUP, group_id) for group_id in (kwargs.get('pk_set') or [])] + _student_group_scopes(instance.pk)
+    _bump_on_commit(scopes)
@@ -0,0 +1,35 @@
+from celery import shared_task
+import logging
+
+from .services import PlatformSnapshotService, RiskScoringService
+
+logger = logging.getLogger(__name__)
+
+# Задача build_platform_snapshots_task запускается ночью Celery Beat и достраивает
+# ежедневные снимки метрик платформы (PlatformDailySnapshot) по вчерашний день включительно.
+# Если задача пропустила запуски, снимки за все пропущенные дни строятся за один проход.
+@shared_task(name="build_platform_snapshots")
+def build_platform_snapshots_task():
+    logger.info("Celery task: Starting build_platform_snapshots_task.")
+    try:
+        created_count = PlatformSnapshotService().build_snapshots()
+        logger.info(f"Celery task: build_platform_snapshots_task finished, snapshots written: {created_count}.")
+        return created_count
+    except Exception as e:
+        logger.error(f"Celery task: Error in build_platform_snapshots_task: {e}", exc_info=True)
+        raise
+
+
+# Задача compute_student_risk_scores_task запускается ночью Celery Beat и пересчитывает
+# баллы риска (StudentRiskScore) для всех студентов в начавшихся периодах текущего учебного года.
+# study_period_ids позволяет пересчитать конкретные периоды вручную.
+@shared_task(name="compute_student_risk_scores")
+def compute_student_risk_scores_task(study_period_ids=None):
+    logger.info(f"Celery task: Starting compute_student_risk_scores_task (periods={study_period_ids}).")
+    try:
+        scores_count = RiskScoringService().compute_scores(study_period_ids=study_period_ids)
+        logger.info(f"Celery task: compute_student_risk_scores_task finished, scores written: {scores_count}.")
+        return scores_count
+    except Exception as e:
+        logger.error(f"Celery task: Error in compute_student_risk_scores_task: {e}", exc_info=True)
+        raise
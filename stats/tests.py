@@ -1,3 +1,438 @@
-from django.test import TestCase
+from datetime import date, datetime, timedelta
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
 
-# Create your tests here.
+from users.models import User
+from edu_core.models import (
+    AcademicYear, StudyPeriod, Subject, StudentGroup, Lesson, LessonJournalEntry,
+    Homework, HomeworkSubmission, Grade, Curriculum, CurriculumEntry, Attendance, AttendanceRollup
+)
+from .cache import get_or_compute_stats, SCOPE_GROUP
+from notifications.models import Notification
+from .models import PlatformDailySnapshot, StudentRiskScore
+from .services import TrendStatsService, PlatformSnapshotService, HomeworkStatsService, TeacherLoadStatsService, StudentPerformanceStatsService, AttendanceStatsService, RiskScoringService, DashboardStatsService
+
+
+class HomeworkStatsServiceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('hwstats_teacher@example.com', 'TestPassword123!', role=User.Role.TEACHER, is_active=True)
+        cls.students = [
+            User.objects.create_user(f'hwstats_s{i}@example.com', 'TestPassword123!', role=User.Role.STUDENT, is_active=True)
+            for i in range(4)
+        ]
+        cls.year = AcademicYear.objects.create(name="HwStatsYear", start_date=date(2023,9,1), end_date=date(2024,8,31))
+        cls.period = StudyPeriod.objects.create(academic_year=cls.year, name="HwStatsPeriod", start_date=date(2023,9,1), end_date=date(2024,1,31))
+        cls.subject = Subject.objects.create(name="HwStatsSubject")
+        cls.group = StudentGroup.objects.create(name="HwStatsGroup", academic_year=cls.year)
+        cls.group.students.add(*cls.students)
+        start = timezone.make_aware(datetime(2023, 10, 2, 9, 0))
+        lesson = Lesson.objects.create(study_period=cls.period, student_group=cls.group, subject=cls.subject, teacher=cls.teacher, start_time=start, end_time=start + timedelta(hours=1))
+        journal = LessonJournalEntry.objects.create(lesson=lesson)
+        cls.homework = Homework.objects.create(journal_entry=journal, title="HW", description="", author=cls.teacher, due_date=start + timedelta(days=7))
+        on_time = HomeworkSubmission.objects.create(homework=cls.homework, student=cls.students[0])
+        late = HomeworkSubmission.objects.create(homework=cls.homework, student=cls.students[1])
+        HomeworkSubmission.objects.filter(pk=on_time.pk).update(submitted_at=start + timedelta(days=1))
+        HomeworkSubmission.objects.filter(pk=late.pk).update(submitted_at=start + timedelta(days=10))
+        Grade.objects.create(student=cls.students[0], subject=cls.subject, study_period=cls.period, academic_year=cls.year,
+                             grade_value="5", numeric_value=5, grade_type=Grade.GradeType.HOMEWORK_GRADE,
+                             homework_submission=on_time, graded_by=cls.teacher)
+
+    def test_overall_submission_stats(self):
+        stats = HomeworkStatsService().get_overall_submission_stats(academic_year_id=self.year.id)
+        self.assertEqual(stats['total_homeworks_issued'], 1)
+        self.assertEqual(stats['total_possible_submissions'], 4)
+        self.assertEqual(stats['total_actual_submissions'], 2)
+        self.assertEqual(stats['average_submission_rate_percent'], 50.0)
+        self.assertEqual(stats['average_on_time_submission_rate_percent'], 50.0)
+
+    def test_teacher_summary_counts(self):
+        with self.assertNumQueries(3): # преподаватель, ДЗ с агрегатами, размеры групп
+            summary = HomeworkStatsService().get_homework_submission_summary_for_teacher(self.teacher.id, self.period.id)
+        row = summary[0]
+        self.assertEqual(row['total_students_expected'], 4)
+        self.assertEqual(row['submissions_received'], 2)
+        self.assertEqual(row['submissions_on_time'], 1)
+        self.assertEqual(row['submissions_graded'], 1)
+        self.assertEqual(row['average_grade'], 5)
+
+
+class TeacherLoadStatsServiceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teachers = [
+            User.objects.create_user(f'load_t{i}@example.com', 'TestPassword123!', role=User.Role.TEACHER, is_active=True, last_name=f'Load{i}')
+            for i in range(3)
+        ]
+        cls.year = AcademicYear.objects.create(name="LoadYear", start_date=date(2023,9,1), end_date=date(2024,8,31))
+        cls.period = StudyPeriod.objects.create(academic_year=cls.year, name="LoadPeriod", start_date=date(2023,9,1), end_date=date(2024,1,31))
+        cls.subject = Subject.objects.create(name="LoadSubject")
+        cls.group = StudentGroup.objects.create(name="LoadGroup", academic_year=cls.year)
+        curriculum = Curriculum.objects.create(name="LoadCurriculum", academic_year=cls.year, student_group=cls.group)
+        CurriculumEntry.objects.create(curriculum=curriculum, subject=cls.subject, teacher=cls.teachers[0], study_period=cls.period, planned_hours=4)
+        start = timezone.make_aware(datetime(2023, 10, 2, 9, 0))
+        for day in range(2): # 2 занятия по 90 минут у первого преподавателя
+            lesson_start = start + timedelta(days=day)
+            Lesson.objects.create(study_period=cls.period, student_group=cls.group, subject=cls.subject, teacher=cls.teachers[0], start_time=lesson_start, end_time=lesson_start + timedelta(minutes=90))
+        Lesson.objects.create(study_period=cls.period, student_group=cls.group, subject=cls.subject, teacher=cls.teachers[1], start_time=start + timedelta(days=5), end_time=start + timedelta(days=5, hours=1))
+
+    def test_summary_load_uses_grouped_queries(self):
+        with self.assertNumQueries(3): # преподаватели, плановые часы, занятия
+            summary = TeacherLoadStatsService().get_all_teachers_summary_load(academic_year_id=self.year.id)
+        by_teacher = {row['teacher_id']: row for row in summary}
+        self.assertEqual(by_teacher[self.teachers[0].id]['total_planned_hours'], 4.0)
+        self.assertEqual(by_teacher[self.teachers[0].id]['total_scheduled_lessons'], 2)
+        self.assertEqual(by_teacher[self.teachers[0].id]['total_scheduled_hours'], 3.0)
+        self.assertEqual(by_teacher[self.teachers[0].id]['load_percentage'], 75.0)
+        self.assertEqual(by_teacher[self.teachers[1].id]['total_scheduled_lessons'], 1)
+        self.assertEqual(by_teacher[self.teachers[1].id]['load_percentage'], 0)
+        self.assertEqual(by_teacher[self.teachers[2].id]['total_scheduled_hours'], 0.0)
+
+    def test_details_match_summary(self):
+        service = TeacherLoadStatsService()
+        details = service.get_teacher_load_details(self.teachers[0].id, study_period_id=self.period.id)
+        summary_row = next(row for row in service.get_all_teachers_summary_load(study_period_id=self.period.id) if row['teacher_id'] == self.teachers[0].id)
+        for key in ('total_planned_hours', 'total_scheduled_lessons', 'total_scheduled_hours', 'load_percentage'):
+            self.assertEqual(details[key], summary_row[key])
+        self.assertEqual(len(details['planned_details_by_subject_group']), 1)
+
+
+class TeacherSubjectGroupMatrixTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teachers = [
+            User.objects.create_user(f'matrix_t{i}@example.com', 'TestPassword123!', role=User.Role.TEACHER, is_active=True, last_name=f'Matrix{i}')
+            for i in range(2)
+        ]
+        cls.students = [
+            User.objects.create_user(f'matrix_s{i}@example.com', 'TestPassword123!', role=User.Role.STUDENT, is_active=True)
+            for i in range(2)
+        ]
+        cls.year = AcademicYear.objects.create(name="MatrixYear", start_date=date(2023,9,1), end_date=date(2024,8,31))
+        cls.period = StudyPeriod.objects.create(academic_year=cls.year, name="MatrixPeriod", start_date=date(2023,9,1), end_date=date(2024,1,31))
+        cls.subjects = [Subject.objects.create(name=f"MatrixSubject{i}") for i in range(2)]
+        cls.group = StudentGroup.objects.create(name="MatrixGroup", academic_year=cls.year)
+        cls.group.students.add(*cls.students)
+        start = timezone.make_aware(datetime(2023, 10, 2, 9, 0))
+        for i, (teacher, subject) in enumerate(zip(cls.teachers, cls.subjects)):
+            lesson_start = start + timedelta(days=i)
+            Lesson.objects.create(study_period=cls.period, student_group=cls.group, subject=subject, teacher=teacher, start_time=lesson_start, end_time=lesson_start + timedelta(hours=1))
+        grade_kwargs = dict(subject=cls.subjects[0], study_period=cls.period, academic_year=cls.year, grade_type=Grade.GradeType.HOMEWORK_GRADE, graded_by=cls.teachers[0])
+        Grade.objects.create(student=cls.students[0], grade_value="5", numeric_value=5, weight=2, **grade_kwargs)
+        Grade.objects.create(student=cls.students[1], grade_value="2", numeric_value=2, weight=1, **grade_kwargs)
+        Grade.objects.create(student=cls.students[1], grade_value="4", numeric_value=4, weight=0, **grade_kwargs)
+
+    def test_matrix_for_all_teachers(self):
+        with self.assertNumQueries(3): # занятия, оценки, преподаватели
+            matrix = StudentPerformanceStatsService().get_teacher_subject_group_matrix(self.period.id)
+        self.assertEqual([row['teacher_id'] for row in matrix], [teacher.id for teacher in self.teachers])
+        first_cell = matrix[0]['groups_data'][0]
+        self.assertEqual(first_cell['subject_id'], self.subjects[0].id)
+        self.assertEqual(float(first_cell['average_grade']), 4.0) # (5*2 + 2*1) / 3; оценка с весом 0 не учитывается
+        self.assertEqual(first_cell['grades_count'], 3)
+        second_cell = matrix[1]['groups_data'][0]
+        self.assertIsNone(second_cell['average_grade'])
+        self.assertEqual(second_cell['grades_count'], 0)
+
+    def test_matrix_for_single_teacher(self):
+        matrix = StudentPerformanceStatsService().get_teacher_subject_group_matrix(self.period.id, teacher_ids=[self.teachers[1].id])
+        self.assertEqual(len(matrix), 1)
+        self.assertEqual(matrix[0]['teacher_id'], self.teachers[1].id)
+
+
+class AttendanceRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('rollup_teacher@example.com', 'TestPassword123!', role=User.Role.TEACHER, is_active=True)
+        cls.students = [
+            User.objects.create_user(f'rollup_s{i}@example.com', 'TestPassword123!', role=User.Role.STUDENT, is_active=True)
+            for i in range(2)
+        ]
+        cls.year = AcademicYear.objects.create(name="RollupYear", start_date=date(2023,9,1), end_date=date(2024,8,31))
+        cls.period = StudyPeriod.objects.create(academic_year=cls.year, name="RollupPeriod", start_date=date(2023,9,1), end_date=date(2024,1,31))
+        cls.subject = Subject.objects.create(name="RollupSubject")
+        cls.group = StudentGroup.objects.create(name="RollupGroup", academic_year=cls.year)
+        cls.group.students.add(*cls.students)
+        start = timezone.make_aware(datetime(2023, 10, 2, 9, 0))
+        cls.journals = []
+        for day in range(2):
+            lesson_start = start + timedelta(days=day)
+            lesson = Lesson.objects.create(study_period=cls.period, student_group=cls.group, subject=cls.subject, teacher=cls.teacher, start_time=lesson_start, end_time=lesson_start + timedelta(hours=1))
+            cls.journals.append(LessonJournalEntry.objects.create(lesson=lesson))
+
+    def _rollup(self, student):
+        return AttendanceRollup.objects.get(student=student, subject=self.subject, study_period=self.period)
+
+    def test_rollup_follows_attendance_writes(self):
+        record = Attendance.objects.create(journal_entry=self.journals[0], student=self.students[0], status=Attendance.Status.PRESENT)
+        Attendance.objects.create(journal_entry=self.journals[1], student=self.students[0], status=Attendance.Status.ABSENT_INVALID)
+        rollup = self._rollup(self.students[0])
+        self.assertEqual((rollup.total_count, rollup.present_count, rollup.absent_invalid_count), (2, 1, 1))
+
+        record.status = Attendance.Status.LATE
+        record.save()
+        rollup = self._rollup(self.students[0])
+        self.assertEqual((rollup.present_count, rollup.late_count, rollup.attended_count), (0, 1, 1))
+
+        Attendance.objects.filter(student=self.students[0]).delete()
+        self.assertFalse(AttendanceRollup.objects.filter(student=self.students[0]).exists())
+
+    def test_summaries_match_records(self):
+        Attendance.objects.create(journal_entry=self.journals[0], student=self.students[0], status=Attendance.Status.PRESENT)
+        Attendance.objects.create(journal_entry=self.journals[0], student=self.students[1], status=Attendance.Status.ABSENT_INVALID)
+        Attendance.objects.create(journal_entry=self.journals[1], student=self.students[1], status=Attendance.Status.REMOTE)
+        service = AttendanceStatsService()
+        self.assertEqual(service.get_overall_attendance_percentage(academic_year_id=self.year.id), 66.7)
+        self.assertEqual(service.get_top_absent_students(study_period_id=self.period.id)[0]['student'], self.students[1].id)
+        student_summary = service.get_student_attendance_summary(self.students[1].id, self.period.id)
+        self.assertEqual(student_summary['total_recorded_lessons'], 2)
+        self.assertEqual(student_summary['presence_percentage'], 50.0)
+        with self.assertNumQueries(2): # группа, один проход агрегации
+            group_summary = service.get_group_attendance_summary(self.group.id, self.period.id)
+        self.assertEqual(group_summary['total_student_lesson_records'], 3)
+        self.assertEqual(group_summary['total_present_student_lessons'], 2)
+        self.assertEqual(group_summary['unique_lessons_with_attendance_records'], 2)
+
+        AttendanceRollup.objects.all().delete()
+        self.assertEqual(AttendanceRollup.rebuild(), 2)
+        self.assertEqual(self._rollup(self.students[1]).total_count, 2)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'stats-cache-tests'}})
+class StatsCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('cache_teacher@example.com', 'TestPassword123!', role=User.Role.TEACHER, is_active=True)
+        cls.student = User.objects.create_user('cache_student@example.com', 'TestPassword123!', role=User.Role.STUDENT, is_active=True)
+        cls.year = AcademicYear.objects.create(name="CacheYear", start_date=date(2023,9,1), end_date=date(2024,8,31))
+        cls.period = StudyPeriod.objects.create(academic_year=cls.year, name="CachePeriod", start_date=date(2023,9,1), end_date=date(2024,1,31))
+        cls.other_period = StudyPeriod.objects.create(academic_year=cls.year, name="CacheOtherPeriod", start_date=date(2024,2,1), end_date=date(2024,5,31))
+        cls.subject = Subject.objects.create(name="CacheSubject")
+        cls.group = StudentGroup.objects.create(name="CacheGroup", academic_year=cls.year)
+        cls.group.students.add(cls.student)
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def _compute(self):
+        self.calls += 1
+        return {'calls': self.calls}
+
+    def _create_grade(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Grade.objects.create(student=self.student, subject=self.subject, study_period=self.period, academic_year=self.year,
+                                 grade_value="4", numeric_value=4, grade_type=Grade.GradeType.LESSON_WORK, graded_by=self.teacher)
+
+    def test_repeated_requests_hit_cache(self):
+        filters = {'academic_year_id': None, 'study_period_id': self.period.id}
+        get_or_compute_stats('endpoint', 'admin', filters, self._compute)
+        data = get_or_compute_stats('endpoint', 'admin', filters, self._compute)
+        self.assertEqual(data, {'calls': 1})
+        get_or_compute_stats('endpoint', f'student:{self.student.id}', filters, self._compute)
+        self.assertEqual(self.calls, 2) # другая область роли - отдельная запись
+
+    def test_writes_invalidate_affected_scopes_only(self):
+        period_filters = {'academic_year_id': None, 'study_period_id': self.period.id}
+        year_filters = {'academic_year_id': self.year.id, 'study_period_id': None}
+        other_filters = {'academic_year_id': None, 'study_period_id': self.other_period.id}
+        for filters in (period_filters, year_filters, other_filters):
+            get_or_compute_stats('endpoint', 'admin', filters, self._compute)
+        get_or_compute_stats('group', 'admin', period_filters, self._compute, scopes=[(SCOPE_GROUP, self.group.id)])
+        self.assertEqual(self.calls, 4)
+
+        self._create_grade()
+        self.assertEqual(get_or_compute_stats('endpoint', 'admin', period_filters, self._compute), {'calls': 5})
+        self.assertEqual(get_or_compute_stats('endpoint', 'admin', year_filters, self._compute), {'calls': 6})
+        self.assertEqual(get_or_compute_stats('endpoint', 'admin', other_filters, self._compute), {'calls': 3})
+        self.assertEqual(get_or_compute_stats('group', 'admin', period_filters, self._compute, scopes=[(SCOPE_GROUP, self.group.id)]), {'calls': 7})
+
+
+class PlatformSnapshotServiceTests(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.users = [
+            User.objects.create_user(f'snapshot_u{i}@example.com', 'TestPassword123!', role=role, is_active=True)
+            for i, role in enumerate([User.Role.STUDENT, User.Role.STUDENT, User.Role.TEACHER])
+        ]
+        # Первый пользователь зарегистрирован 3 дня назад, второй - позавчера, третий - сегодня
+        for user, days_back in zip(self.users, (3, 2, 0)):
+            User.objects.filter(pk=user.pk).update(date_joined=timezone.now() - timedelta(days=days_back))
+        notification = Notification.objects.create(recipient=self.users[0], message="Snapshot", notification_type=Notification.NotificationType.SYSTEM, is_read=True)
+        Notification.objects.filter(pk=notification.pk).update(created_at=timezone.now() - timedelta(days=2))
+
+    def test_snapshots_are_built_incrementally(self):
+        service = PlatformSnapshotService()
+        self.assertEqual(service.build_snapshots(until_date=self.today - timedelta(days=3)), 1)
+        self.assertEqual(service.build_snapshots(), 2) # дни после последнего снимка по вчерашний день
+        self.assertEqual(service.build_snapshots(), 0)
+        snapshot = PlatformDailySnapshot.objects.get(date=self.today - timedelta(days=2))
+        self.assertEqual(snapshot.new_users, 1)
+        self.assertEqual(snapshot.users_by_role, {User.Role.STUDENT: 2})
+        self.assertEqual((snapshot.notifications_sent, snapshot.notifications_read), (1, 1))
+
+        history = service.get_history(self.today - timedelta(days=3), self.today)
+        self.assertEqual([row['date'] for row in history], [self.today - timedelta(days=offset) for offset in (3, 2, 1)])
+
+        # Смена роли и удаление пользователя учитываются в следующих снимках и в сводке
+        User.objects.filter(pk=self.users[1].pk).update(role=User.Role.TEACHER)
+        self.users[0].delete()
+        self.assertEqual(service.build_snapshots(until_date=self.today), 1)
+        self.assertEqual(PlatformDailySnapshot.objects.get(date=self.today).users_by_role, {User.Role.TEACHER: 2})
+        self.assertEqual(service.get_platform_summary(days_ago=7)['user_counts_by_role'], [{'role': User.Role.TEACHER, 'count': 2}])
+
+    def test_summary_combines_snapshots_and_today_delta(self):
+        PlatformSnapshotService().build_snapshots(until_date=self.today - timedelta(days=4))
+        PlatformSnapshotService().build_snapshots()
+        summary = PlatformSnapshotService().get_platform_summary(days_ago=7)
+        self.assertEqual(summary['user_counts_by_role'], [{'role': User.Role.STUDENT, 'count': 2}, {'role': User.Role.TEACHER, 'count': 1}])
+        self.assertEqual(summary['recent_registrations_7_days'], 3)
+        self.assertEqual(summary['notification_stats']['total_notifications_sent'], 1)
+        self.assertEqual(summary['notification_stats']['read_percentage'], 100.0)
+
+
+class TrendStatsServiceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('trend_teacher@example.com', 'TestPassword123!', role=User.Role.TEACHER, is_active=True)
+        cls.student = User.objects.create_user('trend_student@example.com', 'TestPassword123!', role=User.Role.STUDENT, is_active=True)
+        cls.year = AcademicYear.objects.create(name="TrendYear", start_date=date(2023,9,1), end_date=date(2024,8,31))
+        cls.period = StudyPeriod.objects.create(academic_year=cls.year, name="TrendPeriod", start_date=date(2023,9,1), end_date=date(2024,1,31))
+        cls.subject = Subject.objects.create(name="TrendSubject")
+        cls.group = StudentGroup.objects.create(name="TrendGroup", academic_year=cls.year)
+        cls.group.students.add(cls.student)
+        grade_kwargs = dict(student=cls.student, subject=cls.subject, study_period=cls.period, academic_year=cls.year, grade_type=Grade.GradeType.LESSON_WORK, graded_by=cls.teacher)
+        # Неделя со 2 октября 2023: (5*1 + 3*1) / 2 = 4; неделя с 9 октября: одна оценка 2
+        Grade.objects.create(grade_value="5", numeric_value=5, date_given=date(2023, 10, 2), **grade_kwargs)
+        Grade.objects.create(grade_value="3", numeric_value=3, date_given=date(2023, 10, 4), **grade_kwargs)
+        Grade.objects.create(grade_value="2", numeric_value=2, date_given=date(2023, 10, 10), **grade_kwargs)
+        for day, attendance_status in ((2, Attendance.Status.PRESENT), (3, Attendance.Status.ABSENT_INVALID)):
+            lesson_start = timezone.make_aware(datetime(2023, 10, day, 9, 0))
+            lesson = Lesson.objects.create(study_period=cls.period, student_group=cls.group, subject=cls.subject, teacher=cls.teacher, start_time=lesson_start, end_time=lesson_start + timedelta(hours=1))
+            Attendance.objects.create(journal_entry=LessonJournalEntry.objects.create(lesson=lesson), student=cls.student, status=attendance_status)
+
+    def test_weekly_trend_for_student(self):
+        with self.assertNumQueries(2): # оценки и посещаемость - по одному сгруппированному запросу
+            trend = TrendStatsService().get_trends('student', self.student.id, bucket='week', study_period_id=self.period.id)
+        self.assertEqual(trend['buckets'], [date(2023, 10, 2), date(2023, 10, 9)])
+        self.assertEqual(trend['average_grade'], [4.0, 2.0])
+        self.assertEqual(trend['grades_count'], [2, 1])
+        self.assertEqual(trend['attendance_rate'], [50.0, None])
+
+    def test_daily_trend_for_group(self):
+        trend = TrendStatsService().get_trends('group', self.group.id, bucket='day', academic_year_id=self.year.id)
+        self.assertEqual(len(trend['buckets']), 4)
+        self.assertEqual(trend['attendance_records'], [1, 1, 0, 0])
+        self.assertIn('error', TrendStatsService().get_trends('group', self.group.id, bucket='month'))
+
+    def test_trend_access_is_limited_to_related_teachers(self):
+        from rest_framework.test import APIClient
+        outsider = User.objects.create_user('trend_outsider@example.com', 'TestPassword123!', role=User.Role.TEACHER, is_active=True)
+        client = APIClient()
+        targets = [('trend_stats:trend-stats-student', self.student.id), ('trend_stats:trend-stats-subject', self.subject.id), ('trend_stats:trend-stats-group', self.group.id)]
+        client.force_authenticate(outsider)
+        for url_name, target_id in targets:
+            self.assertEqual(client.get(reverse(url_name, args=[target_id]), {'academic_year_id': self.year.id}).status_code, 403)
+        client.force_authenticate(self.teacher)
+        for url_name, target_id in targets:
+            self.assertEqual(client.get(reverse(url_name, args=[target_id]), {'academic_year_id': self.year.id}).status_code, 200)
+
+
+class RiskScoringServiceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('risk_teacher@example.com', 'TestPassword123!', role=User.Role.TEACHER, is_active=True)
+        cls.good, cls.weak = [
+            User.objects.create_user(f'risk_s{i}@example.com', 'TestPassword123!', role=User.Role.STUDENT, is_active=True)
+            for i in range(2)
+        ]
+        cls.year = AcademicYear.objects.create(name="RiskYear", start_date=date(2023,9,1), end_date=date(2024,8,31))
+        cls.period = StudyPeriod.objects.create(academic_year=cls.year, name="RiskPeriod", start_date=date(2023,9,1), end_date=date(2024,1,31))
+        cls.subject = Subject.objects.create(name="RiskSubject")
+        cls.group = StudentGroup.objects.create(name="RiskGroup", academic_year=cls.year, curator=cls.teacher)
+        cls.group.students.add(cls.good, cls.weak)
+        start = timezone.make_aware(datetime(2023, 10, 2, 9, 0))
+        lesson = Lesson.objects.create(study_period=cls.period, student_group=cls.group, subject=cls.subject, teacher=cls.teacher, start_time=start, end_time=start + timedelta(hours=1))
+        journal = LessonJournalEntry.objects.create(lesson=lesson)
+        homework = Homework.objects.create(journal_entry=journal, title="RiskHW", description="", author=cls.teacher, due_date=start + timedelta(days=7))
+        HomeworkSubmission.objects.create(homework=homework, student=cls.good)
+        Attendance.objects.create(journal_entry=journal, student=cls.good, status=Attendance.Status.PRESENT)
+        Attendance.objects.create(journal_entry=journal, student=cls.weak, status=Attendance.Status.ABSENT_INVALID)
+        for student, value in ((cls.good, 5), (cls.weak, 2)):
+            Grade.objects.create(student=student, subject=cls.subject, study_period=cls.period, grade_value=str(value), numeric_value=value, grade_type=Grade.GradeType.TEST)
+
+    def test_scores_are_computed_and_ranked(self):
+        service = RiskScoringService()
+        self.assertEqual(service.compute_scores(study_period_ids=[self.period.id]), 2)
+        weak_score = StudentRiskScore.objects.get(student=self.weak, study_period=self.period)
+        self.assertEqual((weak_score.absences_invalid, weak_score.homework_expected, weak_score.homework_missed), (1, 1, 1))
+        self.assertEqual(float(weak_score.risk_score), 100.0)
+        self.assertEqual(float(StudentRiskScore.objects.get(student=self.good).risk_score), 0.0)
+
+        with self.assertNumQueries(1): # баллы со студентами
+            top = service.get_top_at_risk(self.period.id, limit=1)
+        self.assertEqual([row['student_id'] for row in top], [self.weak.id])
+        self.assertEqual(service.get_top_at_risk(self.period.id, min_score=50, student_group_ids=[self.group.id])[0]['student_id'], self.weak.id)
+
+        # Повторный расчет обновляет баллы, студенты без данных в периоде удаляются
+        Attendance.objects.filter(student=self.weak).delete()
+        service.compute_scores(study_period_ids=[self.period.id])
+        self.assertEqual(float(StudentRiskScore.objects.get(student=self.weak).risk_score), 70.0)
+        Grade.objects.filter(student=self.weak).delete()
+        self.group.students.remove(self.weak)
+        service.compute_scores(study_period_ids=[self.period.id])
+        self.assertEqual(list(StudentRiskScore.objects.values_list('student_id', flat=True)), [self.good.id])
+
+
+class DashboardStatsServiceTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = User.objects.create_user('dash_teacher@example.com', 'TestPassword123!', role=User.Role.TEACHER, is_active=True)
+        cls.parent = User.objects.create_user('dash_parent@example.com', 'TestPassword123!', role=User.Role.PARENT, is_active=True)
+        cls.students = [
+            User.objects.create_user(f'dash_s{i}@example.com', 'TestPassword123!', role=User.Role.STUDENT, is_active=True)
+            for i in range(2)
+        ]
+        cls.parent.children.add(*cls.students)
+        cls.year = AcademicYear.objects.create(name="DashYear", start_date=date(2023,9,1), end_date=date(2024,8,31))
+        cls.period = StudyPeriod.objects.create(academic_year=cls.year, name="DashPeriod", start_date=date(2023,9,1), end_date=date(2024,1,31))
+        cls.subject = Subject.objects.create(name="DashSubject")
+        cls.group = StudentGroup.objects.create(name="DashGroup", academic_year=cls.year, curator=cls.teacher)
+        cls.group.students.add(*cls.students)
+        start = timezone.make_aware(datetime(2023, 10, 2, 9, 0))
+        lesson = Lesson.objects.create(study_period=cls.period, student_group=cls.group, subject=cls.subject, teacher=cls.teacher, start_time=start, end_time=start + timedelta(hours=1))
+        journal = LessonJournalEntry.objects.create(lesson=lesson)
+        homework = Homework.objects.create(journal_entry=journal, title="DashHW", description="", author=cls.teacher, due_date=start + timedelta(days=7))
+        HomeworkSubmission.objects.create(homework=homework, student=cls.students[0])
+        Attendance.objects.create(journal_entry=journal, student=cls.students[0], status=Attendance.Status.PRESENT)
+        Grade.objects.create(student=cls.students[0], subject=cls.subject, study_period=cls.period, grade_value="4", numeric_value=4, grade_type=Grade.GradeType.TEST)
+
+    def test_student_dashboard_matches_single_student_services(self):
+        student = self.students[0]
+        with self.assertNumQueries(7): # период, группы, занятия, оценки, агрегаты посещаемости, ДЗ, сдачи
+            dashboard = DashboardStatsService().get_student_dashboard(student, self.period.id)
+        self.assertEqual(dashboard['groups'], [{'group_id': self.group.id, 'group_name': self.group.name}])
+        self.assertEqual(dashboard['average_grades_by_subject'], StudentPerformanceStatsService().get_student_performance_by_subject(student.id, self.period.id))
+        self.assertEqual(dashboard['attendance_summary'], AttendanceStatsService().get_student_attendance_summary(student.id, self.period.id))
+        self.assertEqual(dashboard['homework_summary'], HomeworkStatsService().get_student_homework_summary(student.id, self.period.id))
+
+    def test_parent_dashboard_queries_do_not_grow_with_children(self):
+        with self.assertNumQueries(8): # дети + запросы панели студента
+            dashboard = DashboardStatsService().get_parent_dashboard(self.parent, self.period.id)
+        self.assertEqual(len(dashboard['children']), 2)
+        second_child = next(child for child in dashboard['children'] if child['child_id'] == self.students[1].id)
+        self.assertEqual(second_child['average_grades_by_subject'][0]['grades_count'], 0)
+        self.assertIsNone(second_child['attendance_summary']['presence_percentage'])
+        self.assertEqual(second_child['homework_summary'][0]['my_grade'], None)
+
+    def test_teacher_dashboard(self):
+        with self.assertNumQueries(9): # период, план, нагрузка (2), курируемые группы, ДЗ (2), состав групп, оценки
+            dashboard = DashboardStatsService().get_teacher_dashboard(self.teacher, self.period.id)
+        self.assertEqual(dashboard['my_load_summary']['total_scheduled_lessons'], 1)
+        self.assertEqual(dashboard['my_homework_summary'][0]['submissions_received'], 1)
+        group_summary = dashboard['curated_groups_performance_summary'][0]
+        self.assertEqual(group_summary, StudentPerformanceStatsService().get_group_performance_summary(self.group.id, self.period.id))
+        self.assertEqual(group_summary['students_counted_for_average'], 1)
+        self.assertEqual(DashboardStatsService().get_teacher_dashboard(self.teacher, 0), {"error": "Учебный период не найден."})
@@ -1,16 +1,22 @@
 from django.urls import path, include
 from .views import ( # Импорт всех необходимых представлений (views)
     AdminPlatformSummaryStatsView,
+    AdminPlatformHistoryView,
     AdminAllTeachersLoadView,
     AdminTeacherLoadDetailView,
     AdminGroupPerformanceView,
     AdminStudentsByPerformanceView,
+    AtRiskStudentsView,
     AdminOverallAttendanceStatsView,
     AdminHomeworkOverallStatsView,
     TeacherMyOverallStatsView,
+    TeacherDashboardView,
     TeacherGroupStudentDetailsView,
     StudentMyPerformanceStatsView,
-    ParentChildPerformanceStatsView
+    StudentDashboardView,
+    ParentChildPerformanceStatsView,
+    ParentDashboardView,
+    TrendStatsView
 )
 
 # --- URL-маршруты для Администратора ---
@@ -20,6 +26,8 @@ from .views import ( # Импорт всех необходимых предст
 admin_urlpatterns = [
     # Общая сводная статистика по платформе
     path('platform-summary/', AdminPlatformSummaryStatsView.as_view(), name='admin-stats-platform-summary'),
+    # Временной ряд ежедневных снимков метрик платформы
+    path('platform-history/', AdminPlatformHistoryView.as_view(), name='admin-stats-platform-history'),
     # Сводная статистика по нагрузке всех преподавателей
     path('teachers-load/summary/', AdminAllTeachersLoadView.as_view(), name='admin-stats-teachers-load-summary'),
     # Детализированная статистика по нагрузке конкретного преподавателя
@@ -28,6 +36,8 @@ admin_urlpatterns = [
     path('groups/<int:group_id>/performance/', AdminGroupPerformanceView.as_view(), name='admin-stats-group-performance'),
     # Список студентов, отфильтрованных по успеваемости (например, группы риска/отличники)
     path('students-performance-filtered/', AdminStudentsByPerformanceView.as_view(), name='admin-stats-students-filtered'),
+    # "Группа риска" по сохраненным баллам риска (администраторы и кураторы)
+    path('students-at-risk/', AtRiskStudentsView.as_view(), name='admin-stats-students-at-risk'),
     # Общая статистика по посещаемости
     path('attendance/overall/', AdminOverallAttendanceStatsView.as_view(), name='admin-stats-overall-attendance'),
     # Общая статистика по домашним заданиям
@@ -40,6 +50,8 @@ admin_urlpatterns = [
 teacher_urlpatterns = [
     # Сводная статистика для текущего преподавателя (нагрузка, ДЗ, успеваемость курируемых групп)
     path('my-summary/', TeacherMyOverallStatsView.as_view(), name='teacher-stats-my-summary'),
+    # Сводная панель преподавателя одним ответом (нагрузка, ДЗ, курируемые группы)
+    path('dashboard/', TeacherDashboardView.as_view(), name='teacher-stats-dashboard'),
     # Детализированная успеваемость студентов в конкретной группе (для преподавателя/куратора)
     path('my-groups/<int:group_id>/student-details/', TeacherGroupStudentDetailsView.as_view(), name='teacher-stats-group-student-details'),
 ]
@@ -50,6 +62,8 @@ teacher_urlpatterns = [
 student_urlpatterns = [
     # Сводная статистика успеваемости и посещаемости для текущего студента
     path('my-performance/', StudentMyPerformanceStatsView.as_view(), name='student-stats-my-performance'),
+    # Сводная панель студента одним ответом (группы, успеваемость, посещаемость, ДЗ)
+    path('dashboard/', StudentDashboardView.as_view(), name='student-stats-dashboard'),
 ]
 
 # --- URL-маршруты для Родителя ---
@@ -58,6 +72,17 @@ student_urlpatterns = [
 parent_urlpatterns = [
     # Сводная статистика успеваемости и посещаемости для конкретного ребенка родителя
     path('child/<int:child_id>/performance/', ParentChildPerformanceStatsView.as_view(), name='parent-stats-child-performance'),
+    # Сводная панель родителя по всем детям одним ответом
+    path('dashboard/', ParentDashboardView.as_view(), name='parent-stats-dashboard'),
+]
+
+# --- URL-маршруты для трендов ---
+# Временные ряды средневзвешенной оценки и посещаемости (по неделям/дням) для студента, группы или предмета.
+# Доступ проверяется в TrendStatsView в зависимости от роли пользователя.
+trend_urlpatterns = [
+    path('student/<int:target_id>/', TrendStatsView.as_view(target='student'), name='trend-stats-student'),
+    path('group/<int:target_id>/', TrendStatsView.as_view(target='group'), name='trend-stats-group'),
+    path('subject/<int:target_id>/', TrendStatsView.as_view(target='subject'), name='trend-stats-subject'),
 ]
 
 # --- Общий список urlpatterns для модуля 'stats' ---
@@ -70,4 +95,5 @@ urlpatterns = [
     path('teacher/', include((teacher_urlpatterns, 'teacher_stats'))),
     path('student/', include((student_urlpatterns, 'student_stats'))),
     path('parent/', include((parent_urlpatterns, 'parent_stats'))),
+    path('trends/', include((trend_urlpatterns, 'trend_stats'))),
 ]
\ No newline at end of file
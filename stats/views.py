@@ -2,20 +2,26 @@ import logging
 from rest_framework import permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.utils.decorators import method_decorator # Для декораторов кэширования
-from django.views.decorators.cache import cache_page # Для кэширования на уровне view
+from datetime import timedelta
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings # Для глобальных настроек, если нужны
 
-from edu_core.models import Lesson, StudentGroup, StudyPeriod # Модели из edu_core
+from edu_core.models import Lesson, StudentGroup, StudyPeriod, CurriculumEntry # Модели из edu_core
 from .services import ( # Сервисы для получения статистических данных
     PlatformStatsService, 
+    PlatformSnapshotService,
     TeacherLoadStatsService, 
     StudentPerformanceStatsService,
     AttendanceStatsService, 
     HomeworkStatsService,
+    TrendStatsService,
+    RiskScoringService,
+    DashboardStatsService,
     get_active_academic_year_service # Вспомогательная сервисная функция
 )
+from .cache import get_or_compute_stats, period_scopes, SCOPE_GROUP # Кэш ответов статистики
 from users.permissions import IsAdmin, IsTeacher, IsStudent, IsParent, IsTeacherOrAdmin # Кастомные пермишены
 from users.models import User # Модель пользователя
 
@@ -56,38 +62,62 @@ def get_effective_period_filters(request, study_period_required=False, default_t
             
     return {'academic_year_id': academic_year_id, 'study_period_id': study_period_id}
 
+# Вспомогательная функция, возвращающая область видимости роли для ключа кэша статистики:
+# 'admin' для администраторов (данные не зависят от конкретного администратора),
+# '<роль>:<id>' для остальных пользователей.
+def get_stats_role_scope(user):
+    if user.is_admin: return 'admin'
+    return f"{user.role.lower()}:{user.id}"
+
+# Время жизни кэша сводки по платформе: она зависит от онлайн-активности, а не от учебных данных,
+# поэтому инвалидируется только по таймауту.
+PLATFORM_SUMMARY_CACHE_TIMEOUT = getattr(settings, 'STATS_PLATFORM_SUMMARY_CACHE_TIMEOUT', 60)
+
 # --- Эндпоинты для Администратора ---
 
 # View для получения общей сводной статистики по платформе.
 # Доступно только администраторам.
-# - get_user_counts_by_role: Количество пользователей по ролям.
-# - get_recent_registrations: Количество недавних регистраций.
-# - get_active_users_approx: Примерное количество активных пользователей.
-# - get_online_users_via_channels: Количество онлайн-пользователей (через Redis/Channels).
-# - get_messaging_activity_summary: Сводка по активности в мессенджере.
-# - get_notification_stats: Статистика по уведомлениям.
+# - user_counts_by_role: Количество пользователей по ролям.
+# - recent_registrations_<days_ago>_days: Количество недавних регистраций.
+# - active_users_approx_15_min: Примерное количество активных пользователей.
+# - online_users_via_channels: Количество онлайн-пользователей (через Redis/Channels).
+# - messaging_activity_summary: Сводка по активности в мессенджере.
+# - notification_stats: Статистика по уведомлениям.
 # Параметр `days_ago` (по умолчанию 7) определяет период для статистики.
-# (Закомментировано) `@method_decorator(cache_page(60 * 15), name='dispatch')` - пример кэширования ответа.
+# Данные собираются PlatformSnapshotService из ежедневных снимков и дельт за текущий день
+# (окно - с начала дня `days_ago` дней назад); ответ кэшируется на PLATFORM_SUMMARY_CACHE_TIMEOUT секунд.
 class AdminPlatformSummaryStatsView(APIView):
     permission_classes = [permissions.IsAuthenticated, IsAdmin]
     def get(self, request, *args, **kwargs):
         logger.info(f"Admin {request.user.email} requesting platform summary stats.")
-        service = PlatformStatsService()
+        service = PlatformSnapshotService()
         days_ago_param = request.query_params.get('days_ago', '7')
         try:
             days_ago = int(days_ago_param)
             if days_ago <= 0: raise ValueError()
         except ValueError: return Response({"error": _("Параметр 'days_ago' должен быть положительным числом.")}, status=status.HTTP_400_BAD_REQUEST)
-        data = {
-            'user_counts_by_role': service.get_user_counts_by_role(),
-            f'recent_registrations_{days_ago}_days': service.get_recent_registrations(days_ago=days_ago),
-            'active_users_approx_15_min': service.get_active_users_approx(minutes_ago=15),
-            'online_users_via_channels': service.get_online_users_via_channels(),
-            'messaging_activity_summary': service.get_messaging_activity_summary(days_ago=days_ago),
-            'notification_stats': service.get_notification_stats(days_ago=days_ago),
-        }
+        data = get_or_compute_stats(
+            'admin_platform_summary', 'admin', {}, lambda: service.get_platform_summary(days_ago=days_ago),
+            scopes=[], extra={'days_ago': days_ago}, timeout=PLATFORM_SUMMARY_CACHE_TIMEOUT
+        )
         return Response(data)
 
+# View для получения временного ряда ежедневных снимков метрик платформы.
+# Доступно только администраторам.
+# Параметры: `date_from`, `date_to` (YYYY-MM-DD); по умолчанию - последние 30 дней.
+class AdminPlatformHistoryView(APIView):
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+    DEFAULT_HISTORY_DAYS = 30
+    def get(self, request, *args, **kwargs):
+        try:
+            date_to = parse_date(request.query_params['date_to']) if request.query_params.get('date_to') else timezone.localdate()
+            date_from = parse_date(request.query_params['date_from']) if request.query_params.get('date_from') else date_to - timedelta(days=self.DEFAULT_HISTORY_DAYS)
+            if not date_from or not date_to: raise ValueError()
+        except (ValueError, TypeError): return Response({"error": _("Параметры 'date_from', 'date_to' должны быть в формате YYYY-MM-DD.")}, status=status.HTTP_400_BAD_REQUEST)
+        if date_from > date_to: return Response({"error": _("'date_from' не может быть позже 'date_to'.")}, status=status.HTTP_400_BAD_REQUEST)
+        logger.info(f"Admin {request.user.email} requesting platform history {date_from} - {date_to}.")
+        return Response(PlatformSnapshotService().get_history(date_from, date_to))
+
 # View для получения сводной статистики по нагрузке всех преподавателей.
 # Доступно только администраторам.
 # Использует `get_effective_period_filters` для определения учебного года/периода.
@@ -98,7 +128,7 @@ class AdminAllTeachersLoadView(APIView):
         except ValueError as e: return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         logger.info(f"Admin {request.user.email} requesting all teachers load. Filters: {filters}")
         service = TeacherLoadStatsService()
-        data = service.get_all_teachers_summary_load(academic_year_id=filters.get('academic_year_id'), study_period_id=filters.get('study_period_id'))
+        data = get_or_compute_stats('admin_all_teachers_load', 'admin', filters, lambda: service.get_all_teachers_summary_load(academic_year_id=filters.get('academic_year_id'), study_period_id=filters.get('study_period_id')))
         return Response(data)
 
 # View для получения детализированной статистики по нагрузке конкретного преподавателя.
@@ -110,7 +140,11 @@ class AdminTeacherLoadDetailView(APIView):
         except ValueError as e: return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         logger.info(f"Admin {request.user.email} requesting load details for teacher ID {teacher_id}. Filters: {filters}")
         service = TeacherLoadStatsService()
-        data = service.get_teacher_load_details(teacher_id=teacher_id, academic_year_id=filters.get('academic_year_id'), study_period_id=filters.get('study_period_id'))
+        data = get_or_compute_stats(
+            'admin_teacher_load_detail', 'admin', filters,
+            lambda: service.get_teacher_load_details(teacher_id=teacher_id, academic_year_id=filters.get('academic_year_id'), study_period_id=filters.get('study_period_id')),
+            extra={'teacher_id': teacher_id}
+        )
         if "error" in data:
             status_code = status.HTTP_404_NOT_FOUND if "не найден" in str(data["error"]).lower() else status.HTTP_400_BAD_REQUEST
             return Response(data, status=status_code)
@@ -130,7 +164,11 @@ class AdminGroupPerformanceView(APIView):
                 return Response({"error": _("Вы не являетесь куратором этой группы.")}, status=status.HTTP_403_FORBIDDEN)
         logger.info(f"User {request.user.email} requesting performance for group ID {group_id}. Period ID: {filters.get('study_period_id')}")
         service = StudentPerformanceStatsService()
-        summary = service.get_group_performance_summary(student_group_id=group_id, study_period_id=filters.get('study_period_id'))
+        summary = get_or_compute_stats(
+            'group_performance', get_stats_role_scope(request.user), filters,
+            lambda: service.get_group_performance_summary(student_group_id=group_id, study_period_id=filters.get('study_period_id')),
+            scopes=[(SCOPE_GROUP, group_id)]
+        )
         if "error" in summary: return Response(summary, status=status.HTTP_404_NOT_FOUND)
         return Response(summary)
 
@@ -151,9 +189,42 @@ class AdminStudentsByPerformanceView(APIView):
         except ValueError: return Response({"error": _("Параметры 'threshold', 'limit' имеют неверный формат.")}, status=status.HTTP_400_BAD_REQUEST)
         logger.info(f"Admin {request.user.email} requesting students by performance. Period: {study_period_id}, Thr: {threshold}, Above: {above}, Limit: {limit}")
         service = StudentPerformanceStatsService()
-        students_data = service.get_students_by_performance_threshold(study_period_id=study_period_id, threshold=threshold, above_threshold=above, limit=limit)
+        students_data = get_or_compute_stats(
+            'admin_students_by_performance', 'admin', filters,
+            lambda: service.get_students_by_performance_threshold(study_period_id=study_period_id, threshold=threshold, above_threshold=above, limit=limit),
+            extra={'threshold': threshold, 'above': above, 'limit': limit}
+        )
         return Response(students_data)
 
+# View для получения "группы риска" - студентов с наибольшим баллом риска неуспеваемости
+# (StudentRiskScore, пересчитывается ночью). Доступно администраторам и кураторам групп.
+# Параметры: `study_period_id` (обязателен, по умолчанию - первый период текущего года),
+# `group_id` (опционально), `limit` (по умолчанию 20, максимум 200), `min_score` (минимальный балл).
+# Преподаватель видит только студентов курируемых групп.
+class AtRiskStudentsView(APIView):
+    permission_classes = [permissions.IsAuthenticated, IsTeacherOrAdmin]
+    DEFAULT_LIMIT = 20
+    MAX_LIMIT = 200
+    def get(self, request, *args, **kwargs):
+        try: filters = get_effective_period_filters(request, study_period_required=True, default_to_active_year=True)
+        except ValueError as e: return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            group_id = int(request.query_params['group_id']) if request.query_params.get('group_id') else None
+            limit = min(int(request.query_params.get('limit', self.DEFAULT_LIMIT)), self.MAX_LIMIT)
+            min_score = float(request.query_params['min_score']) if request.query_params.get('min_score') else None
+            if limit <= 0: raise ValueError()
+        except ValueError: return Response({"error": _("Параметры 'group_id', 'limit', 'min_score' имеют неверный формат.")}, status=status.HTTP_400_BAD_REQUEST)
+        student_group_ids = [group_id] if group_id else None
+        if request.user.is_teacher and not request.user.is_admin:
+            curated_group_ids = list(StudentGroup.objects.filter(curator=request.user).values_list('id', flat=True))
+            if group_id and group_id not in curated_group_ids:
+                return Response({"error": _("Вы не являетесь куратором этой группы.")}, status=status.HTTP_403_FORBIDDEN)
+            student_group_ids = student_group_ids or curated_group_ids
+        logger.info(f"User {request.user.email} requesting at-risk students. Period: {filters.get('study_period_id')}, Groups: {student_group_ids}")
+        return Response(RiskScoringService().get_top_at_risk(
+            filters.get('study_period_id'), limit=limit, student_group_ids=student_group_ids, min_score=min_score
+        ))
+
 # View для получения общей статистики по посещаемости.
 # Доступно только администраторам.
 # Включает общий процент посещаемости и топ студентов по пропускам.
@@ -168,9 +239,11 @@ class AdminOverallAttendanceStatsView(APIView):
         if limit_top_absent <=0: limit_top_absent = 10 # Коррекция лимита
         logger.info(f"Admin {request.user.email} requesting overall attendance stats. Filters: {filters}")
         service = AttendanceStatsService()
-        percentage = service.get_overall_attendance_percentage(academic_year_id=filters.get('academic_year_id'), study_period_id=filters.get('study_period_id'))
-        top_absent = service.get_top_absent_students(limit=limit_top_absent, academic_year_id=filters.get('academic_year_id'), study_period_id=filters.get('study_period_id'))
-        return Response({'overall_attendance_percentage': percentage, 'top_absent_students_invalid_reason': top_absent})
+        data = get_or_compute_stats('admin_overall_attendance', 'admin', filters, lambda: {
+            'overall_attendance_percentage': service.get_overall_attendance_percentage(academic_year_id=filters.get('academic_year_id'), study_period_id=filters.get('study_period_id')),
+            'top_absent_students_invalid_reason': service.get_top_absent_students(limit=limit_top_absent, academic_year_id=filters.get('academic_year_id'), study_period_id=filters.get('study_period_id')),
+        }, extra={'limit_top_absent': limit_top_absent})
+        return Response(data)
 
 # View для получения общей статистики по сдаче домашних заданий.
 # Доступно только администраторам.
@@ -181,13 +254,14 @@ class AdminHomeworkOverallStatsView(APIView):
         except ValueError as e: return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         logger.info(f"Admin {request.user.email} requesting overall homework stats. Filters: {filters}")
         service = HomeworkStatsService()
-        data = service.get_overall_submission_stats(academic_year_id=filters.get('academic_year_id'), study_period_id=filters.get('study_period_id'))
+        data = get_or_compute_stats('admin_homework_overall', 'admin', filters, lambda: service.get_overall_submission_stats(academic_year_id=filters.get('academic_year_id'), study_period_id=filters.get('study_period_id')))
         return Response(data)
 
 # --- Эндпоинты для Преподавателя ---
 
 # View для получения сводной статистики для преподавателя (нагрузка, ДЗ, успеваемость курируемых групп).
 # Доступно только преподавателям. `study_period_id` обязателен.
+# Данные собираются DashboardStatsService (те же блоки, что и в TeacherDashboardView).
 class TeacherMyOverallStatsView(APIView):
     permission_classes = [permissions.IsAuthenticated, IsTeacher]
     def get(self, request, *args, **kwargs):
@@ -195,29 +269,25 @@ class TeacherMyOverallStatsView(APIView):
         except ValueError as e: return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         study_period_id = filters.get('study_period_id')
         logger.info(f"Teacher {request.user.email} requesting their overall stats. Filters: {filters}")
-        load_service = TeacherLoadStatsService(); homework_service = HomeworkStatsService(); performance_service = StudentPerformanceStatsService()
-        my_load_data_details = load_service.get_teacher_load_details(teacher_id=request.user.id, academic_year_id=filters.get('academic_year_id'), study_period_id=study_period_id)
-        my_homework_data = homework_service.get_homework_submission_summary_for_teacher(teacher_id=request.user.id, study_period_id=study_period_id)
-        curated_groups_performance = []
-        if StudentGroup: # Проверка, что модель StudentGroup импортирована
-            active_year_id_for_curated = filters.get('academic_year_id')
-            if active_year_id_for_curated:
-                my_curated_groups_qs = StudentGroup.objects.filter(curator=request.user, academic_year_id=active_year_id_for_curated)
-                for group in my_curated_groups_qs:
-                    group_perf = performance_service.get_group_performance_summary(student_group_id=group.id, study_period_id=study_period_id)
-                    if "error" not in group_perf: curated_groups_performance.append(group_perf)
-            else: logger.warning(f"Teacher {request.user.email}: Cannot fetch curated group performance without an academic year.")
-        data = {
-            'my_load_summary': {
-                'total_planned_hours': my_load_data_details.get('total_planned_hours'),
-                'total_scheduled_lessons': my_load_data_details.get('total_scheduled_lessons'),
-                'total_scheduled_hours': my_load_data_details.get('total_scheduled_hours'),
-                'load_percentage': my_load_data_details.get('load_percentage'),
-                'planned_details_by_subject_group': my_load_data_details.get('planned_details_by_subject_group', []) 
-            },
-            'my_homework_summary': my_homework_data,
-            'curated_groups_performance_summary': curated_groups_performance
-        }
+        def compute_teacher_stats():
+            dashboard = DashboardStatsService().get_teacher_dashboard(request.user, study_period_id)
+            if "error" in dashboard: return dashboard
+            return {key: dashboard[key] for key in ('my_load_summary', 'my_homework_summary', 'curated_groups_performance_summary')}
+        data = get_or_compute_stats('teacher_my_overall', get_stats_role_scope(request.user), filters, compute_teacher_stats)
+        if "error" in data: return Response(data, status=status.HTTP_404_NOT_FOUND)
+        return Response(data)
+
+# View сводной панели преподавателя: нагрузка, ДЗ и успеваемость курируемых групп за период
+# одним ответом (DashboardStatsService, ограниченное число запросов). `study_period_id` обязателен.
+class TeacherDashboardView(APIView):
+    permission_classes = [permissions.IsAuthenticated, IsTeacher]
+    def get(self, request, *args, **kwargs):
+        try: filters = get_effective_period_filters(request, study_period_required=True, default_to_active_year=True)
+        except ValueError as e: return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        logger.info(f"Teacher {request.user.email} requesting dashboard. Filters: {filters}")
+        data = get_or_compute_stats('teacher_dashboard', get_stats_role_scope(request.user), filters,
+                                    lambda: DashboardStatsService().get_teacher_dashboard(request.user, filters.get('study_period_id')))
+        if "error" in data: return Response(data, status=status.HTTP_404_NOT_FOUND)
         return Response(data)
 
 # View для получения детализированной успеваемости студентов в группе (для преподавателя).
@@ -234,7 +304,11 @@ class TeacherGroupStudentDetailsView(APIView):
         if not (is_curator or teaches_in_group_period): return Response({"error": _("Нет доступа к статистике этой группы.")}, status=status.HTTP_403_FORBIDDEN)
         logger.info(f"Teacher {request.user.email} requesting student details for group ID {group_id}, Period ID: {study_period_id}")
         service = StudentPerformanceStatsService()
-        data = service.get_group_performance_summary(student_group_id=group_id, study_period_id=study_period_id)
+        data = get_or_compute_stats(
+            'group_performance', get_stats_role_scope(request.user), filters,
+            lambda: service.get_group_performance_summary(student_group_id=group_id, study_period_id=study_period_id),
+            scopes=[(SCOPE_GROUP, group_id)]
+        )
         if "error" in data: return Response(data, status=status.HTTP_404_NOT_FOUND)
         return Response(data.get('students_details', []))
 
@@ -242,6 +316,7 @@ class TeacherGroupStudentDetailsView(APIView):
 
 # View для получения сводной статистики успеваемости и посещаемости для студента.
 # Доступно только аутентифицированному студенту для своих данных. `study_period_id` обязателен.
+# Данные собираются DashboardStatsService (те же блоки, что и в StudentDashboardView).
 class StudentMyPerformanceStatsView(APIView):
     permission_classes = [permissions.IsAuthenticated, IsStudent]
     def get(self, request, *args, **kwargs):
@@ -249,18 +324,32 @@ class StudentMyPerformanceStatsView(APIView):
         except ValueError as e: return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         study_period_id = filters.get('study_period_id')
         logger.info(f"Student {request.user.email} requesting their performance stats. Period ID: {study_period_id}")
-        performance_service = StudentPerformanceStatsService(); attendance_service = AttendanceStatsService(); homework_service = HomeworkStatsService()
-        data = {
-            'average_grades_by_subject': performance_service.get_student_performance_by_subject(request.user.id, study_period_id),
-            'attendance_summary': attendance_service.get_student_attendance_summary(request.user.id, study_period_id),
-            'homework_summary': homework_service.get_student_homework_summary(request.user.id, study_period_id),
-        }
+        def compute_student_stats():
+            dashboard = DashboardStatsService().get_student_dashboard(request.user, study_period_id)
+            if "error" in dashboard: return dashboard
+            return {key: dashboard[key] for key in ('average_grades_by_subject', 'attendance_summary', 'homework_summary')}
+        data = get_or_compute_stats('student_my_performance', get_stats_role_scope(request.user), filters, compute_student_stats)
+        if "error" in data: return Response(data, status=status.HTTP_404_NOT_FOUND)
+        return Response(data)
+
+# View сводной панели студента: группы, успеваемость по предметам, посещаемость и ДЗ за период
+# одним ответом (DashboardStatsService, ограниченное число запросов). `study_period_id` обязателен.
+class StudentDashboardView(APIView):
+    permission_classes = [permissions.IsAuthenticated, IsStudent]
+    def get(self, request, *args, **kwargs):
+        try: filters = get_effective_period_filters(request, study_period_required=True, default_to_active_year=True)
+        except ValueError as e: return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        logger.info(f"Student {request.user.email} requesting dashboard. Filters: {filters}")
+        data = get_or_compute_stats('student_dashboard', get_stats_role_scope(request.user), filters,
+                                    lambda: DashboardStatsService().get_student_dashboard(request.user, filters.get('study_period_id')))
+        if "error" in data: return Response(data, status=status.HTTP_404_NOT_FOUND)
         return Response(data)
 
 # --- Эндпоинты для Родителя ---
 
 # View для получения сводной статистики успеваемости и посещаемости для ребенка родителя.
 # Доступно только аутентифицированному родителю. `child_id` передается в URL. `study_period_id` обязателен.
+# Данные собираются DashboardStatsService (те же блоки, что и в ParentDashboardView).
 class ParentChildPerformanceStatsView(APIView):
     permission_classes = [permissions.IsAuthenticated, IsParent]
     def get(self, request, child_id, *args, **kwargs):
@@ -270,11 +359,67 @@ class ParentChildPerformanceStatsView(APIView):
         try: child = request.user.children.get(pk=child_id, role=User.Role.STUDENT)
         except User.DoesNotExist: return Response({"error": _("Ребенок не найден или не привязан к вашему аккаунту.")}, status=status.HTTP_404_NOT_FOUND)
         logger.info(f"Parent {request.user.email} requesting stats for child ID {child_id}. Period ID: {study_period_id}")
-        performance_service = StudentPerformanceStatsService(); attendance_service = AttendanceStatsService(); homework_service = HomeworkStatsService()
-        data = {
-            'child_id': child.id, 'child_name': child.get_full_name(),
-            'average_grades_by_subject': performance_service.get_student_performance_by_subject(child.id, study_period_id),
-            'attendance_summary': attendance_service.get_student_attendance_summary(child.id, study_period_id),
-            'homework_summary': homework_service.get_student_homework_summary(child.id, study_period_id),
-        }
-        return Response(data)
\ No newline at end of file
+        def compute_child_stats():
+            dashboard = DashboardStatsService().get_parent_dashboard(request.user, study_period_id, child_ids=[child.id])
+            if "error" in dashboard: return dashboard
+            child_data = dashboard['children'][0]
+            return {key: child_data[key] for key in ('child_id', 'child_name', 'average_grades_by_subject', 'attendance_summary', 'homework_summary')}
+        data = get_or_compute_stats('parent_child_performance', get_stats_role_scope(request.user), filters, compute_child_stats, extra={'child_id': child.id})
+        if "error" in data: return Response(data, status=status.HTTP_404_NOT_FOUND)
+        return Response(data)
+
+# View сводной панели родителя: блоки успеваемости, посещаемости и ДЗ сразу для всех детей
+# одним ответом (DashboardStatsService; число запросов не зависит от количества детей).
+# `study_period_id` обязателен.
+class ParentDashboardView(APIView):
+    permission_classes = [permissions.IsAuthenticated, IsParent]
+    def get(self, request, *args, **kwargs):
+        try: filters = get_effective_period_filters(request, study_period_required=True, default_to_active_year=True)
+        except ValueError as e: return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        logger.info(f"Parent {request.user.email} requesting dashboard. Filters: {filters}")
+        data = get_or_compute_stats('parent_dashboard', get_stats_role_scope(request.user), filters,
+                                    lambda: DashboardStatsService().get_parent_dashboard(request.user, filters.get('study_period_id')))
+        if "error" in data: return Response(data, status=status.HTTP_404_NOT_FOUND)
+        return Response(data)
+
+# --- Тренды (временные ряды) ---
+
+# View для получения тренда средневзвешенной оценки и процента посещаемости по неделям/дням.
+# Объект тренда задается в URL (`target`: student/group/subject и его ID).
+# Параметры: `bucket` (week/day, по умолчанию week), `academic_year_id`/`study_period_id`
+# (по умолчанию - текущий учебный год).
+# Доступ: администратор - к любым трендам; преподаватель - к трендам студентов, предметов и групп,
+# которые он курирует или в которых ведет занятия; студент - только к своему тренду;
+# родитель - к трендам своих детей.
+class TrendStatsView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    target = None
+
+    def _has_access(self, user, target_id):
+        if user.is_admin: return True
+        if self.target == 'student':
+            if user.is_student: return user.id == target_id
+            if user.is_parent: return user.children.filter(pk=target_id).exists()
+            if not user.is_teacher: return False
+            return StudentGroup.objects.filter(curator=user, students__id=target_id).exists()\
+                or Lesson.objects.filter(teacher=user, student_group__students__id=target_id).exists()
+        if not user.is_teacher: return False
+        if self.target == 'group':
+            return StudentGroup.objects.filter(pk=target_id, curator=user).exists() or Lesson.objects.filter(teacher=user, student_group_id=target_id).exists()
+        if self.target == 'subject':
+            return Lesson.objects.filter(teacher=user, subject_id=target_id).exists() or CurriculumEntry.objects.filter(teacher=user, subject_id=target_id).exists()
+        return False
+
+    def get(self, request, target_id, *args, **kwargs):
+        if not self._has_access(request.user, target_id): return Response({"error": _("Нет доступа к этому тренду.")}, status=status.HTTP_403_FORBIDDEN)
+        try: filters = get_effective_period_filters(request, default_to_active_year=True)
+        except ValueError as e: return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        bucket = request.query_params.get('bucket', 'week')
+        scopes = [(SCOPE_GROUP, target_id)] if self.target == 'group' else period_scopes(filters.get('academic_year_id'), filters.get('study_period_id'))
+        data = get_or_compute_stats(
+            f'trend_{self.target}', 'trends', filters,
+            lambda: TrendStatsService().get_trends(self.target, target_id, bucket=bucket, academic_year_id=filters.get('academic_year_id'), study_period_id=filters.get('study_period_id')),
+            scopes=scopes, extra={'target_id': target_id, 'bucket': bucket}
+        )
+        if "error" in data: return Response(data, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data)
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, Profile, InvitationCode
+from .models import User, Profile, InvitationCode, OutgoingEmail
 
 # Класс ProfileInline определяет встроенное отображение модели Profile
 # в административной панели Django внутри страницы редактирования пользователя (User).
@@ -65,4 +65,12 @@ class CustomUserAdmin(BaseUserAdmin):
 admin.site.register(User, CustomUserAdmin)
 # Регистрация модели InvitationCode в административной панели с настройками по умолчанию.
 # Модель Profile не регистрируется отдельно, так как она управляется через ProfileInline внутри CustomUserAdmin.
-admin.site.register(InvitationCode)
\ No newline at end of file
+admin.site.register(InvitationCode)
+
+# Очередь исходящих писем (users.mail) - только для просмотра статуса отправки и ошибок.
+@admin.register(OutgoingEmail)
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    list_display = ('to_email', 'subject', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('status', 'template_name')
+    search_fields = ('to_email', 'subject')
+    readonly_fields = ('created_at', 'sent_at', 'attempts', 'last_error')
@@ -0,0 +1,138 @@
+import logging
+from datetime import timedelta
+from functools import lru_cache
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.template.loader import get_template
+from django.utils import timezone
+from django.utils.html import strip_tags
+from .models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+# Очередь исходящих писем (OutgoingEmail).
+# enqueue_email / enqueue_emails только сохраняют письма в очередь и после фиксации транзакции
+# ставят задачу Celery send_outgoing_emails - HTTP-запрос не ждет рендеринга и SMTP.
+# Задача обрабатывает очередь через OutgoingEmailProcessor; письма, которые не удалось отправить,
+# повторяются с экспоненциальной задержкой, а периодический запуск (Celery Beat) подбирает
+# отложенные повторы и письма, для которых задача не была поставлена (например, брокер недоступен).
+
+OUTBOX_BATCH_SIZE = getattr(settings, 'EMAIL_OUTBOX_BATCH_SIZE', 100)
+OUTBOX_MAX_ATTEMPTS = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+OUTBOX_RETRY_BASE_SECONDS = getattr(settings, 'EMAIL_OUTBOX_RETRY_BASE_SECONDS', 60)
+
+
+# Скомпилированные шаблоны писем кэшируются в процессе воркера:
+# шаблон разбирается один раз, а не для каждого письма пакета.
+@lru_cache(maxsize=32)
+def _get_email_template(template_name):
+    return get_template(template_name)
+
+def _schedule_outbox_processing():
+    from .tasks import send_outgoing_emails_task
+    try:
+        send_outgoing_emails_task.delay()
+    except Exception as e:
+        # Письма остаются в очереди и будут отправлены периодическим запуском задачи
+        logger.warning(f"Could not schedule send_outgoing_emails task: {e}")
+
+
+# Ставит в очередь несколько писем одним bulk_create (например, массовые приглашения).
+# messages - итерируемое словарей с ключами to_email, subject, template_name и context
+# (контекст должен сериализоваться в JSON). Возвращает созданные записи OutgoingEmail.
+def enqueue_emails(messages):
+    emails = [
+        OutgoingEmail(
+            to_email=message['to_email'], subject=message['subject'],
+            template_name=message['template_name'], context=message.get('context') or {},
+        )
+        for message in messages
+    ]
+    if not emails: return []
+    created = OutgoingEmail.objects.bulk_create(emails, batch_size=OUTBOX_BATCH_SIZE)
+    transaction.on_commit(_schedule_outbox_processing)
+    logger.info(f"Queued {len(created)} outgoing email(s)")
+    return created
+
+def enqueue_email(to_email, subject, template_name, context=None):
+    return enqueue_emails([{'to_email': to_email, 'subject': subject, 'template_name': template_name, 'context': context}])[0]
+
+
+# Класс OutgoingEmailProcessor отправляет письма из очереди пакетами.
+# - Пакет выбирается с select_for_update(skip_locked=True), поэтому несколько воркеров
+#   обрабатывают очередь параллельно, не отправляя одно письмо дважды.
+# - Все письма пакета отправляются через одно SMTP-соединение (get_connection).
+# - Неудачная отправка увеличивает attempts и откладывает письмо на
+#   OUTBOX_RETRY_BASE_SECONDS * 2^(attempts-1) секунд; после OUTBOX_MAX_ATTEMPTS письмо помечается FAILED.
+# - max_batches ограничивает объем работы за один запуск (None - до опустошения очереди).
+class OutgoingEmailProcessor:
+    def __init__(self, batch_size=None, max_batches=None):
+        self.batch_size = batch_size or OUTBOX_BATCH_SIZE
+        self.max_batches = max_batches
+
+    def _build_message(self, email, connection):
+        html_message = _get_email_template(email.template_name).render(email.context)
+        message = EmailMultiAlternatives(
+            subject=email.subject, body=strip_tags(html_message), from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[email.to_email], connection=connection,
+        )
+        message.attach_alternative(html_message, 'text/html')
+        return message
+
+    # Отправляет письма пакета через одно соединение; возвращает (отправленные, [(письмо, ошибка)]).
+    def _send_batch(self, emails):
+        sent, failed = [], []
+        try:
+            with get_connection() as connection:
+                for email in emails:
+                    try:
+                        self._build_message(email, connection).send()
+                        sent.append(email)
+                    except Exception as e:
+                        failed.append((email, e))
+        except Exception as e:
+            # Соединение не удалось открыть/закрыть - необработанные письма считаются неудачной попыткой
+            processed_ids = {email.pk for email in sent} | {email.pk for email, _ in failed}
+            failed += [(email, e) for email in emails if email.pk not in processed_ids]
+        return sent, failed
+
+    def _process_batch(self, now):
+        with transaction.atomic():
+            emails = list(
+                OutgoingEmail.objects.select_for_update(skip_locked=True)
+                .filter(status=OutgoingEmail.Status.PENDING, next_attempt_at__lte=now)
+                .order_by('next_attempt_at', 'id')[:self.batch_size]
+            )
+            if not emails: return None
+            sent, failed = self._send_batch(emails)
+            for email in sent:
+                email.status = OutgoingEmail.Status.SENT
+                email.sent_at = timezone.now()
+                email.last_error = ''
+            for email, error in failed:
+                email.attempts += 1
+                email.last_error = str(error)[:1000]
+                if email.attempts >= OUTBOX_MAX_ATTEMPTS:
+                    email.status = OutgoingEmail.Status.FAILED
+                else:
+                    email.next_attempt_at = now + timedelta(seconds=OUTBOX_RETRY_BASE_SECONDS * 2 ** (email.attempts - 1))
+                logger.warning(f"Failed to send email {email.pk} to {email.to_email} (attempt {email.attempts}): {error}")
+            OutgoingEmail.objects.bulk_update(emails, ['status', 'sent_at', 'attempts', 'last_error', 'next_attempt_at'])
+        return {
+            'sent': len(sent),
+            'retrying': sum(1 for email, _ in failed if email.status == OutgoingEmail.Status.PENDING),
+            'failed': sum(1 for email, _ in failed if email.status == OutgoingEmail.Status.FAILED),
+        }
+
+    def execute(self):
+        now = timezone.now()
+        result = {'sent': 0, 'retrying': 0, 'failed': 0}
+        batches = 0
+        while self.max_batches is None or batches < self.max_batches:
+            batch_result = self._process_batch(now)
+            if batch_result is None: break
+            for key, value in batch_result.items(): result[key] += value
+            batches += 1
+        logger.info(f"Outgoing emails processed: {result}")
+        return result
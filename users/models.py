@@ -273,4 +273,37 @@ class InvitationCode(models.Model):
             return False
         if self.expires_at and self.expires_at < timezone.now():
             return False
-        return True
\ No newline at end of file
+        return True
+
+# Модель OutgoingEmail - очередь исходящих писем (outbox).
+# Эндпоинты (регистрация, сброс пароля, массовые рассылки) только создают запись с именем
+# шаблона и контекстом; рендеринг и отправку выполняет задача Celery send_outgoing_emails
+# (users.mail.OutgoingEmailProcessor) пакетами через одно SMTP-соединение.
+# - status: PENDING - ожидает отправки, SENT - отправлено, FAILED - исчерпаны попытки.
+# - attempts / next_attempt_at: число неудачных попыток и время следующей попытки
+#   (экспоненциальная задержка), last_error - текст последней ошибки.
+class OutgoingEmail(models.Model):
+    class Status(models.TextChoices):
+        PENDING = 'PENDING', _('Ожидает отправки')
+        SENT = 'SENT', _('Отправлено')
+        FAILED = 'FAILED', _('Ошибка')
+
+    to_email = models.EmailField(_('получатель'))
+    subject = models.CharField(_('тема'), max_length=255)
+    template_name = models.CharField(_('шаблон'), max_length=255)
+    context = models.JSONField(_('контекст шаблона'), default=dict, blank=True)
+    status = models.CharField(_('статус'), max_length=10, choices=Status.choices, default=Status.PENDING)
+    attempts = models.PositiveSmallIntegerField(_('попыток'), default=0)
+    last_error = models.TextField(_('последняя ошибка'), blank=True)
+    next_attempt_at = models.DateTimeField(_('следующая попытка'), default=timezone.now)
+    created_at = models.DateTimeField(_('создано'), auto_now_add=True)
+    sent_at = models.DateTimeField(_('отправлено'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('исходящее письмо')
+        verbose_name_plural = _('исходящие письма')
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to_email} ({self.get_status_display()})"
@@ -0,0 +1,19 @@
+from celery import shared_task
+from .mail import OutgoingEmailProcessor
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Задача send_outgoing_emails_task отправляет письма из очереди OutgoingEmail
+# (users.mail.OutgoingEmailProcessor). Ставится после фиксации транзакции, создавшей письма,
+# и запускается ежеминутно через Celery Beat для повторных попыток с задержкой.
+@shared_task(name="send_outgoing_emails")
+def send_outgoing_emails_task(max_batches=None):
+    logger.info("Celery task: Starting send_outgoing_emails_task.")
+    try:
+        result = OutgoingEmailProcessor(max_batches=max_batches).execute()
+        logger.info(f"Celery task: Finished send_outgoing_emails_task successfully: {result}")
+        return result
+    except Exception as e:
+        logger.error(f"Celery task: Error in send_outgoing_emails_task: {e}", exc_info=True)
+        raise
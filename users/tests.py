@@ -9,7 +9,7 @@ from datetime import timedelta
 import uuid
 from unittest.mock import patch, MagicMock, AsyncMock 
 
-from .models import Profile, InvitationCode
+from .models import Profile, InvitationCode, OutgoingEmail
 
 User = get_user_model()
 
@@ -287,4 +287,59 @@ class UserProfileAPITests(APITestCase):
         self.user.refresh_from_db()
         self.user.profile.refresh_from_db()
         self.assertEqual(self.user.first_name, 'UpdatedFirst')
-        self.assertEqual(self.user.profile.bio, 'This is my updated bio.')
\ No newline at end of file
+        self.assertEqual(self.user.profile.bio, 'This is my updated bio.')
+
+
+class OutgoingEmailQueueTests(APITestCase):
+    @patch('users.tasks.send_outgoing_emails_task.delay')
+    def test_registration_queues_email_and_processor_sends_it(self, mock_delay):
+        from django.core import mail
+        from .mail import OutgoingEmailProcessor
+        data = {
+            'email': 'queued@example.com', 'password': 'ComplexPassword123!', 'password2': 'ComplexPassword123!',
+            'first_name': 'Queued', 'last_name': 'User', 'role': User.Role.STUDENT
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('register'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(mail.outbox), 0)
+        mock_delay.assert_called_once()
+        queued = OutgoingEmail.objects.get(to_email='queued@example.com')
+        self.assertEqual(queued.status, OutgoingEmail.Status.PENDING)
+
+        result = OutgoingEmailProcessor().execute()
+        self.assertEqual(result['sent'], 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['queued@example.com'])
+        token = User.objects.get(email='queued@example.com').confirmation_token
+        self.assertIn(str(token), mail.outbox[0].alternatives[0][0])
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, OutgoingEmail.Status.SENT)
+
+    @patch('users.tasks.send_outgoing_emails_task.delay')
+    def test_bulk_emails_share_one_connection_and_failures_back_off(self, mock_delay):
+        from django.core import mail
+        from django.core.mail import get_connection
+        from .mail import OutgoingEmailProcessor, enqueue_emails
+        enqueue_emails([
+            {'to_email': f'invitee{i}@example.com', 'subject': 'Приглашение', 'template_name': 'emails/account_confirmation_email.html',
+             'context': {'confirm_url': f'https://example.com/{i}/', 'platform_name': 'Test', 'first_name': f'Invitee{i}'}}
+            for i in range(3)
+        ])
+        with patch('users.mail.get_connection', wraps=get_connection) as mock_connection:
+            self.assertEqual(OutgoingEmailProcessor().execute()['sent'], 3)
+        mock_connection.assert_called_once()
+        self.assertEqual(len(mail.outbox), 3)
+
+        failing = enqueue_emails([{'to_email': 'broken@example.com', 'subject': 'Test', 'template_name': 'emails/password_reset_email.html'}])[0]
+        with patch('django.core.mail.EmailMultiAlternatives.send', side_effect=OSError('SMTP down')):
+            result = OutgoingEmailProcessor().execute()
+        self.assertEqual(result, {'sent': 0, 'retrying': 1, 'failed': 0})
+        failing.refresh_from_db()
+        self.assertEqual(failing.status, OutgoingEmail.Status.PENDING)
+        self.assertEqual(failing.attempts, 1)
+        self.assertIn('SMTP down', failing.last_error)
+        self.assertGreater(failing.next_attempt_at, timezone.now())
+        # До истечения задержки письмо не отправляется повторно
+        self.assertEqual(OutgoingEmailProcessor().execute()['sent'], 0)
+